@@ -0,0 +1,137 @@
+import argparse
+import csv
+import json
+import os
+import random
+import shutil
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import compression
+from lib.compression import COPY_BLOCK_SIZE, compressed_path, open_binary, open_text
+from lib.functions import REPOS_CSV_HEADER, write_csv_rows, load_csv_repo_file_gen
+
+
+# Disk throughputs (MB/s) the reading times are estimated for: network storage, HDD, SATA SSD and NVMe
+DISK_SPEEDS = [50, 150, 500, 2000]
+
+
+def generate_rows(num_rows, seed=0):
+    """
+    Rows like the ones of a repos csv: owner/name with the usual skew of stars and forks (mostly zeros).
+    """
+
+    rand = random.Random(seed)
+    words = [''.join(rand.choices(string.ascii_lowercase, k=rand.randint(3, 10))) for _ in range(5000)]
+    for _ in range(num_rows):
+        stars = int(rand.paretovariate(1.2)) - 1
+        yield [f"{rand.choice(words)}{rand.randint(0, 999)}/{rand.choice(words)}-{rand.choice(words)}",
+               stars or "", int(stars * rand.random() / 4) or "", "",
+               1 if rand.random() < 0.02 else "", "", 1 if rand.random() < 0.05 else "", ""]
+
+
+def variants(threads):
+    """
+    :return: List of (name, compression, threads, level) to benchmark, skipping the unavailable ones.
+    """
+
+    found = [("none", None, 1, None), ("gz-1", "gz", 1, 1), ("gz-6", "gz", 1, 6)]
+    if threads > 1 and shutil.which("pigz"):
+        found += [(f"pigz-6-x{threads}", "gz", threads, 6)]
+    if compression.zstandard is not None:
+        found += [("zst-3", "zst", 1, 3), (f"zst-3-x{threads}", "zst", threads, 3), (f"zst-9-x{threads}", "zst", threads, 9)]
+    return found
+
+
+def bench_variant(csv_path, rows, plain_bytes, variant_compression, threads, level):
+    path = compressed_path(csv_path, variant_compression)
+    start = time.perf_counter()
+    with open_text(path, 'w', threads=threads, level=level) as csv_file:
+        csv_writer = csv.writer(csv_file)
+        csv_writer.writerow(REPOS_CSV_HEADER)
+        csv_writer.writerows(rows)
+    write_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with open_binary(path) as csv_file:
+        while csv_file.read(COPY_BLOCK_SIZE):
+            pass
+    decompress_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    read_rows = sum(1 for _ in load_csv_repo_file_gen(path))
+    read_seconds = time.perf_counter() - start
+
+    size = os.path.getsize(path)
+    os.remove(path)
+    mb = plain_bytes / 1024 / 1024
+    return {
+        "bytes": size,
+        "ratio": plain_bytes / size,
+        "write_seconds": write_seconds,
+        "write_mb_per_sec": mb / write_seconds,
+        "decompress_seconds": decompress_seconds,
+        "decompress_mb_per_sec": mb / decompress_seconds,
+        "read_seconds": read_seconds,
+        "read_mb_per_sec": mb / read_seconds,
+        "rows": read_rows,
+        # Streaming overlaps the disk and the decompression, so getting the bytes takes the slowest of both,
+        # then the rows are parsed as fast as from a plain csv
+        "read_seconds_at_disk": {str(speed): max(size / 1024 / 1024 / speed, decompress_seconds) for speed in DISK_SPEEDS},
+    }
+
+
+def main(work_folder, num_rows, threads, seed=0):
+    """
+    Write and read the same repos csv plain and compressed, measuring the cpu cost of each compression and the
+    time to get its bytes from disks of several speeds (the parsing of the rows costs the same for all of them).
+
+    :return: Dict with the results of each variant.
+    """
+
+    rows = list(generate_rows(num_rows, seed))
+    csv_path = os.path.join(work_folder, "repos.csv")
+    write_csv_rows(csv_path, REPOS_CSV_HEADER, rows)
+    plain_bytes = os.path.getsize(csv_path)
+    os.remove(csv_path)
+
+    results = {"rows": num_rows, "plain_bytes": plain_bytes, "threads": threads, "variants": dict()}
+    for name, variant_compression, variant_threads, level in variants(threads):
+        results["variants"][name] = bench_variant(csv_path, rows, plain_bytes, variant_compression, variant_threads, level)
+        result = results["variants"][name]
+        print(f"[+] {name}: ratio {result['ratio']:.2f}, write {result['write_mb_per_sec']:.0f} MB/s, decompress {result['decompress_mb_per_sec']:.0f} MB/s, "
+              f"read {result['read_mb_per_sec']:.0f} MB/s, "
+              + ", ".join(f"{speed} MB/s disk {seconds:.2f}s" for speed, seconds in result["read_seconds_at_disk"].items()))
+
+    # The fastest variant to read for each disk
+    results["best_read_at_disk"] = {str(speed): min(results["variants"], key=lambda name: results["variants"][name]["read_seconds_at_disk"][str(speed)])
+                                    for speed in DISK_SPEEDS}
+    for speed, name in results["best_read_at_disk"].items():
+        print(f"[+] Fastest to read from a {speed} MB/s disk: {name}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the disk vs cpu trade-off of the compressed csvs (.gz, .zst).")
+    parser.add_argument('-n', '--rows', type=int, default=1_000_000, help="Rows of the generated repos csv.")
+    parser.add_argument('-t', '--threads', type=int, default=os.cpu_count(), help="Compression threads of the multi-threaded variants.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the generated csv.")
+    parser.add_argument('-w', '--work-folder', type=str, default=None, help="Folder where the csvs are written (a temporary one by default).")
+    parser.add_argument('-o', '--output', type=str, default=None, help="JSON file where the results are written.")
+
+    args = parser.parse_args()
+    if args.work_folder:
+        os.makedirs(args.work_folder, exist_ok=True)
+        results = main(args.work_folder, args.rows, args.threads, args.seed)
+    else:
+        with tempfile.TemporaryDirectory() as work_folder:
+            results = main(work_folder, args.rows, args.threads, args.seed)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+        print(f"[+] Results written to {args.output}")
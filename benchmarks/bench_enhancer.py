@@ -0,0 +1,148 @@
+import argparse
+import csv
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gh_enhancer
+import lib.functions
+
+from benchmarks.mock_github_graphql import MockGithubState, start_mock_server
+
+
+def write_synthetic_csvs(folder, num_repos, num_users, seed=0):
+    """
+    Write synthetic repos and users csvs in the format generated by gh_scraper.
+
+    :param folder: The folder where repos.csv and users.csv are written.
+    :param num_repos: Number of repos to generate.
+    :param num_users: Number of users to generate.
+    :param seed: Seed of the random generator.
+    :return: A tuple with the repos and users csv paths.
+    """
+
+    rand = random.Random(seed)
+    num_owners = max(1, num_repos // 3)
+    repos_csv_path = os.path.join(folder, "input_repos.csv")
+    users_csv_path = os.path.join(folder, "input_users.csv")
+
+    with open(repos_csv_path, 'w', newline='', encoding='utf-8') as repos_csv_file:
+        repos_csv_writer = csv.writer(repos_csv_file)
+        for i in range(num_repos):
+            repos_csv_writer.writerow([f"owner{rand.randrange(num_owners)}/repo{i}", 0, 0, 0, int(rand.random() < 0.01), 0, 0, 0])
+
+    with open(users_csv_path, 'w', newline='', encoding='utf-8') as users_csv_file:
+        users_csv_writer = csv.writer(users_csv_file)
+        for i in range(num_users):
+            repos_collab = [f"owner{rand.randrange(num_owners)}/repo{rand.randrange(max(1, num_repos))}" for _ in range(rand.randrange(4))]
+            # Half of the users are also repo owners, like in the real data
+            username = f"owner{i // 2}" if i % 2 == 0 and i // 2 < num_owners else f"user{i}"
+            users_csv_writer.writerow([username, ','.join(repos_collab), 0, 0, 0, "", "", 0])
+
+    return repos_csv_path, users_csv_path
+
+
+def run_benchmark(num_repos, num_users, num_tokens, threads, batch_size, mixed, state, sleep_scale, with_owners=False, seed=0):
+    """
+    Run gh_enhancer against the mock server and collect the results.
+
+    :param num_repos: Number of synthetic repos.
+    :param num_users: Number of synthetic users.
+    :param num_tokens: Number of fake tokens in the tokens file.
+    :param threads: Number of enhancer threads.
+    :param batch_size: Enhancer batch size.
+    :param mixed: Use the mixed repos+users batches.
+    :param state: The MockGithubState configuring the mock server.
+    :param sleep_scale: Factor applied to the retry and rate limit sleeps of the enhancer.
+    :param with_owners: Ask the owners in the repos queries.
+    :param seed: Seed of the synthetic data.
+    :return: A dict with the benchmark results.
+    """
+
+    server, url = start_mock_server(state)
+
+    original_settings = (lib.functions.GITHUB_GRAPHQL_API_URL, lib.functions.GRAPHQL_RETRY_SLEEP, lib.functions.GRAPHQL_RATE_LIMIT_SLEEP)
+    lib.functions.GITHUB_GRAPHQL_API_URL = url
+    lib.functions.GRAPHQL_RETRY_SLEEP = original_settings[1] * sleep_scale
+    lib.functions.GRAPHQL_RATE_LIMIT_SLEEP = original_settings[2] * sleep_scale
+    for stat_name in lib.functions.API_STATS:
+        lib.functions.API_STATS[stat_name] = 0
+    gh_enhancer.OWNERS_INFO.clear()
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="gh_bench_") as tmp_dir:
+            repos_csv_path, users_csv_path = write_synthetic_csvs(tmp_dir, num_repos, num_users, seed)
+            tokens_path = os.path.join(tmp_dir, "tokens.txt")
+            with open(tokens_path, 'w') as tokens_file:
+                tokens_file.write("\n".join(f"token{i}" for i in range(num_tokens)))
+
+            output_folder = os.path.join(tmp_dir, "out")
+            start = time.monotonic()
+            gh_enhancer.main(users_csv_path if num_users else None, repos_csv_path if num_repos else None, output_folder,
+                             None, tokens_path, batch_size, threads, mixed=mixed, with_owners=with_owners)
+            elapsed = time.monotonic() - start
+
+    finally:
+        server.shutdown()
+        lib.functions.GITHUB_GRAPHQL_API_URL, lib.functions.GRAPHQL_RETRY_SLEEP, lib.functions.GRAPHQL_RATE_LIMIT_SLEEP = original_settings
+
+    snapshot = state.snapshot()
+    api_stats = dict(lib.functions.API_STATS)
+    windows = max(1, math.ceil(elapsed / state.window_secs))
+    capacity = num_tokens * state.points_per_token * windows
+
+    return {
+        "repos": num_repos,
+        "users": num_users,
+        "mixed": mixed,
+        "with_owners": with_owners,
+        "threads": threads,
+        "batch_size": batch_size,
+        "elapsed_secs": round(elapsed, 3),
+        "assets_per_sec": round(snapshot["global"]["aliases"] / elapsed, 2) if elapsed else 0,
+        "requests": api_stats["requests"],
+        "retries": api_stats["retries"],
+        "rate_limits": api_stats["rate_limits"],
+        "wasted_sleep_secs": round(api_stats["retry_slept_secs"] + api_stats["rate_limit_slept_secs"], 3),
+        "retry_slept_secs": round(api_stats["retry_slept_secs"], 3),
+        "rate_limit_slept_secs": round(api_stats["rate_limit_slept_secs"], 3),
+        "points_used": snapshot["global"]["points"],
+        "token_utilization": round(snapshot["global"]["points"] / capacity, 4) if capacity else 0,
+        "points_per_token": {token: token_stats["points"] for token, token_stats in snapshot["tokens"].items()},
+        "server": snapshot["global"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark gh_enhancer against a local mock of the Github GraphQL API.")
+    parser.add_argument('-r', '--repos', type=int, default=30000, help="Number of synthetic repos.")
+    parser.add_argument('-u', '--users', type=int, default=10000, help="Number of synthetic users.")
+    parser.add_argument('-T', '--tokens', type=int, default=3, help="Number of fake tokens.")
+    parser.add_argument('-t', '--threads', type=int, default=5, help="Number of enhancer threads.")
+    parser.add_argument('-b', '--batch-size', type=int, default=300, help="Enhancer batch size.")
+    parser.add_argument('-m', '--mixed', action='store_true', help="Use mixed repos+users batches.")
+    parser.add_argument('--with-owners', action='store_true', help="Ask the owners in the repos queries.")
+    parser.add_argument('--points', type=int, default=5000, help="GraphQL points per token and window.")
+    parser.add_argument('--window', type=float, default=3600, help="Seconds of each rate limit window.")
+    parser.add_argument('--latency', type=float, default=200, help="Mean latency of the responses in ms.")
+    parser.add_argument('--jitter', type=float, default=100, help="Standard deviation of the latency in ms.")
+    parser.add_argument('--error-502', type=float, default=0.0, help="Ratio of requests answered with a 502.")
+    parser.add_argument('--rate-limit-status', type=int, default=200, help="Status code of rate limited responses.")
+    parser.add_argument('--sleep-scale', type=float, default=0.01, help="Factor applied to the enhancer retry and rate limit sleeps.")
+    parser.add_argument('-o', '--output', type=str, help="JSON file where the results are written.")
+
+    args = parser.parse_args()
+    state = MockGithubState(args.points, args.window, args.latency, args.jitter, args.error_502, rate_limit_status=args.rate_limit_status)
+    results = run_benchmark(args.repos, args.users, args.tokens, args.threads, args.batch_size, args.mixed, state, args.sleep_scale, args.with_owners)
+
+    print()
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
@@ -0,0 +1,296 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.gen_gh_archive import generate_archive, parse_event_mix
+
+
+STAGES = ["split", "parse", "aggregate", "scrape", "csv_write", "csv_read", "investigator"]
+
+# Metrics compared with the baseline, a higher value is better for all of them
+RATE_METRICS = ["events_per_sec", "rows_per_sec", "mb_per_sec"]
+
+
+def _log_files(work_folder):
+    logs_folder = os.path.join(work_folder, "logs")
+    return [os.path.join(logs_folder, file_name) for file_name in sorted(os.listdir(logs_folder)) if file_name.endswith(".json")]
+
+
+def _scrape(log_files):
+    import gh_scraper
+    for file_path in log_files:
+        gh_scraper.parse_github_archive(file_path)
+    return gh_scraper.UNIQUE_REPOS, gh_scraper.UNIQUE_USERS
+
+
+def stage_split(work_folder):
+    """
+    Decompress the hour files and split them in json files like gh_downloader.py.
+    """
+
+    from gh_downloader import write_content_to_file
+    from lib.functions import decompress_gz
+
+    archive_folder = os.path.join(work_folder, "archive")
+    logs_folder = os.path.join(work_folder, "logs")
+    shutil.rmtree(logs_folder, ignore_errors=True)
+    events = size = 0
+    start = time.perf_counter()
+    for file_name in sorted(os.listdir(archive_folder)):
+        with open(os.path.join(archive_folder, file_name), 'rb') as archive_file:
+            content = decompress_gz(archive_file.read())
+        size += len(content)
+        events += content.count(b"\n")
+        write_content_to_file(content.decode('utf-8'), logs_folder, file_name.split('.')[0])
+    return {"seconds": time.perf_counter() - start, "events": events, "bytes": size}
+
+
+def stage_parse(work_folder):
+    """
+    Only json.loads of every event.
+    """
+
+    events = size = 0
+    start = time.perf_counter()
+    for file_path in _log_files(work_folder):
+        with open(file_path, 'rb') as log_file:
+            for line in log_file:
+                json.loads(line)
+                events += 1
+                size += len(line)
+    return {"seconds": time.perf_counter() - start, "events": events, "bytes": size}
+
+
+def stage_aggregate(work_folder):
+    """
+    Only the updates of the scraper dicts, with the events already parsed.
+    """
+
+    import gh_scraper
+
+    parsed = []
+    for file_path in _log_files(work_folder):
+        with open(file_path, 'rb') as log_file:
+            parsed.extend(json.loads(line) for line in log_file)
+
+    start = time.perf_counter()
+    for event in parsed:
+        gh_scraper.EXTRACTORS.dispatch(event)
+    return {"seconds": time.perf_counter() - start, "events": len(parsed)}
+
+
+def stage_scrape(work_folder):
+    """
+    gh_scraper.parse_github_archive over every log file (parse plus aggregate).
+    """
+
+    log_files = _log_files(work_folder)
+    size = sum(os.path.getsize(file_path) for file_path in log_files)
+    start = time.perf_counter()
+    repos, users = _scrape(log_files)
+    return {"seconds": time.perf_counter() - start, "bytes": size, "repos": len(repos), "users": len(users)}
+
+
+def stage_csv_write(work_folder):
+    """
+    Write the scraper csvs, the logs are scraped first without timing it.
+    """
+
+    from lib.functions import write_csv_files
+
+    repos, users = _scrape(_log_files(work_folder))
+    csv_folder = os.path.join(work_folder, "csvs")
+    start = time.perf_counter()
+    write_csv_files(repos, users, csv_folder)
+    elapsed = time.perf_counter() - start
+    size = sum(os.path.getsize(os.path.join(csv_folder, name)) for name in ("repos.csv", "users.csv"))
+    return {"seconds": elapsed, "rows": len(repos) + len(users), "bytes": size}
+
+
+def stage_csv_read(work_folder):
+    """
+    Load the scraper csvs with the loaders used by the enhancer and the investigator.
+    """
+
+    from lib.functions import load_csv_repo_file_gen, load_csv_user_file_gen
+
+    csv_folder = os.path.join(work_folder, "csvs")
+    repos_path = os.path.join(csv_folder, "repos.csv")
+    users_path = os.path.join(csv_folder, "users.csv")
+    start = time.perf_counter()
+    rows = sum(1 for _ in load_csv_repo_file_gen(repos_path)) + sum(1 for _ in load_csv_user_file_gen(users_path))
+    return {"seconds": time.perf_counter() - start, "rows": rows, "bytes": os.path.getsize(repos_path) + os.path.getsize(users_path)}
+
+
+def stage_investigator(work_folder):
+    """
+    All the default gh_investigator reports over the scraper csvs.
+    """
+
+    import gh_investigator
+
+    csv_folder = os.path.join(work_folder, "csvs")
+    repos_path = os.path.join(csv_folder, "repos.csv")
+    users_path = os.path.join(csv_folder, "users.csv")
+    start = time.perf_counter()
+    gh_investigator.main(users_path, repos_path, None, os.path.join(work_folder, "reports"), 0, 0, 0)
+    return {"seconds": time.perf_counter() - start, "bytes": os.path.getsize(repos_path) + os.path.getsize(users_path)}
+
+
+def _run_stage_child(stage, work_folder, results_queue):
+    # The output of the stages (progress bars, reports messages) would hide the results
+    sys.stdout = open(os.devnull, 'w')
+    result = globals()[f"stage_{stage}"](work_folder)
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["peak_rss_mb"] = round(max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    results_queue.put(result)
+
+
+def run_stage(stage, work_folder):
+    """
+    Run a stage in a new process, so its peak RSS isn't mixed with the one of the other stages.
+
+    :return: Dict with the metrics of the stage.
+    """
+
+    context = multiprocessing.get_context("spawn")
+    results_queue = context.Queue()
+    process = context.Process(target=_run_stage_child, args=(stage, work_folder, results_queue))
+    process.start()
+    result = results_queue.get()
+    process.join()
+
+    seconds = result["seconds"]
+    if "events" in result:
+        result["events_per_sec"] = round(result["events"] / seconds, 1) if seconds else 0
+    if "rows" in result:
+        result["rows_per_sec"] = round(result["rows"] / seconds, 1) if seconds else 0
+    if "bytes" in result:
+        result["mb_per_sec"] = round(result["bytes"] / (1024 * 1024) / seconds, 2) if seconds else 0
+    result["seconds"] = round(seconds, 4)
+    return result
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    :param tolerance: Allowed slowdown ratio, e.g. 0.2 flags the rates more than 20% below the baseline.
+    :return: A list of messages describing the regressions.
+    """
+
+    if baseline.get("dataset") != results["dataset"]:
+        print("[!] The baseline was generated with another dataset, the comparison is not meaningful")
+
+    regressions = []
+    for stage, stage_results in results["stages"].items():
+        baseline_stage = baseline.get("stages", {}).get(stage)
+        if not baseline_stage:
+            continue
+        for metric in RATE_METRICS:
+            if metric in stage_results and baseline_stage.get(metric):
+                change = stage_results[metric] / baseline_stage[metric] - 1
+                print(f"    {stage} {metric}: {stage_results[metric]} (baseline {baseline_stage[metric]}, {change:+.1%})")
+                if change < -tolerance:
+                    regressions.append(f"{stage} {metric} {change:+.1%}")
+    return regressions
+
+
+def main(work_folder, stages, dataset, repeat=1):
+    """
+    Generate the dataset and run the stages on it.
+
+    :param work_folder: Folder for the dataset and the outputs of the stages.
+    :param stages: The stages to run, in order (each one uses the outputs of the previous ones).
+    :param dataset: Arguments of generate_archive.
+    :param repeat: Run each stage this number of times and keep the fastest run.
+    :return: Dict with the dataset and the results of each stage.
+    """
+
+    archive_folder = os.path.join(work_folder, "archive")
+    shutil.rmtree(archive_folder, ignore_errors=True)
+    print(f"[+] Generating the dataset in {archive_folder}")
+    generate_archive(archive_folder, **dataset)
+
+    # The stages need the split logs and the csvs even if only later stages are measured
+    needed = set(stages)
+    if needed & {"parse", "aggregate", "scrape", "csv_write", "csv_read", "investigator"}:
+        needed.add("split")
+    if needed & {"csv_read", "investigator"}:
+        needed.add("csv_write")
+
+    results = {
+        "dataset": dataset,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "stages": dict(),
+    }
+    for stage in STAGES:
+        if stage not in needed:
+            continue
+        runs = [run_stage(stage, work_folder) for _ in range(repeat if stage in stages else 1)]
+        if stage in stages:
+            results["stages"][stage] = min(runs, key=lambda run: run["seconds"])
+            print(f"[+] {stage}: {json.dumps(results['stages'][stage])}")
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scraping and investigating stages on a synthetic GH Archive dataset.")
+    parser.add_argument('-s', '--stages', type=str, default=",".join(STAGES), help=f"Comma separated stages to run ({','.join(STAGES)}).")
+    parser.add_argument('--hours', type=int, default=3, help="Number of hour files of the dataset.")
+    parser.add_argument('-e', '--events-per-hour', type=int, default=20_000, help="Events of each hour file.")
+    parser.add_argument('-r', '--repos', type=int, default=100_000, help="Number of distinct repos.")
+    parser.add_argument('-u', '--users', type=int, default=50_000, help="Number of distinct users.")
+    parser.add_argument('--skew', type=float, default=1.1, help="Zipf skew of the repos and users activity.")
+    parser.add_argument('--event-mix', type=str, default=None, help="Weights of the event types, e.g. PushEvent=0.6,WatchEvent=0.4.")
+    parser.add_argument('--payload-size', type=int, default=200, help="Mean length of the free texts of the payloads.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the dataset.")
+    parser.add_argument('--repeat', type=int, default=1, help="Runs of each stage, the fastest one is kept.")
+    parser.add_argument('-w', '--work-folder', type=str, default=None, help="Folder for the dataset and the outputs (a temporary one by default).")
+    parser.add_argument('-o', '--output', type=str, default=None, help="JSON file where the results are written, can be used as baseline later.")
+    parser.add_argument('-b', '--baseline', type=str, default=None, help="JSON results of a previous run to compare with.")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Slowdown ratio over the baseline flagged as a regression.")
+
+    args = parser.parse_args()
+    stages = [stage.strip() for stage in args.stages.split(',')]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+    dataset = {
+        "hours": args.hours, "events_per_hour": args.events_per_hour, "num_repos": args.repos, "num_users": args.users,
+        "skew": args.skew, "payload_size": args.payload_size, "seed": args.seed,
+        "event_mix": parse_event_mix(args.event_mix) if args.event_mix else None,
+    }
+
+    if args.work_folder:
+        os.makedirs(args.work_folder, exist_ok=True)
+        results = main(args.work_folder, stages, dataset, args.repeat)
+    else:
+        with tempfile.TemporaryDirectory(prefix="gh_bench_stages_") as tmp_dir:
+            results = main(tmp_dir, stages, dataset, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+        print(f"[+] Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        print(f"[+] Comparing with {args.baseline}")
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"[!] Regressions over {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("[+] No regressions")
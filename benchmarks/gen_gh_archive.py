@@ -0,0 +1,237 @@
+import argparse
+import gzip
+import io
+import json
+import os
+import random
+
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+
+# Share of each event type in a real GH Archive hour (approximately)
+DEFAULT_EVENT_MIX = {
+    "PushEvent": 0.50,
+    "CreateEvent": 0.12,
+    "PullRequestEvent": 0.08,
+    "WatchEvent": 0.07,
+    "IssueCommentEvent": 0.06,
+    "DeleteEvent": 0.04,
+    "PullRequestReviewEvent": 0.03,
+    "IssuesEvent": 0.03,
+    "ForkEvent": 0.02,
+    "ReleaseEvent": 0.01,
+    "PublicEvent": 0.01,
+    "MemberEvent": 0.01,
+    "GollumEvent": 0.02,
+}
+
+WORDS = ["fix", "add", "update", "remove", "refactor", "bump", "merge", "docs", "tests", "build", "readme", "config",
+         "version", "typo", "feature", "bug", "cleanup", "deps", "release", "ci", "lint", "api", "cache", "parser"]
+
+
+def parse_event_mix(event_mix):
+    """
+    :param event_mix: String like "PushEvent=0.5,WatchEvent=0.2".
+    :return: Dict with the weight of each event type.
+    """
+
+    mix = dict()
+    for item in event_mix.split(','):
+        event_type, weight = item.split('=')
+        mix[event_type.strip()] = float(weight)
+    return mix
+
+
+class ZipfSampler:
+    """
+    Sample ranks in [0, n) with probability proportional to 1 / (rank + 1) ** skew, skew 0 is uniform.
+    """
+
+    def __init__(self, n, skew, rand):
+        self.rand = rand
+        self.cumulative = list(accumulate(1 / (rank + 1) ** skew for rank in range(n)))
+        self.total = self.cumulative[-1]
+
+    def sample(self):
+        return min(bisect_left(self.cumulative, self.rand.random() * self.total), len(self.cumulative) - 1)
+
+
+class ArchiveGenerator:
+    """
+    Deterministic generator of GH Archive events: same parameters and seed, same events.
+    """
+
+    def __init__(self, num_repos=100_000, num_users=50_000, skew=1.1, event_mix=None, payload_size=200, merged_ratio=0.6, seed=0):
+        """
+        :param num_repos: Number of distinct repos the events can reference.
+        :param num_users: Number of distinct actors.
+        :param skew: Zipf skew of the repos and users activity (a few are in most events).
+        :param event_mix: Dict with the weight of each event type.
+        :param payload_size: Mean length of the free texts (commit messages, issue bodies...).
+        :param merged_ratio: Ratio of closed pull requests that are merged.
+        :param seed: Seed of the random generator.
+        """
+
+        self.rand = random.Random(seed)
+        self.num_repos = num_repos
+        self.num_users = num_users
+        self.payload_size = payload_size
+        self.merged_ratio = merged_ratio
+        self.repos = ZipfSampler(num_repos, skew, self.rand)
+        self.users = ZipfSampler(num_users, skew, self.rand)
+        event_mix = event_mix or DEFAULT_EVENT_MIX
+        self.event_types = list(event_mix)
+        self.event_weights = list(accumulate(event_mix.values()))
+        self.num_owners = max(1, num_repos // 3)
+        self.event_id = 0
+
+    def repo_name(self, rank):
+        # Owners are spread with a multiplicative hash so the popular repos don't share the owner
+        return f"owner{(rank * 2654435761) % self.num_owners}/repo{rank}"
+
+    def login(self, rank):
+        return f"user{rank}"
+
+    def text(self):
+        length = int(self.rand.expovariate(1 / self.payload_size)) if self.payload_size else 0
+        words = []
+        size = 0
+        while size < length:
+            word = self.rand.choice(WORDS)
+            words.append(word)
+            size += len(word) + 1
+        return " ".join(words)
+
+    def sha(self):
+        return "%040x" % self.rand.getrandbits(160)
+
+    def payload(self, event_type, repo_name, login):
+        rand = self.rand
+        if event_type == "PushEvent":
+            size = 1 + int(rand.expovariate(1 / 2))
+            return {
+                "push_id": rand.getrandbits(40), "size": size, "distinct_size": size, "ref": "refs/heads/main",
+                "head": self.sha(), "before": self.sha(),
+                "commits": [{"sha": self.sha(), "author": {"email": f"{login}@users.noreply.github.com", "name": login},
+                             "message": self.text(), "distinct": True,
+                             "url": f"https://api.github.com/repos/{repo_name}/commits/{i}"} for i in range(size)],
+            }
+
+        if event_type in ("CreateEvent", "DeleteEvent"):
+            ref_type = rand.choice(["branch", "branch", "tag"])
+            # Deleting the main branch is what marks a repo as deleted in the scraper, so it must happen sometimes
+            ref = rand.choice(["main", "master"]) if rand.random() < 0.05 else f"feature-{rand.getrandbits(16)}"
+            payload = {"ref": ref, "ref_type": ref_type, "pusher_type": "user"}
+            if event_type == "CreateEvent":
+                payload.update({"master_branch": "main", "description": self.text()})
+            return payload
+
+        if event_type in ("PullRequestEvent", "PullRequestReviewEvent"):
+            action = rand.choice(["opened", "closed", "closed", "reopened"]) if event_type == "PullRequestEvent" else "created"
+            merged = action == "closed" and rand.random() < self.merged_ratio
+            return {
+                "action": action, "number": rand.randrange(1, 5000),
+                "pull_request": {
+                    "title": self.text()[:80], "body": self.text(), "state": "closed" if action == "closed" else "open",
+                    "user": {"login": login}, "merged_at": "2023-01-01T00:00:00Z" if merged else None,
+                    "head": {"sha": self.sha()}, "base": {"repo": {"full_name": repo_name}},
+                },
+            }
+
+        if event_type in ("IssuesEvent", "IssueCommentEvent"):
+            return {"action": "created" if event_type == "IssueCommentEvent" else rand.choice(["opened", "closed"]),
+                    "issue": {"number": rand.randrange(1, 5000), "title": self.text()[:80], "body": self.text(), "user": {"login": login}},
+                    "comment": {"body": self.text()} if event_type == "IssueCommentEvent" else None}
+
+        if event_type == "ForkEvent":
+            return {"forkee": {"full_name": f"{login}/{repo_name.split('/')[1]}", "private": False}}
+
+        if event_type == "WatchEvent":
+            return {"action": "started"}
+
+        if event_type == "ReleaseEvent":
+            return {"action": "published", "release": {"tag_name": f"v{rand.randrange(10)}.{rand.randrange(20)}", "body": self.text()}}
+
+        return {}
+
+    def event(self, created_at):
+        """
+        :param created_at: The timestamp of the event.
+        :return: A dict with the fields of a GH Archive event.
+        """
+
+        self.event_id += 1
+        event_type = self.event_types[min(bisect_left(self.event_weights, self.rand.random() * self.event_weights[-1]), len(self.event_types) - 1)]
+        repo_rank = self.repos.sample()
+        user_rank = self.users.sample()
+        repo_name = self.repo_name(repo_rank)
+        login = self.login(user_rank)
+        return {
+            "id": str(20_000_000_000 + self.event_id),
+            "type": event_type,
+            "actor": {"id": user_rank, "login": login, "display_login": login, "gravatar_id": "",
+                      "url": f"https://api.github.com/users/{login}", "avatar_url": f"https://avatars.githubusercontent.com/u/{user_rank}?"},
+            "repo": {"id": repo_rank, "name": repo_name, "url": f"https://api.github.com/repos/{repo_name}"},
+            "payload": self.payload(event_type, repo_name, login),
+            "public": True,
+            "created_at": created_at,
+        }
+
+
+def generate_archive(output_folder, hours=3, events_per_hour=20_000, start="2023-01-01-0", compress=True, **generator_args):
+    """
+    Write GH Archive hour files (YYYY-MM-DD-H.json.gz) with synthetic events.
+
+    :param output_folder: The folder where the hour files are written.
+    :param hours: Number of hour files.
+    :param events_per_hour: Events of each hour file.
+    :param start: First hour, in the format of the GH Archive file names.
+    :param compress: Write gzip files like GH Archive, or plain json files like gh_downloader.py.
+    :param generator_args: Arguments of ArchiveGenerator.
+    :return: The list of files written.
+    """
+
+    os.makedirs(output_folder, exist_ok=True)
+    generator = ArchiveGenerator(**generator_args)
+    start_hour = datetime.strptime(start, "%Y-%m-%d-%H")
+    file_paths = []
+
+    for hour in range(hours):
+        hour_start = start_hour + timedelta(hours=hour)
+        file_name = f"{hour_start.year}-{hour_start.month:02d}-{hour_start.day:02d}-{hour_start.hour}.json"
+        file_path = os.path.join(output_folder, file_name + (".gz" if compress else ""))
+        if compress:
+            # mtime=0 so the same events give the same bytes
+            hour_file = io.TextIOWrapper(gzip.GzipFile(file_path, 'wb', mtime=0), encoding='utf-8')
+        else:
+            hour_file = open(file_path, 'w', encoding='utf-8')
+        with hour_file:
+            for i in range(events_per_hour):
+                created_at = (hour_start + timedelta(seconds=i * 3600 // events_per_hour)).strftime("%Y-%m-%dT%H:%M:%SZ")
+                hour_file.write(json.dumps(generator.event(created_at), separators=(',', ':')) + "\n")
+        file_paths.append(file_path)
+
+    return file_paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate deterministic synthetic GH Archive hour files.")
+    parser.add_argument('-o', '--output-folder', type=str, required=True, help="Folder where the hour files are written.")
+    parser.add_argument('--hours', type=int, default=3, help="Number of hour files.")
+    parser.add_argument('-e', '--events-per-hour', type=int, default=20_000, help="Events of each hour file.")
+    parser.add_argument('--start', type=str, default="2023-01-01-0", help="First hour (YYYY-MM-DD-H).")
+    parser.add_argument('-r', '--repos', type=int, default=100_000, help="Number of distinct repos.")
+    parser.add_argument('-u', '--users', type=int, default=50_000, help="Number of distinct users.")
+    parser.add_argument('--skew', type=float, default=1.1, help="Zipf skew of the repos and users activity (0 is uniform).")
+    parser.add_argument('--event-mix', type=str, default=None, help="Weights of the event types, e.g. PushEvent=0.6,WatchEvent=0.4.")
+    parser.add_argument('--payload-size', type=int, default=200, help="Mean length of the free texts of the payloads.")
+    parser.add_argument('--plain', action='store_true', help="Write plain json files (like gh_downloader.py) instead of gzip.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the random generator.")
+
+    args = parser.parse_args()
+    event_mix = parse_event_mix(args.event_mix) if args.event_mix else None
+    file_paths = generate_archive(args.output_folder, args.hours, args.events_per_hour, args.start, not args.plain, num_repos=args.repos,
+                                  num_users=args.users, skew=args.skew, event_mix=event_mix, payload_size=args.payload_size, seed=args.seed)
+    print(f"[+] {len(file_paths)} hour files written to {args.output_folder}")
@@ -0,0 +1,281 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+
+REPO_ALIAS_RE = re.compile(r'(\w+):\s*repository\(owner:\s*"([^"]*)",\s*name:\s*"([^"]*)"\)\s*\{')
+REPO_OWNER_RE = re.compile(r'\bowner\s*\{')
+USER_ALIAS_RE = re.compile(r'(\w+):\s*user\(login:\s*"([^"]*)"\)\s*\{')
+RATE_LIMIT_RE = re.compile(r'\brateLimit\s*\{')
+# A connection is a field selecting totalCount, nodes, edges or pageInfo (with or without pagination arguments)
+CONNECTION_RE = re.compile(r'\b\w+\s*(?:\([^)]*\))?\s*\{\s*(?:totalCount|nodes|edges|pageInfo)\b')
+
+
+def name_hash(name):
+    """
+    Deterministic integer derived from a repo or user name.
+
+    :param name: The name to hash.
+    :return: An integer.
+    """
+
+    return int(hashlib.md5(name.encode('utf-8')).hexdigest()[:8], 16)
+
+
+def query_cost(query):
+    """
+    Cost of a query following the GitHub GraphQL rate limit formula: the requests needed to fulfill every
+    connection of the query divided by 100 and rounded, at least 1 point. Nested connections aren't modelled
+    (the enhancer queries don't have them), so every connection is a single request.
+
+    :param query: The GraphQL query.
+    :return: The points charged for the query.
+    """
+
+    connections = len(CONNECTION_RE.findall(query))
+    return max(1, int(connections / 100 + 0.5))
+
+
+def fake_repo_data(full_name, inexistent_ratio, with_owner=False):
+    """
+    Deterministic fake data of a repository alias.
+
+    :param full_name: The full name of the repo.
+    :param inexistent_ratio: Ratio of repos reported as inexistent.
+    :param with_owner: Add the owner fields.
+    :return: The alias data, or None for inexistent repos.
+    """
+
+    h = name_hash(full_name)
+    if (h % 1000) < inexistent_ratio * 1000:
+        return None
+
+    repo_data = {
+        "nameWithOwner": full_name,
+        "stargazerCount": (h >> 10) % 5000,
+        "forks": {"totalCount": (h >> 12) % 500},
+        "watchers": {"totalCount": (h >> 14) % 200},
+        "isArchived": (h >> 3) % 20 == 0,
+        "isDisabled": (h >> 5) % 500 == 0,
+    }
+
+    if with_owner:
+        login = full_name.split('/')[0]
+        if name_hash(login) % 5 == 0:
+            repo_data["owner"] = {"login": login, "__typename": "Organization"}
+        else:
+            repo_data["owner"] = dict(fake_user_data(login, 0), login=login, __typename="User")
+
+    return repo_data
+
+
+def fake_user_data(username, inexistent_ratio):
+    """
+    Deterministic fake data of a user alias.
+
+    :param username: The username.
+    :param inexistent_ratio: Ratio of users reported as inexistent.
+    :return: The alias data, or None for inexistent users.
+    """
+
+    h = name_hash(username)
+    if (h % 1000) < inexistent_ratio * 1000:
+        return None
+
+    return {
+        "isSiteAdmin": h % 1000 == 1,
+        "isHireable": (h >> 4) % 4 == 0,
+        "isGitHubStar": (h >> 6) % 200 == 0,
+        "email": f"{username}@example.com" if (h >> 8) % 3 == 0 else "",
+        "company": f"company{h % 100}" if (h >> 9) % 3 == 0 else None,
+    }
+
+
+class MockGithubState:
+    """
+    Configuration and counters of the mock server, shared by all the request handlers.
+    """
+
+    def __init__(self, points_per_token=5000, window_secs=3600, latency_ms=200, latency_jitter_ms=100,
+                 error_502_ratio=0.0, inexistent_ratio=0.05, rate_limit_status=200, max_aliases=None, seed=0):
+        """
+        :param points_per_token: GraphQL points each token can spend per window.
+        :param window_secs: Seconds after which the points of every token are reset.
+        :param latency_ms: Mean latency of each response.
+        :param latency_jitter_ms: Standard deviation of the latency (normal distribution, truncated at 0).
+        :param error_502_ratio: Ratio of requests answered with a 502.
+        :param inexistent_ratio: Ratio of repos/users reported as inexistent.
+        :param rate_limit_status: Status code of rate limited responses (200 with errors like the real API, or 403).
+        :param max_aliases: Reject queries with more aliases than this (None for no limit).
+        :param seed: Seed of the random generator used for latencies and errors.
+        """
+
+        self.points_per_token = points_per_token
+        self.window_secs = window_secs
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_502_ratio = error_502_ratio
+        self.inexistent_ratio = inexistent_ratio
+        self.rate_limit_status = rate_limit_status
+        self.max_aliases = max_aliases
+        self.random = random.Random(seed)
+        self.lock = Lock()
+        self.window_start = time.monotonic()
+        self.tokens = dict()
+        self.stats = {"requests": 0, "ok": 0, "errors_502": 0, "rate_limited": 0, "aliases": 0, "points": 0}
+
+    def token_stats(self, token):
+        if token not in self.tokens:
+            self.tokens[token] = {"requests": 0, "points": 0, "rate_limited": 0, "window_points": 0}
+        return self.tokens[token]
+
+    def reset_window_if_needed(self):
+        if time.monotonic() - self.window_start >= self.window_secs:
+            self.window_start = time.monotonic()
+            for token_stats in self.tokens.values():
+                token_stats["window_points"] = 0
+
+    def snapshot(self):
+        """
+        :return: A copy of the global and per token counters.
+        """
+
+        with self.lock:
+            return {
+                "global": dict(self.stats),
+                "tokens": {token: dict(token_stats) for token, token_stats in self.tokens.items()},
+                "points_per_token": self.points_per_token,
+            }
+
+
+class MockGithubHandler(BaseHTTPRequestHandler):
+    state: MockGithubState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status_code, content):
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        state = self.state
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        query = payload.get("query", "")
+        token = self.headers.get("Authorization", "").replace("Bearer ", "")
+
+        repo_aliases = REPO_ALIAS_RE.findall(query)
+        user_aliases = USER_ALIAS_RE.findall(query)
+        num_aliases = len(repo_aliases) + len(user_aliases)
+        cost = query_cost(query)
+
+        with state.lock:
+            state.reset_window_if_needed()
+            state.stats["requests"] += 1
+            token_stats = state.token_stats(token)
+            token_stats["requests"] += 1
+            latency = max(0, state.random.gauss(state.latency_ms, state.latency_jitter_ms)) / 1000
+            is_502 = state.random.random() < state.error_502_ratio
+            is_rate_limited = not is_502 and token_stats["window_points"] + cost > state.points_per_token
+
+            if is_502:
+                state.stats["errors_502"] += 1
+            elif is_rate_limited:
+                state.stats["rate_limited"] += 1
+                token_stats["rate_limited"] += 1
+            else:
+                state.stats["ok"] += 1
+                state.stats["aliases"] += num_aliases
+                state.stats["points"] += cost
+                token_stats["points"] += cost
+                token_stats["window_points"] += cost
+
+            remaining = state.points_per_token - token_stats["window_points"]
+            reset_at = state.window_start + state.window_secs
+
+        time.sleep(latency)
+
+        if is_502:
+            self.send_response(502)
+            self.end_headers()
+            self.wfile.write(b"<html>502 Bad Gateway</html>")
+            return
+
+        if is_rate_limited:
+            errors = [{"type": "RATE_LIMITED", "message": "API rate limit exceeded for user ID 1."}]
+            if state.rate_limit_status == 200:
+                self.send_json(200, {"errors": errors})
+            else:
+                self.send_json(state.rate_limit_status, {"message": "API rate limit exceeded", "errors": errors})
+            return
+
+        if state.max_aliases and num_aliases > state.max_aliases:
+            self.send_json(200, {"errors": [{"message": f"Query has {num_aliases} aliases, max {state.max_aliases}"}], "data": None})
+            return
+
+        data = dict()
+        with_owner = bool(REPO_OWNER_RE.search(query))
+        for alias, owner, repo in repo_aliases:
+            data[alias] = fake_repo_data(f"{owner}/{repo}", state.inexistent_ratio, with_owner)
+        for alias, username in user_aliases:
+            data[alias] = fake_user_data(username, state.inexistent_ratio)
+
+        if RATE_LIMIT_RE.search(query):
+            data["rateLimit"] = {
+                "cost": cost,
+                "limit": state.points_per_token,
+                "remaining": remaining,
+                "resetAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + reset_at - time.monotonic())),
+            }
+
+        self.send_json(200, {"data": data})
+
+
+def start_mock_server(state, host="127.0.0.1", port=0):
+    """
+    Start the mock GraphQL server in a background thread.
+
+    :param state: The MockGithubState with the configuration of the server.
+    :param host: The host to listen on.
+    :param port: The port to listen on (0 for a random free one).
+    :return: A tuple with the server and the GraphQL url.
+    """
+
+    handler = type("BoundMockGithubHandler", (MockGithubHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/graphql"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in of the Github GraphQL API for the repository/user queries of gh_enhancer.")
+    parser.add_argument('-p', '--port', type=int, default=8787, help="Port to listen on.")
+    parser.add_argument('--points', type=int, default=5000, help="GraphQL points per token and window.")
+    parser.add_argument('--window', type=float, default=3600, help="Seconds of each rate limit window.")
+    parser.add_argument('--latency', type=float, default=200, help="Mean latency of the responses in ms.")
+    parser.add_argument('--jitter', type=float, default=100, help="Standard deviation of the latency in ms.")
+    parser.add_argument('--error-502', type=float, default=0.0, help="Ratio of requests answered with a 502.")
+    parser.add_argument('--rate-limit-status', type=int, default=200, help="Status code of rate limited responses.")
+
+    args = parser.parse_args()
+    state = MockGithubState(args.points, args.window, args.latency, args.jitter, args.error_502, rate_limit_status=args.rate_limit_status)
+    server, url = start_mock_server(state, port=args.port)
+    print(f"Mock Github GraphQL API listening on {url}. Use GITHUB_GRAPHQL_API_URL={url}")
+    try:
+        while True:
+            time.sleep(60)
+            print(json.dumps(state.snapshot()["global"]))
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,33 +1,274 @@
+import argparse
 import datetime
+import json
+import os
 import random
+import re
+import sys
+import zlib
 
-current_date = datetime.datetime.now()
-
-# Function to generate URLs
-def generate_urls(current_date):
-    urls = []
-    for year in range(2015, current_date.year + 1):
-        for month in range(1, 13):
-            if year == current_date.year and month > current_date.month:
-                break
-            for day in range(1, 32):
-                if year == current_date.year and month == current_date.month and day > current_date.day:
-                    break
-                for hour in range(0, 24):
-                    if year == current_date.year and month == current_date.month and day == current_date.day and hour > current_date.hour:
-                        break
-
-                    url = f"https://data.gharchive.org/{year}-{month:02d}-{day:02d}-{hour:02d}.json.gz"
-                    urls.append(url)
-    return urls
-
-urls = generate_urls(current_date)
-
-# Shuffle the URLs and get the first 100
-random.shuffle(urls)
-selected_urls = urls
-
-# Write the selected URLs to the output file
-with open("urls_list.txt", "w") as output_file:
-    for url in selected_urls:
-        output_file.write(f"{url}\n")
\ No newline at end of file
+
+GH_ARCHIVE_URL = "https://data.gharchive.org/{year}-{month:02d}-{day:02d}-{hour}.json.gz"
+# GH Archive starts at 2011-02-12 but the events before 2015 have another format
+DEFAULT_SINCE = "2015-01-01"
+ORDERS = ["chronological", "reverse", "shuffled"]
+
+# Attributes of the hours that can be used as strata of a sample
+STRATA_KEYS = {
+    "year": lambda hour: hour.year,
+    "month": lambda hour: hour.month,
+    "weekday": lambda hour: hour.weekday(),
+    "hour": lambda hour: hour.hour,
+}
+
+# The hour in a URL or in a file name written by gh_downloader.py (e.g. 2023-01-01-5.json_1.json)
+HOUR_REGEX = re.compile(r"(\d{4})-(\d{2})-(\d{2})-(\d{1,2})(?!\d)")
+
+
+def parse_hour(value, end=False):
+    """
+    :param value: A date (YYYY-MM-DD) or an hour (YYYY-MM-DD-H).
+    :param end: For dates, return the last hour of the day instead of the first one.
+    :return: The datetime of the hour.
+    """
+
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d-%H")
+    except ValueError:
+        day = datetime.datetime.strptime(value, "%Y-%m-%d")
+        return day + datetime.timedelta(hours=23) if end else day
+
+
+def hour_from_name(name):
+    """
+    :param name: A GH Archive URL or a file name containing the hour.
+    :return: The datetime of the hour, or None if the name doesn't contain an hour.
+    """
+
+    match = HOUR_REGEX.search(name)
+    if not match:
+        return None
+    try:
+        return datetime.datetime(*map(int, match.groups()))
+    except ValueError:
+        return None
+
+
+def hour_url(hour):
+    return GH_ARCHIVE_URL.format(year=hour.year, month=hour.month, day=hour.day, hour=hour.hour)
+
+
+def last_published_hour(now=None):
+    """
+    :return: The last complete hour, GH Archive publishes each hour after it ends.
+    """
+
+    now = now or datetime.datetime.utcnow()
+    return now.replace(minute=0, second=0, microsecond=0) - datetime.timedelta(hours=1)
+
+
+def hours_gen(since, until):
+    """
+    Generate every calendar hour between since and until (both included), so there are no invalid dates like Feb 30.
+    """
+
+    hour = since.replace(minute=0, second=0, microsecond=0)
+    while hour <= until:
+        yield hour
+        hour += datetime.timedelta(hours=1)
+
+
+def in_shard(hour, shard_index, shard_count):
+    """
+    Deterministic partition of the hours: the same hour is always in the same shard, in every machine and run.
+    """
+
+    return zlib.crc32(hour.strftime("%Y-%m-%d-%H").encode()) % shard_count == shard_index
+
+
+def existing_hours(manifests=(), folders=()):
+    """
+    :param manifests: Files with one URL (or file name) per line, e.g. the urls already processed.
+    :param folders: Folders with files named after the hours, e.g. the output of gh_downloader.py.
+    :return: Set with the datetimes of the hours found.
+    """
+
+    hours = set()
+    for manifest in manifests:
+        with open(manifest, 'r') as manifest_file:
+            hours.update(hour_from_name(line.strip()) for line in manifest_file)
+    for folder in folders:
+        hours.update(hour_from_name(file_name) for file_name in os.listdir(folder))
+    hours.discard(None)
+    return hours
+
+
+def generate_urls(since=None, until=None, order="chronological", shard=None, skip_hours=None, seed=None):
+    """
+    Generate the GH Archive URLs of the hours of a range lazily.
+
+    :param since: First hour (datetime), 2015-01-01 by default.
+    :param until: Last hour (datetime), the last published hour by default.
+    :param order: "chronological", "reverse" or "shuffled" (shuffling needs the hours of the range in memory).
+    :param shard: Tuple (index, count) to generate only the hours of one of count shards.
+    :param skip_hours: Set of hours (datetimes) to skip, e.g. the ones already downloaded.
+    :param seed: Seed of the shuffle, so different machines shuffle the same way.
+    :return: A generator of URLs.
+    """
+
+    since = since or parse_hour(DEFAULT_SINCE)
+    until = until or last_published_hour()
+
+    if order == "reverse":
+        hours = (until - datetime.timedelta(hours=i) for i in range(int((until - since).total_seconds() // 3600) + 1))
+    else:
+        hours = hours_gen(since, until)
+
+    if shard:
+        hours = (hour for hour in hours if in_shard(hour, *shard))
+    if skip_hours:
+        hours = (hour for hour in hours if hour not in skip_hours)
+
+    if order == "shuffled":
+        hours = list(hours)
+        random.Random(seed).shuffle(hours)
+
+    return (hour_url(hour) for hour in hours)
+
+
+def stratum_label(hour, strata):
+    """
+    :param strata: List of STRATA_KEYS names.
+    :return: The label of the stratum of the hour, e.g. "year=2023|weekday=6".
+    """
+
+    return "|".join(f"{key}={STRATA_KEYS[key](hour)}" for key in strata)
+
+
+def stratified_sample(since=None, until=None, strata=("year", "month"), sample_size=None, sample_ratio=None, min_per_stratum=2, seed=None):
+    """
+    Pick a stratified random sample of the hours of a range: the hours are grouped by the strata keys and every stratum
+    gets a share of the sample proportional to its hours (at least min_per_stratum, so its variance can be estimated).
+
+    :param strata: List of STRATA_KEYS names.
+    :param sample_size: Number of hours to sample (the minimum per stratum can add some more).
+    :param sample_ratio: Ratio of hours to sample, instead of sample_size.
+    :param seed: Seed of the sample.
+    :return: The sampling frame, a JSON serializable dict with the range, the strata and for each stratum its
+             number of hours and the sampled ones. The estimators need it to scale the results.
+    """
+
+    since = since or parse_hour(DEFAULT_SINCE)
+    until = until or last_published_hour()
+    rand = random.Random(seed)
+
+    population = dict()
+    for hour in hours_gen(since, until):
+        population.setdefault(stratum_label(hour, strata), []).append(hour)
+
+    total_hours = sum(len(hours) for hours in population.values())
+    if sample_size is None:
+        sample_size = round(total_hours * sample_ratio)
+
+    # Proportional allocation, the hours lost rounding down go to the strata with the largest remainders
+    quotas = {label: sample_size * len(hours) / total_hours for label, hours in population.items()}
+    allocation = {label: int(quota) for label, quota in quotas.items()}
+    # (shuffled first, so the ties are broken at random and not always in favour of the first strata)
+    labels = list(quotas)
+    rand.shuffle(labels)
+    for label in sorted(labels, key=lambda label: quotas[label] - allocation[label], reverse=True)[:sample_size - sum(allocation.values())]:
+        allocation[label] += 1
+
+    frame_strata = dict()
+    for label, hours in population.items():
+        stratum_size = min(len(hours), max(min_per_stratum, allocation[label]))
+        sampled = sorted(rand.sample(hours, stratum_size))
+        frame_strata[label] = {"population": len(hours), "sample": [hour.strftime("%Y-%m-%d-%H") for hour in sampled]}
+
+    return {
+        "since": since.strftime("%Y-%m-%d-%H"),
+        "until": until.strftime("%Y-%m-%d-%H"),
+        "strata_keys": list(strata),
+        "seed": seed,
+        "population_hours": total_hours,
+        "sample_hours": sum(len(stratum["sample"]) for stratum in frame_strata.values()),
+        "strata": frame_strata,
+    }
+
+
+def frame_urls(frame):
+    """
+    :return: The URLs of the hours sampled in a sampling frame.
+    """
+
+    return [hour_url(parse_hour(hour)) for stratum in frame["strata"].values() for hour in stratum["sample"]]
+
+
+def parse_shard(value):
+    """
+    :param value: String "i/N", with 0 <= i < N.
+    :return: The tuple (i, N).
+    """
+
+    index, count = map(int, value.split('/'))
+    if not 0 <= index < count:
+        raise ValueError(f"Invalid shard {value}")
+    return index, count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the GitHub Archive URLs of a range of hours.")
+    parser.add_argument('-o', '--output-file', type=str, default="urls_list.txt", help="The file where the URLs are written, - for stdout.")
+    parser.add_argument('--since', type=str, default=DEFAULT_SINCE, help="First date or hour (YYYY-MM-DD or YYYY-MM-DD-H).")
+    parser.add_argument('--until', type=str, default=None, help="Last date or hour (YYYY-MM-DD or YYYY-MM-DD-H), the last published hour by default.")
+    parser.add_argument('--order', type=str, choices=ORDERS, default="shuffled", help="Order of the URLs.")
+    parser.add_argument('--seed', type=int, default=None, help="Seed of the shuffle.")
+    parser.add_argument('--shard', type=str, default=None, help="Only the hours of the shard i of N (i/N), the same hour always goes to the same shard.")
+    parser.add_argument('--skip-manifest', type=str, nargs='+', default=[], help="Skip the hours of the URLs (or file names) listed in these files.")
+    parser.add_argument('--skip-folder', type=str, nargs='+', default=[], help="Skip the hours with files in these folders (e.g. the output of gh_downloader.py).")
+    sample_group = parser.add_argument_group("sampling", "Only a stratified random sample of the hours, see gh_sampler.py")
+    sample_group.add_argument('--sample', type=int, default=None, help="Number of hours to sample.")
+    sample_group.add_argument('--sample-ratio', type=float, default=None, help="Ratio of the hours to sample, instead of --sample.")
+    sample_group.add_argument('--strata', type=str, default="year,month", help=f"Comma separated strata of the sample ({','.join(STRATA_KEYS)}).")
+    sample_group.add_argument('--min-per-stratum', type=int, default=2, help="Minimum sampled hours of each stratum.")
+    sample_group.add_argument('--frame-file', type=str, default="sampling_frame.json", help="The file where the sampling frame is written.")
+
+    args = parser.parse_args()
+    try:
+        shard = parse_shard(args.shard) if args.shard else None
+        since = parse_hour(args.since)
+        until = parse_hour(args.until, end=True) if args.until else None
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.sample is not None or args.sample_ratio is not None:
+        strata = [key.strip() for key in args.strata.split(',') if key.strip()]
+        if set(strata) - set(STRATA_KEYS):
+            parser.error(f"Unknown strata: {', '.join(sorted(set(strata) - set(STRATA_KEYS)))}")
+        if shard or args.skip_manifest or args.skip_folder:
+            parser.error("--shard and --skip-* can't be used with a sample, the estimates need the whole range as population.")
+
+        frame = stratified_sample(since, until, strata, args.sample, args.sample_ratio, args.min_per_stratum, args.seed)
+        with open(args.frame_file, 'w') as frame_file:
+            json.dump(frame, frame_file, indent=2)
+        print(f"[+] Sampled {frame['sample_hours']} of {frame['population_hours']} hours in {len(frame['strata'])} strata, frame written to {args.frame_file}", file=sys.stderr)
+
+        urls = frame_urls(frame)
+        if args.order == "shuffled":
+            random.Random(args.seed).shuffle(urls)
+        elif args.order == "reverse":
+            urls.sort(key=hour_from_name, reverse=True)
+        else:
+            urls.sort(key=hour_from_name)
+    else:
+        skip_hours = existing_hours(args.skip_manifest, args.skip_folder) if args.skip_manifest or args.skip_folder else None
+        urls = generate_urls(since, until, args.order, shard, skip_hours, args.seed)
+
+    output_file = open(args.output_file, 'w') if args.output_file != "-" else sys.stdout
+    count = 0
+    for url in urls:
+        output_file.write(f"{url}\n")
+        count += 1
+    if args.output_file != "-":
+        output_file.close()
+    print(f"[+] {count} URLs written to {args.output_file}", file=sys.stderr)
@@ -0,0 +1,65 @@
+import argparse
+import json
+import os
+
+from lib.archive_cache import ArchiveCache, ORPHAN_GRACE_SECS
+
+
+def status_main(archive_cache):
+    """
+    Print the hours cached, the bytes of their archives and the limits.
+    """
+
+    print(json.dumps(archive_cache.status(), indent=2))
+
+
+def prune_main(archive_cache, orphan_grace_secs=ORPHAN_GRACE_SECS):
+    """
+    Evict the hours over the limits and delete the archives no hour uses.
+
+    :param orphan_grace_secs: Only delete the orphan files not modified for these seconds.
+    """
+
+    evicted = archive_cache.evict()
+    removed = archive_cache.remove_orphans(orphan_grace_secs)
+    print(f"[+] {evicted} hours evicted and {removed} orphan files deleted")
+    print(f"[+] Cache status: {archive_cache.status()}")
+
+
+def verify_main(archive_cache):
+    """
+    Check the size and the hash of every cached archive, the corrupt ones are dropped and downloaded again when used.
+    """
+
+    corrupt = archive_cache.verify_all()
+    for hour in corrupt:
+        print(f"[!] Corrupt archive of {hour} dropped")
+    print(f"[+] {archive_cache.status()['hours']} hours verified, {len(corrupt)} corrupt")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the cache of GH Archive hours shared by gh_downloader.py, gh_scraper.py, gh_pipeline.py and gh_sampler.py.")
+    parser.add_argument('-d', '--cache-dir', type=str, required=True, help="The folder of the archive cache (the --cache-dir of the other scripts).")
+    parser.add_argument('--max-gb', type=float, default=None, help="Disk quota to prune the cache to.")
+    parser.add_argument('--max-age-days', type=float, default=None, help="Prune the hours not used for this many days.")
+    parser.add_argument('--orphan-grace-secs', type=float, default=ORPHAN_GRACE_SECS, help="Prune only the orphan archives, temporary files and lock files older than this, newer ones may be being stored by a running process.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("status", help="Show the hours cached and their size.")
+    subparsers.add_parser("prune", help="Evict the hours over --max-gb or --max-age-days and delete the orphan archives and lock files.")
+    subparsers.add_parser("verify", help="Check the hash of every cached archive and drop the corrupt ones.")
+
+    args = parser.parse_args()
+    if not os.path.isdir(args.cache_dir):
+        parser.error("The folder specified by --cache-dir does not exist.")
+
+    archive_cache = ArchiveCache(args.cache_dir,
+                                 int(args.max_gb * 1024 ** 3) if args.max_gb is not None else None,
+                                 args.max_age_days * 24 * 3600 if args.max_age_days is not None else None)
+    if args.command == "status":
+        status_main(archive_cache)
+    elif args.command == "prune":
+        prune_main(archive_cache, args.orphan_grace_secs)
+    else:
+        verify_main(archive_cache)
+    archive_cache.close()
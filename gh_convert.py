@@ -0,0 +1,36 @@
+import argparse
+import os
+
+from lib.records import REPOS_KIND, USERS_KIND, is_records_file, csv_to_records, records_to_csv
+
+
+def main(input_file, output_file, kind=None):
+    """
+    Convert a repos/users csv into a binary records file or a records file into a csv, depending on the input.
+
+    :param input_file: The csv or records file to convert.
+    :param output_file: The converted file.
+    :param kind: repos or users, by default guessed from the header of the csv.
+    """
+
+    if is_records_file(input_file):
+        count = records_to_csv(input_file, output_file)
+        print(f"[+] {count} records converted to the csv {output_file}")
+    else:
+        kind = {"repos": REPOS_KIND, "users": USERS_KIND}.get(kind)
+        count = csv_to_records(input_file, output_file, kind)
+        print(f"[+] {count} rows converted to the records file {output_file}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert between the repos/users CSV files and the binary records files.")
+    parser.add_argument('-i', '--input-file', type=str, help="The csv or records file to convert.", required=True)
+    parser.add_argument('-o', '--output-file', type=str, help="The converted file.", required=True)
+    parser.add_argument('-k', '--kind', choices=["repos", "users"], help="Kind of the csv (guessed from its header by default).")
+
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.input_file):
+        parser.error("The file specified by --input-file does not exist.")
+
+    main(args.input_file, args.output_file, args.kind)
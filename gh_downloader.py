@@ -5,10 +5,15 @@ from queue import Queue
 from threading import Thread, Lock
 from tqdm import tqdm
 
+from lib import metrics
+from lib.archive_cache import add_cache_arguments, cache_from_args
 from lib.functions import download_file, decompress_gz, read_urls_from_file, splitlines_generator
+from lib.work_queue import WorkQueue, Heartbeat, leased_urls_gen
 
 
 PROGRESS_BAR_LOCK = Lock()
+# ArchiveCache the hours are read through (None to always download them)
+ARCHIVE_CACHE = None
 
 def write_content_to_file(decompressed_content, output_folder, file_prefix):
     """
@@ -58,12 +63,13 @@ def write_content_to_file(decompressed_content, output_folder, file_prefix):
             f.write(output)
 
 
-def worker(queue, progress_bar, output_folder):
+def worker(queue, progress_bar, output_folder, work_queue=None):
     """
     Worker function for threads. Continuously processes URLs from the queue until a sentinel value (None) is encountered.
 
     :param queue: A queue containing GitHub Archive URLs to process.
     :param progress_bar: A tqdm progress bar object to update as tasks are completed.
+    :param work_queue: The WorkQueue the URLs were leased from, they are marked as done or failed in it.
     """
 
     global PROGRESS_BAR_LOCK
@@ -72,22 +78,41 @@ def worker(queue, progress_bar, output_folder):
         url = queue.get()
         if url is None:
             break
-        
-        content = download_file(url)
-        if not content:
-            return
-        
-        decompressed_content = decompress_gz(content)
-        del content
-        if decompressed_content:
-            file_prefix = os.path.splitext(os.path.basename(url))[0]
-            write_content_to_file(decompressed_content.decode('utf-8'), output_folder, file_prefix)
-        
-        with PROGRESS_BAR_LOCK:
-            progress_bar.update()
 
-        queue.task_done()
-        
+        try:
+            content = ARCHIVE_CACHE.get(url) if ARCHIVE_CACHE else download_file(url)
+            if not content:
+                if work_queue:
+                    work_queue.fail(url, "download failed")
+                    continue
+                return
+
+            decompressed_content = decompress_gz(content)
+            del content
+            if decompressed_content:
+                file_prefix = os.path.splitext(os.path.basename(url))[0]
+                write_content_to_file(decompressed_content.decode('utf-8'), output_folder, file_prefix)
+                if work_queue:
+                    work_queue.complete([url])
+            else:
+                if ARCHIVE_CACHE:
+                    ARCHIVE_CACHE.discard(url)
+                if work_queue:
+                    work_queue.fail(url, "not gzip content")
+
+            with PROGRESS_BAR_LOCK:
+                progress_bar.update()
+
+        except Exception as e:
+            if not work_queue:
+                raise
+            # E.g. a truncated .gz or a full disk, the hour goes back to the queue and the thread keeps taking
+            # URLs so the bounded queue of process_github_archive_queue is never left full
+            print(f"[!] Error downloading {url}: {e!r}")
+            work_queue.fail(url, repr(e))
+
+        finally:
+            queue.task_done()
 
 
 def process_github_archive(urls, output_folder, num_threads):
@@ -108,7 +133,7 @@ def process_github_archive(urls, output_folder, num_threads):
     with tqdm(total=len(urls), desc="Processing URLs") as progress_bar:
         threads = []
         for _ in range(num_threads):
-            t = Thread(target=worker, args=(queue, progress_bar, output_folder))
+            t = Thread(target=worker, args=(queue, progress_bar, output_folder), name="download")
             t.start()
             threads.append(t)
 
@@ -124,7 +149,47 @@ def process_github_archive(urls, output_folder, num_threads):
             t.join()
 
 
-def main(urls_file_path, output_folder, num_threads, one_file_name):
+def process_github_archive_queue(work_queue, output_folder, num_threads, lease_batch=10, poll_interval=30):
+    """
+    Same as process_github_archive but leasing the URLs from a WorkQueue shared with other nodes until it's empty.
+    The URLs are leased only when a worker is about to need them and the leases are kept alive while downloading.
+
+    :param work_queue: The WorkQueue with the URLs.
+    :param output_folder: The folder path where the logs are written.
+    :param num_threads: The number of threads to use for processing URLs.
+    :param lease_batch: Number of URLs leased at once.
+    :param poll_interval: Seconds to wait for the hours leased by other nodes to be done or to come back.
+    """
+
+    # Bounded so the URLs are leased as the workers need them
+    queue = Queue(maxsize=num_threads)
+    heartbeat = Heartbeat(work_queue)
+
+    with tqdm(total=work_queue.status()["hours"]["pending"], desc="Processing URLs") as progress_bar:
+        threads = []
+        for _ in range(num_threads):
+            t = Thread(target=worker, args=(queue, progress_bar, output_folder, work_queue), name="download")
+            t.start()
+            threads.append(t)
+
+        try:
+            for url in leased_urls_gen(work_queue, lease_batch, poll_interval):
+                queue.put(url)
+
+            queue.join()
+            for _ in range(num_threads):
+                queue.put(None)
+            for t in threads:
+                t.join()
+        finally:
+            heartbeat.close()
+            # Hours leased and not done (e.g. interrupted with Ctrl+C) go back to the queue at once
+            work_queue.release()
+
+    print(f"[+] Queue status: {work_queue.status()['hours']}")
+
+
+def main(urls_file_path, output_folder, num_threads, one_file_name, queue_db=None, node=None, lease_secs=600, lease_batch=10, archive_cache=None):
     """
     Main function to download all github archive log files.
     
@@ -132,10 +197,23 @@ def main(urls_file_path, output_folder, num_threads, one_file_name):
     :param output_folder: The folder path where the final CSV files will be generated.
     :param num_threads: The number of threads to use for processing URLs.
     :param one_file_name: The file name of the final json file.
+    :param queue_db: Lease the URLs from this work queue (see gh_work_queue.py) instead of reading urls_file_path.
+    :param node: Id of this node in the work queue.
+    :param lease_secs: Seconds the leases last without heartbeats.
+    :param lease_batch: Number of URLs leased at once.
+    :param archive_cache: ArchiveCache to read the hours through, they are downloaded only if they aren't cached.
     """
-    
-    urls = read_urls_from_file(urls_file_path)
-    process_github_archive(urls, output_folder, num_threads)
+
+    global ARCHIVE_CACHE
+    ARCHIVE_CACHE = archive_cache
+
+    if queue_db:
+        work_queue = WorkQueue(queue_db, stage="download", node=node, lease_secs=lease_secs)
+        process_github_archive_queue(work_queue, output_folder, num_threads, lease_batch)
+        work_queue.close()
+    else:
+        urls = read_urls_from_file(urls_file_path)
+        process_github_archive(urls, output_folder, num_threads)
 
     # Get the list of JSON files in the source directory
     if one_file_name:
@@ -157,10 +235,25 @@ def main(urls_file_path, output_folder, num_threads, one_file_name):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process GitHub Archive URLs and generate unique repositories and users CSV files.")
-    parser.add_argument('-i', '--urls-file', type=str, help="The path of the file containing the GitHub Archive URLs.")
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument('-i', '--urls-file', type=str, help="The path of the file containing the GitHub Archive URLs.")
+    input_group.add_argument('-q', '--queue', type=str, help="Lease the URLs from this work queue file shared by several nodes (created with gh_work_queue.py).")
     parser.add_argument('-o', '--output-folder', type=str, help="The path of the folder where the CSV files will be generated.")
     parser.add_argument('-t', '--threads', type=int, default=4, help="Number of threads to use for processing URLs.")
     parser.add_argument('-1', '--one', type=str, default=4, help="Reduce the content to one file indicating the file name.")
+    parser.add_argument('--node', type=str, default=None, help="Id of this node in the work queue (hostname-pid by default).")
+    parser.add_argument('--lease-secs', type=float, default=600, help="Seconds a lease of the work queue lasts without heartbeats.")
+    parser.add_argument('--lease-batch', type=int, default=10, help="URLs leased from the work queue at once.")
+    add_cache_arguments(parser)
+    metrics.add_metrics_arguments(parser)
 
     args = parser.parse_args()
-    main(args.urls_file, args.output_folder, args.threads, args.one)
\ No newline at end of file
+    archive_cache = cache_from_args(args)
+    metrics.start_metrics_from_args(args)
+    try:
+        with metrics.stage("download"):
+            main(args.urls_file, args.output_folder, args.threads, args.one, args.queue, args.node, args.lease_secs, args.lease_batch, archive_cache)
+    finally:
+        metrics.stop_metrics()
+        if archive_cache:
+            archive_cache.close()
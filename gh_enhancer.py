@@ -1,127 +1,309 @@
 import argparse
-import csv
 import os
 import threading
 
+from itertools import chain, islice
 from typing import List
 
+from lib import metrics
 from lib.classes import Repository, User
-from lib.functions import get_repos_info, get_users_info, process_repos_in_batches, process_users_in_batches, count_lines, now_str
+from lib.compression import COMPRESSIONS, compressed_path, require_zstandard
+from lib.external_sort import external_sort
+from lib.functions import get_repos_info, get_users_info, get_assets_info, process_repos_in_batches, process_assets_in_batches, count_lines, now_str, \
+    load_csv_repo_file_gen, load_csv_user_file_gen, process_assets_by_priority, process_assets_by_cost, user_priority_score, \
+    prioritized_repos_gen, estimate_batch_cost, PointsBudget
+from lib.records import REPOS_KIND, USERS_KIND, RECORDS_EXTENSION
+from lib.row_index import DEFAULT_INDEX_EVERY
+from lib.writers import CSVWriter, RecordsWriter
 from threading import Lock
 from time import sleep
 
-# Locks for thread-safe writing to CSV files
-REPOS_LOCK = Lock()
-USERS_LOCK = Lock()
+REPOS_HEADER = ['full_name', 'stars', 'forks', 'watchers', 'deleted', 'private', 'archived', 'disabled']
+USERS_HEADER = ['user', 'repos_collab', 'deleted', 'site_admin', 'hireable', 'email', 'company', 'github_star']
+
 TOTAL_CHECKED = 0
 TOTAL_LOCK = Lock()
 
+# Ask the user fields of the repos owners in the repos queries and don't ask them again in the users pass
+WITH_OWNERS = False
+# User info of the repos owners found, shared by all the batches
+OWNERS_INFO = dict()
+# Every username written to the users csv, an owner found after its user was written isn't written again
+WRITTEN_USERS = set()
+OWNERS_LOCK = Lock()
+
+
+
+def write_repos_info(repos:List[Repository], repos_info, csv_writer):
+    """
+    Update the repos with the info obtained from Github and queue them in the writer
+
+    :param repos: A list of Repository objects checked.
+    :param repos_info: Dict with the info of each repo obtained from Github.
+    :param csv_writer: The CSVWriter where the information extracted is queued.
+    :return: None
+    """
+
+    repos_by_name = {repo.full_name: repo for repo in repos}
+    rows = []
+
+    for repo_full_name, repo_info in repos_info.items():
+        repo = repos_by_name[repo_full_name]
+
+        if repo_info["inexistent"]:
+            repo.stars = -1
+            repo.forks = -1
+            repo.watchers = -1
+            repo.archived = False
+            repo.disabled = False
+            repo.deleted = repo.deleted
+            repo.private = False if repo.deleted else True
+
+        else:
+            repo.stars = repo_info['stargazers_count']
+            repo.forks = repo_info['forks_count']
+            repo.watchers = repo_info['watchers_count']
+            repo.archived = repo_info['archived']
+            repo.disabled = repo_info['disabled']
+            repo.deleted = False
+            repo.private = False
+
+        rows.append([repo.full_name, repo.stars, repo.forks, repo.watchers, int(repo.deleted), int(repo.private), int(repo.archived), int(repo.disabled)])
+
+    csv_writer.write_rows(rows)
+
+
+def write_users_info(users: List[User], users_info, csv_writer):
+    """
+    Update the users with the info obtained from Github and queue them in the writer
+
+    :param users: A list of User objects checked.
+    :param users_info: Dict with the info of each user obtained from Github.
+    :param csv_writer: The CSVWriter where the information extracted is queued.
+    :return: None
+    """
+
+    users_by_name = {user.username: user for user in users}
+    rows = []
+
+    for username, user_info in users_info.items():
+        # Get original csv user
+        user = users_by_name[username]
+
+        if user_info["inexistent"]:
+            user.deleted=True
+
+        else:
+            user.site_admin=user_info['site_admin']
+            user.hireable=user_info['hireable']
+            user.email=user_info['email']
+            user.company=user_info['company']
+            user.github_star=user_info['github_star']
+
+        #Filter empty repos in user.repos_collab
+        user.repos_collab = list(filter(lambda item: item, user.repos_collab))
+        rows.append([user.username, ','.join(user.repos_collab), int(user.deleted), int(user.site_admin), int(user.hireable), user.email, user.company, int(user.github_star)])
+
+    if WITH_OWNERS:
+        mark_owners_written(users_info.keys())
+
+    csv_writer.write_rows(rows)
+
+
+def record_owners(repos_info):
+    """
+    Save the user info of the owners of the repos checked so they aren't asked again in the users pass.
+
+    :param repos_info: Dict with the info of each repo obtained from Github.
+    """
+
+    global OWNERS_INFO, OWNERS_LOCK
+
+    with OWNERS_LOCK:
+        for repo_info in repos_info.values():
+            owner_info = repo_info.get("owner")
+            if owner_info and owner_info["login"] not in OWNERS_INFO:
+                # Its user may have been written before the batch of the repo finished
+                owner_info["written"] = owner_info["login"] in WRITTEN_USERS
+                OWNERS_INFO[owner_info["login"]] = owner_info
+
+
+def mark_owners_written(usernames):
+    """
+    Mark the users and the owners already written to the users csv.
+
+    :param usernames: The usernames written.
+    """
+
+    global OWNERS_INFO, OWNERS_LOCK
+
+    with OWNERS_LOCK:
+        for username in usernames:
+            WRITTEN_USERS.add(username)
+            if username in OWNERS_INFO:
+                OWNERS_INFO[username]["written"] = True
+
+
+def split_known_owners(users: List[User]):
+    """
+    Split the users whose info was already obtained as owner of a repo from the ones that need to be asked.
+
+    :param users: A list of User objects to check.
+    :return: A tuple with the known users, a dict with their info and the list of users to ask.
+    """
+
+    global OWNERS_INFO, OWNERS_LOCK
+
+    known_users = []
+    known_users_info = dict()
+    users_to_ask = []
+
+    with OWNERS_LOCK:
+        for user in users:
+            owner_info = OWNERS_INFO.get(user.username)
+            if owner_info and not owner_info["written"]:
+                known_users.append(user)
+                known_users_info[user.username] = owner_info
+            else:
+                users_to_ask.append(user)
+
+    return known_users, known_users_info, users_to_ask
+
+
+def skip_known_owners(users, csv_writer, chunk_size=1000):
+    """
+    Write the users already known as repos owners and yield the rest, so the users batches are only
+    filled with users that need to be asked.
+
+    :param users: A generator of User objects.
+    :param csv_writer: The CSVWriter where the users information is queued.
+    :param chunk_size: Number of users checked at once.
+    """
+
+    while True:
+        chunk = list(islice(users, chunk_size))
+        if not chunk:
+            return
+
+        known_users, known_users_info, users_to_ask = split_known_owners(chunk)
+        if known_users:
+            write_users_info(known_users, known_users_info, csv_writer)
+            add_total_checked(len(known_users))
+
+        yield from users_to_ask
+
+
+def write_pending_owners(csv_writer):
+    """
+    Write the owners that never appeared in the users csv (they never were the actor of an event).
+
+    :param csv_writer: The CSVWriter where the users information is queued.
+    :return: The number of owners written.
+    """
+
+    global OWNERS_INFO, OWNERS_LOCK
+
+    with OWNERS_LOCK:
+        pending_info = {login: owner_info for login, owner_info in OWNERS_INFO.items() if not owner_info["written"]}
+
+    pending_users = [
+        User(username=login, repos_collab=list(), deleted=False, site_admin=False, hireable=False, email='', company='', github_star=False)
+        for login in pending_info
+    ]
+    write_users_info(pending_users, pending_info, csv_writer)
+    return len(pending_users)
 
 
-def check_repos(repos:List[Repository], gh_token_or_file, csv_path):
+def add_total_checked(num_checked):
+    """
+    Add the number of assets checked to the global counter and print it.
+
+    :param num_checked: The number of assets checked.
+    """
+
+    global TOTAL_CHECKED, TOTAL_LOCK
+
+    metrics.inc("assets_checked_total", num_checked)
+    with TOTAL_LOCK:
+        TOTAL_CHECKED += num_checked
+        print(f"{now_str()} Total assets checked: {TOTAL_CHECKED}", end='\r')
+
+
+def check_repos(repos:List[Repository], gh_token_or_file, csv_writer):
     """
     Write delailed info about the Github repos
 
     :param repos: A list of Repository objects to check.
     :param gh_token_or_file: Github token or file with tokens.
-    :param csv_path: The csv path to write the information extracted.
+    :param csv_writer: The CSVWriter where the information extracted is queued.
     :return: None
     """
 
-    global TOTAL_CHECKED, TOTAL_LOCK, REPOS_LOCK
-    repos_info = get_repos_info(repos, gh_token_or_file)
+    repos_info = get_repos_info(repos, gh_token_or_file, WITH_OWNERS)
 
     if not repos_info:
         return
 
-    with REPOS_LOCK:
-        with open(csv_path, 'a', newline='', encoding='utf-8') as repos_csv_file:
-            repos_csv_writer = csv.writer(repos_csv_file)
-            
-            for repo_full_name, repo_info in repos_info.items():
-
-                for repo in repos:
-                    if repo.full_name == repo_full_name:
-                        break
-                
-                if repo_info["inexistent"]:
-                    repo.stars = -1
-                    repo.forks = -1
-                    repo.watchers = -1
-                    repo.archived = False
-                    repo.disabled = False
-                    repo.deleted = repo.deleted
-                    repo.private = False if repo.deleted else True
+    if WITH_OWNERS:
+        record_owners(repos_info)
 
-                else:
-                    repo.stars = repo_info['stargazers_count']
-                    repo.forks = repo_info['forks_count']
-                    repo.watchers = repo_info['watchers_count']
-                    repo.archived = repo_info['archived']
-                    repo.disabled = repo_info['disabled']
-                    repo.deleted = False
-                    repo.private = False
-                
-                repos_csv_writer.writerow([repo.full_name, repo.stars, repo.forks, repo.watchers, int(repo.deleted), int(repo.private), int(repo.archived), int(repo.disabled)])
-    
-    with TOTAL_LOCK:
-        TOTAL_CHECKED += len(repos_info)
-        print(f"{now_str()} Total assets checked: {TOTAL_CHECKED}", end='\r')
+    write_repos_info(repos, repos_info, csv_writer)
+    add_total_checked(len(repos_info))
 
 
-def check_users(users: List[User], gh_token_or_file, csv_path):
+def check_users(users: List[User], gh_token_or_file, csv_writer):
     """
     Write delailed info about the Github users
 
     :param users: A lis of User objects to check.
     :param gh_token_or_file: Github token or file with tokens.
-    :param csv_path: The csv file to write the information extracted.
+    :param csv_writer: The CSVWriter where the information extracted is queued.
     :return: None
     """
 
-    global TOTAL_CHECKED, TOTAL_LOCK, USERS_LOCK
     users_info = get_users_info(users, gh_token_or_file)
 
     if not users_info:
         return
-    
-    with USERS_LOCK:
-        with open(csv_path, 'a', newline='', encoding='utf-8') as users_csv_file:
-            users_csv_writer = csv.writer(users_csv_file)
-            
-            for username, user_info in users_info.items():
-                # Get original csv user
-                for user in users:
-                    if user.username == username:
-                        break
-                
-                if user_info["inexistent"]:
-                    user.deleted=True
 
-                else:
-                    user.site_admin=user_info['site_admin']
-                    user.hireable=user_info['hireable']
-                    user.email=user_info['email']
-                    user.company=user_info['company']
-                    user.github_star=user_info['github_star']        
-
-                #Filter empty repos in user.repos_collab
-                user.repos_collab = list(filter(lambda item: item, user.repos_collab))
-                users_csv_writer.writerow([user.username, ','.join(user.repos_collab), int(user.deleted), int(user.site_admin), int(user.hireable), user.email, user.company, int(user.github_star)])
-    
-    with TOTAL_LOCK:
-        TOTAL_CHECKED += len(users_info)
-        print(f"{now_str()} Total assets checked: {TOTAL_CHECKED}", end='\r')
+    write_users_info(users, users_info, csv_writer)
+    add_total_checked(len(users_info))
+
+
+def check_assets(repos:List[Repository], users: List[User], gh_token_or_file, repos_writer, users_writer):
+    """
+    Write delailed info about Github repos and users asked in the same GraphQL request
+
+    :param repos: A list of Repository objects to check.
+    :param users: A list of User objects to check.
+    :param gh_token_or_file: Github token or file with tokens.
+    :param repos_writer: The CSVWriter where the repos information is queued.
+    :param users_writer: The CSVWriter where the users information is queued.
+    :return: None
+    """
+
+    assets_info = get_assets_info(repos, users, gh_token_or_file, WITH_OWNERS)
+
+    if not assets_info:
+        return
+
+    repos_info, users_info = assets_info
+    if WITH_OWNERS:
+        record_owners(repos_info)
 
+    write_repos_info(repos, repos_info, repos_writer)
+    write_users_info(users, users_info, users_writer)
+    add_total_checked(len(repos_info) + len(users_info))
 
 
-def parse_github_assets(assets, gh_token_or_file, csv_path):
+def parse_github_assets(assets, gh_token_or_file, repos_writer=None, users_writer=None):
     """
     Parse a single GitHub assets and obtain details about it.
 
     :param assets: The Github assets.
     :param gh_token_or_file: Github token or file with tokens.
-    :param csv_path: The csv path to write the information extracted.
+    :param repos_writer: The CSVWriter where the repos information is queued.
+    :param users_writer: The CSVWriter where the users information is queued.
     """
 
     users = []
@@ -135,18 +317,90 @@ def parse_github_assets(assets, gh_token_or_file, csv_path):
         else:
             print(f"Unknown asset type: {type(asset)}")
 
+    if WITH_OWNERS and users:
+        known_users, known_users_info, users = split_known_owners(users)
+        if known_users:
+            write_users_info(known_users, known_users_info, users_writer)
+            add_total_checked(len(known_users))
+
+        if not users and not repos:
+            return
+
     if users and repos:
+        if repos_writer and users_writer:
+            check_assets(repos, users, gh_token_or_file, repos_writer, users_writer)
+            return
+
         print(f"Somehow there are users and repos in the same batch. users: {len(users)} repos: {len(repos)}")
 
     if len(users) > len(repos):
-        check_users(users, gh_token_or_file, csv_path)
+        check_users(users, gh_token_or_file, users_writer)
 
     else:
-        check_repos(repos, gh_token_or_file, csv_path)
+        check_repos(repos, gh_token_or_file, repos_writer)
+
+
+
+def wait_for_threads(run_threads, max_num_threads):
+    """
+    Block until less than max_num_threads threads of run_threads are alive.
+
+    :param run_threads: The list of running threads, finished ones are removed from it.
+    :param max_num_threads: The number of threads allowed to keep running.
+    """
+
+    while len(run_threads) >= max_num_threads:
+        sleep(1)
+        for check_t in list(run_threads):
+            if not check_t.is_alive():
+                run_threads.remove(check_t)
+
+
+def parse_budgeted_assets(assets, gh_token_or_file, repos_writer, users_writer, budget, cost):
+    """
+    parse_github_assets releasing the points reserved for the batch when it's done.
+    """
+
+    try:
+        parse_github_assets(assets, gh_token_or_file, repos_writer, users_writer)
+    finally:
+        budget.release(cost)
+
 
+def run_batches(batches_generator, gh_token_or_file, max_num_threads, budget=None, repos_writer=None, users_writer=None):
+    """
+    Check every batch of assets in its own thread, keeping at most max_num_threads running.
+
+    :param batches_generator: Generator of batches of assets.
+    :param gh_token_or_file: Github token or file with tokens.
+    :param max_num_threads: The number of threads to use.
+    :param budget: The PointsBudget each batch is charged to (None for no limit).
+    :param repos_writer: The CSVWriter where the repos information is queued.
+    :param users_writer: The CSVWriter where the users information is queued.
+    :return: False if the points budget was exhausted.
+    """
+
+    run_threads = []
+    for batch_assets in batches_generator:
+        wait_for_threads(run_threads, max_num_threads)
+
+        if budget is None:
+            x = threading.Thread(target=parse_github_assets, args=(batch_assets, gh_token_or_file, repos_writer, users_writer), name="enrich")
+        else:
+            cost = estimate_batch_cost(batch_assets)
+            if not budget.reserve(cost):
+                print(f"{now_str()} Points budget exhausted ({budget.spent()} of {budget.points} points spent), stopping enrichment")
+                wait_for_threads(run_threads, 1)
+                return False
+            x = threading.Thread(target=parse_budgeted_assets, args=(batch_assets, gh_token_or_file, repos_writer, users_writer, budget, cost), name="enrich")
+        x.start()
+        run_threads.append(x)
 
+    wait_for_threads(run_threads, 1)
+    return True
 
-def main(users_file, repos_file, output_folder, gh_token_or_file, file_tokens, batch_size, max_num_threads):
+
+def main(users_file, repos_file, output_folder, gh_token_or_file, file_tokens, batch_size, max_num_threads, flush_rows=1000, flush_interval=5, priority=False, budget=None, mixed=False, max_cost=None, with_owners=False, binary=False, index_every=None, start_row=0, end_row=None, compression=None, contributors_file=None):
     """
     Main function to process csvs containing GitHub users and repos and write the results to CSV files.
 
@@ -157,60 +411,114 @@ def main(users_file, repos_file, output_folder, gh_token_or_file, file_tokens, b
     :param file_tokens: File containing Github tokens to use for API calls.
     :param batch_size: The size of the batch to ask Github graphql API at the same time.
     :param max_num_threads: The number of threads to use.
+    :param flush_rows: Number of buffered rows that makes the writers flush to disk.
+    :param flush_interval: Max seconds the writers keep rows buffered.
+    :param priority: Enrich the assets with the highest priority score first.
+    :param budget: Total GraphQL points to spend across repos and users (None for no limit).
+    :param mixed: Enrich repos and users in a single pass packing both in the same requests.
+    :param max_cost: Max estimated GraphQL points of each mixed request (None for no limit, batch_size caps them).
+    :param with_owners: Get the repos owners info in the repos queries, skip them in the users pass and write the ones not in the users file.
+    :param binary: Append the results to binary records files (repos.ghr and users.ghr) instead of csvs.
+    :param index_every: Keep a sidecar row index of the output csvs with the offset of every index_every rows.
+    :param start_row: Only enrich the rows of the input files from this one (rows are counted after the header).
+    :param end_row: Only enrich the rows of the input files before this one (None for the end of the files).
+    :param compression: Append the results to compressed csvs ("gz" or "zst"), each run adds a gzip member or zstd frame.
+    :param contributors_file: Users csv whose repos_collab gives the contributors of each repo, the main priority of the repos (users_file by default).
     :return: None
     """
 
+    global WITH_OWNERS
+    WITH_OWNERS = with_owners
+    OWNERS_INFO.clear()
+    WRITTEN_USERS.clear()
+
     gh_token_or_file = gh_token_or_file if gh_token_or_file else file_tokens
+    budget = PointsBudget(budget) if budget is not None else None
 
     os.makedirs(output_folder, exist_ok=True)
 
-    if repos_file:
-        num_lines = count_lines(repos_file)
-        print(f"Processing {num_lines} repositories")
-
-        repos_generator = process_repos_in_batches(repos_file, batch_size, skip_header=False)
-        repos_csv_path = os.path.join(output_folder, 'repos.csv')
+    # The scraper repos csvs have no stars, forks or watchers: the repos are prioritized by their contributors
+    contributors_file = contributors_file or users_file
+    if priority and repos_file:
+        if contributors_file:
+            print(f"{now_str()} Prioritizing the repos by their contributors in {contributors_file}")
+        else:
+            print("[!] Without a users file (-u or --contributors-file) the repos are prioritized only by their stars, forks and watchers")
+
+    repos_writer = None
+    users_writer = None
+
+    # The writer threads are daemons, their buffered rows (and their errors) are lost if they aren't closed
+    try:
+        if repos_file:
+            num_lines = count_lines(repos_file)
+            print(f"Processing {num_lines} repositories" + (f" (rows {start_row} to {end_row if end_row is not None else 'end'})" if start_row or end_row is not None else ""))
+            if binary:
+                repos_writer = RecordsWriter(os.path.join(output_folder, 'repos' + RECORDS_EXTENSION), REPOS_KIND, flush_rows=flush_rows, flush_interval=flush_interval)
+            else:
+                repos_csv_path = compressed_path(os.path.join(output_folder, 'repos.csv'), compression)
+                repos_writer = CSVWriter(repos_csv_path, header=REPOS_HEADER, flush_rows=flush_rows, flush_interval=flush_interval, index_every=index_every)
+
+        if users_file:
+            num_lines = count_lines(users_file)
+            print(f"Processing {num_lines} users" + (f" (rows {start_row} to {end_row if end_row is not None else 'end'})" if start_row or end_row is not None else ""))
+
+        if users_file or (with_owners and repos_file):
+            if binary:
+                users_writer = RecordsWriter(os.path.join(output_folder, 'users' + RECORDS_EXTENSION), USERS_KIND, flush_rows=flush_rows, flush_interval=flush_interval)
+            else:
+                users_csv_path = compressed_path(os.path.join(output_folder, 'users.csv'), compression)
+                users_writer = CSVWriter(users_csv_path, header=USERS_HEADER, flush_rows=flush_rows, flush_interval=flush_interval, index_every=index_every)
+
+        if mixed:
+            assets = []
+            if repos_file:
+                repos_gen = load_csv_repo_file_gen(repos_file, skip_header=False, start_row=start_row, end_row=end_row)
+                assets.append(prioritized_repos_gen(repos_gen, contributors_file) if priority else repos_gen)
+            if users_file:
+                users_gen = load_csv_user_file_gen(users_file, skip_header=False, start_row=start_row, end_row=end_row)
+                if with_owners:
+                    users_gen = skip_known_owners(users_gen, users_writer)
+                assets.append(external_sort(users_gen, key=user_priority_score, reverse=True) if priority else users_gen)
+
+            batches_generator = process_assets_by_cost(chain(*assets), max_cost, max_assets=batch_size)
+            run_batches(batches_generator, gh_token_or_file, max_num_threads, budget, repos_writer, users_writer)
 
-        with open(repos_csv_path, 'a', newline='', encoding='utf-8') as repos_csv_file:
-            repos_csv_writer = csv.writer(repos_csv_file)
-            repos_csv_writer.writerow(['full_name', 'stars', 'forks', 'watchers', 'deleted', 'private', 'archived', 'disabled'])
+        else:
+            budget_left = True
+            if repos_file:
+                if priority:
+                    repos_gen = prioritized_repos_gen(load_csv_repo_file_gen(repos_file, skip_header=False, start_row=start_row, end_row=end_row), contributors_file)
+                    repos_generator = process_assets_in_batches(repos_gen, batch_size)
+                else:
+                    repos_generator = process_repos_in_batches(repos_file, batch_size, skip_header=False, start_row=start_row, end_row=end_row)
 
-        run_threads = []
-        for batch_assets in repos_generator:
-            while len(run_threads) >= max_num_threads:
-                sleep(1)
-                for check_t in run_threads:
-                    if not check_t.is_alive():
-                        run_threads.remove(check_t)
+                budget_left = run_batches(repos_generator, gh_token_or_file, max_num_threads, budget, repos_writer=repos_writer)
 
-            x = threading.Thread(target=parse_github_assets, args=(batch_assets, gh_token_or_file, repos_csv_path))
-            x.start()
-            run_threads.append(x)
+            if users_file and budget_left:
+                users_gen = load_csv_user_file_gen(users_file, skip_header=False, start_row=start_row, end_row=end_row)
+                if with_owners:
+                    users_gen = skip_known_owners(users_gen, users_writer)
 
+                if priority:
+                    users_generator = process_assets_by_priority(users_gen, user_priority_score, batch_size)
+                else:
+                    users_generator = process_assets_in_batches(users_gen, batch_size)
 
-    if users_file:
-        num_lines = count_lines(users_file)
-        print(f"Processing {num_lines} users")
+                run_batches(users_generator, gh_token_or_file, max_num_threads, budget, users_writer=users_writer)
 
-        users_csv_path = os.path.join(output_folder, 'users.csv')
+        if with_owners and users_writer:
+            pending_owners = write_pending_owners(users_writer)
+            print(f"{now_str()} {len(OWNERS_INFO)} users obtained as repos owners, {pending_owners} of them weren't in the users file")
 
-        with open(users_csv_path, 'a', newline='', encoding='utf-8') as users_csv_file:
-            users_csv_writer = csv.writer(users_csv_file)
-            users_csv_writer.writerow(['user', 'repos_collab', 'deleted', 'site_admin', 'hireable', 'email', 'company', 'github_star'])
-            
-        run_threads = []
-        users_generator = process_users_in_batches(users_file, batch_size, skip_header=False)
-        for batch_assets in users_generator:
-            while len(run_threads) >= max_num_threads:
-                sleep(1)
-                for check_t in run_threads:
-                    if not check_t.is_alive():
-                        run_threads.remove(check_t)
+    finally:
+        try:
+            if repos_writer:
+                repos_writer.close()
+        finally:
+            if users_writer:
+                users_writer.close()
 
-            x = threading.Thread(target=parse_github_assets, args=(batch_assets, gh_token_or_file, users_csv_path))
-            x.start()
-            run_threads.append(x)
-            
 
 
 if __name__ == "__main__":
@@ -218,13 +526,28 @@ if __name__ == "__main__":
     parser.add_argument('-o', '--output-folder', type=str, help="The path of the folder where the CSV files are generated.", required=True)
     parser.add_argument('-u', '--users-file', type=str, help="The path of the file containing the users csv files.")
     parser.add_argument('-r', '--repos-file', type=str, help="The path of the file containing the repos csv files.")
-    parser.add_argument('-b', '--batch-size', type=int, default=300, help="The size of the batch to ask Github graphql API at the same time.")
+    parser.add_argument('-b', '--batch-size', type=int, default=300, help="The size of the batch to ask Github graphql API at the same time, also the max repos and users of each mixed request.")
     parser.add_argument('-t', '--threads', type=int, default=5, help="The number of threads to use.")
+    parser.add_argument('--flush-rows', type=int, default=1000, help="Number of buffered rows that makes the writers flush to disk.")
+    parser.add_argument('--flush-interval', type=float, default=5, help="Max seconds the writers keep rows buffered before flushing.")
+    parser.add_argument('-p', '--priority', action='store_true', help="Enrich the most interesting repos and users first instead of following the file order.")
+    parser.add_argument('--contributors-file', type=str, default=None, help="Users csv whose repos_collab gives the contributors of the repos, how -p prioritizes them (the --users-file by default).")
+    parser.add_argument('--budget', type=int, default=None, help="Total GraphQL points to spend (the cost GitHub reports for each request, every batch reserves its estimated cost first). Stops enriching when exhausted.")
+    parser.add_argument('-m', '--mixed', action='store_true', help="Enrich repos and users in a single pass packing both in the same requests.")
+    parser.add_argument('--max-cost', type=int, default=None, help="Max estimated GraphQL points of each mixed request (connections / 100, every repo asks for 2). By default only --batch-size limits them.")
+    parser.add_argument('--with-owners', action='store_true', help="Get the owners info in the repos queries and don't ask them again in the users pass.")
+    parser.add_argument('--binary', action='store_true', help="Append the results to binary records files (repos.ghr, users.ghr) instead of csvs.")
+    parser.add_argument('--row-index', type=int, nargs='?', const=DEFAULT_INDEX_EVERY, default=None, help=f"Keep a sidecar row index (.idx) of the output csvs with the offset of every N rows (default {DEFAULT_INDEX_EVERY}).")
+    parser.add_argument('--compress', type=str, choices=COMPRESSIONS, default=None, help="Append the results to compressed csvs (repos.csv.gz with pigz if installed, repos.csv.zst requires zstandard).")
+    parser.add_argument('--start-row', type=int, default=0, help="Only enrich the rows of the input files from this one, instant with a row index (see gh_index.py ranges).")
+    parser.add_argument('--end-row', type=int, default=None, help="Only enrich the rows of the input files before this one.")
     
     token_group = parser.add_mutually_exclusive_group(required=True)
     token_group.add_argument('-T', '--token', type=str, help="Github token to use for API calls.")
     token_group.add_argument('-f', '--file-tokens', type=str, help="File containing Github tokens to use for API calls.")
     
+    metrics.add_metrics_arguments(parser)
+
     args = parser.parse_args()
 
     if args.users_file is None and args.repos_file is None:
@@ -238,4 +561,20 @@ if __name__ == "__main__":
     if args.repos_file is not None and not os.path.isfile(args.repos_file):
         parser.error("The file specified by --repos-file does not exist.")
 
-    main(args.users_file, args.repos_file, args.output_folder, args.token, args.file_tokens, args.batch_size, args.threads)
+    if args.contributors_file is not None and not os.path.isfile(args.contributors_file):
+        parser.error("The file specified by --contributors-file does not exist.")
+
+    if args.compress and (args.binary or args.row_index):
+        parser.error("--compress can't be used with --binary or --row-index, compressed csvs can't be seeked.")
+    if args.compress == "zst":
+        try:
+            require_zstandard()
+        except ImportError as e:
+            parser.error(str(e))
+
+    metrics.start_metrics_from_args(args)
+    try:
+        with metrics.stage("enrich"):
+            main(args.users_file, args.repos_file, args.output_folder, args.token, args.file_tokens, args.batch_size, args.threads, args.flush_rows, args.flush_interval, args.priority, args.budget, args.mixed, args.max_cost, args.with_owners, args.binary, args.row_index, args.start_row, args.end_row, args.compress, args.contributors_file)
+    finally:
+        metrics.stop_metrics()
@@ -0,0 +1,77 @@
+import argparse
+import os
+import time
+
+from lib.compression import is_compressed
+from lib.row_index import DEFAULT_INDEX_EVERY, RowIndex, build_row_index, split_row_ranges, index_path, scan_rows
+
+
+def build_main(csv_files, every):
+    """
+    Write the sidecar row index of existing csvs.
+    """
+
+    for csv_file in csv_files:
+        start = time.time()
+        row_index = build_row_index(csv_file, every)
+        print(f"[+] {row_index.rows} rows of {csv_file} indexed in {time.time() - start:.1f}s ({index_path(csv_file)})")
+
+
+def count_main(csv_files):
+    """
+    Print the rows of the csvs, from their index when they have a valid one.
+    """
+
+    for csv_file in csv_files:
+        if is_compressed(csv_file):
+            print(f"{csv_file}: {scan_rows(csv_file)} rows (compressed, not indexed)")
+            continue
+        row_index = RowIndex.load(csv_file)
+        if row_index:
+            print(f"{csv_file}: {row_index.rows} rows")
+        else:
+            print(f"{csv_file}: no valid index, counting the rows")
+            print(f"{csv_file}: {build_row_index(csv_file).rows} rows (index written)")
+
+
+def ranges_main(csv_file, parts, every):
+    """
+    Print the exact row ranges splitting the csv in parts, e.g. for gh_enhancer.py --start-row/--end-row.
+    """
+
+    for start_row, end_row in split_row_ranges(csv_file, parts, every):
+        print(f"--start-row {start_row} --end-row {end_row}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and use the sidecar row indexes of the repos/users csvs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Index existing csvs.")
+    build_parser.add_argument('csv_files', nargs='+', help="The csvs to index.")
+    build_parser.add_argument('-k', '--every', type=int, default=DEFAULT_INDEX_EVERY, help="Rows between indexed offsets.")
+
+    count_parser = subparsers.add_parser("count", help="Count the rows of csvs.")
+    count_parser.add_argument('csv_files', nargs='+', help="The csvs to count.")
+
+    ranges_parser = subparsers.add_parser("ranges", help="Split a csv in exact row ranges for parallel workers.")
+    ranges_parser.add_argument('csv_file', help="The csv to split.")
+    ranges_parser.add_argument('-n', '--parts', type=int, required=True, help="Number of ranges.")
+    ranges_parser.add_argument('-k', '--every', type=int, default=DEFAULT_INDEX_EVERY, help="Rows between indexed offsets if the csv has to be indexed.")
+
+    args = parser.parse_args()
+
+    csv_files = args.csv_files if hasattr(args, "csv_files") else [args.csv_file]
+    for csv_file in csv_files:
+        if not os.path.isfile(csv_file):
+            parser.error(f"The file {csv_file} does not exist.")
+
+    if args.command == "build" and any(is_compressed(csv_file) for csv_file in csv_files):
+        parser.error("Compressed csvs can't be indexed, they can't be seeked.")
+
+    if args.command == "build":
+        build_main(args.csv_files, args.every)
+    elif args.command == "count":
+        count_main(args.csv_files)
+    else:
+        ranges_main(args.csv_file, args.parts, args.every)
@@ -2,161 +2,431 @@ import argparse
 import csv
 import os
 
-from lib.functions import load_csv_repo_file_gen, load_csv_user_file_gen
+from lib import metrics
+from lib.collab_index import CollabIndex, USER_HAS_EMAIL
+from lib.collab_graph import connected_components, pagerank, repo_projection, write_graph_stats
+from lib.columnar import np, RepoTable, write_stats
+from lib.compression import COMPRESSIONS, compressed_path, open_text, require_zstandard
+from lib.external_sort import ExternalSorter, TopK
+from lib.functions import load_csv_repo_file_gen, load_csv_user_file_gen, parse_repo_row, parse_user_row
+from lib.parallel_csv import load_csv_file_parallel_gen
+from lib.report_cache import ReportCache, copy_cached_report, derive_sorted_report
 
-def write_csv(output_folder, file_name, header, data):
-    os.makedirs(output_folder,exist_ok=True)
-    file_path = os.path.join(output_folder, file_name)
 
-    with open(file_path, 'w', newline='', encoding='utf-8') as csv_file:
+REPOS_REPORT_HEADER = ['owner', 'repo', 'stars', 'forks', 'watchers', 'deleted', 'private', 'archived', 'disabled']
+USERS_REPORT_HEADER = ['user', 'repos_collab', 'deleted', 'site_admin', 'hireable', 'email', 'company', 'github_star']
+REPOS_CONTRIBUTORS_REPORT_HEADER = REPOS_REPORT_HEADER + ['contributors']
+USERS_POPULAR_REPORT_HEADER = USERS_REPORT_HEADER + ['popular_repos']
+REPOS_PAGERANK_REPORT_HEADER = REPOS_REPORT_HEADER + ['pagerank']
+USERS_PAGERANK_REPORT_HEADER = USERS_REPORT_HEADER + ['pagerank']
+REPOS_CLUSTERS_REPORT_HEADER = ['cluster', 'cluster_users', 'cluster_repos'] + REPOS_REPORT_HEADER
+REPOS_CO_CONTRIBUTIONS_REPORT_HEADER = ['repo_a', 'repo_b', 'shared_contributors']
+
+# Compression of the reports written to the output folder ("gz", "zst" or None)
+COMPRESSION = None
+
+
+def report_name(file_name):
+    return compressed_path(file_name, COMPRESSION)
+
+def write_csv_file(file_path, header, data):
+    os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+
+    with open_text(file_path, 'w') as csv_file:
         csv_writer = csv.writer(csv_file)
         csv_writer.writerow(header)
 
         for row in data:
             csv_writer.writerow(row)
 
-def write_sort_repos_by_stars(output_folder, minimum_stars, repos):
-    repos_with_stars = [repo for repo in repos if repo.stars > minimum_stars]
-    sorted_repos = sorted(repos_with_stars, key=lambda repo: int(repo.stars), reverse=True)
-    header = ['owner', 'repo', 'stars', 'forks', 'watchers', 'deleted', 'private', 'archived', 'disabled']
-    data = [
-        (owner, repo_name, repo.stars, repo.forks, repo.watchers, repo.deleted, repo.private, repo.archived, repo.disabled)
-        for repo in sorted_repos
-        for owner, repo_name in [repo.full_name.split('/')]
+def write_csv(output_folder, file_name, header, data):
+    write_csv_file(os.path.join(output_folder, report_name(file_name)), header, data)
+
+def repo_report_row(repo):
+    owner, repo_name = repo.full_name.split('/')
+    return (owner, repo_name, repo.stars, repo.forks, repo.watchers, repo.deleted, repo.private, repo.archived, repo.disabled)
+
+def user_report_row(user):
+    return (user.username, ','.join(user.repos_collab), user.deleted, user.site_admin, user.hireable, user.email, user.company, user.github_star)
+
+
+class CSVReport:
+    """
+    Report consuming assets one by one from a streaming pass and writing the ones matching
+    its filter to its csv as they arrive.
+    """
+
+    def __init__(self, output_folder, file_name, header, filter_func, row_func, message):
+        """
+        :param output_folder: The folder where the report is written.
+        :param file_name: The file name of the report.
+        :param header: The header of the report csv.
+        :param filter_func: Function returning if an asset goes to the report.
+        :param row_func: Function transforming an asset into a csv row.
+        :param message: Message printed when the report is finished, formatted with count and file_name.
+        """
+        self.output_folder = output_folder
+        self.file_name = file_name
+        self.header = header
+        self.filter_func = filter_func
+        self.row_func = row_func
+        self.message = message
+        self.compression = COMPRESSION
+        # Don't print the message, e.g. for the reports written to the cache and not to the output folder
+        self.quiet = False
+        self.count = 0
+        self.csv_file = None
+        self.csv_writer = None
+
+    def path(self):
+        return compressed_path(os.path.join(self.output_folder, self.file_name), self.compression)
+
+    def start(self):
+        os.makedirs(self.output_folder, exist_ok=True)
+        self.csv_file = open_text(self.path(), 'w')
+        self.csv_writer = csv.writer(self.csv_file)
+        self.csv_writer.writerow(self.header)
+
+    def consume(self, asset):
+        if self.filter_func(asset):
+            self.csv_writer.writerow(self.row_func(asset))
+            self.count += 1
+
+    def finish(self):
+        self.csv_file.close()
+        self.print_message()
+
+    def print_message(self):
+        if not self.quiet:
+            print(self.message.format(count=self.count, file_name=self.file_name))
+
+
+class SortedCSVReport(CSVReport):
+    """
+    Report writing the assets matching its filter sorted (descending) when the pass ends. With top only the
+    top assets are kept in a bounded heap, otherwise all of them are sorted with an external merge sort
+    that spills runs of run_size rows to disk.
+    """
+
+    def __init__(self, output_folder, file_name, header, filter_func, row_func, message, sort_key, top=None, run_size=1_000_000):
+        """
+        :param sort_key: Function returning the key to sort the assets by (descending).
+        :param top: Only write the top assets (None to write all of them).
+        :param run_size: Max number of rows kept in memory by the external sort.
+        """
+        super().__init__(output_folder, file_name, header, filter_func, row_func, message)
+        self.sort_key = sort_key
+        self.top = top
+        self.run_size = run_size
+        self.sorter = None
+
+    def start(self):
+        # The (key, row) pairs are sorted instead of the assets to keep them small and picklable
+        if self.top:
+            self.sorter = TopK(self.top, key=lambda key_row: key_row[0])
+        else:
+            self.sorter = ExternalSorter(key=lambda key_row: key_row[0], reverse=True, run_size=self.run_size)
+
+    def consume(self, asset):
+        if self.filter_func(asset):
+            self.sorter.add((self.sort_key(asset), self.row_func(asset)))
+            self.count += 1
+
+    def finish(self):
+        if self.top:
+            self.count = min(self.count, self.top)
+        write_csv_file(self.path(), self.header, (row for _, row in self.sorter.sorted()))
+        self.sorter = None
+        self.print_message()
+
+
+def run_reports(assets, reports):
+    """
+    Feed every asset of a single streaming pass to all the reports.
+
+    :param assets: A generator of Repository or User objects.
+    :param reports: The reports consuming the assets.
+    """
+
+    for report in reports:
+        report.start()
+
+    for asset in assets:
+        for report in reports:
+            report.consume(asset)
+
+    for report in reports:
+        report.finish()
+
+
+def sort_repos_by_stars_report(output_folder, minimum_stars, top=None, run_size=1_000_000):
+    return SortedCSVReport(output_folder, 'repos_sorted_stars.csv', REPOS_REPORT_HEADER, lambda repo: repo.stars > minimum_stars, repo_report_row,
+                           "[+] {count} repos sorted by stars written to {file_name}", lambda repo: int(repo.stars), top, run_size)
+
+def sort_repos_by_forks_report(output_folder, minimum_forks, top=None, run_size=1_000_000):
+    return SortedCSVReport(output_folder, 'repos_sorted_forks.csv', REPOS_REPORT_HEADER, lambda repo: repo.forks > minimum_forks, repo_report_row,
+                           "[+] {count} repos sorted by forks written to {file_name}", lambda repo: int(repo.forks), top, run_size)
+
+def sort_repos_by_watchers_report(output_folder, minimum_watchers, top=None, run_size=1_000_000):
+    return SortedCSVReport(output_folder, 'repos_sorted_watchers.csv', REPOS_REPORT_HEADER, lambda repo: repo.watchers > minimum_watchers, repo_report_row,
+                           "[+] {count} repos sorted by watchers written to {file_name}", lambda repo: int(repo.watchers), top, run_size)
+
+def private_repos_report(output_folder):
+    return CSVReport(output_folder, 'repos_private.csv', REPOS_REPORT_HEADER, lambda repo: repo.private and int(repo.private) > 0, repo_report_row,
+                     "[+] {count} private repos written to {file_name}")
+
+def deleted_repos_report(output_folder):
+    return CSVReport(output_folder, 'repos_deleted.csv', REPOS_REPORT_HEADER, lambda repo: repo.deleted, repo_report_row,
+                     "[+] {count} deleted repos written to {file_name}")
+
+def archived_repos_report(output_folder):
+    return CSVReport(output_folder, 'repos_archived.csv', REPOS_REPORT_HEADER, lambda repo: repo.archived, repo_report_row,
+                     "[+] {count} archived repos written to {file_name}")
+
+def disabled_repos_report(output_folder):
+    return CSVReport(output_folder, 'repos_disabled.csv', REPOS_REPORT_HEADER, lambda repo: repo.disabled, repo_report_row,
+                     "[+] {count} disabled repos written to {file_name}")
+
+def site_admin_users_report(output_folder):
+    return CSVReport(output_folder, 'users_site_admin.csv', USERS_REPORT_HEADER, lambda user: user.site_admin, user_report_row,
+                     "[+] Site admin users written to {file_name}")
+
+def deleted_users_report(output_folder):
+    return CSVReport(output_folder, 'users_deleted.csv', USERS_REPORT_HEADER, lambda user: user.deleted, user_report_row,
+                     "[+] Deleted users written to {file_name}")
+
+def hireable_users_report(output_folder):
+    return CSVReport(output_folder, 'users_hireable.csv', USERS_REPORT_HEADER, lambda user: user.hireable, user_report_row,
+                     "[+] Hireable users written to {file_name}")
+
+def github_star_users_report(output_folder):
+    return CSVReport(output_folder, 'users_github_star.csv', USERS_REPORT_HEADER, lambda user: user.github_star, user_report_row,
+                     "[+] Github star users written to {file_name}")
+
+def email_users_report(output_folder):
+    return CSVReport(output_folder, 'users_email.csv', USERS_REPORT_HEADER, lambda user: user.email, user_report_row,
+                     "[+] Email users written to {file_name}")
+
+def company_users_report(output_folder):
+    return CSVReport(output_folder, 'users_company.csv', USERS_REPORT_HEADER, lambda user: user.company, user_report_row,
+                     "[+] Company users written to {file_name}")
+
+
+def write_repos_reports_from_table(table, output_folder, minimum_stars, minimum_forks, minimum_watchers, top=None):
+    """
+    Write the same repos reports as get_repos_reports but computed with vectorized operations over a RepoTable.
+    """
+
+    for column, minimum in (("stars", minimum_stars), ("forks", minimum_forks), ("watchers", minimum_watchers)):
+        indexes = table.sorted_indexes(column, mask=table.mask(**{f"min_{column}": minimum}), top=top)
+        write_csv(output_folder, f'repos_sorted_{column}.csv', REPOS_REPORT_HEADER, table.report_rows(indexes))
+        print(f"[+] {len(indexes)} repos sorted by {column} written to repos_sorted_{column}.csv")
+
+    for flag in ("private", "deleted", "archived", "disabled"):
+        indexes = table.indexes(table.mask(**{flag: True}))
+        write_csv(output_folder, f'repos_{flag}.csv', REPOS_REPORT_HEADER, table.report_rows(indexes))
+        print(f"[+] {len(indexes)} {flag} repos written to repos_{flag}.csv")
+
+
+def write_contributors_reports(index, table, output_folder, minimum_stars, min_popular_repos, top=None, run_size=1_000_000):
+    """
+    Reports joining the repos and the users through a CollabIndex built with the RepoTable.
+    Popular repos are the ones with more than minimum_stars stars.
+
+    :param min_popular_repos: Min number of popular repos a user with email has to contribute to.
+    :return: The users reports, they need a pass over the users csv yielding (user id, user) pairs.
+    """
+
+    popular_rows = table.mask(min_stars=minimum_stars)
+
+    # Popular repos with their contributors, sorted by stars
+    has_contributors = index.repo_degrees()[:len(table)] > 0
+    repo_rows = table.sorted_indexes("stars", mask=popular_rows & has_contributors, top=top)
+    rows = (
+        report_row + (','.join(index.usernames[user_id] for user_id in index.contributors_of(repo_row)),)
+        for repo_row, report_row in zip(repo_rows, table.report_rows(repo_rows))
+    )
+    write_csv(output_folder, 'repos_starred_contributors.csv', REPOS_CONTRIBUTORS_REPORT_HEADER, rows)
+    print(f"[+] {len(repo_rows)} starred repos with their contributors written to repos_starred_contributors.csv")
+
+    # Users with email contributing to several popular repos, the user rows come from a pass over the users csv
+    popular_counts = index.count_user_repos(index.repos_mask(popular_rows))
+    selected = (popular_counts >= min_popular_repos) & index.user_has(USER_HAS_EMAIL)
+    return [
+        SortedCSVReport(output_folder, 'users_email_popular_contributors.csv', USERS_POPULAR_REPORT_HEADER,
+                        lambda id_user: selected[id_user[0]],
+                        lambda id_user: user_report_row(id_user[1]) + (int(popular_counts[id_user[0]]),),
+                        "[+] {count} users with email contributing to popular repos written to {file_name}",
+                        sort_key=lambda id_user: int(popular_counts[id_user[0]]), top=top, run_size=run_size),
     ]
-    write_csv(output_folder, 'repos_sorted_stars.csv', header, data)
-    print(f"[+] {len(sorted_repos)} repos sorted by stars written to repos_sorted_stars.csv")
-
-
-def write_sort_repos_by_forks(output_folder, minimum_forks, repos):
-    repos_with_forks = [repo for repo in repos if repo.forks > minimum_forks]
-    sorted_repos = sorted(repos_with_forks, key=lambda repo: int(repo.forks), reverse=True)
-    header = ['owner', 'repo', 'stars', 'forks', 'watchers', 'deleted', 'private', 'archived', 'disabled']
-    data = [
-        (owner, repo_name, repo.stars, repo.forks, repo.watchers, repo.deleted, repo.private, repo.archived, repo.disabled)
-        for repo in sorted_repos
-        for owner, repo_name in [repo.full_name.split('/')]
+
+
+def write_graph_reports(index, table, output_folder, top=None, run_size=1_000_000, projection=False):
+    """
+    Reports from the collaboration graph of a CollabIndex built with the RepoTable: PageRank rankings,
+    clusters of repos sharing contributors, the graph stats and optionally the repos with more shared contributors.
+
+    :return: The users reports, they need a pass over the users csv yielding (user id, user) pairs.
+    """
+
+    user_ranks, repo_ranks = pagerank(index)
+    table_ranks = repo_ranks[:len(table)]
+
+    repo_rows = np.argsort(-table_ranks, kind='stable')[:top]
+    rows = (report_row + (float(table_ranks[repo_row]),) for repo_row, report_row in zip(repo_rows, table.report_rows(repo_rows)))
+    write_csv(output_folder, 'repos_pagerank.csv', REPOS_PAGERANK_REPORT_HEADER, rows)
+    print(f"[+] {len(repo_rows)} repos ranked by pagerank written to repos_pagerank.csv")
+
+    # Repos of the table in clusters with more than 1 repo, the biggest clusters first and by stars inside each cluster
+    _, repo_components, components_sizes = connected_components(index)
+    table_components = repo_components[:len(table)]
+    clustered = np.flatnonzero(components_sizes[table_components, 1] > 1)
+    repo_rows = clustered[np.lexsort((-table.stars[clustered], table_components[clustered]))][:top]
+    rows = (
+        (int(table_components[repo_row]), *components_sizes[table_components[repo_row]].tolist()) + report_row
+        for repo_row, report_row in zip(repo_rows, table.report_rows(repo_rows))
+    )
+    write_csv(output_folder, 'repos_clusters.csv', REPOS_CLUSTERS_REPORT_HEADER, rows)
+    print(f"[+] {len(repo_rows)} repos in clusters written to repos_clusters.csv")
+
+    if projection:
+        offsets, neighbours, weights = repo_projection(index)
+        sources = np.repeat(np.arange(index.num_repos), np.diff(offsets))
+        # Each pair is stored in both directions, keep one
+        pairs = np.flatnonzero(sources < neighbours)
+        pairs = pairs[np.argsort(-weights[pairs], kind='stable')][:top]
+        rows = ((index.repo_names[sources[pair]], index.repo_names[neighbours[pair]], int(weights[pair])) for pair in pairs)
+        write_csv(output_folder, 'repos_co_contributions.csv', REPOS_CO_CONTRIBUTIONS_REPORT_HEADER, rows)
+        print(f"[+] {len(pairs)} pairs of repos with shared contributors written to repos_co_contributions.csv")
+
+    write_graph_stats(index, components_sizes, output_folder)
+
+    return [
+        SortedCSVReport(output_folder, 'users_pagerank.csv', USERS_PAGERANK_REPORT_HEADER, lambda id_user: True,
+                        lambda id_user: user_report_row(id_user[1]) + (float(user_ranks[id_user[0]]),),
+                        "[+] {count} users ranked by pagerank written to {file_name}",
+                        sort_key=lambda id_user: float(user_ranks[id_user[0]]), top=top, run_size=run_size),
     ]
-    write_csv(output_folder, 'repos_sorted_forks.csv', header, data)
-    print(f"[+] {len(sorted_repos)} repos sorted by forks written to repos_sorted_forks.csv")
-
-def write_sort_repos_by_watchers(output_folder, minimum_watchers, repos):
-    repos_with_watchers = [repo for repo in repos if repo.watchers > minimum_watchers]
-    sorted_repos = sorted(repos_with_watchers, key=lambda repo: int(repo.watchers), reverse=True)
-    header = ['owner', 'repo', 'stars', 'forks', 'watchers', 'deleted', 'private', 'archived', 'disabled']
-    data = [
-        (owner, repo_name, repo.stars, repo.forks, repo.watchers, repo.deleted, repo.private, repo.archived, repo.disabled)
-        for repo in sorted_repos
-        for owner, repo_name in [repo.full_name.split('/')]
+
+
+def get_repos_reports(output_folder, minimum_stars, minimum_forks, minimum_watchers, top=None, run_size=1_000_000):
+    """
+    All the reports generated from the repos csv.
+    """
+    return [
+        sort_repos_by_stars_report(output_folder, minimum_stars, top, run_size),
+        sort_repos_by_forks_report(output_folder, minimum_forks, top, run_size),
+        sort_repos_by_watchers_report(output_folder, minimum_watchers, top, run_size),
+        private_repos_report(output_folder),
+        deleted_repos_report(output_folder),
+        archived_repos_report(output_folder),
+        disabled_repos_report(output_folder),
     ]
-    write_csv(output_folder, 'repos_sorted_watchers.csv', header, data)
-    print(f"[+] {len(sorted_repos)} repos sorted by watchers written to repos_sorted_watchers.csv")
 
-def write_private_repos(output_folder, repos):
-    private_repos = [repo for repo in repos if repo.private and int(repo.private) > 0]
-    header = ['owner', 'repo', 'stars', 'forks', 'watchers', 'deleted', 'private', 'archived', 'disabled']
-    data = [
-        (owner, repo_name, repo.stars, repo.forks, repo.watchers, repo.deleted, repo.private, repo.archived, repo.disabled)
-        for repo in private_repos
-        for owner, repo_name in [repo.full_name.split('/')]
+def get_users_reports(output_folder):
+    """
+    All the reports generated from the users csv.
+    """
+    return [
+        site_admin_users_report(output_folder),
+        deleted_users_report(output_folder),
+        hireable_users_report(output_folder),
+        github_star_users_report(output_folder),
+        email_users_report(output_folder),
+        company_users_report(output_folder),
     ]
-    write_csv(output_folder, 'repos_private.csv', header, data)
-    print(f"[+] {len(private_repos)} private repos written to repos_private.csv")
+
+
+def run_cached_reports(cache, input_file, kind, assets_func, reports_func, output_folder, sorted_params=None, top=None):
+    """
+    Generate the reports of an input through the cache. On a miss the input is parsed once to write to its cache
+    entry the reports that don't depend on the parameters, with the sorted reports keeping all the assets. The final
+    sorted reports are derived from those for each minimum and top and cached too, the rest are copied as they are.
+
+    :param cache: The ReportCache.
+    :param input_file: The input csv.
+    :param kind: repos or users.
+    :param assets_func: Function returning the generator of assets of the input, only called on a miss.
+    :param reports_func: Function receiving a folder and returning the reports keeping all the assets.
+    :param output_folder: The folder where the reports are written.
+    :param sorted_params: Dict from the sorted reports file names to their (sort column, minimum) in this run.
+    :param top: Only write the top assets of the sorted reports.
+    """
+
+    sorted_params = sorted_params or dict()
+    entry_folder = cache.entry(input_file, kind)
+    if cache.is_complete(entry_folder):
+        print(f"[cache] Hit for {input_file}")
+    else:
+        print(f"[cache] Miss for {input_file}, parsing it")
+        reports = reports_func(entry_folder)
+        # The cache keeps the reports uncompressed, they are compressed when copied to the output folder. Their
+        # counts are printed when the final reports are copied, they can be derived with other minimums
+        for report in reports:
+            report.compression = None
+            report.quiet = True
+        run_reports(assets_func(), reports)
+        cache.mark_complete(entry_folder)
+
+    for report in reports_func(entry_folder):
+        cached_path = os.path.join(entry_folder, report.file_name)
+        if report.file_name in sorted_params:
+            column, minimum = sorted_params[report.file_name]
+            derived_path = cache.derived_path(entry_folder, report.file_name, {"minimum": minimum, "top": top})
+            if os.path.isfile(derived_path):
+                print(f"[cache] Hit for {report.file_name} with minimum {minimum} and top {top}")
+            else:
+                print(f"[cache] Miss for {report.file_name} with minimum {minimum} and top {top}, deriving it")
+                derive_sorted_report(cached_path, derived_path, report.header.index(column), minimum, top)
+            cached_path = derived_path
+
+        count = copy_cached_report(cached_path, output_folder, report_name(report.file_name))
+        print(report.message.format(count=count, file_name=report.file_name))
+
+
+def write_sort_repos_by_stars(output_folder, minimum_stars, repos, top=None, run_size=1_000_000):
+    run_reports(repos, [sort_repos_by_stars_report(output_folder, minimum_stars, top, run_size)])
+
+def write_sort_repos_by_forks(output_folder, minimum_forks, repos, top=None, run_size=1_000_000):
+    run_reports(repos, [sort_repos_by_forks_report(output_folder, minimum_forks, top, run_size)])
+
+def write_sort_repos_by_watchers(output_folder, minimum_watchers, repos, top=None, run_size=1_000_000):
+    run_reports(repos, [sort_repos_by_watchers_report(output_folder, minimum_watchers, top, run_size)])
+
+def write_private_repos(output_folder, repos):
+    run_reports(repos, [private_repos_report(output_folder)])
 
 def write_deleted_repos(output_folder, repos):
-    private_repos = [repo for repo in repos if repo.deleted]
-    header = ['owner', 'repo', 'stars', 'forks', 'watchers', 'deleted', 'private', 'archived', 'disabled']
-    data = [
-        (owner, repo_name, repo.stars, repo.forks, repo.watchers, repo.deleted, repo.private, repo.archived, repo.disabled)
-        for repo in private_repos
-        for owner, repo_name in [repo.full_name.split('/')]
-    ]
-    write_csv(output_folder, 'repos_deleted.csv', header, data)
-    print(f"[+] {len(private_repos)} deleted repos written to repos_deleted.csv")
+    run_reports(repos, [deleted_repos_report(output_folder)])
 
 def write_archived_repos(output_folder, repos):
-    private_repos = [repo for repo in repos if repo.archived]
-    header = ['owner', 'repo', 'stars', 'forks', 'watchers', 'deleted', 'private', 'archived', 'disabled']
-    data = [
-        (owner, repo_name, repo.stars, repo.forks, repo.watchers, repo.deleted, repo.private, repo.archived, repo.disabled)
-        for repo in private_repos
-        for owner, repo_name in [repo.full_name.split('/')]
-    ]
-    write_csv(output_folder, 'repos_archived.csv', header, data)
-    print(f"[+] {len(private_repos)} archived repos written to repos_archived.csv")
+    run_reports(repos, [archived_repos_report(output_folder)])
 
 def write_disabled_repos(output_folder, repos):
-    private_repos = [repo for repo in repos if repo.disabled]
-    header = ['owner', 'repo', 'stars', 'forks', 'watchers', 'deleted', 'private', 'archived', 'disabled']
-    data = [
-        (owner, repo_name, repo.stars, repo.forks, repo.watchers, repo.deleted, repo.private, repo.archived, repo.disabled)
-        for repo in private_repos
-        for owner, repo_name in [repo.full_name.split('/')]
-    ]
-    write_csv(output_folder, 'repos_disabled.csv', header, data)
-    print(f"[+] {len(private_repos)} disabled repos written to repos_disabled.csv")
+    run_reports(repos, [disabled_repos_report(output_folder)])
 
 def write_site_admin_users(output_folder, users):
-    site_admin_users = [user for user in users if user.site_admin]
-    header = ['user', 'repos_collab', 'deleted', 'site_admin', 'hireable', 'email', 'company', 'github_star']
-    data = [
-        (user.username, ','.join(user.repos_collab), user.deleted, user.site_admin, user.hireable, user.email, user.company, user.github_star)
-        for user in site_admin_users
-    ]
-    write_csv(output_folder, 'users_site_admin.csv', header, data)
-    print("[+] Site admin users written to users_site_admin.csv")
+    run_reports(users, [site_admin_users_report(output_folder)])
 
 def write_deleted_users(output_folder, users):
-    site_admin_users = [user for user in users if user.deleted]
-    header = ['user', 'repos_collab', 'deleted', 'site_admin', 'hireable', 'email', 'company', 'github_star']
-    data = [
-        (user.username, ','.join(user.repos_collab), user.deleted, user.site_admin, user.hireable, user.email, user.company, user.github_star)
-        for user in site_admin_users
-    ]
-    write_csv(output_folder, 'users_deleted.csv', header, data)
-    print("[+] Deleted users written to users_deleted.csv")
+    run_reports(users, [deleted_users_report(output_folder)])
 
 def write_hireable_users(output_folder, users):
-    site_admin_users = [user for user in users if user.hireable]
-    header = ['user', 'repos_collab', 'deleted', 'site_admin', 'hireable', 'email', 'company', 'github_star']
-    data = [
-        (user.username, ','.join(user.repos_collab), user.deleted, user.site_admin, user.hireable, user.email, user.company, user.github_star)
-        for user in site_admin_users
-    ]
-    write_csv(output_folder, 'users_hireable.csv', header, data)
-    print("[+] Hireable users written to users_hireable.csv")
+    run_reports(users, [hireable_users_report(output_folder)])
 
 def write_github_star_users(output_folder, users):
-    site_admin_users = [user for user in users if user.github_star]
-    header = ['user', 'repos_collab', 'deleted', 'site_admin', 'hireable', 'email', 'company', 'github_star']
-    data = [
-        (user.username, ','.join(user.repos_collab), user.deleted, user.site_admin, user.hireable, user.email, user.company, user.github_star)
-        for user in site_admin_users
-    ]
-    write_csv(output_folder, 'users_github_star.csv', header, data)
-    print("[+] Github star users written to users_github_star.csv")
+    run_reports(users, [github_star_users_report(output_folder)])
 
 def write_email_users(output_folder, users):
-    site_admin_users = [user for user in users if user.email]
-    header = ['user', 'repos_collab', 'deleted', 'site_admin', 'hireable', 'email', 'company', 'github_star']
-    data = [
-        (user.username, ','.join(user.repos_collab), user.deleted, user.site_admin, user.hireable, user.email, user.company, user.github_star)
-        for user in site_admin_users
-    ]
-    write_csv(output_folder, 'users_email.csv', header, data)
-    print("[+] Email users written to users_email.csv")
+    run_reports(users, [email_users_report(output_folder)])
 
 def write_company_users(output_folder, users):
-    site_admin_users = [user for user in users if user.company]
-    header = ['user', 'repos_collab', 'deleted', 'site_admin', 'hireable', 'email', 'company', 'github_star']
-    data = [
-        (user.username, ','.join(user.repos_collab), user.deleted, user.site_admin, user.hireable, user.email, user.company, user.github_star)
-        for user in site_admin_users
-    ]
-    write_csv(output_folder, 'users_company.csv', header, data)
-    print("[+] Company users written to users_company.csv")
+    run_reports(users, [company_users_report(output_folder)])
+
+def main(users_file, repos_file, logs_folder, output_folder, minimum_stars, minimum_forks, minimum_watchers, top=None, sort_run_size=1_000_000, processes=1, cache_folder=None, columnar_folder=None, stats=False, collab_folder=None, min_popular_repos=2, graph=False, projection=False, compression=None, cache_keep=None):
+    global COMPRESSION
+    COMPRESSION = compression
 
-def main(users_file, repos_file, logs_folder, output_folder, minimum_stars, minimum_forks, minimum_watchers):
     if logs_folder:
         temp_users_file = os.path.join(output_folder, "users.csv")
         if os.path.isfile(temp_users_file):
@@ -170,22 +440,50 @@ def main(users_file, repos_file, logs_folder, output_folder, minimum_stars, mini
         print("No input files found")
         return
 
-    if repos_file:
-        write_sort_repos_by_stars(output_folder, minimum_stars, load_csv_repo_file_gen(repos_file))
-        write_sort_repos_by_forks(output_folder, minimum_forks, load_csv_repo_file_gen(repos_file))
-        write_sort_repos_by_watchers(output_folder, minimum_watchers, load_csv_repo_file_gen(repos_file))
-        write_private_repos(output_folder, load_csv_repo_file_gen(repos_file))
-        write_deleted_repos(output_folder, load_csv_repo_file_gen(repos_file))
-        write_archived_repos(output_folder, load_csv_repo_file_gen(repos_file))
-        write_disabled_repos(output_folder, load_csv_repo_file_gen(repos_file))
+    # A single pass over each csv feeds all its reports
+    cache = ReportCache(cache_folder) if cache_folder else None
+    table = None
+    if repos_file and (columnar_folder or stats or collab_folder):
+        table = RepoTable.from_csv_cached(repos_file, columnar_folder) if columnar_folder else RepoTable.from_csv(repos_file)
+
+    if table is not None:
+        write_repos_reports_from_table(table, output_folder, minimum_stars, minimum_forks, minimum_watchers, top)
+        if stats:
+            write_stats(table, output_folder)
+
+    elif repos_file:
+        repos_func = lambda: load_csv_file_parallel_gen(repos_file, parse_repo_row, processes) if processes > 1 else load_csv_repo_file_gen(repos_file)
+        if cache:
+            all_repos = float('-inf')
+            sorted_params = {
+                'repos_sorted_stars.csv': ('stars', minimum_stars),
+                'repos_sorted_forks.csv': ('forks', minimum_forks),
+                'repos_sorted_watchers.csv': ('watchers', minimum_watchers),
+            }
+            run_cached_reports(cache, repos_file, "repos", repos_func,
+                               lambda folder: get_repos_reports(folder, all_repos, all_repos, all_repos, None, sort_run_size),
+                               output_folder, sorted_params, top)
+        else:
+            run_reports(repos_func(), get_repos_reports(output_folder, minimum_stars, minimum_forks, minimum_watchers, top, sort_run_size))
 
     if users_file:
-        write_site_admin_users(output_folder, load_csv_user_file_gen(users_file))
-        write_deleted_users(output_folder, load_csv_user_file_gen(users_file))
-        write_hireable_users(output_folder, load_csv_user_file_gen(users_file))
-        write_github_star_users(output_folder, load_csv_user_file_gen(users_file))
-        write_email_users(output_folder, load_csv_user_file_gen(users_file))
-        write_company_users(output_folder, load_csv_user_file_gen(users_file))
+        users_func = lambda: load_csv_file_parallel_gen(users_file, parse_user_row, processes) if processes > 1 else load_csv_user_file_gen(users_file)
+        if cache:
+            run_cached_reports(cache, users_file, "users", users_func, get_users_reports, output_folder)
+        else:
+            run_reports(users_func(), get_users_reports(output_folder))
+
+    if cache and cache_keep:
+        removed = cache.prune(cache_keep)
+        if removed:
+            print(f"[cache] {removed} old entries removed, the last {cache_keep} of repos and of users are kept")
+
+    if collab_folder and users_file and table is not None:
+        index = CollabIndex.build_cached(users_file, collab_folder, repos_file, table)
+        users_reports = write_contributors_reports(index, table, output_folder, minimum_stars, min_popular_repos, top, sort_run_size)
+        if graph:
+            users_reports += write_graph_reports(index, table, output_folder, top, sort_run_size, projection)
+        run_reports(enumerate(load_csv_user_file_gen(users_file)), users_reports)
 
 
 if __name__ == "__main__":
@@ -198,6 +496,19 @@ if __name__ == "__main__":
     parser.add_argument('-s', '--minimum-stars', default=1, type=int, help="Min stars of repos.", required=True)
     parser.add_argument('-f', '--minimum-forks', default=1,type=int, help="Min forks of repos.", required=True)
     parser.add_argument('-w', '--minimum-watchers', default=1, type=int, help="Min watchers of repos.", required=True)
+    parser.add_argument('--top', type=int, default=None, help="Only write the top K repos of the sorted reports (constant memory).")
+    parser.add_argument('-p', '--processes', type=int, default=1, help="Number of processes parsing the csvs.")
+    parser.add_argument('--cache', type=str, help="Folder where the reports are cached by input file and parameters, reruns with the same inputs don't parse the csvs again.")
+    parser.add_argument('--cache-keep', type=int, default=4, help="Entries kept in the --cache folder of each kind (repos, users), the least recently used ones are removed (0 keeps all of them).")
+    parser.add_argument('-c', '--columnar', type=str, help="Folder where a numpy columnar copy of the repos csv is kept and used for the repos reports (requires numpy).")
+    parser.add_argument('--stats', action='store_true', help="Also write repos_stats.json with percentiles, histograms and flag counts (requires numpy).")
+    parser.add_argument('--collab-index', type=str, help="Folder where the repo<->contributors index of the csvs is kept, used for the contributors reports (requires -u, -r and numpy).")
+    parser.add_argument('--min-popular-repos', type=int, default=2, help="Min repos with more than --minimum-stars stars a user with email has to contribute to (contributors report).")
+    parser.add_argument('--graph', action='store_true', help="Also write the collaboration graph reports: pagerank of repos and users, repo clusters and graph stats (requires --collab-index).")
+    parser.add_argument('--projection', action='store_true', help="With --graph also write the pairs of repos with more shared contributors.")
+    parser.add_argument('--compress', type=str, choices=COMPRESSIONS, default=None, help="Compress the reports (.csv.gz with pigz if installed, .csv.zst requires zstandard).")
+    parser.add_argument('--sort-run-size', type=int, default=1_000_000, help="Max rows kept in memory when sorting the full reports, the rest is sorted on disk.")
+    metrics.add_metrics_arguments(parser)
 
     args = parser.parse_args()
     if args.users_file is None and args.repos_file is None and args.logs_folder is None:
@@ -215,4 +526,15 @@ if __name__ == "__main__":
     if args.logs_folder is not None and not os.path.isdir(args.logs_folder):
         parser.error("The folder specified by --logs-folder does not exist.")
 
-    main(args.users_file, args.repos_file, args.logs_folder, args.output_folder, int(args.minimum_stars), int(args.minimum_forks), int(args.minimum_watchers))
+    if args.compress == "zst":
+        try:
+            require_zstandard()
+        except ImportError as e:
+            parser.error(str(e))
+
+    metrics.start_metrics_from_args(args)
+    try:
+        with metrics.stage("investigate"):
+            main(args.users_file, args.repos_file, args.logs_folder, args.output_folder, int(args.minimum_stars), int(args.minimum_forks), int(args.minimum_watchers), args.top, args.sort_run_size, args.processes, args.cache, args.columnar, args.stats, args.collab_index, args.min_popular_repos, args.graph, args.projection, args.compress, args.cache_keep)
+    finally:
+        metrics.stop_metrics()
@@ -0,0 +1,51 @@
+import argparse
+import os
+
+from lib import metrics
+from lib.merge import merge_repos_csvs, merge_users_csvs
+
+
+def main(repos_files, users_files, output_folder, unsorted=False, run_size=1_000_000):
+    """
+    Merge the repos.csv and users.csv files of several gh_scraper runs into one repos.csv and users.csv.
+
+    :param repos_files: The repos csvs to merge.
+    :param users_files: The users csvs to merge.
+    :param output_folder: The folder where the merged csvs are written.
+    :param unsorted: The inputs weren't written with gh_scraper.py --sorted, sort them on disk first.
+    :param run_size: Max rows kept in memory when sorting the inputs.
+    """
+
+    if repos_files:
+        count = merge_repos_csvs(repos_files, os.path.join(output_folder, "repos.csv"), unsorted, run_size)
+        print(f"[+] {count} repos from {len(repos_files)} files merged into repos.csv")
+
+    if users_files:
+        count = merge_users_csvs(users_files, os.path.join(output_folder, "users.csv"), unsorted, run_size)
+        print(f"[+] {count} users from {len(users_files)} files merged into users.csv")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge the CSV files of several scrape runs in constant memory.")
+    parser.add_argument('-r', '--repos-files', type=str, nargs='+', help="The repos csvs to merge, sorted by gh_scraper.py --sorted.")
+    parser.add_argument('-u', '--users-files', type=str, nargs='+', help="The users csvs to merge, sorted by gh_scraper.py --sorted.")
+    parser.add_argument('-o', '--output-folder', type=str, help="The folder where the merged repos.csv and users.csv are written.", required=True)
+    parser.add_argument('--unsorted', action='store_true', help="The inputs are not sorted, sort them on disk before merging.")
+    parser.add_argument('--sort-run-size', type=int, default=1_000_000, help="Max rows kept in memory when sorting unsorted inputs.")
+    metrics.add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+
+    if not args.repos_files and not args.users_files:
+        parser.error("At least one of --repos-files or --users-files is required.")
+
+    for file_path in (args.repos_files or []) + (args.users_files or []):
+        if not os.path.isfile(file_path):
+            parser.error(f"The file {file_path} does not exist.")
+
+    metrics.start_metrics_from_args(args)
+    try:
+        with metrics.stage("merge"):
+            main(args.repos_files, args.users_files, args.output_folder, args.unsorted, args.sort_run_size)
+    finally:
+        metrics.stop_metrics()
@@ -0,0 +1,568 @@
+import argparse
+import csv
+import json
+import os
+import time
+
+from io import BytesIO
+from itertools import islice
+from queue import Queue, Empty, Full
+from threading import Thread, Lock, Event, current_thread
+
+import gh_enhancer
+import gh_investigator
+import gh_scraper
+
+from collections import Counter
+from gh_downloader import write_content_to_file
+from lib import metrics
+from lib.archive_cache import add_cache_arguments, cache_from_args
+from lib.classes import Repository, User
+from lib.compression import compression_of, open_text
+from lib.functions import download_file, decompress_gz, read_urls_from_file, now_str, estimate_query_connections, \
+    estimate_connections_cost, estimate_batch_cost, write_csv_files, load_csv_repo_file_gen, load_csv_user_file_gen, PointsBudget, \
+    REPO_QUERY_CONNECTIONS, API_STATS
+from lib.writers import CSVWriter
+
+
+# Stages of the pipeline, connected by bounded queues so a slow stage blocks the ones feeding it:
+#   sources -> [fetch workers] -> logs queue -> [scrape workers] -> assets queue -> [enrich workers] -> writers
+# When the scraping ends the scraper csvs are written, the enriched csvs are completed with the final scraper
+# state and optionally the investigator reports are generated from them.
+
+# Number of events parsed before taking the scraper lock to apply them
+EVENTS_CHUNK = 1000
+
+SCRAPE_LOCK = Lock()
+STATS_LOCK = Lock()
+STATS = {
+    "sources": 0, "fetched": 0, "fetch_errors": 0, "scraped": 0, "events": 0, "bad_events": 0,
+    "new_repos": 0, "new_users": 0, "enriched_batches": 0, "enrich_errors": 0, "skipped_assets": 0,
+}
+STAGE_TIMES = dict()
+FIRST_RESULT_TIME = None
+START_TIME = None
+# ArchiveCache the urls are read through (None to always download them)
+ARCHIVE_CACHE = None
+
+# PointsBudget the enrichment batches are charged to (None for no limit)
+BUDGET = None
+
+# Set when a worker fails: every stage stops instead of blocking forever on the queues of the dead one
+STOP_EVENT = Event()
+WORKER_ERRORS = []
+# Seconds between the checks of STOP_EVENT while waiting on a queue
+QUEUE_POLL_SECS = 1
+
+
+def add_stat(name, value=1):
+    with STATS_LOCK:
+        STATS[name] += value
+
+
+def stage_finished(stage):
+    STAGE_TIMES[stage] = time.monotonic() - START_TIME
+    print(f"{now_str()} [+] Stage {stage} finished after {STAGE_TIMES[stage]:.1f}s")
+
+
+def run_worker(worker, *args):
+    """
+    Run a worker of a stage, if it fails the error is kept and the whole pipeline is stopped.
+    """
+
+    try:
+        worker(*args)
+    except BaseException as e:
+        print(f"{now_str()} [!] Error in a {current_thread().name} worker, stopping the pipeline: {e!r}")
+        WORKER_ERRORS.append(e)
+        STOP_EVENT.set()
+
+
+def queue_get(queue):
+    """
+    :return: The next item of the queue, None if the pipeline was stopped.
+    """
+
+    while not STOP_EVENT.is_set():
+        try:
+            return queue.get(timeout=QUEUE_POLL_SECS)
+        except Empty:
+            continue
+    return None
+
+
+def queue_put(queue, item):
+    """
+    Put the item in the queue waiting while it's full.
+
+    :return: False if the pipeline was stopped before the item could be queued.
+    """
+
+    while not STOP_EVENT.is_set():
+        try:
+            queue.put(item, timeout=QUEUE_POLL_SECS)
+            return True
+        except Full:
+            continue
+    return False
+
+
+def fetch_url(url):
+    """
+    :return: The decompressed content of a GitHub Archive URL or None.
+    """
+
+    content = ARCHIVE_CACHE.get(url) if ARCHIVE_CACHE else download_file(url)
+    if not content:
+        return None
+    decompressed = decompress_gz(content)
+    if decompressed is None and ARCHIVE_CACHE:
+        ARCHIVE_CACHE.discard(url)
+    return decompressed
+
+
+def fetch_file(file_path):
+    """
+    :return: The content of a local GitHub Archive log file.
+    """
+
+    with open(file_path, 'rb') as log_file:
+        return log_file.read()
+
+
+def fetch_worker(sources_queue, logs_queue, fetch_func, logs_output_folder=None):
+    """
+    Fetch the logs of the sources until a None is found, queueing their content to be scraped.
+    Blocks when the logs queue is full, so only a bounded number of logs are kept in memory.
+
+    :param sources_queue: Queue of URLs or log files.
+    :param logs_queue: Bounded queue of (source, content) to scrape.
+    :param fetch_func: Function returning the content of a source.
+    :param logs_output_folder: Also write the logs there, like gh_downloader.py.
+    """
+
+    while True:
+        source = queue_get(sources_queue)
+        if source is None:
+            return
+
+        try:
+            content = fetch_func(source)
+        except Exception as e:
+            print(f"{now_str()} Error fetching {source}: {e}")
+            content = None
+
+        if not content:
+            add_stat("fetch_errors")
+            continue
+
+        if logs_output_folder:
+            write_content_to_file(content.decode('utf-8'), logs_output_folder, os.path.splitext(os.path.basename(source))[0])
+
+        add_stat("fetched")
+        if not queue_put(logs_queue, (source, content)):
+            return
+
+
+def apply_events(events):
+    """
+    Update the scraper dicts with the events.
+
+    :return: A list with copies of the repos and users found for the first time, to be enriched.
+    """
+
+    event_types = Counter()
+    bad_events = 0
+    with SCRAPE_LOCK:
+        num_repos = len(gh_scraper.UNIQUE_REPOS)
+        num_users = len(gh_scraper.UNIQUE_USERS)
+        for event in events:
+            event_types[event.get("type")] += 1
+            try:
+                gh_scraper.EXTRACTORS.dispatch(event)
+            except Exception:
+                # E.g. an event with an unexpected structure, the others of the chunk are still applied
+                bad_events += 1
+
+        # Dicts keep the insertion order, the new keys are the last ones
+        new_repos = list(islice(reversed(gh_scraper.UNIQUE_REPOS.values()), len(gh_scraper.UNIQUE_REPOS) - num_repos))
+        new_users = list(islice(reversed(gh_scraper.UNIQUE_USERS), len(gh_scraper.UNIQUE_USERS) - num_users))
+
+    # Copies, so the enrichment never touches the objects the scraper keeps updating
+    new_assets = [Repository(repo.full_name, 0, 0, 0, repo.deleted, repo.private, False, False) for repo in reversed(new_repos)]
+    new_assets.extend(User(username, list(), False, False, False, '', '', False) for username in reversed(new_users))
+
+    metrics.inc_many("events_parsed_total", event_types, "type")
+    add_stat("events", len(events))
+    add_stat("bad_events", bad_events)
+    add_stat("new_repos", len(new_repos))
+    add_stat("new_users", len(new_users))
+    return new_assets
+
+
+def scrape_worker(logs_queue, assets_queue, enrich):
+    """
+    Scrape the logs of the logs queue until a None is found, queueing the new repos and users to be enriched.
+    Blocks when the assets queue is full, so scraping never runs too far ahead of the enrichment.
+
+    :param logs_queue: Bounded queue of (source, content) to scrape.
+    :param assets_queue: Bounded queue of assets to enrich.
+    :param enrich: If the new assets are queued to be enriched.
+    """
+
+    while True:
+        entry = queue_get(logs_queue)
+        if entry is None:
+            return
+
+        source, content = entry
+        events = []
+        for line in BytesIO(content):
+            try:
+                event_type, event = gh_scraper.EXTRACTORS.decode(line)
+            except (ValueError, AttributeError):
+                # Invalid json or utf-8 (UnicodeDecodeError is a ValueError) or json that isn't an object
+                add_stat("bad_events")
+                continue
+            # Events of types without extractors aren't decoded, only their type is kept to count them
+            events.append(event if event is not None else {"type": event_type})
+
+            if len(events) >= EVENTS_CHUNK:
+                queue_assets(apply_events(events), assets_queue, enrich)
+                events = []
+
+        queue_assets(apply_events(events), assets_queue, enrich)
+        del content, entry
+        add_stat("scraped")
+
+
+def queue_assets(assets, assets_queue, enrich):
+    if not enrich:
+        return
+    for asset in assets:
+        if not queue_put(assets_queue, asset):
+            return
+
+
+def next_batch(assets_queue, max_cost, batch_timeout, max_assets=None):
+    """
+    Take assets from the queue up to max_cost estimated points and max_assets (None for no limit). The batch is returned before being full after batch_timeout
+    seconds, so the assets found while the scraping goes slowly are enriched without waiting for more.
+
+    :return: A tuple (batch, finished), finished is True when the None of the end was found.
+    """
+
+    batch = []
+    batch_connections = 0
+    deadline = None
+    while True:
+        try:
+            if deadline is None:
+                asset = queue_get(assets_queue)
+                deadline = time.monotonic() + batch_timeout
+            else:
+                asset = assets_queue.get(timeout=max(0, deadline - time.monotonic()))
+        except Empty:
+            return batch, False
+
+        if asset is None:
+            return batch, True
+
+        batch.append(asset)
+        batch_connections += estimate_query_connections(asset)
+        if (max_cost and estimate_connections_cost(batch_connections + REPO_QUERY_CONNECTIONS) > max_cost) or (max_assets and len(batch) >= max_assets):
+            return batch, False
+
+
+def enrich_worker(assets_queue, gh_token_or_file, repos_writer, users_writer, max_cost, batch_timeout, batch_size=None):
+    """
+    Enrich the assets of the assets queue in mixed batches until a None is found. When the points budget
+    is exhausted the assets are still taken from the queue so the scraping is never blocked.
+    """
+
+    global FIRST_RESULT_TIME
+
+    finished = False
+    while not finished:
+        batch, finished = next_batch(assets_queue, max_cost, batch_timeout, batch_size)
+        if not batch:
+            continue
+
+        cost = estimate_batch_cost(batch)
+        if BUDGET is not None and not BUDGET.reserve(cost):
+            add_stat("skipped_assets", len(batch))
+            continue
+
+        try:
+            gh_enhancer.parse_github_assets(batch, gh_token_or_file, repos_writer, users_writer)
+        except Exception as e:
+            print(f"{now_str()} Error enriching a batch of {len(batch)} assets: {e}")
+            add_stat("enrich_errors")
+            continue
+        finally:
+            if BUDGET is not None:
+                BUDGET.release(cost)
+
+        add_stat("enriched_batches")
+        if FIRST_RESULT_TIME is None:
+            FIRST_RESULT_TIME = time.monotonic() - START_TIME
+
+
+def progress_line(queues, writers):
+    with STATS_LOCK:
+        stats = dict(STATS)
+    elapsed = time.monotonic() - START_TIME
+    queues_str = " ".join(f"{name}={queue.qsize()}" for name, queue in queues.items())
+    enriched = " ".join(f"{name}={writer.rows_written}" for name, writer in writers.items() if writer)
+    return (f"{now_str()} [{elapsed:.0f}s] logs {stats['scraped']}/{stats['sources']} (fetched {stats['fetched']}, errors {stats['fetch_errors']}) | "
+            f"events {stats['events']} | new repos {stats['new_repos']} users {stats['new_users']} | "
+            f"enriched {enriched or '-'} (api requests {API_STATS['requests']}) | queues {queues_str}")
+
+
+def progress_worker(queues, writers, interval, stop_queue):
+    """
+    Print the state of every stage and the size of every queue each interval seconds.
+    """
+
+    while True:
+        try:
+            stop_queue.get(timeout=interval)
+            return
+        except Empty:
+            print(progress_line(queues, writers))
+
+
+def complete_enriched_csv(csv_path, load_func, header, row_func, update_func):
+    """
+    Rewrite an enriched csv updating every row with the final state of the scraper, e.g. the repos a user
+    collaborated with after the user was enriched.
+
+    :return: The number of rows written.
+    """
+
+    tmp_path = csv_path + ".tmp"
+    count = 0
+    with open_text(tmp_path, 'w', compression_of(csv_path)) as tmp_file:
+        csv_writer = csv.writer(tmp_file)
+        csv_writer.writerow(header)
+        for asset in load_func(csv_path):
+            update_func(asset)
+            csv_writer.writerow(row_func(asset))
+            count += 1
+    os.replace(tmp_path, csv_path)
+    return count
+
+
+def enriched_repo_row(repo):
+    # Same format as gh_enhancer.write_repos_info, -1 marks the repos Github doesn't return
+    return [repo.full_name, repo.stars, repo.forks, repo.watchers, int(repo.deleted), int(repo.private), int(repo.archived), int(repo.disabled)]
+
+
+def enriched_user_row(user):
+    return [user.username, ','.join(user.repos_collab), int(user.deleted), int(user.site_admin), int(user.hireable), user.email, user.company, int(user.github_star)]
+
+
+def update_enriched_repo(repo):
+    scraped = gh_scraper.UNIQUE_REPOS.get(repo.full_name)
+    # Same rules as gh_enhancer.write_repos_info for the repos Github doesn't return
+    if scraped is not None and repo.stars == -1:
+        repo.deleted = scraped.deleted
+        repo.private = not scraped.deleted
+
+
+def update_enriched_user(user):
+    scraped = gh_scraper.UNIQUE_USERS.get(user.username)
+    if scraped is not None:
+        user.repos_collab = scraped.repos_collab
+
+
+def write_summary(output_folder, writers):
+    summary = {
+        "stats": dict(STATS),
+        "enriched": {name: writer.rows_written for name, writer in writers.items() if writer},
+        "api": dict(API_STATS),
+        "stage_seconds": STAGE_TIMES,
+        "first_result_seconds": FIRST_RESULT_TIME,
+        "total_seconds": time.monotonic() - START_TIME,
+    }
+    with open(os.path.join(output_folder, "pipeline_summary.json"), 'w') as summary_file:
+        json.dump(summary, summary_file, indent=2)
+
+    print(f"{now_str()} [+] Pipeline finished in {summary['total_seconds']:.1f}s")
+    print(f"    Logs scraped: {STATS['scraped']}/{STATS['sources']} ({STATS['fetch_errors']} fetch errors), events: {STATS['events']} ({STATS['bad_events']} bad)")
+    print(f"    Repos found: {STATS['new_repos']}, users found: {STATS['new_users']}")
+    print(f"    Enriched: {summary['enriched']}, batches: {STATS['enriched_batches']} ({STATS['enrich_errors']} errors), points: {API_STATS['points']}, skipped by the budget: {STATS['skipped_assets']}")
+    if FIRST_RESULT_TIME is not None:
+        print(f"    First enriched results after {FIRST_RESULT_TIME:.1f}s")
+    for stage, seconds in STAGE_TIMES.items():
+        print(f"    Stage {stage} finished after {seconds:.1f}s")
+
+
+def main(urls_file, logs_folder, output_folder, gh_token_or_file, fetch_workers=4, scrape_workers=1, enrich_workers=5,
+         logs_queue_size=4, assets_queue_size=100_000, batch_size=300, max_cost=None, batch_timeout=10, budget=None,
+         sort_keys=False, logs_output_folder=None, investigate=False, minimum_stars=1, minimum_forks=1, minimum_watchers=1,
+         flush_rows=1000, flush_interval=5, progress_interval=30, archive_cache=None):
+    """
+    Run the downloader, the scraper, the enhancer and the investigator as one streaming pipeline.
+
+    :param urls_file: The file with the GitHub Archive URLs (generated by gen_gh_urls.py).
+    :param logs_folder: Folder with already downloaded logs, used instead of urls_file.
+    :param output_folder: The folder where the scraped csvs (scraped/), the enriched csvs (enriched/) and the reports (reports/) are written.
+    :param gh_token_or_file: Github token or file with tokens, None to only scrape.
+    :param fetch_workers: Threads downloading (or reading) the logs.
+    :param scrape_workers: Threads parsing the logs.
+    :param enrich_workers: Threads asking the Github GraphQL API.
+    :param logs_queue_size: Max logs fetched and waiting to be scraped, each one is a full decompressed hour in memory.
+    :param assets_queue_size: Max new repos and users waiting to be enriched.
+    :param batch_size: Max repos and users per GraphQL request.
+    :param max_cost: Max estimated GraphQL points of each request (None for no limit, batch_size caps them).
+    :param batch_timeout: Max seconds an incomplete batch waits for more assets.
+    :param budget: Total GraphQL points to spend (None for no limit).
+    :param sort_keys: Write the scraped csvs sorted so they can be merged with gh_merger.py.
+    :param logs_output_folder: Also keep the downloaded logs in this folder.
+    :param investigate: Generate the investigator reports from the enriched csvs at the end.
+    :param progress_interval: Seconds between progress lines.
+    :param archive_cache: ArchiveCache to read the urls through, they are downloaded only if they aren't cached.
+    """
+
+    global START_TIME, BUDGET, ARCHIVE_CACHE
+
+    START_TIME = time.monotonic()
+    BUDGET = PointsBudget(budget) if budget is not None else None
+    ARCHIVE_CACHE = archive_cache
+    STOP_EVENT.clear()
+    WORKER_ERRORS.clear()
+    enrich = bool(gh_token_or_file)
+
+    if urls_file:
+        sources = read_urls_from_file(urls_file)
+        fetch_func = fetch_url
+    else:
+        sources = sorted(os.path.join(logs_folder, file_name) for file_name in os.listdir(logs_folder) if file_name.endswith(".json"))
+        fetch_func = fetch_file
+    STATS["sources"] = len(sources)
+    print(f"{now_str()} [+] Pipeline over {len(sources)} logs with {fetch_workers} fetch, {scrape_workers} scrape and {enrich_workers if enrich else 0} enrich workers")
+
+    scraped_folder = os.path.join(output_folder, "scraped")
+    enriched_folder = os.path.join(output_folder, "enriched")
+    os.makedirs(enriched_folder, exist_ok=True)
+
+    repos_writer = users_writer = None
+    if enrich:
+        repos_writer = CSVWriter(os.path.join(enriched_folder, "repos.csv"), header=gh_enhancer.REPOS_HEADER, flush_rows=flush_rows, flush_interval=flush_interval, mode='w')
+        users_writer = CSVWriter(os.path.join(enriched_folder, "users.csv"), header=gh_enhancer.USERS_HEADER, flush_rows=flush_rows, flush_interval=flush_interval, mode='w')
+    writers = {"repos": repos_writer, "users": users_writer}
+
+    # The sources queue is filled at once (only names), the others are bounded
+    sources_queue = Queue()
+    logs_queue = Queue(maxsize=logs_queue_size)
+    assets_queue = Queue(maxsize=assets_queue_size)
+    for source in sources:
+        sources_queue.put(source)
+    for _ in range(fetch_workers):
+        sources_queue.put(None)
+
+    queues = {"logs": logs_queue, "assets": assets_queue}
+    for name, queue in queues.items():
+        metrics.register_gauge("pipeline_queue_depth", queue.qsize, queue=name)
+    metrics.register_gauge("scraper_unique_repos", gh_scraper.UNIQUE_REPOS.__len__)
+    metrics.register_gauge("scraper_unique_users", gh_scraper.UNIQUE_USERS.__len__)
+    stop_progress = Queue()
+    progress_thread = Thread(target=progress_worker, args=(queues, writers, progress_interval, stop_progress), daemon=True)
+    progress_thread.start()
+
+    fetch_threads = [Thread(target=run_worker, args=(fetch_worker, sources_queue, logs_queue, fetch_func, logs_output_folder), name="fetch") for _ in range(fetch_workers)]
+    scrape_threads = [Thread(target=run_worker, args=(scrape_worker, logs_queue, assets_queue, enrich), name="scrape") for _ in range(scrape_workers)]
+    enrich_threads = [Thread(target=run_worker, args=(enrich_worker, assets_queue, gh_token_or_file, repos_writer, users_writer, max_cost, batch_timeout, batch_size), name="enrich")
+                      for _ in range(enrich_workers if enrich else 0)]
+    for thread in fetch_threads + scrape_threads + enrich_threads:
+        thread.start()
+
+    # Each stage ends when the previous one has ended and its queue is drained
+    for thread in fetch_threads:
+        thread.join()
+    stage_finished("fetch")
+
+    for _ in scrape_threads:
+        queue_put(logs_queue, None)
+    for thread in scrape_threads:
+        thread.join()
+    stage_finished("scrape")
+
+    if not WORKER_ERRORS:
+        write_csv_files(gh_scraper.UNIQUE_REPOS, gh_scraper.UNIQUE_USERS, scraped_folder, sort_keys)
+        stage_finished("scraped csvs")
+
+    for _ in enrich_threads:
+        queue_put(assets_queue, None)
+    for thread in enrich_threads:
+        thread.join()
+    for writer in writers.values():
+        if writer:
+            writer.close()
+    stop_progress.put(None)
+    progress_thread.join()
+
+    if WORKER_ERRORS:
+        raise RuntimeError(f"The pipeline was stopped by {len(WORKER_ERRORS)} failed workers") from WORKER_ERRORS[0]
+
+    if enrich:
+        stage_finished("enrich")
+        enriched_repos = os.path.join(enriched_folder, "repos.csv")
+        enriched_users = os.path.join(enriched_folder, "users.csv")
+        complete_enriched_csv(enriched_repos, load_csv_repo_file_gen, gh_enhancer.REPOS_HEADER, enriched_repo_row, update_enriched_repo)
+        complete_enriched_csv(enriched_users, load_csv_user_file_gen, gh_enhancer.USERS_HEADER, enriched_user_row, update_enriched_user)
+        stage_finished("complete enriched csvs")
+
+        if investigate:
+            gh_investigator.main(enriched_users, enriched_repos, None, os.path.join(output_folder, "reports"), minimum_stars, minimum_forks, minimum_watchers)
+            stage_finished("investigate")
+
+    print(progress_line(queues, writers))
+    write_summary(output_folder, writers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download, scrape, enrich and investigate the GitHub Archive logs as one streaming pipeline.")
+
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument('-i', '--urls-file', type=str, help="The file with the GitHub Archive URLs (generated by gen_gh_urls.py).")
+    input_group.add_argument('-l', '--logs-folder', type=str, help="Folder with already downloaded logs to use instead of URLs.")
+
+    parser.add_argument('-o', '--output-folder', type=str, required=True, help="Folder for the scraped csvs (scraped/), the enriched csvs (enriched/) and the reports (reports/).")
+    token_group = parser.add_mutually_exclusive_group()
+    token_group.add_argument('-T', '--token', type=str, help="Github token to use for API calls.")
+    token_group.add_argument('-f', '--file-tokens', type=str, help="File containing Github tokens to use for API calls. Without tokens the logs are only scraped.")
+
+    parser.add_argument('--fetch-workers', type=int, default=4, help="Threads downloading the logs.")
+    parser.add_argument('--scrape-workers', type=int, default=1, help="Threads parsing the logs.")
+    parser.add_argument('--enrich-workers', type=int, default=5, help="Threads asking the Github GraphQL API.")
+    parser.add_argument('--logs-queue', type=int, default=4, help="Max decompressed logs waiting to be scraped (bounds the memory used).")
+    parser.add_argument('--assets-queue', type=int, default=100_000, help="Max new repos and users waiting to be enriched, the scraping waits when it's full.")
+    parser.add_argument('-b', '--batch-size', type=int, default=300, help="Max repos and users per GraphQL request (--max-cost can also limit them).")
+    parser.add_argument('--max-cost', type=int, default=None, help="Max estimated GraphQL points of each request (connections / 100, every repo asks for 2). By default only --batch-size limits them.")
+    parser.add_argument('--batch-timeout', type=float, default=10, help="Max seconds an incomplete batch waits for more assets.")
+    parser.add_argument('--budget', type=int, default=None, help="Total GraphQL points to spend (the cost GitHub reports for each request), the rest of the assets are only scraped.")
+    parser.add_argument('--sorted', action='store_true', help="Write the scraped csvs sorted so they can be merged with gh_merger.py.")
+    parser.add_argument('--keep-logs', type=str, default=None, help="Also write the downloaded logs to this folder.")
+    parser.add_argument('--investigate', action='store_true', help="Generate the investigator reports from the enriched csvs at the end.")
+    parser.add_argument('-s', '--minimum-stars', type=int, default=1, help="Minimum stars of the investigator reports.")
+    parser.add_argument('--minimum-forks', type=int, default=1, help="Minimum forks of the investigator reports.")
+    parser.add_argument('-w', '--minimum-watchers', type=int, default=1, help="Minimum watchers of the investigator reports.")
+    parser.add_argument('--progress-interval', type=float, default=30, help="Seconds between progress lines.")
+    add_cache_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+    archive_cache = cache_from_args(args)
+    metrics.start_metrics_from_args(args)
+    try:
+        with metrics.stage("pipeline"):
+            main(args.urls_file, args.logs_folder, args.output_folder, args.token or args.file_tokens, args.fetch_workers, args.scrape_workers,
+                 args.enrich_workers, args.logs_queue, args.assets_queue, args.batch_size, args.max_cost, args.batch_timeout, args.budget,
+                 args.sorted, args.keep_logs, args.investigate, args.minimum_stars, args.minimum_forks, args.minimum_watchers,
+                 progress_interval=args.progress_interval, archive_cache=archive_cache)
+    finally:
+        metrics.stop_metrics()
+        if archive_cache:
+            archive_cache.close()
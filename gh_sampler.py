@@ -0,0 +1,271 @@
+import argparse
+import csv
+import json
+import os
+
+from collections import Counter
+from io import BytesIO
+from queue import Queue
+from threading import Thread
+from tqdm import tqdm
+
+import gh_scraper
+from gen_gh_urls import hour_from_name, hour_url, parse_hour
+from lib import metrics
+from lib.archive_cache import add_cache_arguments, cache_from_args
+from lib.functions import download_file, decompress_gz
+from lib.sampling import stratified_total, chao2, ratio_estimate
+
+
+# Incidence of the repos and users: number of sampled hours each one was found in
+REPOS_INCIDENCE = Counter()
+USERS_INCIDENCE = Counter()
+# Number of sampled hours each repo was marked as deleted in
+DELETED_INCIDENCE = Counter()
+# ArchiveCache the hours are read through (None to always download them)
+ARCHIVE_CACHE = None
+
+
+def scrape_hour(lines):
+    """
+    Scrape the events of one hour with the scraper functions and update the incidences.
+
+    :param lines: The lines (bytes) of the hour.
+    :return: Dict with the counts of the hour.
+    """
+
+    gh_scraper.UNIQUE_REPOS.clear()
+    gh_scraper.UNIQUE_USERS.clear()
+    event_types = Counter()
+    bad_events = 0
+
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            event_type, event = gh_scraper.EXTRACTORS.decode(line)
+        except (ValueError, AttributeError):
+            # Invalid json or utf-8 (UnicodeDecodeError is a ValueError) or json that isn't an object
+            bad_events += 1
+            continue
+        event_types[event_type] += 1
+        if event is not None:
+            try:
+                gh_scraper.EXTRACTORS.dispatch(event)
+            except Exception:
+                # E.g. an event with an unexpected structure
+                bad_events += 1
+
+    deleted_repos = [repo.full_name for repo in gh_scraper.UNIQUE_REPOS.values() if repo.deleted]
+    REPOS_INCIDENCE.update(gh_scraper.UNIQUE_REPOS.keys())
+    USERS_INCIDENCE.update(gh_scraper.UNIQUE_USERS.keys())
+    DELETED_INCIDENCE.update(deleted_repos)
+    metrics.inc_many("events_parsed_total", event_types, "type")
+    metrics.inc("events_bad_total", bad_events)
+
+    return {
+        "events": sum(event_types.values()),
+        "repos": len(gh_scraper.UNIQUE_REPOS),
+        "users": len(gh_scraper.UNIQUE_USERS),
+        "deleted_repos": len(deleted_repos),
+        "event_types": event_types,
+    }
+
+
+def download_worker(urls_queue, contents_queue):
+    """
+    Download the hours of the URLs until a None is found, queueing (hour, content) in a bounded queue. Every hour
+    is queued, with a None content if it couldn't be read, so hours_from_urls never waits for a missing one.
+    """
+
+    while True:
+        hour, url = urls_queue.get()
+        if url is None:
+            return
+        content = decompressed = None
+        try:
+            content = ARCHIVE_CACHE.get(url) if ARCHIVE_CACHE else download_file(url)
+            decompressed = decompress_gz(content) if content else None
+            if decompressed is None and content and ARCHIVE_CACHE:
+                ARCHIVE_CACHE.discard(url)
+        except Exception as e:
+            # E.g. a truncated .gz (EOFError, zlib.error) or an error of the archive cache
+            print(f"[!] Error reading the hour {hour} from {url}: {e!r}")
+            if content and ARCHIVE_CACHE:
+                ARCHIVE_CACHE.discard(url)
+        finally:
+            contents_queue.put((hour, decompressed))
+
+
+def hours_from_urls(hours, num_threads):
+    """
+    Download the sampled hours with num_threads threads.
+
+    :return: A generator of (hour, lines) tuples, lines is None if the hour couldn't be downloaded.
+    """
+
+    urls_queue = Queue()
+    contents_queue = Queue(maxsize=num_threads)
+    for hour in hours:
+        urls_queue.put((hour, hour_url(parse_hour(hour))))
+    for _ in range(num_threads):
+        urls_queue.put((None, None))
+
+    threads = [Thread(target=download_worker, args=(urls_queue, contents_queue), name="download") for _ in range(num_threads)]
+    for t in threads:
+        t.start()
+    for _ in hours:
+        hour, content = contents_queue.get()
+        yield hour, BytesIO(content) if content else None
+    for t in threads:
+        t.join()
+
+
+def hours_from_folder(hours, logs_folder):
+    """
+    Read the sampled hours from a folder with the files written by gh_downloader.py.
+
+    :return: A generator of (hour, lines) tuples, lines is None if the folder has no files of the hour.
+    """
+
+    files_by_hour = dict()
+    for file_name in sorted(os.listdir(logs_folder)):
+        hour = hour_from_name(file_name)
+        if hour:
+            files_by_hour.setdefault(hour.strftime("%Y-%m-%d-%H"), []).append(os.path.join(logs_folder, file_name))
+
+    def lines_gen(file_paths):
+        for file_path in file_paths:
+            with open(file_path, 'rb') as log_file:
+                yield from log_file
+
+    for hour in hours:
+        yield hour, lines_gen(files_by_hour[hour]) if hour in files_by_hour else None
+
+
+def estimate(frame, hours_stats, confidence):
+    """
+    Scale the counts of the sampled hours to the whole range of the frame.
+
+    :param frame: The sampling frame.
+    :param hours_stats: Dict with the counts of each processed hour.
+    :return: Dict with the estimates.
+    """
+
+    stratum_of_hour = {hour: label for label, stratum in frame["strata"].items() for hour in stratum["sample"]}
+    population = {label: stratum["population"] for label, stratum in frame["strata"].items()}
+
+    def values_by_stratum(func):
+        values = {label: [] for label in frame["strata"]}
+        for hour, stats in hours_stats.items():
+            values[stratum_of_hour[hour]].append(func(stats))
+        return values
+
+    event_types = sorted(set().union(*(stats["event_types"] for stats in hours_stats.values())) - {None})
+    events = stratified_total(values_by_stratum(lambda stats: stats["events"]), population, confidence)
+    # Only the hours of the strata with sampled hours are covered by the estimates
+    covered_hours = sum(population[label] for label, values in values_by_stratum(lambda stats: 1).items() if values)
+    repos = chao2(REPOS_INCIDENCE.values(), len(hours_stats), covered_hours, confidence)
+    users = chao2(USERS_INCIDENCE.values(), len(hours_stats), covered_hours, confidence)
+    # The main branch of a repo can be deleted in several hours, so the deleted repos are distinct items too
+    deleted_repos = chao2(DELETED_INCIDENCE.values(), len(hours_stats), covered_hours, confidence)
+
+    return {
+        "events": events,
+        "events_by_type": {event_type: stratified_total(values_by_stratum(lambda stats: stats["event_types"].get(event_type, 0)),
+                                                        population, confidence) for event_type in event_types},
+        "distinct_repos": repos,
+        "distinct_users": users,
+        "deleted_repos": deleted_repos,
+        "deleted_repos_rate": ratio_estimate(deleted_repos, repos, confidence),
+    }
+
+
+def main(frame_file, logs_folder, output_folder, num_threads=4, confidence=0.95, archive_cache=None):
+    """
+    Scrape the hours of a sampling frame generated with gen_gh_urls.py --sample and write the estimates for the
+    whole range of hours of the frame.
+
+    :param frame_file: The JSON file with the sampling frame.
+    :param logs_folder: Read the hours from this folder (downloaded with gh_downloader.py) instead of downloading them.
+    :param output_folder: The folder where estimates.json and sample_hours.csv are written.
+    :param num_threads: Download threads.
+    :param confidence: Confidence level of the intervals.
+    :param archive_cache: ArchiveCache to read the hours through, they are downloaded only if they aren't cached.
+    """
+
+    global ARCHIVE_CACHE
+    ARCHIVE_CACHE = archive_cache
+
+    with open(frame_file, 'r') as file:
+        frame = json.load(file)
+
+    hours = sorted(hour for stratum in frame["strata"].values() for hour in stratum["sample"])
+    sources = hours_from_folder(hours, logs_folder) if logs_folder else hours_from_urls(hours, num_threads)
+
+    hours_stats = dict()
+    missing = []
+    for hour, lines in tqdm(sources, total=len(hours), desc="Sampled hours"):
+        if lines is None:
+            missing.append(hour)
+            continue
+        hours_stats[hour] = scrape_hour(lines)
+
+    if missing:
+        print(f"[!] {len(missing)} sampled hours couldn't be read, the estimates use the other hours of their strata")
+    uncovered = [label for label, stratum in frame["strata"].items() if not set(stratum["sample"]) & set(hours_stats)]
+    if uncovered:
+        print(f"[!] No hours of the strata {', '.join(uncovered)}, the estimates don't include them")
+
+    estimates = estimate(frame, hours_stats, confidence)
+
+    os.makedirs(output_folder, exist_ok=True)
+    with open(os.path.join(output_folder, "sample_hours.csv"), 'w', newline='', encoding='utf-8') as csv_file:
+        csv_writer = csv.writer(csv_file)
+        csv_writer.writerow(["hour", "events", "repos", "users", "deleted_repos"])
+        for hour, stats in sorted(hours_stats.items()):
+            csv_writer.writerow([hour, stats["events"], stats["repos"], stats["users"], stats["deleted_repos"]])
+
+    summary = {
+        "frame": {key: value for key, value in frame.items() if key != "strata"},
+        "frame_file": os.path.abspath(frame_file),
+        "strata": len(frame["strata"]),
+        "hours_processed": len(hours_stats),
+        "hours_missing": missing,
+        "strata_uncovered": uncovered,
+        "estimates": estimates,
+    }
+    with open(os.path.join(output_folder, "estimates.json"), 'w') as json_file:
+        json.dump(summary, json_file, indent=2)
+
+    for name in ["events", "distinct_repos", "distinct_users", "deleted_repos", "deleted_repos_rate"]:
+        result = estimates[name]
+        print(f"[+] {name}: {result['estimate']:.6g} ({confidence:.0%} CI {result['ci_low']:.6g} - {result['ci_high']:.6g})")
+    print(f"[+] Estimates of {len(hours_stats)} of {frame['population_hours']} hours written to {output_folder}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate the totals of a range of GitHub Archive hours from a stratified sample of them.")
+    parser.add_argument('-F', '--frame-file', type=str, required=True, help="The sampling frame written by gen_gh_urls.py --sample.")
+    parser.add_argument('-i', '--logs-folder', type=str, default=None, help="Read the sampled hours from this folder (gh_downloader.py output) instead of downloading them.")
+    parser.add_argument('-o', '--output-folder', type=str, required=True, help="The folder where estimates.json and sample_hours.csv are written.")
+    parser.add_argument('-t', '--threads', type=int, default=4, help="Number of download threads.")
+    parser.add_argument('-c', '--confidence', type=float, default=0.95, help="Confidence level of the intervals.")
+    add_cache_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+    if not os.path.isfile(args.frame_file):
+        parser.error("The file specified by --frame-file does not exist.")
+    if args.logs_folder and not os.path.isdir(args.logs_folder):
+        parser.error("The folder specified by --logs-folder does not exist.")
+
+    archive_cache = cache_from_args(args)
+    metrics.start_metrics_from_args(args)
+    try:
+        with metrics.stage("sample"):
+            main(args.frame_file, args.logs_folder, args.output_folder, args.threads, args.confidence, archive_cache)
+    finally:
+        metrics.stop_metrics()
+        if archive_cache:
+            archive_cache.close()
@@ -2,131 +2,184 @@ import argparse
 import json
 import os
 import subprocess
+import zlib
 
+from collections import Counter
 from tqdm import tqdm
 
+from lib import metrics
+from lib.archive_cache import add_cache_arguments, cache_from_args
 from lib.classes import Repository, User
+from lib.compression import COMPRESSIONS, open_binary, require_zstandard
+from lib.event_dispatch import ALL_EVENTS, EventDispatcher
 from lib.functions import write_csv_files
+from lib.row_index import DEFAULT_INDEX_EVERY
+from lib.work_queue import WorkQueue, Heartbeat, leased_urls_gen
 
 
 UNIQUE_REPOS = dict()
 UNIQUE_USERS = dict()
 
+# Rows between the offsets of the sidecar row index of the csvs (None to not index them)
+INDEX_EVERY = None
+# Compression of the csvs ("gz", "zst" or None)
+COMPRESSION = None
+# ArchiveCache the urls are read through (None to always download them)
+ARCHIVE_CACHE = None
+
+
+
+def new_repository(repo_full_name):
+    return Repository(
+        full_name=repo_full_name,
+        stars=0,
+        forks=0,
+        watchers=0,
+        deleted=False,
+        private=False,
+        archived=False,
+        disabled=False
+    )
+
+
+def new_user(username):
+    return User(
+        username=username,
+        repos_collab=list(),
+        deleted=False,
+        site_admin=False,
+        hireable=False,
+        github_star=False,
+        email='',
+        company='',
+    )
+
+
+def normalize_repo_name(repo_full_name):
+    """
+    :return: The owner/name of a repo name with more than 2 slashes, as is otherwise.
+    """
 
+    s = repo_full_name.split("/")
+    if len(s) > 2:
+        return f"{s[1]}/{s[2]}"
+    return repo_full_name
 
-def check_repo_in_event(event):
-    """
-    Get the repository from the event and update the UNIQUE_REPOS dictionary accordingly.
 
-    :param event: The event to check.
-    :return: None
+def add_repo_collab(username, repo_name):
+    user = UNIQUE_USERS.get(username)
+    if user and repo_name and len(user.repos_collab) < user.max_repos and not repo_name in user.repos_collab:
+        user.repos_collab.append(repo_name)
+
+
+# The extractors of the events, see lib/event_dispatch.py. The ones of an event run in this order.
+EXTRACTORS = EventDispatcher()
+
+
+@EXTRACTORS.extractor(ALL_EVENTS, ["repo"])
+def extract_repo(fields):
+    """
+    Get the repository from the event and add it to UNIQUE_REPOS.
     """
 
-    global UNIQUE_REPOS
+    repo = fields["repo"]
+    if repo is None:
+        return
 
-    if 'repo' in event:
-        repo_full_name = event.get('repo', {}).get('name')
-        if not repo_full_name:
-            print(f"Error: no repo_full_name in event: {event}")
-            return
+    repo_full_name = repo.get('name')
+    if not repo_full_name:
+        print(f"Error: no repo_full_name in event repo: {repo}")
+        return
 
-        s = repo_full_name.split("/")
-        if len(s) > 2:
-            print(f"Error: repo_full_name has more than 2 slashes: {repo_full_name}. Changed to {s[1]}/{s[2]}")
-            repo_full_name = f"{s[1]}/{s[2]}"
-                
+    normalized_name = normalize_repo_name(repo_full_name)
+    if normalized_name != repo_full_name:
+        print(f"Error: repo_full_name has more than 2 slashes: {repo_full_name}. Changed to {normalized_name}")
 
-        if not repo_full_name in UNIQUE_REPOS:
-            UNIQUE_REPOS[repo_full_name] = Repository(
-                full_name=repo_full_name,
-                stars=0,
-                forks=0,
-                watchers=0,
-                deleted=False,
-                private=False,
-                archived=False,
-                disabled=False
-            )
-            
-        if event["type"] == "DeleteEvent":
-            # If aparently private, and deleted main/master branch -> not private, just deleted
-            if event["payload"]["ref_type"] == "branch" and event["payload"]["ref"] in ["master", "main"]:
-                UNIQUE_REPOS[repo_full_name].deleted = True
-                UNIQUE_REPOS[repo_full_name].private = False
+    if not normalized_name in UNIQUE_REPOS:
+        UNIQUE_REPOS[normalized_name] = new_repository(normalized_name)
 
 
-def check_user_in_event(event):
+@EXTRACTORS.extractor(["DeleteEvent"], ["repo.name", "payload.ref_type", "payload.ref"])
+def extract_deleted_repo(fields):
+    """
+    If aparently private, and deleted main/master branch -> not private, just deleted
     """
-    Get the repository from the event and update the UNIQUE_REPOS dictionary accordingly.
 
-    :param event: The event to check.
-    :return: None
+    repo = UNIQUE_REPOS.get(normalize_repo_name(fields["repo.name"] or ""))
+    if repo and fields["payload.ref_type"] == "branch" and fields["payload.ref"] in ["master", "main"]:
+        repo.deleted = True
+        repo.private = False
+
+
+@EXTRACTORS.extractor(ALL_EVENTS, ["actor"])
+def extract_user(fields):
+    """
+    Get the user (actor) from the event and add it to UNIQUE_USERS.
     """
 
-    global UNIQUE_USERS
+    actor = fields["actor"]
+    if actor is None:
+        return
 
-    if 'actor' in event or event.get("pull_request", {}).get("user", None):
-        username = event["actor"].get('login') if 'actor' in event else event.get('pull_request', {}).get('user', {}).get('login')
+    username = actor.get('login')
+    if not username:
+        print(f"Error: no username in event actor: {actor}")
+        return
 
-        if not username:
-            print(f"Error: no username in event: {event}")
-            return
+    if not username in UNIQUE_USERS:
+        UNIQUE_USERS[username] = new_user(username)
 
-        if not username in UNIQUE_USERS:            
-            UNIQUE_USERS[username] = User(
-                username=username,
-                repos_collab=list(),
-                deleted=False,
-                site_admin=False,
-                hireable=False,
-                github_star=False,
-                email='',
-                company='',
-            )
 
-        if "pull_request" in event and event["pull_request"]["merged_at"]:
-            repo_name = event['repo']['name']
-            user = UNIQUE_USERS[username]
-            if len(user.repos_collab) < user.max_repos and not repo_name in user.repos_collab:
-                UNIQUE_USERS[username].repos_collab.append(repo_name)
-            
-        elif event["type"] == "PushEvent":
-            repo_name = event['repo']['name']
-            user = UNIQUE_USERS[username]
-            if len(user.repos_collab) < user.max_repos and not repo_name in user.repos_collab:
-                UNIQUE_USERS[username].repos_collab.append(repo_name)
+@EXTRACTORS.extractor(["PushEvent"], ["actor.login", "repo.name"])
+def extract_push_collab(fields):
+    """
+    The repo a user pushes to is a collaboration.
+    """
+
+    add_repo_collab(fields["actor.login"], fields["repo.name"])
 
 
 def parse_github_archive(file_path):
     """
     Parse a single GitHub Archive log file and update the UNIQUE_REPOS and UNIQUE_USERS dictionaries accordingly.
 
-    :param file_path: The path to a GitHub Archive log file.
+    :param file_path: The path to a GitHub Archive log file (it's decompressed on the fly if it ends with .gz).
     """
 
+    # Counted per file and reported at the end, updating the metrics per event would slow the loop
+    event_types = Counter()
+    bad_events = 0
+
     # Open and read the log file line by line
-    with open(file_path, 'rb') as f:
+    with metrics.timer("scraper_file_seconds"), open_binary(file_path) as f:
         for line in f:
-            # Load the event as a JSON object
+            # Decode only the fields the extractors of the type of the event need
             try:
-                event = json.loads(line)
+                event_type, event = EXTRACTORS.decode(line)
             except json.decoder.JSONDecodeError:
                 print(f"Error decoding JSON in file {file_path} on line {line}.")
+                bad_events += 1
                 continue
 
-            # Check the repository in the event and update the UNIQUE_REPOS dictionary
-            check_repo_in_event(event)
+            event_types[event_type] += 1
+            if event is not None:
+                EXTRACTORS.dispatch(event)
+
+        metrics.inc("scraper_bytes_total", f.tell())
 
-            # Check the user in the event and update the UNIQUE_USERS dictionary
-            check_user_in_event(event)
+    metrics.inc_many("events_parsed_total", event_types, "type")
+    metrics.inc("events_bad_total", bad_events)
+    metrics.inc("scraper_files_total")
 
 
-def process_files_github_archive(logs_files, output_folder):
+def process_files_github_archive(logs_files, output_folder, sort_keys=False, binary=False):
     """
     Process a list of GitHub Archive log files and write the results to CSV files in the specified output folder.
 
     :param logs_files: A list of paths to GitHub Archive log files.
     :param output_folder: The folder path where the final CSV files will be generated.
+    :param sort_keys: Write the CSV files sorted by repo/user name.
+    :param binary: Write binary records files instead of CSV files.
     """
 
     # Iterate over each log file with a progress bar
@@ -136,45 +189,120 @@ def process_files_github_archive(logs_files, output_folder):
             progress_bar.update()
 
     # Write the final results to CSV files
-    write_csv_files(UNIQUE_REPOS, UNIQUE_USERS, output_folder)
+    write_csv_files(UNIQUE_REPOS, UNIQUE_USERS, output_folder, sort_keys, binary, INDEX_EVERY, COMPRESSION)
+
+def parse_downloaded_url(url):
+    """
+    Download and decompress the logs of a url to /tmp, parse them and delete them.
 
-def process_urls_github_archive(urls, output_folder):
+    :return: If the logs were parsed.
+    """
+
+    file_name = url.split("/")[-1]
+    file_path = os.path.join("/tmp", file_name).replace(".gz", "")
+    cmd = f'curl -s "{url}" | gzip -d 2>/dev/null > "{file_path}"'
+    try:
+        subprocess.run(cmd, shell=True, check=True)
+    except subprocess.CalledProcessError:
+        pass
+
+    parsed = os.path.isfile(file_path) and os.path.getsize(file_path) > 0
+    if parsed:
+        parse_github_archive(file_path)
+
+    try:
+        os.remove(file_path)
+    except:
+        pass
+    return parsed
+
+
+def parse_cached_url(url):
+    """
+    Parse the archive of a url from ARCHIVE_CACHE (downloading it if it isn't cached), decompressing it on the fly.
+
+    :return: If the logs were parsed.
+    """
+
+    # The hour stays locked while it's parsed so it can't be evicted meanwhile
+    with ARCHIVE_CACHE.use_path(url) as file_path:
+        if not file_path:
+            return False
+
+        try:
+            parse_github_archive(file_path)
+            return True
+        except (OSError, EOFError, zlib.error) as e:
+            # A truncated or bad gzip is dropped from the cache, the events parsed before the error are kept
+            # as with a partially downloaded file
+            print(f"Error decompressing the cached archive of {url}: {e}")
+
+    # Discarded once the hour is unlocked
+    ARCHIVE_CACHE.discard(url)
+    return False
+
+
+def process_urls_github_archive(urls, output_folder, sort_keys=False, binary=False, work_queue=None):
     """
     Process a list of GitHub Archive log files and write the results to CSV files in the specified output folder.
 
-    :param urls: A list of urls to process
+    :param urls: A list (or generator) of urls to process
     :param output_folder: The folder path where the final CSV files will be generated.
+    :param sort_keys: Write the CSV files sorted by repo/user name.
+    :param binary: Write binary records files instead of CSV files.
+    :param work_queue: The WorkQueue the urls are leased from. They are only marked as done once the CSV files
+                       are written, the results of a node that dies before aren't lost.
     """
 
+    parsed_urls = []
+
     # Iterate over each log file with a progress bar
-    with tqdm(total=len(urls), desc="Processing URLs") as progress_bar:
+    with tqdm(total=len(urls) if isinstance(urls, list) else None, desc="Processing URLs") as progress_bar:
         for url in urls:
-            file_name = url.split("/")[-1]
-            file_path = os.path.join("/tmp", file_name).replace(".gz", "")
-            cmd = f'curl -s "{url}" | gzip -d 2>/dev/null > "{file_path}"'
-            try:
-                subprocess.run(cmd, shell=True, check=True)
-            except subprocess.CalledProcessError:
-                pass
+            if ARCHIVE_CACHE:
+                parsed = parse_cached_url(url)
+            else:
+                parsed = parse_downloaded_url(url)
 
-            if os.path.isfile(file_path) and os.path.getsize(file_path) > 0:
-                parse_github_archive(file_path)
+            if parsed:
+                parsed_urls.append(url)
                 print(f"Parsed: {url}")
             else:
                 print(f"Bad logs: {url}")
-            
-            try:
-                os.remove(file_path)
-            except:
-                pass
+                if work_queue:
+                    work_queue.fail(url, "bad logs")
             progress_bar.update()
 
 
     # Write the final results to CSV files
-    write_csv_files(UNIQUE_REPOS, UNIQUE_USERS, output_folder)
-        
+    write_csv_files(UNIQUE_REPOS, UNIQUE_USERS, output_folder, sort_keys, binary, INDEX_EVERY, COMPRESSION)
+    if work_queue:
+        work_queue.complete(parsed_urls)
+
 
-def main(urls_file_path, logs_folder, logs_file, output_folder):
+def process_queue_github_archive(work_queue, output_folder, sort_keys=False, binary=False, lease_batch=10):
+    """
+    Process the urls leased from a WorkQueue shared with other nodes until nothing is pending and write the results
+    to CSV files. Every node writes its own files, merge them with gh_merger.py.
+    The nodes hold their leases until their CSV files are written, so they don't wait for the leases of the others
+    (they would wait for each other forever): the hours of a node that died come back to the queue when its leases
+    expire and are scraped by the next run of a node.
+
+    :param work_queue: The WorkQueue with the urls.
+    :param lease_batch: Number of urls leased at once.
+    """
+
+    heartbeat = Heartbeat(work_queue)
+    try:
+        process_urls_github_archive(leased_urls_gen(work_queue, lease_batch), output_folder, sort_keys, binary, work_queue)
+    finally:
+        heartbeat.close()
+        # Urls leased and not written to the CSV files (e.g. interrupted with Ctrl+C) go back to the queue at once
+        work_queue.release()
+    print(f"[+] Queue status: {work_queue.status()['hours']}")
+
+
+def main(urls_file_path, logs_folder, logs_file, output_folder, sort_keys=False, binary=False, queue_db=None, node=None, lease_secs=600, lease_batch=10, index_every=None, compression=None, archive_cache=None):
     """
     Main function to process a folder containing GitHub Archive log files and write the results to CSV files.
 
@@ -182,29 +310,51 @@ def main(urls_file_path, logs_folder, logs_file, output_folder):
     :param logs_folder: The folder path containing the GitHub Archive log files.
     :param logs_file: The file path containing all the GitHub Archive logs.
     :param output_folder: The folder path where the final CSV files will be generated.
+    :param sort_keys: Write the CSV files sorted by repo/user name so they can be merged with gh_merger.py.
+    :param binary: Write binary records files (repos.ghr and users.ghr) instead of CSV files.
+    :param queue_db: Lease the urls from this work queue (see gh_work_queue.py).
+    :param node: Id of this node in the work queue.
+    :param lease_secs: Seconds the leases last without heartbeats.
+    :param lease_batch: Number of urls leased at once.
+    :param index_every: Write a sidecar row index of the csvs with the offset of every index_every rows.
+    :param compression: Compress the csvs ("gz" or "zst").
+    :param archive_cache: ArchiveCache to read the urls through, they are downloaded only if they aren't cached.
     """
 
-    if urls_file_path:
+    global INDEX_EVERY, COMPRESSION, ARCHIVE_CACHE
+    INDEX_EVERY = index_every
+    COMPRESSION = compression
+    ARCHIVE_CACHE = archive_cache
+
+    metrics.register_gauge("scraper_unique_repos", UNIQUE_REPOS.__len__)
+    metrics.register_gauge("scraper_unique_users", UNIQUE_USERS.__len__)
+
+    if queue_db:
+        work_queue = WorkQueue(queue_db, stage="scrape", node=node, lease_secs=lease_secs)
+        process_queue_github_archive(work_queue, output_folder, sort_keys, binary, lease_batch)
+        work_queue.close()
+
+    elif urls_file_path:
         # Read the URLs file and get the list of log files
         with open(urls_file_path, "r") as f:
             log_urls = f.read().splitlines()
 
         # Process the log files and generate the output CSV files
-        process_urls_github_archive(log_urls, output_folder)
+        process_urls_github_archive(log_urls, output_folder, sort_keys, binary)
     
     else:
-        # Get the list of log files in the logs_folder with a .json extension
+        # Get the list of log files in the logs_folder, .json or .json.gz as published by GH Archive
         if logs_folder:
             logs_files = [
                 os.path.join(logs_folder, file_name)
                 for file_name in os.listdir(logs_folder)
-                if file_name.endswith(".json")
+                if file_name.endswith((".json", ".json.gz"))
             ]
         else:
             logs_files = [logs_file]
 
         # Process the log files and generate the output CSV files
-        process_files_github_archive(logs_files, output_folder)
+        process_files_github_archive(logs_files, output_folder, sort_keys, binary)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process GitHub Archive URLs and generate unique repositories and users CSV files.")
@@ -212,10 +362,36 @@ if __name__ == "__main__":
     # Create a mutually exclusive group for input options
     input_group = parser.add_mutually_exclusive_group(required=True)
     input_group.add_argument('-u', '--urls-file', type=str, help="The path of the file containing the log URLs to parse.")
-    input_group.add_argument('-i', '--logs-folder', type=str, help="The path of the folder containing the GitHub Archive logs.")
+    input_group.add_argument('-i', '--logs-folder', type=str, help="The path of the folder containing the GitHub Archive logs (.json or .json.gz files).")
     input_group.add_argument('-f', '--logs-file', type=str, help="The path of the file containing the GitHub Archive logs.")
+    input_group.add_argument('-q', '--queue', type=str, help="Lease the log URLs from this work queue file shared by several nodes (created with gh_work_queue.py).")
     
     parser.add_argument('-o', '--output-folder', type=str, help="The path of the folder where the CSV files will be generated.")
+    parser.add_argument('--sorted', action='store_true', help="Write the CSV files sorted by repo/user name, so the outputs of several runs can be merged with gh_merger.py.")
+    parser.add_argument('--binary', action='store_true', help="Write binary records files (repos.ghr, users.ghr), faster to load than CSV files. Convert them with gh_convert.py.")
+    parser.add_argument('--row-index', type=int, nargs='?', const=DEFAULT_INDEX_EVERY, default=None, help=f"Write a sidecar row index (.idx) of the csvs with the offset of every N rows (default {DEFAULT_INDEX_EVERY}) for instant counts and seeks.")
+    parser.add_argument('--compress', type=str, choices=COMPRESSIONS, default=None, help="Write compressed csvs (repos.csv.gz with pigz if installed, repos.csv.zst requires zstandard).")
+    parser.add_argument('--node', type=str, default=None, help="Id of this node in the work queue (hostname-pid by default).")
+    parser.add_argument('--lease-secs', type=float, default=600, help="Seconds a lease of the work queue lasts without heartbeats.")
+    parser.add_argument('--lease-batch', type=int, default=10, help="URLs leased from the work queue at once.")
+    add_cache_arguments(parser)
+    metrics.add_metrics_arguments(parser)
 
     args = parser.parse_args()
-    main(args.urls_file, args.logs_folder, args.logs_file, args.output_folder)
\ No newline at end of file
+    if args.compress and (args.binary or args.row_index):
+        parser.error("--compress can't be used with --binary or --row-index, compressed csvs can't be seeked.")
+    if args.compress == "zst":
+        try:
+            require_zstandard()
+        except ImportError as e:
+            parser.error(str(e))
+
+    archive_cache = cache_from_args(args)
+    metrics.start_metrics_from_args(args)
+    try:
+        with metrics.stage("scrape"):
+            main(args.urls_file, args.logs_folder, args.logs_file, args.output_folder, args.sorted, args.binary, args.queue, args.node, args.lease_secs, args.lease_batch, args.row_index, args.compress, archive_cache)
+    finally:
+        metrics.stop_metrics()
+        if archive_cache:
+            archive_cache.close()
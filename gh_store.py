@@ -0,0 +1,146 @@
+import argparse
+import csv
+import os
+import sys
+import time
+
+from lib.compression import open_text
+from lib.store import open_store, import_repos, import_users, create_indexes, query_repos, query_users, REPOS_COLUMNS, USERS_COLUMNS
+
+
+def import_main(db_path, repos_file, users_file):
+    """
+    Import the repos and/or users csvs into the sqlite store and index them.
+
+    :param db_path: The path of the sqlite database.
+    :param repos_file: The repos csv to import.
+    :param users_file: The users csv to import.
+    """
+
+    conn = open_store(db_path)
+
+    if repos_file:
+        start = time.time()
+        num_repos = import_repos(conn, repos_file)
+        print(f"[+] {num_repos} repos imported in {time.time() - start:.1f}s")
+
+    if users_file:
+        start = time.time()
+        num_users = import_users(conn, users_file)
+        print(f"[+] {num_users} users imported in {time.time() - start:.1f}s")
+
+    start = time.time()
+    create_indexes(conn)
+    print(f"[+] Indexes created in {time.time() - start:.1f}s")
+    conn.close()
+
+
+def query_main(db_path, table, output_file, sort, ascending, limit, filters):
+    """
+    Query the sqlite store and write the results as csv.
+
+    :param db_path: The path of the sqlite database.
+    :param table: "repos" or "users".
+    :param output_file: The csv file where the results are written (stdout if not given).
+    :param sort: Column to sort by.
+    :param ascending: Sort in ascending order.
+    :param limit: Max number of results.
+    :param filters: Dict of filters.
+    """
+
+    conn = open_store(db_path)
+    start = time.time()
+
+    if table == "repos":
+        header = REPOS_COLUMNS
+        rows = query_repos(conn, sort, ascending, limit, **filters)
+    else:
+        header = USERS_COLUMNS
+        rows = query_users(conn, sort, ascending, limit, **filters)
+
+    output = open_text(output_file, 'w') if output_file else sys.stdout
+    try:
+        csv_writer = csv.writer(output)
+        csv_writer.writerow(header)
+        count = 0
+        for row in rows:
+            csv_writer.writerow(row)
+            count += 1
+    finally:
+        if output_file:
+            output.close()
+
+    print(f"[+] {count} {table} found in {(time.time() - start) * 1000:.0f}ms", file=sys.stderr)
+    conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the repos and users csvs into an indexed sqlite store and query it.")
+    parser.add_argument('-d', '--database', type=str, help="The path of the sqlite database.", required=True)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Import the csvs into the store.")
+    import_parser.add_argument('-r', '--repos-file', type=str, help="The path of the repos csv file.")
+    import_parser.add_argument('-u', '--users-file', type=str, help="The path of the users csv file.")
+
+    query_parser = subparsers.add_parser("query", help="Query the store.")
+    query_parser.add_argument('table', choices=["repos", "users"], help="What to query.")
+    query_parser.add_argument('-o', '--output-file', type=str, help="The csv file where the results are written (stdout by default).")
+    query_parser.add_argument('--sort', type=str, help="Column to sort by (one of the columns of the table).")
+    query_parser.add_argument('--asc', action='store_true', help="Sort in ascending order.")
+    query_parser.add_argument('-l', '--limit', type=int, help="Max number of results.")
+
+    repos_filters = query_parser.add_argument_group("repos filters")
+    repos_filters.add_argument('--min-stars', type=int, help="Repos with more than this number of stars (exclusive like the gh_investigator.py minimums).")
+    repos_filters.add_argument('--max-stars', type=int, help="Repos with at most this number of stars.")
+    repos_filters.add_argument('--min-forks', type=int, help="Repos with more than this number of forks (exclusive like the gh_investigator.py minimums).")
+    repos_filters.add_argument('--max-forks', type=int, help="Repos with at most this number of forks.")
+    repos_filters.add_argument('--min-watchers', type=int, help="Repos with more than this number of watchers (exclusive like the gh_investigator.py minimums).")
+    repos_filters.add_argument('--max-watchers', type=int, help="Repos with at most this number of watchers.")
+    repos_filters.add_argument('--owner', type=str)
+    repos_filters.add_argument('--private', type=int, choices=[0, 1])
+    repos_filters.add_argument('--archived', type=int, choices=[0, 1])
+    repos_filters.add_argument('--disabled', type=int, choices=[0, 1])
+
+    users_filters = query_parser.add_argument_group("users filters")
+    users_filters.add_argument('--company', type=str, help="Exact company (case insensitive).")
+    users_filters.add_argument('--company-like', type=str, help="Company LIKE pattern, e.g. %%google%%.")
+    users_filters.add_argument('--email-domain', type=str)
+    users_filters.add_argument('--has-email', type=int, choices=[0, 1])
+    users_filters.add_argument('--collab-repo', type=str, help="Users that contributed to this repo (owner/repo).")
+    users_filters.add_argument('--site-admin', type=int, choices=[0, 1])
+    users_filters.add_argument('--hireable', type=int, choices=[0, 1])
+    users_filters.add_argument('--github-star', type=int, choices=[0, 1])
+
+    query_parser.add_argument('--deleted', type=int, choices=[0, 1], help="Filter by the deleted flag (repos and users).")
+
+    args = parser.parse_args()
+
+    if args.command == "import":
+        if args.users_file is None and args.repos_file is None:
+            parser.error("At least one of --users-file or --repos-file is required.")
+        if args.users_file is not None and not os.path.isfile(args.users_file):
+            parser.error("The file specified by --users-file does not exist.")
+        if args.repos_file is not None and not os.path.isfile(args.repos_file):
+            parser.error("The file specified by --repos-file does not exist.")
+        import_main(args.database, args.repos_file, args.users_file)
+
+    else:
+        if not os.path.isfile(args.database):
+            parser.error("The database doesn't exist, run the import command first.")
+
+        columns = REPOS_COLUMNS if args.table == "repos" else USERS_COLUMNS
+        if args.sort is not None and args.sort not in columns:
+            parser.error(f"--sort must be one of the {args.table} columns: {', '.join(columns)}.")
+
+        repos_filter_names = ["min_stars", "max_stars", "min_forks", "max_forks", "min_watchers", "max_watchers", "owner", "private", "archived", "disabled", "deleted"]
+        users_filter_names = ["company", "company_like", "email_domain", "has_email", "collab_repo", "site_admin", "hireable", "github_star", "deleted"]
+        filter_names, other_filter_names = (repos_filter_names, users_filter_names) if args.table == "repos" else (users_filter_names, repos_filter_names)
+
+        # The filters of the other table would be silently ignored
+        ignored = [f"--{name.replace('_', '-')}" for name in other_filter_names if name not in filter_names and getattr(args, name) is not None]
+        if ignored:
+            parser.error(f"{', '.join(ignored)} can't be used to query {args.table}.")
+
+        filters = {name: getattr(args, name) for name in filter_names}
+        query_main(args.database, args.table, args.output_file, args.sort, args.asc, args.limit, filters)
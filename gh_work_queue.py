@@ -0,0 +1,90 @@
+import argparse
+import json
+import os
+
+from gen_gh_urls import generate_urls, parse_hour, parse_shard
+from lib.work_queue import WorkQueue
+
+
+def add_main(db_path, stage, urls_file=None, since=None, until=None, shard=None):
+    """
+    Add the URLs of a file, or the ones of a range of hours generated with gen_gh_urls, to the work queue.
+
+    :param db_path: The path of the work queue sqlite file.
+    :param stage: The queue in the file ("download" or "scrape").
+    :param urls_file: The file with one URL per line.
+    :param since: First hour (datetime) of the range.
+    :param until: Last hour (datetime) of the range.
+    :param shard: Tuple (index, count) to add only the hours of a shard.
+    """
+
+    if urls_file:
+        with open(urls_file, 'r') as file:
+            urls = [line.strip() for line in file if line.strip()]
+    else:
+        urls = list(generate_urls(since, until, shard=shard))
+
+    work_queue = WorkQueue(db_path, stage)
+    added = work_queue.add(urls)
+    print(f"[+] {added} URLs added to the {stage} queue ({len(urls) - added} were already in it)")
+    print(f"[+] Queue status: {work_queue.status()['hours']}")
+    work_queue.close()
+
+
+def status_main(db_path, stage):
+    """
+    Print the number of hours in each status and the hours leased by each node.
+    """
+
+    work_queue = WorkQueue(db_path, stage)
+    print(json.dumps(work_queue.status(), indent=2))
+    work_queue.close()
+
+
+def retry_failed_main(db_path, stage):
+    """
+    Put back in the queue the hours that failed max_attempts times.
+    """
+
+    work_queue = WorkQueue(db_path, stage)
+    print(f"[+] {work_queue.retry_failed()} failed hours back to the {stage} queue")
+    work_queue.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the work queue of hours shared by several gh_downloader.py and gh_scraper.py nodes.")
+    parser.add_argument('-d', '--database', type=str, help="The path of the work queue sqlite file (on a disk shared by the nodes).", required=True)
+    parser.add_argument('--stage', type=str, choices=["download", "scrape"], default="scrape", help="The queue in the file: the urls of gh_downloader.py or of gh_scraper.py.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = subparsers.add_parser("add", help="Add URLs to the queue.")
+    add_parser.add_argument('-i', '--urls-file', type=str, help="The file with the URLs (e.g. urls_list.txt).")
+    add_parser.add_argument('--since', type=str, help="Instead of a file, add the hours since this date or hour (YYYY-MM-DD or YYYY-MM-DD-H).")
+    add_parser.add_argument('--until', type=str, help="Last date or hour of the range, the last published hour by default.")
+    add_parser.add_argument('--shard', type=str, help="Only the hours of the shard i of N (i/N).")
+
+    subparsers.add_parser("status", help="Show the hours in each status and the leases of each node.")
+    subparsers.add_parser("retry-failed", help="Put back in the queue the failed hours.")
+
+    args = parser.parse_args()
+
+    if args.command == "add":
+        if (args.urls_file is None) == (args.since is None):
+            parser.error("One of --urls-file or --since is required.")
+        if args.urls_file is not None and not os.path.isfile(args.urls_file):
+            parser.error("The file specified by --urls-file does not exist.")
+        try:
+            since = parse_hour(args.since) if args.since else None
+            until = parse_hour(args.until, end=True) if args.until else None
+            shard = parse_shard(args.shard) if args.shard else None
+        except ValueError as e:
+            parser.error(str(e))
+        add_main(args.database, args.stage, args.urls_file, since, until, shard)
+
+    else:
+        if not os.path.isfile(args.database):
+            parser.error("The work queue doesn't exist, run the add command first.")
+        if args.command == "status":
+            status_main(args.database, args.stage)
+        else:
+            retry_failed_main(args.database, args.stage)
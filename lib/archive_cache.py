@@ -0,0 +1,494 @@
+import fcntl
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from collections import Counter
+from contextlib import contextmanager
+
+from . import metrics
+from .functions import download_file
+
+
+# Local cache of the raw GH Archive hours (the .json.gz files as downloaded) shared by the downloader, the scraper,
+# the pipeline and the sampler, so every hour is downloaded once per cache lifetime and reruns (e.g. with new
+# extractors) read it from disk.
+#
+# The archives are content addressed: they are kept in objects/<hash[:2]>/<hash>.gz by the sha256 of their bytes and
+# a sqlite index maps each hour (the file name of its URL, e.g. 2023-01-01-5.json.gz) to the hash and size of its
+# archive, when it was downloaded and when it was last used. The size of an archive is checked every time it's used
+# and its hash too unless verify is False, a corrupt or missing archive is dropped and downloaded again.
+#
+# The hours not used for max_age_secs are evicted, and the least recently used ones while the archives take more
+# than max_bytes. Several processes can share a cache folder: the index is updated in short transactions and an
+# hour is downloaded by a single process at a time (locks/<hour>.lock), the others wait for it and read the cache.
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS hours (
+        hour TEXT PRIMARY KEY,
+        hash TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        fetched REAL NOT NULL,
+        used REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_hours_used ON hours (used);
+    CREATE INDEX IF NOT EXISTS idx_hours_hash ON hours (hash);
+'''
+
+GZIP_MAGIC = b'\x1f\x8b'
+HASH_BLOCK_SIZE = 1024 * 1024
+# Orphan archives and temporary files modified more recently than this may belong to a process still storing them
+ORPHAN_GRACE_SECS = 3600
+
+
+def hour_key(url):
+    """
+    :return: The hour of a GH Archive URL as kept in the cache, the file name of the URL.
+    """
+
+    return url.rstrip("/").rsplit("/", 1)[-1]
+
+
+def is_archive(content):
+    return bool(content) and content[:2] == GZIP_MAGIC
+
+
+class ArchiveCache:
+    def __init__(self, cache_folder, max_bytes=None, max_age_secs=None, verify=True):
+        """
+        :param cache_folder: The folder of the cache, created if it doesn't exist.
+        :param max_bytes: Disk quota of the archives (None for no quota).
+        :param max_age_secs: Seconds an hour is kept without being used (None to keep it until evicted by the quota).
+        :param verify: Check the hash of the archives every time they are used, not only their size.
+        """
+
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes
+        self.max_age_secs = max_age_secs
+        self.verify = verify
+        os.makedirs(os.path.join(cache_folder, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(cache_folder, "locks"), exist_ok=True)
+
+        self.lock = threading.Lock()
+        # The rollback journal instead of WAL, WAL doesn't work on network filesystems
+        self.connection = sqlite3.connect(os.path.join(cache_folder, "index.db"), timeout=120, isolation_level=None, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+
+    def _transaction(self, func):
+        """
+        Run func(cursor) in an immediate transaction.
+        """
+
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(cursor)
+                cursor.execute("COMMIT")
+                return result
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+
+    def object_path(self, digest):
+        return os.path.join(self.cache_folder, "objects", digest[:2], digest + ".gz")
+
+    def _lock_path(self, hour):
+        return os.path.join(self.cache_folder, "locks", hour + ".lock")
+
+    @contextmanager
+    def _hour_lock(self, hour, blocking=True):
+        """
+        Lock an hour between the threads and the processes using the cache, flock locks are per open file so
+        every thread opens its own. The lock file of an hour is deleted (holding the lock) when the hour is
+        evicted, so a lock taken on a file that is no longer the one in the locks folder is taken again.
+
+        :param blocking: Wait for the lock, otherwise False is yielded if another thread or process holds it.
+        :return: A context manager yielding if the lock was taken.
+        """
+
+        lock_path = self._lock_path(hour)
+        while True:
+            lock_file = open(lock_path, 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                yield False
+                return
+            try:
+                if os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def _entry(self, hour):
+        """
+        :return: Tuple with the hash and the size of the archive of the hour, or None if it isn't cached.
+        """
+
+        with self.lock:
+            return self.connection.execute("SELECT hash, size FROM hours WHERE hour = ?", (hour,)).fetchone()
+
+    def _check(self, path, digest, size, content=None):
+        """
+        :param content: The content of the archive if it was already read, otherwise it's read from path.
+        :return: If the archive has the size (and the hash if verifying) of the index.
+        """
+
+        if content is not None:
+            return len(content) == size and (not self.verify or hashlib.sha256(content).hexdigest() == digest)
+
+        try:
+            if os.path.getsize(path) != size:
+                return False
+        except OSError:
+            return False
+        if not self.verify:
+            return True
+
+        sha = hashlib.sha256()
+        with open(path, 'rb') as archive_file:
+            for block in iter(lambda: archive_file.read(HASH_BLOCK_SIZE), b''):
+                sha.update(block)
+        return sha.hexdigest() == digest
+
+    def _touch(self, hour):
+        self._transaction(lambda cursor: cursor.execute("UPDATE hours SET used = ? WHERE hour = ?", (time.time(), hour)))
+
+    def _cached(self, hour, read):
+        """
+        :param read: Return the content of the archive instead of its path.
+        :return: The path (or content) of the cached archive of the hour, or None if it isn't cached or is corrupt.
+        """
+
+        entry = self._entry(hour)
+        if entry is None:
+            return None
+
+        digest, size = entry
+        path = self.object_path(digest)
+        content = None
+        if read:
+            try:
+                with open(path, 'rb') as archive_file:
+                    content = archive_file.read()
+            except OSError:
+                content = b''
+
+        if not self._check(path, digest, size, content):
+            print(f"[!] Corrupt archive of {hour} in the cache, downloading it again")
+            metrics.inc("archive_cache_corrupt_total")
+            self._drop([hour])
+            return None
+
+        self._touch(hour)
+        return content if read else path
+
+    def _store(self, hour, content):
+        """
+        Add the archive of an hour, written to a temporary file first so a crash never leaves a partial archive.
+
+        :return: The path of the archive.
+        """
+
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.object_path(digest)
+        if self._check(path, digest, len(content)):
+            # Reused, remove_orphans must see it as recent until the hour references it
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as archive_file:
+                archive_file.write(content)
+            os.replace(tmp_path, path)
+
+        now = time.time()
+        self._transaction(lambda cursor: cursor.execute("INSERT OR REPLACE INTO hours (hour, hash, size, fetched, used) VALUES (?, ?, ?, ?, ?)",
+                                                        (hour, digest, len(content), now, now)))
+        metrics.inc("archive_cache_stored_bytes_total", len(content))
+        return path
+
+    def _fetch(self, hour, url, read):
+        """
+        Get the archive of an hour, downloading and storing it if it isn't cached. The hour must be locked.
+
+        :return: Tuple with the content (or the path) and if the archive was downloaded.
+        """
+
+        cached = self._cached(hour, read)
+        if cached is not None:
+            metrics.inc("archive_cache_hits_total")
+            return cached, False
+
+        metrics.inc("archive_cache_misses_total")
+        content = download_file(url)
+        # Not cached if it isn't a gzip, e.g. the NoSuchKey error of an hour not published yet
+        if not is_archive(content):
+            return (content if read else None), False
+        path = self._store(hour, content)
+        return (content if read else path), True
+
+    def get(self, url):
+        """
+        Get the archive of a GH Archive URL from the cache, downloading and caching it if it isn't cached.
+
+        :param url: The GH Archive URL.
+        :return: The content of the URL, as download_file (contents that aren't gzip archives are returned but not cached).
+        """
+
+        hour = hour_key(url)
+        with self._hour_lock(hour):
+            content, stored = self._fetch(hour, url, read=True)
+        if stored:
+            self.evict(keep=hour)
+        return content
+
+    @contextmanager
+    def use_path(self, url):
+        """
+        Same as get but yielding the path of the cached archive (a .gz file), or None if the URL isn't an archive.
+        The hour stays locked inside the with block so it can't be evicted while the archive is read, don't
+        discard the URL inside it.
+
+        :return: A context manager yielding the path.
+        """
+
+        hour = hour_key(url)
+        with self._hour_lock(hour):
+            path, stored = self._fetch(hour, url, read=False)
+            yield path
+        if stored:
+            self.evict(keep=hour)
+
+    def discard(self, url):
+        """
+        Remove the hour of a URL from the cache, e.g. when its archive can't be decompressed.
+        """
+
+        hour = hour_key(url)
+        with self._hour_lock(hour):
+            self._drop([hour])
+            self._remove_lock_file(hour)
+
+    def _remove_lock_file(self, hour):
+        # Only while holding the lock, see _hour_lock
+        try:
+            os.remove(self._lock_path(hour))
+        except FileNotFoundError:
+            pass
+
+    def _drop_unused(self, hours):
+        """
+        Drop hours taking their locks and deleting their lock files. The hours in use (locked by another thread or
+        process, e.g. reading the path of use_path) are skipped.
+
+        :return: Tuple with the hours dropped and the bytes freed.
+        """
+
+        dropped = []
+        freed = 0
+        for hour in hours:
+            with self._hour_lock(hour, blocking=False) as locked:
+                if not locked:
+                    continue
+                freed += self._drop([hour])
+                self._remove_lock_file(hour)
+                dropped.append(hour)
+        return dropped, freed
+
+    def _drop(self, hours):
+        """
+        Remove hours from the index and delete the archives no other hour uses. The hours must be locked or unused.
+
+        :return: The bytes freed.
+        """
+
+        def drop(cursor):
+            freed = []
+            for hour in hours:
+                entry = cursor.execute("SELECT hash, size FROM hours WHERE hour = ?", (hour,)).fetchone()
+                if entry is None:
+                    continue
+                cursor.execute("DELETE FROM hours WHERE hour = ?", (hour,))
+                if cursor.execute("SELECT 1 FROM hours WHERE hash = ? LIMIT 1", (entry[0],)).fetchone() is None:
+                    freed.append(entry)
+            return freed
+
+        freed = self._transaction(drop)
+        for digest, _ in freed:
+            try:
+                os.remove(self.object_path(digest))
+            except FileNotFoundError:
+                pass
+        return sum(size for _, size in freed)
+
+    def evict(self, keep=None):
+        """
+        Evict the hours not used for max_age_secs, then the least recently used ones until the archives fit in
+        max_bytes.
+
+        :param keep: An hour never evicted, e.g. the one just downloaded.
+        :return: Number of hours evicted, the ones in use are skipped.
+        """
+
+        if self.max_bytes is None and self.max_age_secs is None:
+            return 0
+
+        def select_evicted(cursor):
+            evicted = []
+            if self.max_age_secs is not None:
+                evicted += [hour for hour, in cursor.execute("SELECT hour FROM hours WHERE used < ? AND hour != ?",
+                                                              (time.time() - self.max_age_secs, keep or ""))]
+            if self.max_bytes is not None:
+                # Archives shared by several hours count once and are freed with the last of them
+                total = cursor.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT hash, size FROM hours)").fetchone()[0]
+                rows = cursor.execute("SELECT hour, hash, size FROM hours ORDER BY used").fetchall()
+                users = Counter(digest for _, digest, _ in rows)
+                expired = set(evicted)
+                for hour, digest, size in rows:
+                    if hour in expired:
+                        users[digest] -= 1
+                        if not users[digest]:
+                            total -= size
+                for hour, digest, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    if hour == keep or hour in expired:
+                        continue
+                    evicted.append(hour)
+                    users[digest] -= 1
+                    if not users[digest]:
+                        total -= size
+            return evicted
+
+        evicted, freed = self._drop_unused(self._transaction(select_evicted))
+
+        if evicted:
+            metrics.inc("archive_cache_evicted_total", len(evicted))
+            print(f"[+] {len(evicted)} hours evicted from the archive cache ({freed / 1024 / 1024:.1f} MB freed)")
+        return len(evicted)
+
+    def verify_all(self):
+        """
+        Check the size and the hash of every cached archive, dropping the corrupt ones.
+
+        :return: The corrupt hours (the ones in use are dropped when they are used again).
+        """
+
+        with self.lock:
+            entries = self.connection.execute("SELECT hour, hash, size FROM hours").fetchall()
+
+        corrupt = []
+        verify, self.verify = self.verify, True
+        try:
+            for hour, digest, size in entries:
+                if not self._check(self.object_path(digest), digest, size):
+                    corrupt.append(hour)
+        finally:
+            self.verify = verify
+        self._drop_unused(corrupt)
+        return corrupt
+
+    def remove_orphans(self, grace_secs=ORPHAN_GRACE_SECS):
+        """
+        Delete the archives no hour uses (e.g. left by a process killed while storing them), the temporary files and
+        the lock files of the hours not cached (e.g. URLs that weren't archives). Only the files older than grace_secs
+        are deleted, the recent ones may be written by a process using the cache, and the locks held are kept.
+
+        :param grace_secs: Minimum seconds since the last modification of a file to delete it.
+        :return: The number of files deleted.
+        """
+
+        with self.lock:
+            hashes = {digest for digest, in self.connection.execute("SELECT DISTINCT hash FROM hours")}
+            hours = {hour for hour, in self.connection.execute("SELECT hour FROM hours")}
+
+        min_mtime = time.time() - grace_secs
+        removed = 0
+        objects_folder = os.path.join(self.cache_folder, "objects")
+        for folder in os.listdir(objects_folder):
+            for file_name in os.listdir(os.path.join(objects_folder, folder)):
+                if file_name.endswith(".gz") and file_name[:-len(".gz")] in hashes:
+                    continue
+                file_path = os.path.join(objects_folder, folder, file_name)
+                try:
+                    if os.path.getmtime(file_path) > min_mtime:
+                        continue
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    # Replaced or removed meanwhile by another process
+                    continue
+                removed += 1
+
+        for file_name in os.listdir(os.path.join(self.cache_folder, "locks")):
+            hour = file_name[:-len(".lock")]
+            if not file_name.endswith(".lock") or hour in hours:
+                continue
+            try:
+                if os.path.getmtime(self._lock_path(hour)) > min_mtime:
+                    continue
+            except FileNotFoundError:
+                continue
+            with self._hour_lock(hour, blocking=False) as locked:
+                # Cached meanwhile
+                if not locked or self._entry(hour) is not None:
+                    continue
+                self._remove_lock_file(hour)
+                removed += 1
+        return removed
+
+    def status(self):
+        """
+        :return: Dict with the hours cached, the bytes of their archives, the limits and the oldest uses.
+        """
+
+        with self.lock:
+            hours, oldest_fetched, oldest_used = self.connection.execute("SELECT COUNT(*), MIN(fetched), MIN(used) FROM hours").fetchone()
+            total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT hash, size FROM hours)").fetchone()[0]
+        return {
+            "hours": hours,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "max_age_secs": self.max_age_secs,
+            "oldest_fetched": oldest_fetched,
+            "oldest_used": oldest_used,
+        }
+
+    def close(self):
+        self.connection.close()
+
+
+def add_cache_arguments(parser):
+    """
+    Add the archive cache options shared by the scripts downloading GH Archive hours to an argparse parser.
+    """
+
+    group = parser.add_argument_group("archive cache")
+    group.add_argument('--cache-dir', type=str, default=None, help="Keep the downloaded GH Archive hours in this folder (shared by all the scripts) and read them from it instead of downloading them again.")
+    group.add_argument('--cache-max-gb', type=float, default=None, help="Disk quota of the archive cache, the least recently used hours are evicted above it.")
+    group.add_argument('--cache-max-age-days', type=float, default=None, help="Evict the hours not used for this many days.")
+    group.add_argument('--cache-no-verify', action='store_true', help="Only check the size of the cached archives when used, not their hash.")
+
+
+def cache_from_args(args):
+    """
+    :return: The ArchiveCache of the --cache-* options, or None without --cache-dir.
+    """
+
+    if not args.cache_dir:
+        return None
+    return ArchiveCache(args.cache_dir,
+                        int(args.cache_max_gb * 1024 ** 3) if args.cache_max_gb is not None else None,
+                        args.cache_max_age_days * 24 * 3600 if args.cache_max_age_days is not None else None,
+                        not args.cache_no_verify)
@@ -0,0 +1,201 @@
+import json
+import os
+
+from .columnar import np, require_numpy
+
+# Graph analytics over the bipartite users<->repos graph of a CollabIndex. Everything is computed with
+# vectorized operations over its CSR arrays, no Python object is created per node or edge.
+
+
+def edge_users(index):
+    """
+    :return: The user id of each edge of index.user_repos.
+    """
+    return np.repeat(np.arange(index.num_users, dtype=np.int64), np.diff(index.user_offsets))
+
+
+def _degree_stats(degrees, percents=(50, 90, 99, 99.9)):
+    if not len(degrees):
+        return {"count": 0}
+    return {
+        "count": int(len(degrees)),
+        "isolated": int((degrees == 0).sum()),
+        "mean": float(degrees.mean()),
+        "max": int(degrees.max()),
+        "percentiles": {str(percent): float(value) for percent, value in zip(percents, np.percentile(degrees, percents))},
+    }
+
+
+def degree_stats(index):
+    """
+    :return: A JSON serializable dict with the degree distributions of the users and the repos.
+    """
+
+    return {
+        "edges": int(len(index.user_repos)),
+        "users": _degree_stats(index.user_degrees()),
+        "repos": _degree_stats(index.repo_degrees()),
+    }
+
+
+def connected_components(index):
+    """
+    Connected components of the bipartite graph with min-label propagation plus pointer jumping,
+    users are the nodes [0, num_users) and repos the nodes [num_users, num_users + num_repos).
+
+    :return: A tuple (user_components, repo_components, sizes). The components are numbered by decreasing
+             number of nodes and sizes is an array (num_components, 2) with the users and repos of each one.
+    """
+
+    require_numpy()
+    num_users = index.num_users
+    labels = np.arange(num_users + index.num_repos, dtype=np.int64)
+    sources = edge_users(index)
+    targets = index.user_repos.astype(np.int64) + num_users
+
+    while True:
+        edge_labels = np.minimum(labels[sources], labels[targets])
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, sources, edge_labels)
+        np.minimum.at(new_labels, targets, edge_labels)
+        # Pointer jumping: every label is a node of the same component, follow it until it's a root
+        while True:
+            jumped = new_labels[new_labels]
+            if np.array_equal(jumped, new_labels):
+                break
+            new_labels = jumped
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+    roots, components = np.unique(labels, return_inverse=True)
+    node_counts = np.bincount(components)
+    order = np.argsort(-node_counts, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    components = rank[components]
+
+    sizes = np.zeros((len(roots), 2), dtype=np.int64)
+    sizes[:, 0] = np.bincount(components[:num_users], minlength=len(roots))
+    sizes[:, 1] = np.bincount(components[num_users:], minlength=len(roots))
+    return components[:num_users], components[num_users:], sizes
+
+
+def pagerank(index, damping=0.85, max_iter=100, tol=1e-9):
+    """
+    PageRank over the bipartite graph as an undirected graph: the rank of each node is split evenly between
+    its neighbours, so it flows from the users to their repos and back. The rank of the isolated nodes is
+    spread over all the nodes.
+
+    :param damping: Probability of following an edge instead of jumping to a random node.
+    :param max_iter: Max number of iterations.
+    :param tol: Stop when the L1 change of the ranks is below it.
+    :return: A tuple (user_ranks, repo_ranks), together they add up to 1.
+    """
+
+    require_numpy()
+    num_users, num_repos = index.num_users, index.num_repos
+    num_nodes = num_users + num_repos
+    if not num_nodes:
+        return np.zeros(0), np.zeros(0)
+
+    sources = edge_users(index)
+    targets = index.user_repos
+    user_degrees = index.user_degrees().astype(np.float64)
+    repo_degrees = index.repo_degrees().astype(np.float64)
+    user_isolated = user_degrees == 0
+    repo_isolated = repo_degrees == 0
+    user_degrees[user_isolated] = 1
+    repo_degrees[repo_isolated] = 1
+
+    user_ranks = np.full(num_users, 1 / num_nodes)
+    repo_ranks = np.full(num_repos, 1 / num_nodes)
+    for _ in range(max_iter):
+        isolated_rank = user_ranks[user_isolated].sum() + repo_ranks[repo_isolated].sum()
+        base = (1 - damping) / num_nodes + damping * isolated_rank / num_nodes
+        new_repo_ranks = base + damping * np.bincount(targets, weights=(user_ranks / user_degrees)[sources], minlength=num_repos)
+        new_user_ranks = base + damping * np.bincount(sources, weights=(repo_ranks / repo_degrees)[targets], minlength=num_users)
+        change = np.abs(new_user_ranks - user_ranks).sum() + np.abs(new_repo_ranks - repo_ranks).sum()
+        user_ranks, repo_ranks = new_user_ranks, new_repo_ranks
+        if change < tol:
+            break
+
+    return user_ranks, repo_ranks
+
+
+def repo_projection(index, max_user_degree=100, max_pairs=10_000_000):
+    """
+    Repo<->repo co-contribution graph: two repos are linked with the number of users that contributed to both.
+    A user with d repos creates d*(d-1) pairs, so users above max_user_degree (bots, mass forkers) are skipped.
+
+    :param max_user_degree: Max repos of a user for its pairs to be counted.
+    :param max_pairs: Approximate number of pairs generated at once, bounds the memory used.
+    :return: A tuple of CSR arrays (offsets, neighbours, weights), symmetric and without self links.
+    """
+
+    require_numpy()
+    num_repos = index.num_repos
+    degrees = index.user_degrees()
+    users = np.flatnonzero((degrees > 1) & (degrees <= max_user_degree))
+    pairs_per_user = degrees[users] * (degrees[users] - 1)
+
+    keys = []
+    weights = []
+    cumulative_pairs = np.cumsum(pairs_per_user)
+    chunk_start = 0
+    while chunk_start < len(users):
+        done_pairs = cumulative_pairs[chunk_start - 1] if chunk_start else 0
+        chunk_end = max(int(np.searchsorted(cumulative_pairs, done_pairs + max_pairs, side='right')), chunk_start + 1)
+        chunk_users = users[chunk_start:chunk_end]
+        chunk_start = chunk_end
+
+        # Every edge of a user is paired with every edge of the same user
+        starts = index.user_offsets[chunk_users]
+        chunk_degrees = degrees[chunk_users]
+        edges = np.repeat(starts, chunk_degrees) + _ranges(chunk_degrees)
+        repeats = np.repeat(chunk_degrees, chunk_degrees)
+        first = np.repeat(edges, repeats)
+        second = np.repeat(np.repeat(starts, chunk_degrees), repeats) + _ranges(repeats)
+        first_repos = index.user_repos[first].astype(np.int64)
+        second_repos = index.user_repos[second].astype(np.int64)
+        not_self = first_repos != second_repos
+
+        chunk_keys, chunk_weights = np.unique(first_repos[not_self] * num_repos + second_repos[not_self], return_counts=True)
+        keys.append(chunk_keys)
+        weights.append(chunk_weights)
+
+    if keys:
+        keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+        weights = np.bincount(inverse, weights=np.concatenate(weights)).astype(np.int64)
+    else:
+        keys = np.zeros(0, dtype=np.int64)
+        weights = np.zeros(0, dtype=np.int64)
+
+    offsets = np.zeros(num_repos + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys // num_repos, minlength=num_repos), out=offsets[1:])
+    return offsets, keys % num_repos, weights
+
+
+def _ranges(lengths):
+    """
+    :return: The concatenation of arange(length) for each length.
+    """
+    ends = np.cumsum(lengths)
+    return np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - lengths, lengths)
+
+
+def write_graph_stats(index, components_sizes, output_folder, file_name="collab_graph_stats.json"):
+    """
+    Write the degree stats and the components summary of the graph as JSON.
+    """
+
+    stats = degree_stats(index)
+    stats["components"] = {
+        "count": int(len(components_sizes)),
+        "largest": [{"users": int(users), "repos": int(repos)} for users, repos in components_sizes[:10]],
+    }
+
+    os.makedirs(output_folder, exist_ok=True)
+    with open(os.path.join(output_folder, file_name), 'w') as stats_file:
+        json.dump(stats, stats_file, indent=2)
+    print(f"[+] Collaboration graph stats written to {file_name}")
@@ -0,0 +1,301 @@
+import json
+import os
+
+from array import array
+from bisect import bisect_left
+from itertools import groupby
+
+from .columnar import np, require_numpy, file_identity, write_identity, StringTable
+from .external_sort import ExternalSorter
+from .functions import load_csv_user_file_gen
+
+
+# Bits of the users flags column
+USER_DELETED = 1
+USER_SITE_ADMIN = 2
+USER_HIREABLE = 4
+USER_GITHUB_STAR = 8
+USER_HAS_EMAIL = 16
+USER_HAS_COMPANY = 32
+
+INDEX_ARRAYS = ["usernames_buffer", "usernames_offsets", "user_flags", "repo_names_buffer", "repo_names_offsets",
+                "repo_names_order", "user_offsets", "user_repos", "repo_offsets", "repo_users"]
+
+
+def _id_dtype(count):
+    return np.int32 if count < 2 ** 31 else np.int64
+
+
+def _link_key(link):
+    return link
+
+
+def _link_name(link):
+    return link[0]
+
+
+class _StringTableBuilder:
+    """
+    Build a StringTable appending the strings one by one, they are converted to arrays every chunk_rows strings.
+    """
+
+    def __init__(self, chunk_rows):
+        self.chunk_rows = chunk_rows
+        self.strings = []
+        self.parts = []
+
+    def append(self, string):
+        self.strings.append(string)
+        if len(self.strings) >= self.chunk_rows:
+            self.parts.append(StringTable.from_strings(self.strings))
+            self.strings = []
+
+    def table(self):
+        if self.strings:
+            self.parts.append(StringTable.from_strings(self.strings))
+            self.strings = []
+        return StringTable.concatenate(self.parts)
+
+
+class _SortedNames:
+    """
+    Sorted view of a StringTable through a permutation, so names can be searched with bisect.
+    """
+
+    def __init__(self, names, order):
+        self.names = names
+        self.order = order
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, index):
+        return self.names[int(self.order[index])]
+
+
+class CollabIndex:
+    """
+    Links between users and the repos they contributed to, built from the repos_collab column of a users csv.
+    Both directions are stored as CSR arrays:
+        - user i contributed to the repo ids user_repos[user_offsets[i]:user_offsets[i+1]]
+        - repo j was contributed by the user ids repo_users[repo_offsets[j]:repo_offsets[j+1]]
+
+    User ids are the rows of the users csv. When the index is built with a RepoTable, the first len(table)
+    repo ids are the rows of the table, so the table columns can be used directly with the repo ids.
+    """
+
+    def __init__(self, usernames, user_flags, repo_names, repo_names_order, user_offsets, user_repos, repo_offsets, repo_users):
+        self.usernames = usernames
+        self.user_flags = user_flags
+        self.repo_names = repo_names
+        self.repo_names_order = repo_names_order
+        self.user_offsets = user_offsets
+        self.user_repos = user_repos
+        self.repo_offsets = repo_offsets
+        self.repo_users = repo_users
+
+    @property
+    def num_users(self):
+        return len(self.user_offsets) - 1
+
+    @property
+    def num_repos(self):
+        return len(self.repo_offsets) - 1
+
+    @classmethod
+    def build(cls, users_file, repo_table=None, chunk_rows=1_000_000, tmp_dir=None):
+        """
+        Build the index from a users csv. The memory used is bounded: the users are converted to arrays every
+        chunk_rows rows and the repo ids are assigned from an external sort of the repo names of the links.
+        The repos not in repo_table get their ids in the order of their names.
+
+        :param users_file: The users csv.
+        :param repo_table: Optional RepoTable whose rows become the first repo ids.
+        :param chunk_rows: Rows kept as Python objects before converting them to arrays, also the run size of the sort.
+        :param tmp_dir: Directory where the on-disk runs of the sort are written.
+        :return: The CollabIndex.
+        """
+
+        require_numpy()
+
+        # (repo name, 0, table row) of the table repos and (repo name, 1, link) of every user->repo link, the links
+        # are numbered in the order of the users so they can be sorted by name and written back in place
+        links = ExternalSorter(key=_link_key, run_size=chunk_rows, tmp_dir=tmp_dir)
+        num_table_repos = len(repo_table) if repo_table is not None else 0
+        for row in range(num_table_repos):
+            links.add((repo_table.names[row], 0, row))
+
+        usernames = _StringTableBuilder(chunk_rows)
+        user_flags = array('B')
+        user_offsets = array('q', [0])
+        num_links = 0
+        for user in load_csv_user_file_gen(users_file):
+            usernames.append(user.username)
+            user_flags.append(USER_DELETED * user.deleted | USER_SITE_ADMIN * user.site_admin | USER_HIREABLE * user.hireable |
+                              USER_GITHUB_STAR * user.github_star | USER_HAS_EMAIL * bool(user.email) | USER_HAS_COMPANY * bool(user.company))
+
+            # The same repo can appear twice after merging csvs, each link is stored once
+            for repo_name in dict.fromkeys(user.repos_collab):
+                if repo_name:
+                    links.add((repo_name, 1, num_links))
+                    num_links += 1
+            user_offsets.append(num_links)
+
+        # The names come sorted, so the ids in name order (repo_names_order) are known while they are assigned
+        user_repos = np.zeros(num_links, dtype=np.int64)
+        repo_names_order = array('q')
+        new_repo_names = _StringTableBuilder(chunk_rows)
+        num_repos = num_table_repos
+        for repo_name, name_links in groupby(links.sorted(), key=_link_name):
+            repo_id = None
+            for _, is_link, value in name_links:
+                if not is_link:
+                    # A name repeated in the table keeps all its rows, its links go to the first one
+                    repo_names_order.append(value)
+                    repo_id = value if repo_id is None else repo_id
+                    continue
+                if repo_id is None:
+                    repo_id = num_repos
+                    num_repos += 1
+                    new_repo_names.append(repo_name)
+                    repo_names_order.append(repo_id)
+                user_repos[value] = repo_id
+
+        repo_names = new_repo_names.table()
+        if repo_table is not None:
+            repo_names = StringTable.concatenate([repo_table.names, repo_names])
+        num_users = len(user_offsets) - 1
+        user_offsets = np.frombuffer(user_offsets, dtype=np.int64).copy()
+        user_repos = user_repos.astype(_id_dtype(num_repos))
+
+        # Invert the links: order the edges by repo keeping the users order inside each repo
+        edge_users = np.repeat(np.arange(num_users, dtype=_id_dtype(num_users)), np.diff(user_offsets))
+        order = np.argsort(user_repos, kind='stable')
+        repo_users = edge_users[order]
+        repo_offsets = np.zeros(num_repos + 1, dtype=np.int64)
+        np.cumsum(np.bincount(user_repos, minlength=num_repos), out=repo_offsets[1:])
+
+        repo_names_order = np.frombuffer(repo_names_order, dtype=np.int64).astype(_id_dtype(num_repos))
+
+        return cls(usernames.table(), np.frombuffer(user_flags, dtype=np.uint8).copy(), repo_names,
+                   repo_names_order, user_offsets, user_repos, repo_offsets, repo_users)
+
+    def save(self, folder, sources=None):
+        """
+        Save the index as .npy files, they can be loaded memory mapped.
+
+        :param folder: The folder where the index is saved.
+        :param sources: The csvs the index was built from, their size and mtime are saved to detect changes.
+        """
+
+        os.makedirs(folder, exist_ok=True)
+        sources_path = os.path.join(folder, "sources.json")
+        if os.path.exists(sources_path):
+            os.remove(sources_path)
+
+        arrays = {
+            "usernames_buffer": self.usernames.buffer, "usernames_offsets": self.usernames.offsets,
+            "user_flags": self.user_flags, "repo_names_buffer": self.repo_names.buffer,
+            "repo_names_offsets": self.repo_names.offsets, "repo_names_order": self.repo_names_order,
+            "user_offsets": self.user_offsets, "user_repos": self.user_repos,
+            "repo_offsets": self.repo_offsets, "repo_users": self.repo_users,
+        }
+        for name in INDEX_ARRAYS:
+            np.save(os.path.join(folder, f"{name}.npy"), arrays[name])
+        if sources:
+            write_identity(sources_path, [file_identity(source) for source in sources])
+
+    @classmethod
+    def load(cls, folder, mmap=True):
+        """
+        Load an index saved with save.
+
+        :param folder: The folder where the index was saved.
+        :param mmap: Memory map the arrays instead of reading them.
+        :return: The CollabIndex.
+        """
+
+        require_numpy()
+        mmap_mode = 'r' if mmap else None
+        arrays = {name: np.load(os.path.join(folder, f"{name}.npy"), mmap_mode=mmap_mode) for name in INDEX_ARRAYS}
+        return cls(
+            StringTable(arrays["usernames_buffer"], arrays["usernames_offsets"]), arrays["user_flags"],
+            StringTable(arrays["repo_names_buffer"], arrays["repo_names_offsets"]), arrays["repo_names_order"],
+            arrays["user_offsets"], arrays["user_repos"], arrays["repo_offsets"], arrays["repo_users"],
+        )
+
+    @staticmethod
+    def is_up_to_date(folder, sources):
+        """
+        :return: If the index saved in folder was built from the current version of the source csvs.
+        """
+
+        sources_path = os.path.join(folder, "sources.json")
+        if not os.path.isfile(os.path.join(folder, "repo_users.npy")) or not os.path.isfile(sources_path):
+            return False
+        with open(sources_path) as sources_file:
+            return json.load(sources_file) == [file_identity(source) for source in sources]
+
+    @classmethod
+    def build_cached(cls, users_file, folder, repos_file=None, repo_table=None):
+        """
+        Load the index of the csvs from folder, building and saving it first if it's missing or outdated.
+
+        :param repos_file: The repos csv repo_table was built from.
+        """
+
+        sources = [users_file] + ([repos_file] if repos_file else [])
+        if cls.is_up_to_date(folder, sources):
+            return cls.load(folder)
+
+        index = cls.build(users_file, repo_table)
+        index.save(folder, sources=sources)
+        return index
+
+    def repo_id(self, repo_name):
+        """
+        :return: The id of a repo by its full name or None if it isn't in the index.
+        """
+
+        sorted_names = _SortedNames(self.repo_names, self.repo_names_order)
+        position = bisect_left(sorted_names, repo_name)
+        if position < len(sorted_names) and sorted_names[position] == repo_name:
+            return int(self.repo_names_order[position])
+        return None
+
+    def repos_of(self, user_id):
+        return self.user_repos[self.user_offsets[user_id]:self.user_offsets[user_id + 1]]
+
+    def contributors_of(self, repo_id):
+        return self.repo_users[self.repo_offsets[repo_id]:self.repo_offsets[repo_id + 1]]
+
+    def repo_degrees(self):
+        return np.diff(self.repo_offsets)
+
+    def user_degrees(self):
+        return np.diff(self.user_offsets)
+
+    def repos_mask(self, table_mask):
+        """
+        Extend a boolean mask over the rows of the RepoTable used to build the index to all the repo ids.
+        Repos that are only in the users csv are left out.
+        """
+
+        mask = np.zeros(self.num_repos, dtype=bool)
+        mask[:len(table_mask)] = table_mask
+        return mask
+
+    def count_user_repos(self, repos_mask):
+        """
+        Vectorized count of the repos in repos_mask each user contributed to.
+
+        :param repos_mask: Boolean array over the repo ids.
+        :return: An int64 array over the user ids.
+        """
+
+        counts = np.zeros(len(self.user_repos) + 1, dtype=np.int64)
+        np.cumsum(repos_mask[self.user_repos], out=counts[1:])
+        return counts[self.user_offsets[1:]] - counts[self.user_offsets[:-1]]
+
+    def user_has(self, flag):
+        return (self.user_flags & flag) != 0
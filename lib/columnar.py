@@ -0,0 +1,371 @@
+import csv
+import json
+import os
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .compression import open_text
+from .functions import csv_int, csv_bool
+from .records import is_records_file, iter_blocks, decode_repos_columns
+
+
+# Bits of the flags column
+DELETED = 1
+PRIVATE = 2
+ARCHIVED = 4
+DISABLED = 8
+FLAG_NAMES = {"deleted": DELETED, "private": PRIVATE, "archived": ARCHIVED, "disabled": DISABLED}
+
+NUMERIC_COLUMNS = ["stars", "forks", "watchers"]
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError("numpy is required for the columnar tables, install it with: pip install numpy")
+
+
+def file_identity(file_path):
+    stat = os.stat(file_path)
+    return {"path": os.path.abspath(file_path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def write_identity(identity_path, identity):
+    """
+    Write the source identity of a saved table atomically. Saves write it after the arrays and remove the old
+    one first, so an interrupted save never leaves an identity next to arrays of another build.
+    """
+
+    tmp_path = f"{identity_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as identity_file:
+        json.dump(identity, identity_file)
+    os.replace(tmp_path, identity_path)
+
+
+class StringTable:
+    """
+    Strings stored as one utf-8 buffer plus an offsets array, much smaller than a list of Python strings.
+    """
+
+    def __init__(self, buffer, offsets):
+        """
+        :param buffer: uint8 array with all the strings concatenated.
+        :param offsets: int64 array of len(strings) + 1 offsets into the buffer.
+        """
+        self.buffer = buffer
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]].tobytes().decode('utf-8')
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [string.encode('utf-8') for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(string) for string in encoded], out=offsets[1:])
+        buffer = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return cls(buffer, offsets)
+
+    @classmethod
+    def concatenate(cls, tables):
+        buffer = np.concatenate([table.buffer for table in tables]) if tables else np.zeros(0, dtype=np.uint8)
+        offsets = [np.zeros(1, dtype=np.int64)]
+        base = 0
+        for table in tables:
+            offsets.append(table.offsets[1:] + base)
+            base += int(table.offsets[-1])
+        return cls(buffer, np.concatenate(offsets))
+
+
+class RepoTable:
+    """
+    Columnar view of a repos csv: stars/forks/watchers as int64 arrays, the 4 boolean columns packed
+    in a uint8 flags array and the names in a StringTable. Filters, histograms, percentiles and
+    group-by-flag counts are vectorized over the whole table.
+    """
+
+    def __init__(self, names, stars, forks, watchers, flags):
+        self.names = names
+        self.stars = stars
+        self.forks = forks
+        self.watchers = watchers
+        self.flags = flags
+
+    def __len__(self):
+        return len(self.stars)
+
+    @classmethod
+    def from_csv(cls, file_path, skip_header=True, chunk_rows=1_000_000):
+        """
+        Build the table from a repos csv, converting it to arrays every chunk_rows rows to bound the memory used.
+
+        :param file_path: The repos csv.
+        :param skip_header: Skip the header line.
+        :param chunk_rows: Number of rows parsed before converting them to arrays.
+        :return: The RepoTable.
+        """
+
+        require_numpy()
+        if is_records_file(file_path):
+            return cls.from_records(file_path)
+        csv.field_size_limit(sys.maxsize)
+
+        parts = []
+        malformed = 0
+
+        def flush(names, values):
+            parts.append((
+                StringTable.from_strings(names),
+                np.array(values, dtype=np.int64).reshape(-1, 4),
+            ))
+
+        with open_text(file_path) as repos_csv_file:
+            repos_csv_reader = csv.reader(repos_csv_file)
+            if skip_header:
+                next(repos_csv_reader, None)
+
+            names = []
+            values = []
+            for row in repos_csv_reader:
+                try:
+                    full_name, stars, forks, watchers, deleted, private, archived, disabled = row
+                    flags = (DELETED * csv_bool(deleted) | PRIVATE * csv_bool(private) |
+                             ARCHIVED * csv_bool(archived) | DISABLED * csv_bool(disabled))
+                    values.extend((csv_int(stars), csv_int(forks), csv_int(watchers), flags))
+                except ValueError:
+                    malformed += 1
+                    continue
+                names.append(full_name)
+
+                if len(names) >= chunk_rows:
+                    flush(names, values)
+                    names = []
+                    values = []
+
+            if names or not parts:
+                flush(names, values)
+
+        if malformed:
+            print(f"{malformed} malformed rows skipped in {file_path}")
+
+        columns = np.concatenate([part[1] for part in parts])
+        return cls(
+            StringTable.concatenate([part[0] for part in parts]),
+            columns[:, 0].copy(), columns[:, 1].copy(), columns[:, 2].copy(), columns[:, 3].astype(np.uint8),
+        )
+
+    @classmethod
+    def from_records(cls, file_path):
+        """
+        Build the table from a binary repos records file, its columns are copied into the arrays without creating any object.
+        """
+
+        require_numpy()
+        names, stars, forks, watchers, flags = [], [], [], [], []
+        for num_records, payload in iter_blocks(file_path):
+            block_names, block_stars, block_forks, block_watchers, block_flags = decode_repos_columns(payload, num_records)
+            names.append(StringTable.from_strings(block_names))
+            stars.append(np.frombuffer(block_stars, dtype=np.int32))
+            forks.append(np.frombuffer(block_forks, dtype=np.int32))
+            watchers.append(np.frombuffer(block_watchers, dtype=np.int32))
+            flags.append(np.frombuffer(block_flags, dtype=np.uint8))
+
+        concatenate = lambda parts, dtype: np.concatenate(parts).astype(dtype) if parts else np.zeros(0, dtype=dtype)
+        return cls(StringTable.concatenate(names), concatenate(stars, np.int64), concatenate(forks, np.int64),
+                   concatenate(watchers, np.int64), concatenate(flags, np.uint8))
+
+    def save(self, folder, source=None):
+        """
+        Save the table as .npy files, they can be loaded memory mapped.
+
+        :param folder: The folder where the table is saved.
+        :param source: The csv the table was built from, its size and mtime are saved to detect changes.
+        """
+
+        os.makedirs(folder, exist_ok=True)
+        source_path = os.path.join(folder, "source.json")
+        if os.path.exists(source_path):
+            os.remove(source_path)
+        np.save(os.path.join(folder, "names_buffer.npy"), self.names.buffer)
+        np.save(os.path.join(folder, "names_offsets.npy"), self.names.offsets)
+        for column in NUMERIC_COLUMNS + ["flags"]:
+            np.save(os.path.join(folder, f"{column}.npy"), getattr(self, column))
+        if source:
+            write_identity(source_path, file_identity(source))
+
+    @classmethod
+    def load(cls, folder, mmap=True):
+        """
+        Load a table saved with save.
+
+        :param folder: The folder where the table was saved.
+        :param mmap: Memory map the arrays instead of reading them.
+        :return: The RepoTable.
+        """
+
+        require_numpy()
+        mmap_mode = 'r' if mmap else None
+        load = lambda name: np.load(os.path.join(folder, f"{name}.npy"), mmap_mode=mmap_mode)
+        names = StringTable(load("names_buffer"), load("names_offsets"))
+        return cls(names, load("stars"), load("forks"), load("watchers"), load("flags"))
+
+    @staticmethod
+    def is_up_to_date(folder, source):
+        """
+        :return: If the table saved in folder was built from the current version of the source csv.
+        """
+
+        source_path = os.path.join(folder, "source.json")
+        if not os.path.isfile(os.path.join(folder, "flags.npy")) or not os.path.isfile(source_path):
+            return False
+        with open(source_path) as source_file:
+            return json.load(source_file) == file_identity(source)
+
+    @classmethod
+    def from_csv_cached(cls, file_path, folder):
+        """
+        Load the table of a csv from folder, building and saving it first if it's missing or outdated.
+        """
+
+        if cls.is_up_to_date(folder, file_path):
+            return cls.load(folder)
+
+        table = cls.from_csv(file_path)
+        table.save(folder, source=file_path)
+        return table
+
+    def mask(self, min_stars=None, min_forks=None, min_watchers=None, **flags):
+        """
+        Vectorized filter. The minimums are exclusive like in the gh_investigator reports.
+
+        :param flags: deleted/private/archived/disabled set to True or False to filter by them.
+        :return: A boolean array.
+        """
+
+        result = np.ones(len(self), dtype=bool)
+        if min_stars is not None:
+            result &= self.stars > min_stars
+        if min_forks is not None:
+            result &= self.forks > min_forks
+        if min_watchers is not None:
+            result &= self.watchers > min_watchers
+        for flag_name, value in flags.items():
+            if value is not None:
+                result &= ((self.flags & FLAG_NAMES[flag_name]) != 0) == bool(value)
+        return result
+
+    def percentiles(self, column, percents=(50, 90, 99, 99.9), mask=None):
+        values = getattr(self, column) if mask is None else getattr(self, column)[mask]
+        if not len(values):
+            return {}
+        return {str(percent): float(value) for percent, value in zip(percents, np.percentile(values, percents))}
+
+    def histogram(self, column, bins=None, mask=None):
+        """
+        Histogram with power of 10 bins by default, the distributions are very skewed.
+
+        :return: A list of (bin_start, bin_end, count).
+        """
+
+        values = getattr(self, column) if mask is None else getattr(self, column)[mask]
+        if bins is None:
+            max_value = int(values.max()) if len(values) else 0
+            bins = [-1, 0, 1] + [10 ** exp for exp in range(1, len(str(max(max_value, 1))) + 1)]
+            bins.append(max(max_value + 1, bins[-1] + 1))
+        counts, edges = np.histogram(values, bins=bins)
+        return [(int(edges[i]), int(edges[i + 1]), int(count)) for i, count in enumerate(counts)]
+
+    def fork_star_ratio(self, mask=None):
+        """
+        :return: forks/stars of the repos with stars (NaN free).
+        """
+
+        has_stars = self.stars > 0
+        if mask is not None:
+            has_stars &= mask
+        return self.forks[has_stars] / self.stars[has_stars]
+
+    def group_by_flags(self, mask=None):
+        """
+        :return: Dict from flag combination (e.g. "archived+private", "none") to number of repos.
+        """
+
+        flags = self.flags if mask is None else self.flags[mask]
+        counts = np.bincount(flags, minlength=16)
+        result = dict()
+        for combination, count in enumerate(counts):
+            if count:
+                label = "+".join(name for name, bit in FLAG_NAMES.items() if combination & bit) or "none"
+                result[label] = int(count)
+        return result
+
+    def indexes(self, mask):
+        """
+        :return: The indexes of the repos in the mask, in file order.
+        """
+        return np.flatnonzero(mask)
+
+    def sorted_indexes(self, column, mask=None, top=None):
+        """
+        Indexes of the repos sorted by column descending, ties keep the file order like a stable sorted().
+
+        :param column: stars, forks or watchers.
+        :param mask: Only the repos in the mask.
+        :param top: Only the first top indexes.
+        """
+
+        indexes = np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+        order = np.argsort(-getattr(self, column)[indexes], kind='stable')
+        if top:
+            order = order[:top]
+        return indexes[order]
+
+    def report_rows(self, indexes):
+        """
+        Rows in the format of the gh_investigator repos reports.
+
+        :param indexes: The indexes of the repos.
+        """
+
+        for index in indexes:
+            owner, repo_name = self.names[index].split('/')
+            flags = int(self.flags[index])
+            yield (owner, repo_name, int(self.stars[index]), int(self.forks[index]), int(self.watchers[index]),
+                   bool(flags & DELETED), bool(flags & PRIVATE), bool(flags & ARCHIVED), bool(flags & DISABLED))
+
+    def stats(self, mask=None):
+        """
+        Summary of the distributions of the table.
+
+        :return: A JSON serializable dict.
+        """
+
+        # Empty if none of the repos of the mask has stars, e.g. the deleted ones (stars = -1 once enriched)
+        ratio = self.fork_star_ratio(mask)
+        return {
+            "repos": int(len(self) if mask is None else mask.sum()),
+            "percentiles": {column: self.percentiles(column, mask=mask) for column in NUMERIC_COLUMNS},
+            "histograms": {column: self.histogram(column, mask=mask) for column in NUMERIC_COLUMNS},
+            "fork_star_ratio_percentiles": {
+                str(percent): float(value)
+                for percent, value in zip((50, 90, 99), np.percentile(ratio, (50, 90, 99)))
+            } if len(ratio) else {},
+            "flags": self.group_by_flags(mask),
+        }
+
+
+def write_stats(table, output_folder, file_name="repos_stats.json"):
+    """
+    Write the stats of a RepoTable as JSON.
+    """
+
+    os.makedirs(output_folder, exist_ok=True)
+    with open(os.path.join(output_folder, file_name), 'w') as stats_file:
+        json.dump(table.stats(), stats_file, indent=2)
+    print(f"[+] Repos stats written to {file_name}")
@@ -0,0 +1,148 @@
+import gzip
+import io
+import os
+import shutil
+import subprocess
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Transparent compression of the csvs by their extension: .gz (gzip) and .zst (zstandard). The files are streamed,
+# never decompressed to disk, and opening them in append mode adds a new gzip member or zstd frame at the end, which
+# the readers of both formats read as a single stream.
+#
+# gzip is compressed by pigz in a child process with several threads when it's installed, and by the gzip module
+# otherwise. zstd needs the zstandard package, which compresses with several threads by itself.
+
+COMPRESSION_EXTENSIONS = {"gz": ".gz", "zst": ".zst"}
+COMPRESSIONS = list(COMPRESSION_EXTENSIONS)
+DEFAULT_LEVELS = {"gz": 6, "zst": 3}
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+def require_zstandard():
+    if zstandard is None:
+        raise ImportError("zstandard is required for the .zst files, install it with: pip install zstandard")
+
+
+def compression_of(path):
+    """
+    :return: "gz", "zst" or None, by the extension of the path.
+    """
+
+    for compression, extension in COMPRESSION_EXTENSIONS.items():
+        if path.endswith(extension):
+            return compression
+    return None
+
+
+def is_compressed(path):
+    return compression_of(path) is not None
+
+
+def compressed_path(path, compression):
+    """
+    :return: The path with the extension of the compression (None for no compression).
+    """
+
+    return path + COMPRESSION_EXTENSIONS[compression] if compression else path
+
+
+def compression_threads(threads=None):
+    return threads if threads else os.cpu_count() or 1
+
+
+class PigzWriter(io.BufferedIOBase):
+    """
+    Binary file compressing what is written to it with a pigz child process. pigz writes a complete gzip member
+    when its input ends, so appending to an existing .gz file adds a new member.
+    """
+
+    def __init__(self, path, mode, threads, level):
+        super().__init__()
+        self.output_file = open(path, mode)
+        self.process = subprocess.Popen(["pigz", "-c", f"-{level}", "-p", str(threads)], stdin=subprocess.PIPE, stdout=self.output_file)
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.process.stdin.write(data)
+        return len(data)
+
+    def flush(self):
+        # close() ends the input of pigz before the flush of io.BufferedIOBase.close
+        if not self.closed and not self.process.stdin.closed:
+            self.process.stdin.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.process.stdin.close()
+            return_code = self.process.wait()
+            if return_code:
+                raise OSError(f"pigz exited with code {return_code} writing {self.output_file.name}")
+        finally:
+            self.output_file.close()
+            super().close()
+
+
+def open_binary(path, mode='rb', compression=None, threads=None, level=None):
+    """
+    Open a file decompressing or compressing it by its extension (or the compression given).
+
+    :param path: The file path.
+    :param mode: 'rb', 'wb' or 'ab'. Appending to a compressed file adds a new gzip member or zstd frame.
+    :param compression: "gz", "zst" or None to guess it from the extension.
+    :param threads: Compression threads (all the cpus by default).
+    :param level: Compression level (DEFAULT_LEVELS by default).
+    :return: A binary file object.
+    """
+
+    compression = compression or compression_of(path)
+    if compression is None:
+        return open(path, mode)
+
+    level = level if level is not None else DEFAULT_LEVELS[compression]
+    threads = compression_threads(threads)
+    writing = 'r' not in mode
+
+    if compression == "gz":
+        if writing and threads > 1 and shutil.which("pigz"):
+            return PigzWriter(path, mode, threads, level)
+        return gzip.open(path, mode, compresslevel=level)
+
+    require_zstandard()
+    raw_file = open(path, mode)
+    if writing:
+        return zstandard.ZstdCompressor(level=level, threads=threads).stream_writer(raw_file, closefd=True)
+    # Buffered for readline and line iteration, which the zstandard reader doesn't implement
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw_file, read_across_frames=True, closefd=True))
+
+
+def open_text(path, mode='r', compression=None, threads=None, level=None):
+    """
+    Same as open_binary but returning a utf-8 text file opened with newline='', as the csv module needs.
+
+    :param mode: 'r', 'w' or 'a'.
+    """
+
+    binary_file = open_binary(path, mode.replace('t', '').replace('b', '') + 'b', compression, threads, level)
+    return io.TextIOWrapper(binary_file, encoding='utf-8', newline='')
+
+
+def copy_file(source_path, destination_path, threads=None, level=None):
+    """
+    Copy a file (de)compressing it as their extensions say, e.g. a .csv into a .csv.zst.
+    """
+
+    if not is_compressed(source_path) and not is_compressed(destination_path):
+        shutil.copyfile(source_path, destination_path)
+        return
+
+    with open_binary(source_path) as source_file, open_binary(destination_path, 'wb', threads=threads, level=level) as destination_file:
+        shutil.copyfileobj(source_file, destination_file, COPY_BLOCK_SIZE)
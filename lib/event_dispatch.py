@@ -0,0 +1,139 @@
+import json
+import re
+
+
+# Registry of the extractors of the GH Archive events. Each extractor declares the event types it handles (or
+# ALL_EVENTS) and the fields it reads as dotted paths (e.g. "payload.ref"). Every event is dispatched once through
+# a table from its type to the extractors of that type: the fields they need are read from the event once and
+# passed to all of them, so an extractor costs nothing for the event types it doesn't handle.
+#
+# Only the fields the extractors of a type need are decoded: the events of types no extractor handles are skipped
+# without decoding them, and when none of the extractors of a type reads the payload (most of the bytes of an
+# event) only the part of the line before it is decoded.
+
+ALL_EVENTS = "*"
+
+# The "type" of a raw event line, GH Archive writes it right after the "id", before any nested object
+EVENT_TYPE_REGEX = re.compile(rb'"type"\s*:\s*"([^"]+)"')
+# GH Archive writes the payload after the id, type, actor and repo of the event
+PAYLOAD_KEY = b',"payload":'
+
+
+def sniff_event_type(line):
+    """
+    Get the type of an event from its raw json line without decoding it.
+
+    :param line: The event line (bytes).
+    :return: The event type, or None if it can't be found before the first nested object.
+    """
+
+    match = EVENT_TYPE_REGEX.search(line)
+    if not match or line.find(b'{', 1, match.start()) != -1:
+        return None
+    return match.group(1).decode('utf-8')
+
+
+class EventDispatcher:
+    def __init__(self):
+        # List of (function, set of event types or None for all of them, fields)
+        self.extractors = []
+        # Event type -> (tuple of (field, keys), tuple of functions, top level keys read or None if the payload
+        # is read), or None if no extractor handles the type
+        self.table = dict()
+
+    def extractor(self, event_types=ALL_EVENTS, fields=()):
+        """
+        Decorator registering a function as an extractor.
+
+        :param event_types: List of the event types it handles, or ALL_EVENTS.
+        :param fields: List of the dotted paths of the event fields it reads. The function receives a dict from
+                       these paths to their values (None for the missing ones).
+        """
+
+        def register(func):
+            self.add(func, event_types, fields)
+            return func
+        return register
+
+    def add(self, func, event_types=ALL_EVENTS, fields=()):
+        """
+        Register an extractor, the extractors of an event run in the order they were registered.
+        """
+
+        self.extractors.append((func, None if event_types == ALL_EVENTS else set(event_types), tuple(fields)))
+        self.table.clear()
+
+    def _build_entry(self, event_type):
+        funcs = []
+        fields = dict()
+        for func, event_types, func_fields in self.extractors:
+            if event_types is None or event_type in event_types:
+                funcs.append(func)
+                fields.update(dict.fromkeys(func_fields))
+
+        entry = None
+        if funcs:
+            paths = tuple((field, tuple(field.split('.'))) for field in fields)
+            top_keys = tuple(dict.fromkeys(keys[0] for _, keys in paths))
+            entry = (paths, tuple(funcs), None if "payload" in top_keys else top_keys)
+        self.table[event_type] = entry
+        return entry
+
+    def decode(self, line):
+        """
+        Decode the fields of a raw event line its extractors need.
+
+        :param line: The event line (bytes).
+        :return: Tuple with the type of the event and the decoded event, None if no extractor handles its type.
+                 Raises json.JSONDecodeError if the line isn't valid.
+        """
+
+        event_type = sniff_event_type(line)
+        if event_type is None:
+            event = json.loads(line)
+            return event.get("type"), event
+
+        entry = self.table[event_type] if event_type in self.table else self._build_entry(event_type)
+        if entry is None:
+            return event_type, None
+
+        top_keys = entry[2]
+        cut = line.find(PAYLOAD_KEY) if top_keys is not None else -1
+        if cut != -1:
+            try:
+                event = json.loads(line[:cut] + b'}')
+            except json.JSONDecodeError:
+                event = None
+            # Decoded again entirely if a key the extractors read isn't before the payload
+            if event is not None and all(key in event for key in top_keys):
+                return event_type, event
+
+        return event_type, json.loads(line)
+
+    def dispatch(self, event):
+        """
+        Run the extractors of the type of the event.
+
+        :param event: The decoded event.
+        :return: If any extractor handled it.
+        """
+
+        event_type = event.get("type")
+        entry = self.table[event_type] if event_type in self.table else self._build_entry(event_type)
+        if entry is None:
+            return False
+
+        paths, funcs, _ = entry
+        fields = dict()
+        for field, keys in paths:
+            value = event
+            try:
+                for key in keys:
+                    value = value[key]
+            except (KeyError, TypeError):
+                value = None
+            fields[field] = value
+
+        for func in funcs:
+            func(fields)
+        return True
@@ -0,0 +1,155 @@
+import heapq
+import os
+import pickle
+import shutil
+import tempfile
+
+
+def _write_run(items, tmp_dir, run_num):
+    """
+    Write an already sorted run of (key, item) tuples to a temporary file.
+
+    :param items: The sorted list of (key, item) tuples.
+    :param tmp_dir: The directory where the run file is created.
+    :param run_num: The number of the run, used in the file name.
+    :return: The path of the run file.
+    """
+
+    run_path = os.path.join(tmp_dir, f"run_{run_num}.pkl")
+    with open(run_path, 'wb') as run_file:
+        for key_item in items:
+            pickle.dump(key_item, run_file, protocol=pickle.HIGHEST_PROTOCOL)
+    return run_path
+
+
+def _read_run(run_path):
+    """
+    Stream the (key, item) tuples of a run file.
+
+    :param run_path: The path of the run file.
+    """
+
+    with open(run_path, 'rb') as run_file:
+        while True:
+            try:
+                yield pickle.load(run_file)
+            except EOFError:
+                return
+
+
+def _run_key(key_item):
+    return key_item[0]
+
+
+class ExternalSorter:
+    """
+    Sort items that don't fit in memory. Items are added one by one and kept in runs of run_size,
+    each full run is sorted and spilled to disk, and sorted() streams the runs back with a k-way merge.
+    Peak memory is bounded by run_size items. The sort is stable.
+    """
+
+    def __init__(self, key, reverse=False, run_size=1_000_000, tmp_dir=None):
+        """
+        :param key: Function returning the sort key of an item.
+        :param reverse: Sort in descending order.
+        :param run_size: Max number of items kept in memory per run.
+        :param tmp_dir: Directory where the runs are written. A temporary one is used by default.
+        """
+        self.key = key
+        self.reverse = reverse
+        self.run_size = run_size
+        self.tmp_dir = tmp_dir
+        self.runs_dir = None
+        self.run_paths = []
+        self.run = []
+
+    def add(self, item):
+        """
+        :param item: A picklable item.
+        """
+        self.run.append((self.key(item), item))
+        if len(self.run) >= self.run_size:
+            self._spill()
+
+    def _spill(self):
+        if self.runs_dir is None:
+            self.runs_dir = tempfile.mkdtemp(prefix="gh_sort_", dir=self.tmp_dir)
+        self.run.sort(key=_run_key, reverse=self.reverse)
+        self.run_paths.append(_write_run(self.run, self.runs_dir, len(self.run_paths)))
+        self.run = []
+
+    def sorted(self):
+        """
+        :return: A generator of all the items added in sorted order. The runs on disk are removed when it ends.
+        """
+        try:
+            # Everything fitted in one run, no need to touch the disk
+            if not self.run_paths:
+                self.run.sort(key=_run_key, reverse=self.reverse)
+                for _, item in self.run:
+                    yield item
+                return
+
+            if self.run:
+                self._spill()
+
+            runs = [_read_run(run_path) for run_path in self.run_paths]
+            for _, item in heapq.merge(*runs, key=_run_key, reverse=self.reverse):
+                yield item
+
+        finally:
+            self.run = []
+            self.run_paths = []
+            if self.runs_dir:
+                shutil.rmtree(self.runs_dir, ignore_errors=True)
+                self.runs_dir = None
+
+
+def external_sort(items, key, reverse=False, run_size=1_000_000, tmp_dir=None):
+    """
+    Sort an iterable that doesn't fit in memory using an ExternalSorter.
+
+    :param items: An iterable of picklable items.
+    :param key: Function returning the sort key of an item.
+    :param reverse: Sort in descending order.
+    :param run_size: Max number of items kept in memory per run.
+    :param tmp_dir: Directory where the runs are written. A temporary one is used by default.
+    :return: A generator of the items in sorted order.
+    """
+
+    sorter = ExternalSorter(key, reverse=reverse, run_size=run_size, tmp_dir=tmp_dir)
+    for item in items:
+        sorter.add(item)
+    yield from sorter.sorted()
+
+
+class TopK:
+    """
+    Keep the k items with the highest keys in a bounded heap (constant memory).
+    Ties are resolved in favour of the items added first, like a stable descending sort.
+    """
+
+    def __init__(self, k, key):
+        """
+        :param k: Number of items to keep.
+        :param key: Function returning the sort key of an item.
+        """
+        self.k = k
+        self.key = key
+        self.heap = []
+        self.count = 0
+
+    def add(self, item):
+        # The negative counter makes older items win the ties and keeps items from being compared
+        entry = (self.key(item), -self.count, item)
+        self.count += 1
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif entry[:2] > self.heap[0][:2]:
+            heapq.heapreplace(self.heap, entry)
+
+    def sorted(self):
+        """
+        :return: The kept items sorted from the highest to the lowest key.
+        """
+        return [item for _, _, item in sorted(self.heap, key=lambda entry: entry[:2], reverse=True)]
@@ -1,20 +1,35 @@
 import csv
 import gzip
 import json
+import math
 import os
 import random
 import requests
-import sys
 import time
 
+from itertools import groupby, islice
 from typing import List
 from datetime import datetime
+from threading import Lock
 
+from . import metrics
 from .classes import Repository, User
+from .compression import compressed_path, is_compressed, open_binary, open_text
+from .external_sort import external_sort
+from .records import REPOS_KIND, USERS_KIND, RECORDS_EXTENSION, is_records_file, load_records_gen, count_records, repo_row, user_row, write_records_file
+from .row_index import open_indexed_csv, csv_rows_gen, count_rows
 
 
 GITHUB_API_BASE_URL = "https://api.github.com"
-GITHUB_GRAPHQL_API_URL = "https://api.github.com/graphql"
+GITHUB_GRAPHQL_API_URL = os.environ.get("GITHUB_GRAPHQL_API_URL", "https://api.github.com/graphql")
+
+# Seconds to wait before retrying a failed GraphQL request and when every token is rate limited
+GRAPHQL_RETRY_SLEEP = 30
+GRAPHQL_RATE_LIMIT_SLEEP = 15*60
+
+# Counters of the GraphQL requests done by this process
+API_STATS = {"requests": 0, "retries": 0, "rate_limits": 0, "retry_slept_secs": 0, "rate_limit_slept_secs": 0, "points": 0}
+API_STATS_LOCK = Lock()
 
 def now_str():
     now = datetime.now()
@@ -38,15 +53,18 @@ def download_file(url, cont=0):
     :return: The content of the URL as bytes.
     """
     try:
-        response = requests.get(url)
+        with metrics.timer("download_seconds"):
+            response = requests.get(url)
     except Exception:
         time.sleep(20)
         if cont < 5:
             return download_file(url, cont+1)
         else:
             print("Error downloading " + url)
+            metrics.inc("download_errors_total")
             return None
 
+    metrics.inc("download_bytes_total", len(response.content))
     return response.content
 
 def decompress_gz(content):
@@ -58,13 +76,47 @@ def decompress_gz(content):
     """
 
     try:
-        return gzip.decompress(content)
+        with metrics.timer("decompress_seconds"):
+            decompressed = gzip.decompress(content)
+        metrics.inc("decompressed_bytes_total", len(decompressed))
+        return decompressed
     except gzip.BadGzipFile:
         if not "NoSuchKey" in content.decode("utf-8"):
             print("Unexpected no gzip content: " + content.decode("utf-8"))
         return None
 
 
+def add_api_stat(name, value=1):
+    """
+    Add value to one of the GraphQL API counters.
+
+    :param name: The name of the counter in API_STATS.
+    :param value: The value to add.
+    """
+
+    with API_STATS_LOCK:
+        API_STATS[name] += value
+    metrics.inc(f"graphql_{name}_total", value)
+
+
+def token_label(gh_token):
+    """
+    :return: The label identifying a token in the metrics without exposing it.
+    """
+    return "..." + gh_token[-4:]
+
+def api_sleep(seconds, stat_name):
+    """
+    Sleep waiting for the GraphQL API, accounting the time slept.
+
+    :param seconds: The seconds to sleep.
+    :param stat_name: The counter in API_STATS where the time slept is added.
+    """
+
+    add_api_stat(stat_name, seconds)
+    time.sleep(seconds)
+
+
 def get_github_token(gh_token_or_file):
     """
     Get a GitHub token from the provided input.
@@ -97,219 +149,342 @@ def get_next_token(gh_token_file, token):
             return tokens[token_index + 1].strip()
 
 
-def get_repos_info(repos: List[Repository], gh_token_or_file, cont=0, old_key="", gh_token=""):
+REPO_QUERY_TEMPLATE = '''
+    repo{index}: repository(owner: "{owner}", name: "{repo}") {{
+        nameWithOwner
+        stargazerCount
+        forks {{
+            totalCount
+        }}
+        watchers {{
+            totalCount
+        }}
+        isArchived
+        isDisabled{owner_fields}
+    }}
+'''
+
+# Fields of the repo owner, the same ones asked in USER_QUERY_TEMPLATE so owners don't need to be asked again
+REPO_OWNER_FIELDS = '''
+        owner {
+            login
+            __typename
+            ... on User {
+                isSiteAdmin
+                isHireable
+                isGitHubStar
+                email
+                company
+            }
+        }'''
+
+USER_QUERY_TEMPLATE = '''
+    user{index}: user(login: "{username}") {{
+        isSiteAdmin
+        isHireable
+        isGitHubStar
+        email
+        company
+    }}
+'''
+
+RATE_LIMIT_QUERY = "rateLimit { cost }"
+
+# GitHub charges a request the connections it asks for divided by 100 (rounded, at least 1 point). Every
+# repository alias asks for 2 connections (forks and watchers) and the user aliases for none
+REPO_QUERY_CONNECTIONS = 2
+USER_QUERY_CONNECTIONS = 0
+CONNECTIONS_PER_POINT = 100
+
+
+def estimate_query_connections(asset):
     """
-    Fetch the information of multiple GitHub repositories.
+    Connections that querying a Repository or a User adds to a GraphQL request.
 
-    :param repos: A list of Repositories.
-    :param gh_token: The GitHub token to use for authentication.
-    :return: A list of dictionaries containing the repository information, or None if the request fails.
+    :param asset: A Repository or a User.
+    :return: The number of connections.
     """
 
-    # A gh_token will be given if a rate limit error of a different one is thrown
-    if not gh_token:
-        gh_token = get_github_token(gh_token_or_file)
+    return REPO_QUERY_CONNECTIONS if isinstance(asset, Repository) else USER_QUERY_CONNECTIONS
 
-    repos_full_names = [repo.full_name for repo in repos]
 
-    query_template = '''
-        query{index}: repository(owner: "{owner}", name: "{repo}") {{
-            nameWithOwner
-            stargazerCount
-            forks {{
-                totalCount
-            }}
-            watchers {{
-                totalCount
-            }}
-            isArchived
-            isDisabled
-        }}
-    '''
+def estimate_connections_cost(connections):
+    """
+    :param connections: The connections of a GraphQL request.
+    :return: The estimated cost of the request, rounded up so it's never below the cost GitHub reports.
+    """
+
+    return max(1, math.ceil(connections / CONNECTIONS_PER_POINT))
+
+
+def estimate_batch_cost(assets):
+    """
+    :param assets: The Repositories and Users of a GraphQL request.
+    :return: The estimated cost of the request.
+    """
+
+    return estimate_connections_cost(sum(estimate_query_connections(asset) for asset in assets))
+
+
+class PointsBudget:
+    """
+    GraphQL points budget shared by the enrichment threads. A batch reserves its estimated cost before its request
+    is sent and releases it when done, when the cost GitHub reported for the request (API_STATS["points"]) is
+    already charged. So the budget is never exceeded while the real cost of the requests is what's spent.
+    """
+
+    def __init__(self, points):
+        """
+        :param points: Total GraphQL points to spend.
+        """
+
+        self.points = points
+        self.start_points = API_STATS["points"]
+        self.reserved = 0
+        self.lock = Lock()
+
+    def spent(self):
+        """
+        :return: The points spent since the budget was created.
+        """
+
+        with API_STATS_LOCK:
+            return API_STATS["points"] - self.start_points
+
+    def reserve(self, cost):
+        """
+        :param cost: The estimated cost of a request.
+        :return: If the budget allows the request, its cost is reserved until released.
+        """
+
+        with self.lock:
+            if self.spent() + self.reserved + cost > self.points:
+                return False
+            self.reserved += cost
+            return True
+
+    def release(self, cost):
+        """
+        Release the reservation of a finished request.
+        """
+
+        with self.lock:
+            self.reserved -= cost
+
+
+def build_assets_query(repos_full_names, usernames, with_owners=False):
+    """
+    Build a GraphQL query packing repository and user aliases in the same request.
+
+    :param repos_full_names: A list of repository full names.
+    :param usernames: A list of usernames.
+    :param with_owners: Also ask for the user fields of the owner of each repository.
+    :return: The GraphQL query.
+    """
+
     query_parts = []
+    owner_fields = REPO_OWNER_FIELDS if with_owners else ""
 
     for index, repo_full_name in enumerate(repos_full_names):
         owner, repo = repo_full_name.split('/')
-        query_parts.append(query_template.format(index=index, owner=owner, repo=repo))
+        query_parts.append(REPO_QUERY_TEMPLATE.format(index=index, owner=owner, repo=repo, owner_fields=owner_fields))
 
-    query = 'query {{ {} }}'.format(' '.join(query_parts))
+    for index, username in enumerate(usernames):
+        query_parts.append(USER_QUERY_TEMPLATE.format(index=index, username=username))
 
-    headers = {"Authorization": f"Bearer {gh_token}"}
+    # The cost GitHub charged for the request, the points budget is spent with it
+    query_parts.append(RATE_LIMIT_QUERY)
+    return 'query {{ {} }}'.format(' '.join(query_parts))
 
-    try:
-        response = requests.post(GITHUB_GRAPHQL_API_URL, json={"query": query}, headers=headers)
-    except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError):
-        if cont > 3:
-            print(f"{now_str()} Too many retries with {repos_full_names}, skipping")
-            return None
-        time.sleep(30)
-        return get_repos_info(repos, gh_token_or_file, cont=cont+1)
 
-    if response.status_code == 200:
-        result = json.loads(response.text)
+def parse_repo_data(repo_data):
+    """
+    Transform the GraphQL data of a repository alias into the repo info dict.
 
-        if "rate limit" in str(result.get("errors", {})).lower():
-            # Set initial old key if not set
-            if not old_key:
-                old_key = gh_token
-            
-            next_token = get_next_token(gh_token_or_file, gh_token) if "/" in gh_token_or_file else gh_token
-            if old_key == next_token:
-                print(f"{now_str()} Rate limit exceeded with all tokens in repos, sleeping 15 mins")
-                time.sleep(15*60)
-            
-            return get_repos_info(repos, gh_token_or_file, old_key=old_key, gh_token=next_token)
-        
-        data = result['data']
+    :param repo_data: The data returned for the alias (None if the repo doesn't exist).
+    :return: A dictionary with the repository information.
+    """
 
-        repos_info = dict()
-        for repo_key in data:
-            repo_data = data[repo_key]
-            if repo_data:
-                repo_info = {
-                    "stargazers_count": repo_data["stargazerCount"],
-                    "forks_count": repo_data["forks"]["totalCount"],
-                    "watchers_count": repo_data["watchers"]["totalCount"],
-                    "archived": repo_data["isArchived"],
-                    "disabled": repo_data["isDisabled"],
-                    "inexistent": False
-                }
-            else:
-                repo_info = {
-                    "inexistent": True
-                }
-            repo_full_name = repos_full_names[int(repo_key.replace("query",""))]
-            repos_info[repo_full_name] = repo_info
+    if not repo_data:
+        return {
+            "inexistent": True
+        }
+
+    repo_info = {
+        "stargazers_count": repo_data["stargazerCount"],
+        "forks_count": repo_data["forks"]["totalCount"],
+        "watchers_count": repo_data["watchers"]["totalCount"],
+        "archived": repo_data["isArchived"],
+        "disabled": repo_data["isDisabled"],
+        "inexistent": False
+    }
+
+    # Organizations aren't users, only the info of user owners is kept
+    owner_data = repo_data.get("owner")
+    if owner_data and owner_data.get("__typename") == "User":
+        repo_info["owner"] = parse_user_data(owner_data)
+        repo_info["owner"]["login"] = owner_data["login"]
+
+    return repo_info
 
-        return repos_info
-    
-    elif response.status_code == 502:
-        if cont > 3:
-            print(f"Too many 502 with {repos_full_names}, skipping")
-            return None
-        time.sleep(30)
-        return get_repos_info(repos, gh_token_or_file, cont=cont+1)
-    
-    else:
-        if "rate limit" in str(response.text):
-            # Set initial old key if not set
-            if not old_key:
-                old_key = gh_token
-            
-            next_token = get_next_token(gh_token_or_file, gh_token) if "/" in gh_token_or_file else gh_token
-            if old_key == next_token:
-                print(f"{now_str()} Rate limit exceeded with all tokens in repos, sleeping 15 mins")
-                time.sleep(15*60)
-            
-            return get_repos_info(repos, gh_token_or_file, old_key=old_key, gh_token=next_token)
-        
-        else:
-            print(f"Request failed with status code {response.status_code} with text {response.text}")
-            return None
 
-def get_users_info(users: List[User], gh_token_or_file, cont=0, old_key="", gh_token=""):
+def parse_user_data(user_data):
     """
-    Fetch the information of a GitHub user.
+    Transform the GraphQL data of a user alias into the user info dict.
 
-    :param users: List of Users.
-    :param gh_token: The GitHub token to use for authentication.
-    :return: A dictionary containing the user information, or None if the request fails.
+    :param user_data: The data returned for the alias (None if the user doesn't exist).
+    :return: A dictionary with the user information.
     """
 
-    if not gh_token:
-        gh_token = get_github_token(gh_token_or_file)        
+    if not user_data:
+        return {
+            "inexistent": True
+        }
 
-    usernames = [user.username for user in users]
+    return {
+        "site_admin": user_data["isSiteAdmin"],
+        "hireable": user_data["isHireable"],
+        "email": user_data["email"],
+        "company": user_data["company"],
+        "github_star": user_data["isGitHubStar"],
+        "inexistent": False
+    }
 
-    query_template = '''
-        query{index}: user(login: "{username}") {{
-            isSiteAdmin
-            isHireable
-            isGitHubStar
-            email
-            company
-        }}
-    '''
-    query_parts = []
 
-    for index, username in enumerate(usernames):
-        query_parts.append(query_template.format(index=index, username=username))
+def get_assets_info(repos: List[Repository], users: List[User], gh_token_or_file, with_owners=False, cont=0, old_key="", gh_token=""):
+    """
+    Fetch the information of multiple GitHub repositories and users in a single GraphQL request.
 
-    query = 'query {{ {} }}'.format(' '.join(query_parts))
+    :param repos: A list of Repositories.
+    :param users: A list of Users.
+    :param gh_token_or_file: Github token or file with tokens.
+    :param with_owners: Also get the user info of the repos owners (in the "owner" key of each repo info).
+    :return: A tuple with a dict of repos info and a dict of users info, or None if the request fails.
+    """
+
+    # A gh_token will be given if a rate limit error of a different one is thrown
+    if not gh_token:
+        gh_token = get_github_token(gh_token_or_file)
+
+    repos_full_names = [repo.full_name for repo in repos]
+    usernames = [user.username for user in users]
+    assets_names = repos_full_names + usernames
+    assets_kind = " and ".join(kind for kind, assets in (("repos", repos), ("users", users)) if assets)
+
+    query = build_assets_query(repos_full_names, usernames, with_owners)
 
     headers = {"Authorization": f"Bearer {gh_token}"}
 
     try:
-        response = requests.post(GITHUB_GRAPHQL_API_URL, json={"query": query}, headers=headers)
+        add_api_stat("requests")
+        with metrics.timer("graphql_latency_seconds"):
+            response = requests.post(GITHUB_GRAPHQL_API_URL, json={"query": query}, headers=headers)
     except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError):
         if cont > 3:
-            print(f"{now_str()} Too many retries with {usernames}, skipping")
+            print(f"{now_str()} Too many retries with {assets_names}, skipping")
             return None
-        time.sleep(30)
-        return get_users_info(users, gh_token_or_file, cont=cont+1)
+        add_api_stat("retries")
+        api_sleep(GRAPHQL_RETRY_SLEEP, "retry_slept_secs")
+        return get_assets_info(repos, users, gh_token_or_file, with_owners, cont=cont+1)
 
     if response.status_code == 200:
         result = json.loads(response.text)
-        
+
         if "rate limit" in str(result.get("errors", {})).lower():
+            add_api_stat("rate_limits")
+            metrics.inc("graphql_token_rate_limits_total", token=token_label(gh_token))
+
             # Set initial old key if not set
             if not old_key:
                 old_key = gh_token
-            
+
             next_token = get_next_token(gh_token_or_file, gh_token) if "/" in gh_token_or_file else gh_token
             if old_key == next_token:
-                print(f"{now_str()} Rate limit exceeded with all tokens in users, sleeping 15 mins")
-                time.sleep(15*60)
-            
-            return get_users_info(users, gh_token_or_file, old_key=old_key, gh_token=next_token)
-                
-        data = result['data']
+                print(f"{now_str()} Rate limit exceeded with all tokens in {assets_kind}, sleeping {GRAPHQL_RATE_LIMIT_SLEEP} secs")
+                metrics.inc("graphql_token_rate_limit_waits_total", token=token_label(gh_token))
+                api_sleep(GRAPHQL_RATE_LIMIT_SLEEP, "rate_limit_slept_secs")
+
+            return get_assets_info(repos, users, gh_token_or_file, with_owners, old_key=old_key, gh_token=next_token)
 
+        # Rejected queries (node or alias limits, timeouts...) come with errors and without data
+        data = result.get('data')
+        if data is None:
+            print(f"{now_str()} Request of {len(assets_names)} {assets_kind} failed with errors {result.get('errors')}")
+            return None
+
+        rate_limit = data.pop("rateLimit", None) or dict()
+        cost = rate_limit.get("cost")
+        add_api_stat("points", cost if cost is not None else estimate_batch_cost(repos + users))
+
+        repos_info = dict()
         users_info = dict()
-        for user_key in data:
-            user_data = data[user_key]
-            if user_data:
-                repo_info = {
-                    "site_admin": user_data["isSiteAdmin"],
-                    "hireable": user_data["isHireable"],
-                    "email": user_data["email"],
-                    "company": user_data["company"],
-                    "github_star": user_data["isGitHubStar"],
-                    "inexistent": False
-                }
+        for asset_key in data:
+            if asset_key.startswith("repo"):
+                repo_full_name = repos_full_names[int(asset_key.replace("repo",""))]
+                repos_info[repo_full_name] = parse_repo_data(data[asset_key])
             else:
-                repo_info = {
-                    "inexistent": True
-                }
-            username = usernames[int(user_key.replace("query",""))]
-            users_info[username] = repo_info
+                username = usernames[int(asset_key.replace("user",""))]
+                users_info[username] = parse_user_data(data[asset_key])
+
+        return repos_info, users_info
 
-        return users_info
-    
     elif response.status_code == 502:
         if cont > 3:
-            print(f"{now_str()} Too many 502 with {usernames}, skipping")
+            print(f"{now_str()} Too many 502 with {assets_names}, skipping")
             return None
-        time.sleep(30)
-        return get_users_info(users, gh_token_or_file, cont=cont+1)
-    
+        add_api_stat("retries")
+        api_sleep(GRAPHQL_RETRY_SLEEP, "retry_slept_secs")
+        return get_assets_info(repos, users, gh_token_or_file, with_owners, cont=cont+1)
+
     else:
         if "rate limit" in str(response.text):
+            add_api_stat("rate_limits")
+            metrics.inc("graphql_token_rate_limits_total", token=token_label(gh_token))
+
             # Set initial old key if not set
             if not old_key:
                 old_key = gh_token
-            
+
             next_token = get_next_token(gh_token_or_file, gh_token) if "/" in gh_token_or_file else gh_token
             if old_key == next_token:
-                print(f"{now_str()} Rate limit exceeded with all tokens in users, sleeping 15 mins")
-                time.sleep(15*60)
-            
-            return get_users_info(users, gh_token_or_file, old_key=old_key, gh_token=next_token)
-        
+                print(f"{now_str()} Rate limit exceeded with all tokens in {assets_kind}, sleeping {GRAPHQL_RATE_LIMIT_SLEEP} secs")
+                metrics.inc("graphql_token_rate_limit_waits_total", token=token_label(gh_token))
+                api_sleep(GRAPHQL_RATE_LIMIT_SLEEP, "rate_limit_slept_secs")
+
+            return get_assets_info(repos, users, gh_token_or_file, with_owners, old_key=old_key, gh_token=next_token)
+
         else:
             print(f"{now_str()} Request failed with status code {response.status_code} with text {response.text}")
             return None
 
+
+def get_repos_info(repos: List[Repository], gh_token_or_file, with_owners=False):
+    """
+    Fetch the information of multiple GitHub repositories.
+
+    :param repos: A list of Repositories.
+    :param gh_token_or_file: Github token or file with tokens.
+    :param with_owners: Also get the user info of the repos owners.
+    :return: A dict of dictionaries containing the repository information, or None if the request fails.
+    """
+
+    assets_info = get_assets_info(repos, [], gh_token_or_file, with_owners)
+    return assets_info[0] if assets_info else None
+
+
+def get_users_info(users: List[User], gh_token_or_file):
+    """
+    Fetch the information of multiple GitHub users.
+
+    :param users: List of Users.
+    :param gh_token_or_file: Github token or file with tokens.
+    :return: A dict of dictionaries containing the user information, or None if the request fails.
+    """
+
+    assets_info = get_assets_info([], users, gh_token_or_file)
+    return assets_info[1] if assets_info else None
+
+
 def read_urls_from_file(file_path):
     """
     Read URLs from a file, where each line in the file contains a single URL.
@@ -322,82 +497,166 @@ def read_urls_from_file(file_path):
     return urls
 
 
-def write_csv_files(repos, users, output_folder):
+REPOS_CSV_HEADER = ['full_name', 'stars', 'forks', 'watchers', 'deleted', 'private', 'archived', 'disabled']
+USERS_CSV_HEADER = ['user', 'repos_collab', 'deleted', 'site_admin', 'hireable', 'email', 'company', 'github_star']
+
+
+def repo_csv_row(repo):
+    return [
+        repo.full_name, 
+        repo.stars if repo.stars > 0 else "",
+        repo.forks if repo.forks > 0 else "",
+        repo.watchers if repo.watchers > 0 else "",
+        int(repo.deleted) if repo.deleted else "",
+        int(repo.private) if repo.private else "", 
+        int(repo.archived) if repo.archived else "", 
+        int(repo.disabled) if repo.disabled else ""
+    ]
+
+
+def user_csv_row(user):
+    return [
+        user.username, ','.join(user.repos_collab),
+        int(user.deleted) if user.deleted else "",
+        int(user.site_admin) if user.site_admin else "",
+        int(user.hireable) if user.hireable else "",
+        user.email,
+        user.company,
+        int(user.github_star) if user.github_star else "",
+    ]
+
+
+def write_csv_rows(csv_path, header, rows, index_every=None):
+    """
+    Write a csv, with its sidecar row index if index_every is given. The csv is compressed if its path ends
+    with .gz or .zst (compressed csvs are never indexed).
+    """
+
+    if index_every and not is_compressed(csv_path):
+        csv_file, csv_writer, row_index = open_indexed_csv(csv_path, 'w', header, index_every)
+        with csv_file:
+            csv_writer.writerows(rows)
+        row_index.save(csv_path)
+        return
+
+    with open_text(csv_path, 'w') as csv_file:
+        csv_writer = csv.writer(csv_file)
+        csv_writer.writerow(header)
+        csv_writer.writerows(rows)
+
+
+def write_csv_files(repos, users, output_folder, sort_keys=False, binary=False, index_every=None, compression=None):
     """
     Write the unique repositories and users to CSV files in the specified output folder.
 
     :param repos: A set of unique repositories.
     :param users: A set of unique users.
     :param output_folder: The folder path where the final CSV files will be generated.
+    :param sort_keys: Write the repos sorted by full name and the users by username, so the csvs can be merged with gh_merger.
+    :param binary: Write binary records files (repos.ghr and users.ghr) instead of csvs.
+    :param index_every: Also write a sidecar row index of the csvs with the offset of every index_every rows.
+    :param compression: Compress the csvs ("gz" or "zst"), written as repos.csv.gz/repos.csv.zst...
     """
     os.makedirs(output_folder, exist_ok=True)
 
+    if binary:
+        if repos:
+            write_records_file(os.path.join(output_folder, 'repos' + RECORDS_EXTENSION), REPOS_KIND,
+                               (repo_row(repos[key]) for key in (sorted(repos) if sort_keys else repos)))
+        if users:
+            write_records_file(os.path.join(output_folder, 'users' + RECORDS_EXTENSION), USERS_KIND,
+                               (user_row(users[key]) for key in (sorted(users) if sort_keys else users)))
+        return
+
     if repos:
-        repos_csv_path = os.path.join(output_folder, 'repos.csv')
-        
-        with open(repos_csv_path, 'w', newline='', encoding='utf-8') as repos_csv_file:
-            repos_csv_writer = csv.writer(repos_csv_file)
-            repos_csv_writer.writerow(['full_name', 'stars', 'forks', 'watchers', 'deleted', 'private', 'archived', 'disabled'])
-            for repo in repos.values():
-                repos_csv_writer.writerow([
-                    repo.full_name, 
-                    repo.stars if repo.stars > 0 else "",
-                    repo.forks if repo.forks > 0 else "",
-                    repo.watchers if repo.watchers > 0 else "",
-                    int(repo.deleted) if repo.deleted else "",
-                    int(repo.private) if repo.private else "", 
-                    int(repo.archived) if repo.archived else "", 
-                    int(repo.disabled) if repo.disabled else ""
-                ])
+        repos_csv_path = compressed_path(os.path.join(output_folder, 'repos.csv'), compression)
+        write_csv_rows(repos_csv_path, REPOS_CSV_HEADER, (repo_csv_row(repos[key]) for key in (sorted(repos) if sort_keys else repos)), index_every)
 
     if users:
-        users_csv_path = os.path.join(output_folder, 'users.csv')
-        
-        with open(users_csv_path, 'w', newline='', encoding='utf-8') as users_csv_file:
-            users_csv_writer = csv.writer(users_csv_file)
-            users_csv_writer.writerow(['user', 'repos_collab', 'deleted', 'site_admin', 'hireable', 'email', 'company', 'github_star'])            
+        users_csv_path = compressed_path(os.path.join(output_folder, 'users.csv'), compression)
+        write_csv_rows(users_csv_path, USERS_CSV_HEADER, (user_csv_row(users[key]) for key in (sorted(users) if sort_keys else users)), index_every)
+
+
+def csv_int(value):
+    """
+    Parse an integer csv field, empty fields (written for 0 by write_csv_files) are 0.
+    """
+    return int(value) if value else 0
+
+def csv_bool(value):
+    """
+    Parse a boolean csv field, empty fields (written for False by write_csv_files) are False.
+    """
+    return bool(int(value)) if value else False
+
+def parse_repo_row(row):
+    """
+    Transform a row of a repos csv into a Repository.
+
+    :param row: The csv row.
+    :return: The Repository. Raises ValueError if the row is malformed.
+    """
+
+    full_name, stars, forks, watchers, deleted, private, archived, disabled = row
+    return Repository(full_name, csv_int(stars), csv_int(forks), csv_int(watchers), csv_bool(deleted), csv_bool(private), csv_bool(archived), csv_bool(disabled))
+
+def parse_user_row(row):
+    """
+    Transform a row of a users csv into a User.
+
+    :param row: The csv row.
+    :return: The User. Raises ValueError if the row is malformed.
+    """
+
+    username, repos_collab, deleted, site_admin, hireable, email, company, github_star = row
+    repos_collab = repos_collab.split(',')
+    return User(username, repos_collab, csv_bool(deleted), csv_bool(site_admin), csv_bool(hireable), email, company, csv_bool(github_star))
+
+def report_malformed_rows(file_path, malformed, first_malformed):
+    """
+    Print how many rows of a csv couldn't be parsed.
+
+    :param file_path: The csv path.
+    :param malformed: The number of malformed rows.
+    :param first_malformed: The first malformed row found.
+    """
 
-            for user in users.values():
-                users_csv_writer.writerow([
-                    user.username, ','.join(user.repos_collab),
-                    int(user.deleted) if user.deleted else "",
-                    int(user.site_admin) if user.site_admin else "",
-                    int(user.hireable) if user.hireable else "",
-                    user.email,
-                    user.company,
-                    int(user.github_star) if user.github_star else "",
-                ])
+    if malformed:
+        print(f"{malformed} malformed rows skipped in {file_path}, first one: {first_malformed}")
 
 
-def load_csv_repo_file_gen(file_path, skip_header=True):
+def load_csv_repo_file_gen(file_path, skip_header=True, start_row=0, end_row=None):
     """
-    Load repositories and users from CSV files in the specified folder.
+    Load repositories from a CSV file or a binary records file.
 
     :param file_path: The file path where the repos CSV files are located.
-    :return: A tuple containing two sets: one for repositories and one for users.
+    :param start_row: First row to load (rows are counted after the header), csvs with a row index seek to it.
+    :param end_row: Stop before this row (None for the end of the file).
+    :return: A generator of Repository objects.
     """
 
-    csv.field_size_limit(sys.maxsize)
+    if is_records_file(file_path):
+        yield from islice(load_records_gen(file_path, REPOS_KIND), start_row, end_row)
+        return
 
-    with open(file_path, 'r', newline='', encoding='utf-8') as repos_csv_file:
-        repos_csv_reader = csv.reader(repos_csv_file)
+    malformed = 0
+    first_malformed = None
 
-        if skip_header:
-            next(repos_csv_reader)  # Skip header
-        
+    for row in csv_rows_gen(file_path, skip_header, start_row, end_row):
+        try:
+            repo = parse_repo_row(row)
+        except ValueError:
+            malformed += 1
+            first_malformed = first_malformed or row
+            continue
+        yield repo
 
-        for row in repos_csv_reader:
-            try:
-                full_name, stars, forks, watchers, deleted, private, archived, disabled = row
-                repo = Repository(full_name, int(stars), int(forks), int(watchers), bool(int(deleted)), bool(int(private)), bool(int(archived)), bool(int(disabled)))
-                yield repo
-            except:
-                print(f"Error reading {row}")
+    report_malformed_rows(file_path, malformed, first_malformed)
 
-def process_repos_in_batches(file_path, batch_size=300, skip_header=True):
+def process_repos_in_batches(file_path, batch_size=300, skip_header=True, start_row=0, end_row=None):
     cont = 0
     batch_of_repos = []
-    for repo in load_csv_repo_file_gen(file_path, skip_header=skip_header):
+    for repo in load_csv_repo_file_gen(file_path, skip_header=skip_header, start_row=start_row, end_row=end_row):
         batch_of_repos.append(repo)
         
         if len(batch_of_repos) == batch_size:
@@ -411,36 +670,38 @@ def process_repos_in_batches(file_path, batch_size=300, skip_header=True):
         yield batch_of_repos
 
 
-def load_csv_user_file_gen(file_path, skip_header=True):
+def load_csv_user_file_gen(file_path, skip_header=True, start_row=0, end_row=None):
     """
-    Load users from CSV files in the specified folder.
+    Load users from a CSV file or a binary records file.
 
     :param file_path: The file path where the users CSV files are located.
-    :return: A tuple containing two sets: one for repositories and one for users.
+    :param start_row: First row to load (rows are counted after the header), csvs with a row index seek to it.
+    :param end_row: Stop before this row (None for the end of the file).
+    :return: A generator of User objects.
     """
 
-    csv.field_size_limit(sys.maxsize)
-
-    with open(file_path, 'r', newline='', encoding='utf-8') as users_csv_file:
+    if is_records_file(file_path):
+        yield from islice(load_records_gen(file_path, USERS_KIND), start_row, end_row)
+        return
 
-        users_csv_reader = csv.reader(users_csv_file)
+    malformed = 0
+    first_malformed = None
 
-        if skip_header:
-            next(users_csv_reader)  # Skip header
+    for row in csv_rows_gen(file_path, skip_header, start_row, end_row):
+        try:
+            user = parse_user_row(row)
+        except ValueError:
+            malformed += 1
+            first_malformed = first_malformed or row
+            continue
+        yield user
 
-        for row in users_csv_reader:
-            try:
-                username, repos_collab, deleted, site_admin, hireable, email, company, github_star = row
-                repos_collab = repos_collab.split(',')
-                user = User(username, repos_collab, bool(int(deleted)), bool(int(site_admin)), bool(int(hireable)), email, company, bool(int(github_star)))
-                yield user
-            except:
-                print(f"Error reading {row}")
+    report_malformed_rows(file_path, malformed, first_malformed)
 
-def process_users_in_batches(file_path, batch_size=300, skip_header=True):
+def process_users_in_batches(file_path, batch_size=300, skip_header=True, start_row=0, end_row=None):
     cont = 0
     batch_of_users = []
-    for user in load_csv_user_file_gen(file_path, skip_header=skip_header):
+    for user in load_csv_user_file_gen(file_path, skip_header=skip_header, start_row=start_row, end_row=end_row):
         batch_of_users.append(user)
         
         if len(batch_of_users) == batch_size:
@@ -454,8 +715,199 @@ def process_users_in_batches(file_path, batch_size=300, skip_header=True):
         print("Final batch of users")
         yield batch_of_users
 
+def process_assets_in_batches(assets, batch_size=300):
+    """
+    Yield batches of batch_size assets from a generator of assets.
+
+    :param assets: A generator of Repository or User objects.
+    :param batch_size: The size of each batch.
+    """
+
+    batch_of_assets = []
+    for asset in assets:
+        batch_of_assets.append(asset)
+
+        if len(batch_of_assets) == batch_size:
+            yield batch_of_assets
+            batch_of_assets = []
+
+    if batch_of_assets:
+        print("Final batch of assets")
+        yield batch_of_assets
+
+
+def repo_contributors_gen(users_file, tmp_dir=None):
+    """
+    Count the contributors of each repo from the repos_collab column of a users csv, the scraper's measure of
+    the activity of a repo (its repos.csv has no stars, forks or watchers until it's enriched). The repo names
+    are sorted on disk and the equal ones counted, so the memory doesn't grow with the number of repos.
+
+    :param users_file: The users csv (or records file).
+    :param tmp_dir: Directory where the on-disk runs are written.
+    :return: A generator of (repo name, contributors) tuples sorted by repo name.
+    """
+
+    def repo_names_gen():
+        for user in load_csv_user_file_gen(users_file):
+            # The same repo can appear twice after merging csvs
+            yield from {repo for repo in user.repos_collab if repo}
+
+    for name, group in groupby(external_sort(repo_names_gen(), key=str, tmp_dir=tmp_dir)):
+        yield name, sum(1 for _ in group)
+
+
+def join_repo_contributors(repos, contributors, tmp_dir=None):
+    """
+    Merge-join the repos, sorted on disk by name, with the contributors of each repo.
+
+    :param repos: A generator of Repository objects.
+    :param contributors: A generator of (repo name, contributors) tuples sorted by repo name (see repo_contributors_gen).
+    :param tmp_dir: Directory where the on-disk runs are written.
+    :return: A generator of (Repository, contributors) tuples sorted by repo name.
+    """
+
+    contributors = iter(contributors)
+    name, count = next(contributors, (None, 0))
+    for repo in external_sort(repos, key=repo_full_name, tmp_dir=tmp_dir):
+        while name is not None and name < repo.full_name:
+            name, count = next(contributors, (None, 0))
+        yield repo, count if name == repo.full_name else 0
+
+
+def repo_full_name(repo: Repository):
+    return repo.full_name
+
+
+def repo_priority_score(repo: Repository, contributors=0):
+    """
+    Cheap score of how interesting a repository is to enrich, using only the csv columns.
+    The number of contributors the scraper saw weights the most, the stars, forks and watchers (only known
+    in enriched csvs) break the ties and deleted repos go last.
+
+    :param repo: The Repository to score.
+    :param contributors: The number of contributors of the repo (see repo_contributors_gen), 0 if unknown.
+    :return: The score of the repository, a tuple (contributors, counts score).
+    """
+
+    if repo.deleted:
+        return (-1, -1)
+
+    score = max(repo.stars, 0) + 2 * max(repo.forks, 0) + max(repo.watchers, 0)
+    if repo.archived or repo.disabled:
+        score = score // 2
+    return (contributors, score)
+
+
+def repo_contributors_priority_score(repo_contributors):
+    """
+    :param repo_contributors: A (Repository, contributors) tuple of join_repo_contributors.
+    :return: The repo_priority_score of the repository.
+    """
+
+    return repo_priority_score(*repo_contributors)
+
+
+def prioritized_repos_gen(repos, contributors_file=None, tmp_dir=None):
+    """
+    Order the repos from the highest to the lowest repo_priority_score with external sorts, so neither the repos
+    nor their contributors are ever kept in memory.
+
+    :param repos: A generator of Repository objects.
+    :param contributors_file: Users csv whose repos_collab gives the contributors of the repos, None to prioritize
+                              them only by their stars, forks and watchers.
+    :param tmp_dir: Directory where the on-disk runs are written.
+    :return: A generator of Repository objects.
+    """
+
+    if not contributors_file:
+        yield from external_sort(repos, key=repo_priority_score, reverse=True, tmp_dir=tmp_dir)
+        return
+
+    repos_contributors = join_repo_contributors(repos, repo_contributors_gen(contributors_file, tmp_dir), tmp_dir)
+    for repo, _ in external_sort(repos_contributors, key=repo_contributors_priority_score, reverse=True, tmp_dir=tmp_dir):
+        yield repo
+
+
+def user_priority_score(user: User):
+    """
+    Cheap score of how interesting a user is to enrich. The number of repos the scraper saw
+    the user contributing to is the activity count.
+
+    :param user: The User to score.
+    :return: The score of the user.
+    """
+
+    if user.deleted:
+        return -1
+
+    score = len([repo for repo in user.repos_collab if repo])
+    if user.email:
+        score += 1
+    if user.company:
+        score += 1
+    return score
+
+
+def process_assets_by_priority(assets, score_func, batch_size=300, tmp_dir=None):
+    """
+    Yield batches of assets ordered from the highest to the lowest score. The ordering is done
+    with an external sort so the whole file is never kept in memory.
+
+    :param assets: A generator of Repository or User objects.
+    :param score_func: Function returning the priority score of an asset.
+    :param batch_size: The size of each batch.
+    :param tmp_dir: Directory where the on-disk priority runs are written.
+    """
+
+    batch_of_assets = []
+    for asset in external_sort(assets, key=score_func, reverse=True, tmp_dir=tmp_dir):
+        batch_of_assets.append(asset)
+
+        if len(batch_of_assets) == batch_size:
+            yield batch_of_assets
+            batch_of_assets = []
+
+    if batch_of_assets:
+        print("Final batch of prioritized assets")
+        yield batch_of_assets
+
+def process_assets_by_cost(assets, max_cost=None, max_assets=None):
+    """
+    Yield batches of assets (repos and users can be mixed) of up to max_assets aliases and max_cost estimated GraphQL points.
+
+    :param assets: A generator of Repository and/or User objects.
+    :param max_cost: The max estimated cost of each batch (None for no limit).
+    :param max_assets: The max assets (aliases) of each batch (None for no limit).
+    """
+
+    batch_connections = 0
+    batch_of_assets = []
+    for asset in assets:
+        asset_connections = estimate_query_connections(asset)
+        if batch_of_assets and ((max_cost and estimate_connections_cost(batch_connections + asset_connections) > max_cost)
+                                or (max_assets and len(batch_of_assets) >= max_assets)):
+            yield batch_of_assets
+            batch_of_assets = []
+            batch_connections = 0
+
+        batch_of_assets.append(asset)
+        batch_connections += asset_connections
+
+    if batch_of_assets:
+        print("Final batch of assets")
+        yield batch_of_assets
+
 def count_lines(file_path):
-    with open(file_path, 'r') as file:
+    if is_records_file(file_path):
+        return count_records(file_path)
+
+    # The rows and the header, without reading the csv
+    rows = count_rows(file_path)
+    if rows is not None:
+        return rows + 1
+
+    # Compressed csvs are decompressed on the fly
+    with open_binary(file_path) as file:
         lines = 0
         for _ in file:
             lines += 1
@@ -0,0 +1,155 @@
+import csv
+import heapq
+import os
+
+from itertools import groupby
+
+from .compression import open_text
+from .external_sort import external_sort
+from .functions import load_csv_repo_file_gen, load_csv_user_file_gen, REPOS_CSV_HEADER, USERS_CSV_HEADER, repo_csv_row, user_csv_row
+
+
+def _repo_key(repo):
+    return repo.full_name
+
+
+def _user_key(user):
+    return user.username
+
+
+def combine_repos(repos):
+    """
+    Combine the versions of the same repo from several scrape runs with the rules of the scraper:
+    a repo is deleted if any run saw its main branch deleted, and a deleted repo is not private.
+    Counts from enriched csvs keep the highest value.
+
+    :param repos: The Repository objects with the same full name, in the order of the runs.
+    :return: The combined Repository.
+    """
+
+    combined = repos[0]
+    for repo in repos[1:]:
+        combined.stars = max(combined.stars, repo.stars)
+        combined.forks = max(combined.forks, repo.forks)
+        combined.watchers = max(combined.watchers, repo.watchers)
+        combined.deleted = combined.deleted or repo.deleted
+        combined.private = combined.private or repo.private
+        combined.archived = combined.archived or repo.archived
+        combined.disabled = combined.disabled or repo.disabled
+
+    if combined.deleted:
+        combined.private = False
+    return combined
+
+
+def combine_users(users):
+    """
+    Combine the versions of the same user from several scrape runs with the rules of the scraper:
+    the repos collaborated are joined in the order of the runs without duplicates, up to max_repos.
+    Flags are kept if any run has them and the first email/company found is used.
+
+    :param users: The User objects with the same username, in the order of the runs.
+    :return: The combined User.
+    """
+
+    combined = users[0]
+    repos_collab = dict()
+    for user in users:
+        for repo_name in user.repos_collab:
+            if len(repos_collab) >= combined.max_repos:
+                break
+            if repo_name:
+                repos_collab[repo_name] = True
+
+        if user is not combined:
+            combined.deleted = combined.deleted or user.deleted
+            combined.site_admin = combined.site_admin or user.site_admin
+            combined.hireable = combined.hireable or user.hireable
+            combined.github_star = combined.github_star or user.github_star
+            combined.email = combined.email or user.email
+            combined.company = combined.company or user.company
+
+    combined.repos_collab = list(repos_collab)
+    return combined
+
+
+def _check_sorted(assets, key, file_path):
+    """
+    Pass through the assets of a csv checking that they are sorted by key.
+    """
+
+    previous = None
+    for asset in assets:
+        asset_key = key(asset)
+        if previous is not None and asset_key < previous:
+            raise ValueError(f"{file_path} is not sorted ({asset_key} after {previous}), write it with gh_scraper.py --sorted or merge with --unsorted")
+        previous = asset_key
+        yield asset
+
+
+def merge_sorted_assets(sources, key, combine_func):
+    """
+    k-way merge of several streams of assets sorted by key, combining the assets with the same key.
+    Only the current asset of each stream and the group being combined are kept in memory.
+
+    :param sources: The sorted generators of assets, in the order of the runs.
+    :param key: Function returning the key of an asset.
+    :param combine_func: Function combining a list of assets with the same key into one.
+    :return: A generator of the combined assets sorted by key.
+    """
+
+    # The index of the source breaks the ties so the assets of the same key come in the order of the runs
+    keyed_sources = [((key(asset), source_index, asset) for asset in source) for source_index, source in enumerate(sources)]
+    merged = heapq.merge(*keyed_sources, key=lambda entry: entry[:2])
+    for _, group in groupby(merged, key=lambda entry: entry[0]):
+        yield combine_func([asset for _, _, asset in group])
+
+
+def _merge_csvs(file_paths, output_path, load_func, key, combine_func, header, row_func, unsorted=False, run_size=1_000_000):
+    sources = []
+    for file_path in file_paths:
+        assets = load_func(file_path)
+        if unsorted:
+            sources.append(external_sort(assets, key=key, run_size=run_size))
+        else:
+            sources.append(_check_sorted(assets, key, file_path))
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    count = 0
+    with open_text(output_path, 'w') as output_file:
+        csv_writer = csv.writer(output_file)
+        csv_writer.writerow(header)
+        for asset in merge_sorted_assets(sources, key, combine_func):
+            csv_writer.writerow(row_func(asset))
+            count += 1
+    return count
+
+
+def merge_repos_csvs(file_paths, output_path, unsorted=False, run_size=1_000_000):
+    """
+    Merge the repos csvs of several scrape runs into one sorted csv.
+
+    :param file_paths: The repos csvs, sorted by full name unless unsorted is set.
+    :param output_path: The merged csv.
+    :param unsorted: Sort each input on disk first.
+    :param run_size: Max rows kept in memory when sorting the inputs.
+    :return: The number of repos written.
+    """
+
+    return _merge_csvs(file_paths, output_path, load_csv_repo_file_gen, _repo_key, combine_repos,
+                       REPOS_CSV_HEADER, repo_csv_row, unsorted, run_size)
+
+
+def merge_users_csvs(file_paths, output_path, unsorted=False, run_size=1_000_000):
+    """
+    Merge the users csvs of several scrape runs into one sorted csv.
+
+    :param file_paths: The users csvs, sorted by username unless unsorted is set.
+    :param output_path: The merged csv.
+    :param unsorted: Sort each input on disk first.
+    :param run_size: Max rows kept in memory when sorting the inputs.
+    :return: The number of users written.
+    """
+
+    return _merge_csvs(file_paths, output_path, load_csv_user_file_gen, _user_key, combine_users,
+                       USERS_CSV_HEADER, user_csv_row, unsorted, run_size)
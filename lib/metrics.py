@@ -0,0 +1,370 @@
+import json
+import os
+import sys
+import threading
+import time
+
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Metrics shared by every script: counters, gauges and histograms identified by a name and optional labels.
+# Updating a metric is a dict update under a lock, so hot loops should aggregate locally (e.g. per log file)
+# and report once per chunk of work instead of once per event.
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+METRICS_LOCK = threading.Lock()
+COUNTERS = dict()
+GAUGES = dict()
+GAUGE_FUNCS = dict()
+HISTOGRAMS = dict()
+START_TIME = time.time()
+
+# Stage of each thread, used by the sampling profiler to split the samples
+THREAD_STAGES = dict()
+
+REPORTER = None
+SERVER = None
+PROFILER = None
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def key_str(key):
+    """
+    :return: The metric key in the Prometheus format, e.g. events_parsed_total{type="PushEvent"}.
+    """
+
+    name, labels = key
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{label}="{value}"' for label, value in labels) + "}"
+
+
+def inc(name, value=1, **labels):
+    """
+    Add value to a counter.
+    """
+
+    key = _key(name, labels)
+    with METRICS_LOCK:
+        COUNTERS[key] = COUNTERS.get(key, 0) + value
+
+
+def inc_many(name, counts, label):
+    """
+    Add several values to a counter at once, e.g. the events of each type of a file.
+
+    :param counts: Dict (or Counter) with the value to add for each value of label.
+    :param label: The name of the label.
+    """
+
+    with METRICS_LOCK:
+        for label_value, value in counts.items():
+            key = _key(name, {label: label_value})
+            COUNTERS[key] = COUNTERS.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    with METRICS_LOCK:
+        GAUGES[_key(name, labels)] = value
+
+
+def register_gauge(name, func, **labels):
+    """
+    Gauge whose value is obtained calling func when the metrics are read, e.g. the size of a dict or a queue.
+    """
+
+    with METRICS_LOCK:
+        GAUGE_FUNCS[_key(name, labels)] = func
+
+
+def unregister_gauge(name, **labels):
+    with METRICS_LOCK:
+        GAUGE_FUNCS.pop(_key(name, labels), None)
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    """
+    Add a value (usually seconds) to a histogram.
+    """
+
+    key = _key(name, labels)
+    with METRICS_LOCK:
+        histogram = HISTOGRAMS.get(key)
+        if histogram is None:
+            histogram = HISTOGRAMS[key] = {"buckets": buckets, "counts": [0] * len(buckets), "count": 0, "sum": 0}
+        histogram["count"] += 1
+        histogram["sum"] += value
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                histogram["counts"][i] += 1
+                break
+
+
+@contextmanager
+def timer(name, **labels):
+    """
+    Observe the seconds spent in the block in a histogram.
+    """
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+@contextmanager
+def stage(stage_name):
+    """
+    Mark the current thread as working in a stage, the profiler samples are grouped by stage.
+    """
+
+    thread_id = threading.get_ident()
+    previous = THREAD_STAGES.get(thread_id)
+    THREAD_STAGES[thread_id] = stage_name
+    try:
+        yield
+    finally:
+        if previous is None:
+            THREAD_STAGES.pop(thread_id, None)
+        else:
+            THREAD_STAGES[thread_id] = previous
+
+
+def snapshot():
+    """
+    :return: A JSON serializable dict with the current value of every metric.
+    """
+
+    with METRICS_LOCK:
+        counters = {key_str(key): value for key, value in COUNTERS.items()}
+        gauges = {key_str(key): value for key, value in GAUGES.items()}
+        gauge_funcs = list(GAUGE_FUNCS.items())
+        histograms = {key_str(key): {"count": histogram["count"], "sum": round(histogram["sum"], 6),
+                                     "buckets": dict(zip(map(str, histogram["buckets"]), histogram["counts"]))}
+                      for key, histogram in HISTOGRAMS.items()}
+
+    for key, func in gauge_funcs:
+        try:
+            gauges[key_str(key)] = func()
+        except Exception:
+            pass
+
+    return {
+        "time": datetime.now().isoformat(timespec='seconds'),
+        "uptime_secs": round(time.time() - START_TIME, 3),
+        "counters": counters,
+        "gauges": gauges,
+        "histograms": histograms,
+    }
+
+
+def render_prometheus():
+    """
+    :return: The metrics in the Prometheus text exposition format.
+    """
+
+    with METRICS_LOCK:
+        counters = sorted(COUNTERS.items())
+        gauges = dict(GAUGES)
+        gauge_funcs = list(GAUGE_FUNCS.items())
+        histograms = sorted((key, dict(histogram, counts=list(histogram["counts"]))) for key, histogram in HISTOGRAMS.items())
+
+    for key, func in gauge_funcs:
+        try:
+            gauges[key] = func()
+        except Exception:
+            pass
+
+    lines = []
+    typed = set()
+
+    def add_type(name, metric_type):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {metric_type}")
+
+    for key, value in counters:
+        add_type(key[0], "counter")
+        lines.append(f"{key_str(key)} {value}")
+
+    for key, value in sorted(gauges.items()):
+        add_type(key[0], "gauge")
+        lines.append(f"{key_str(key)} {value}")
+
+    for (name, labels), histogram in histograms:
+        add_type(name, "histogram")
+        cumulative = 0
+        for bound, count in zip(histogram["buckets"], histogram["counts"]):
+            cumulative += count
+            lines.append(f"{key_str((name + '_bucket', labels + (('le', str(bound)),)))} {cumulative}")
+        lines.append(f"{key_str((name + '_bucket', labels + (('le', '+Inf'),)))} {histogram['count']}")
+        lines.append(f"{key_str((name + '_sum', labels))} {histogram['sum']}")
+        lines.append(f"{key_str((name + '_count', labels))} {histogram['count']}")
+
+    return "\n".join(lines) + "\n"
+
+
+class MetricsReporter(threading.Thread):
+    """
+    Append a snapshot of the metrics as a JSON line to a file every interval seconds.
+    """
+
+    def __init__(self, jsonl_path, interval=10):
+        super().__init__(daemon=True, name="metrics")
+        self.jsonl_path = jsonl_path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        os.makedirs(os.path.dirname(jsonl_path) or '.', exist_ok=True)
+        self.start()
+
+    def write_snapshot(self):
+        with open(self.jsonl_path, 'a') as jsonl_file:
+            jsonl_file.write(json.dumps(snapshot()) + "\n")
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.write_snapshot()
+
+    def close(self):
+        self.stop_event.set()
+        self.join()
+        self.write_snapshot()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ("/", "/metrics"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port, host="127.0.0.1"):
+    """
+    Serve the metrics in the Prometheus text format at http://host:port/metrics from a background thread.
+
+    :return: The server.
+    """
+
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    print(f"[+] Metrics served at http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+class SamplingProfiler(threading.Thread):
+    """
+    Sample the stacks of every thread each interval seconds and count them by the stage of the thread.
+    The profiles are written as folded stacks (one "frame;frame;frame count" per line), the input of
+    flamegraph.pl and speedscope. Threads without stage are counted under their thread name.
+    """
+
+    def __init__(self, output_folder, interval=0.01, max_depth=64):
+        super().__init__(daemon=True, name="profiler")
+        self.output_folder = output_folder
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = dict()
+        self.stop_event = threading.Event()
+        self.start()
+
+    def sample(self):
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own_id = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            frames = []
+            while frame is not None and len(frames) < self.max_depth:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stage_name = THREAD_STAGES.get(thread_id) or thread_names.get(thread_id, "unknown")
+            self.samples.setdefault(stage_name, Counter())[";".join(reversed(frames))] += 1
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def close(self):
+        """
+        Stop sampling and write a <stage>.folded file per stage.
+        """
+
+        self.stop_event.set()
+        self.join()
+        os.makedirs(self.output_folder, exist_ok=True)
+        for stage_name, stacks in self.samples.items():
+            file_name = "".join(char if char.isalnum() or char in "-_" else "_" for char in stage_name) + ".folded"
+            with open(os.path.join(self.output_folder, file_name), 'w') as folded_file:
+                for stack, count in stacks.most_common():
+                    folded_file.write(f"{stack} {count}\n")
+        total = sum(sum(stacks.values()) for stacks in self.samples.values())
+        print(f"[+] {total} profiler samples of {len(self.samples)} stages written to {self.output_folder}")
+
+
+def add_metrics_arguments(parser):
+    """
+    Add the metrics options shared by all the scripts to an argparse parser.
+    """
+
+    group = parser.add_argument_group("metrics")
+    group.add_argument('--metrics-file', type=str, default=None, help="Append a JSON line with all the metrics to this file periodically.")
+    group.add_argument('--metrics-interval', type=float, default=10, help="Seconds between the JSON lines of the metrics file.")
+    group.add_argument('--metrics-port', type=int, default=None, help="Serve the metrics in the Prometheus text format on this local port.")
+    group.add_argument('--profile', type=str, default=None, help="Sample the stacks of the threads and write a folded profile per stage to this folder.")
+    group.add_argument('--profile-interval', type=float, default=0.01, help="Seconds between profiler samples.")
+
+
+def start_metrics(metrics_file=None, interval=10, port=None, profile_folder=None, profile_interval=0.01):
+    """
+    Start the reporters asked for, nothing is started (or costs anything) by default.
+    """
+
+    global REPORTER, SERVER, PROFILER
+
+    if metrics_file:
+        REPORTER = MetricsReporter(metrics_file, interval)
+    if port is not None:
+        SERVER = serve_metrics(port)
+    if profile_folder:
+        PROFILER = SamplingProfiler(profile_folder, profile_interval)
+
+
+def start_metrics_from_args(args):
+    start_metrics(args.metrics_file, args.metrics_interval, args.metrics_port, args.profile, args.profile_interval)
+
+
+def stop_metrics():
+    """
+    Write the last metrics line and the profiles, and stop the server.
+    """
+
+    global REPORTER, SERVER, PROFILER
+
+    if REPORTER:
+        REPORTER.close()
+        REPORTER = None
+    if PROFILER:
+        PROFILER.close()
+        PROFILER = None
+    if SERVER:
+        SERVER.shutdown()
+        SERVER = None
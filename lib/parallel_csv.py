@@ -0,0 +1,205 @@
+import csv
+import io
+import os
+import sys
+
+from collections import deque
+from multiprocessing import Pool
+
+from .compression import is_compressed, open_binary
+from .records import is_records_file, load_records_gen
+from .row_index import RowIndex
+
+
+SCAN_BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def find_csv_chunks(file_path, chunk_bytes=64 * 1024 * 1024, skip_header=True):
+    """
+    Split a csv file into byte ranges that start and end at record boundaries.
+    A newline is a record boundary only if an even number of quotes precede it, so newlines
+    inside quoted fields never split a record.
+
+    :param file_path: The csv path.
+    :param chunk_bytes: Approximate size of each range.
+    :param skip_header: Leave the header line out of the first range.
+    :return: A list of (start, end) byte offsets.
+    """
+
+    file_size = os.path.getsize(file_path)
+
+    # The offsets of the row index are row boundaries, no need to scan the file
+    row_index = RowIndex.load(file_path) if skip_header else None
+    if row_index and row_index.rows:
+        boundaries = [row_index.offsets[0]]
+        for offset in row_index.offsets[1:]:
+            if offset - boundaries[-1] >= chunk_bytes:
+                boundaries.append(offset)
+        boundaries.append(file_size)
+        return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+    boundaries = [0]
+    quotes_before = 0
+    offset = 0
+    target = chunk_bytes
+
+    with open(file_path, 'rb') as csv_file:
+        if skip_header:
+            header = csv_file.readline()
+            # A header never has quoted newlines in the files generated here
+            offset = len(header)
+            boundaries = [offset]
+            target = offset + chunk_bytes
+
+        while True:
+            block = csv_file.read(SCAN_BLOCK_SIZE)
+            if not block:
+                break
+
+            block_end = offset + len(block)
+            pos = 0
+            while target < block_end:
+                newline = block.find(b'\n', max(pos, target - offset))
+                if newline == -1:
+                    break
+
+                quotes_before += block.count(b'"', pos, newline)
+                pos = newline
+                if quotes_before % 2 == 0:
+                    boundaries.append(offset + newline + 1)
+                    target = offset + newline + 1 + chunk_bytes
+                else:
+                    # Inside a quoted field, look for the next newline
+                    target = offset + newline + 1
+
+            quotes_before += block.count(b'"', pos)
+            offset = block_end
+
+    if boundaries[-1] < file_size:
+        boundaries.append(file_size)
+
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+
+def compressed_csv_chunks_gen(file_path, chunk_bytes=64 * 1024 * 1024, skip_header=True):
+    """
+    Split a compressed csv, which can't be seeked, into blocks of its decompressed content that end at record
+    boundaries (a newline preceded by an even number of quotes), decompressing it on the fly.
+
+    :return: A generator of bytes.
+    """
+
+    with open_binary(file_path) as csv_file:
+        if skip_header:
+            csv_file.readline()
+
+        pending = b""
+        while True:
+            block = csv_file.read(chunk_bytes)
+            if not block:
+                break
+            pending += block
+
+            boundary = pending.rfind(b'\n')
+            while boundary != -1 and pending.count(b'"', 0, boundary) % 2:
+                boundary = pending.rfind(b'\n', 0, boundary)
+            if boundary != -1:
+                yield pending[:boundary + 1]
+                pending = pending[boundary + 1:]
+
+        if pending:
+            yield pending
+
+
+def _parse_csv_chunk(args):
+    """
+    Worker parsing a byte range of a csv.
+
+    :param args: Tuple with the csv path, the (start, end) range (or the content of a compressed csv), the row parser and the optional batch function.
+    :return: A tuple with the list of parsed objects (or the batch function result), the number of malformed rows and the first malformed row.
+    """
+
+    file_path, chunk, parse_row, batch_func = args
+    csv.field_size_limit(sys.maxsize)
+
+    if isinstance(chunk, bytes):
+        content = chunk.decode('utf-8')
+    else:
+        start, end = chunk
+        with open(file_path, 'rb') as csv_file:
+            csv_file.seek(start)
+            content = csv_file.read(end - start).decode('utf-8')
+
+    parsed = []
+    malformed = 0
+    first_malformed = None
+    for row in csv.reader(io.StringIO(content, newline='')):
+        try:
+            parsed.append(parse_row(row))
+        except ValueError:
+            malformed += 1
+            first_malformed = first_malformed or row
+
+    if batch_func:
+        parsed = batch_func(parsed)
+
+    return parsed, malformed, first_malformed
+
+
+def load_csv_file_batches_parallel(file_path, parse_row, processes=None, chunk_bytes=64 * 1024 * 1024, skip_header=True, batch_func=None):
+    """
+    Parse a csv in worker processes, each one parsing a different byte range of the file.
+    Batches are yielded in file order. Malformed rows are counted and reported at the end.
+
+    Sending the parsed objects back to the main process costs about as much as parsing them, so when only
+    a part of the rows or an aggregate is needed pass a batch_func to reduce each batch inside the workers.
+    Compressed csvs are decompressed in the main process and their blocks sent to the workers.
+
+    :param file_path: The csv path.
+    :param parse_row: Top level function transforming a row into an object (e.g. parse_repo_row).
+    :param processes: The number of worker processes (all the cpus by default).
+    :param chunk_bytes: Approximate bytes parsed by each task.
+    :param skip_header: Skip the header line.
+    :param batch_func: Optional top level function applied to each list of parsed objects inside the workers.
+    :return: A generator of lists of parsed objects (or of the batch_func results).
+    """
+
+    if is_compressed(file_path):
+        chunks = compressed_csv_chunks_gen(file_path, chunk_bytes, skip_header)
+    else:
+        chunks = iter(find_csv_chunks(file_path, chunk_bytes, skip_header))
+    chunk = next(chunks, None)
+    processes = processes or os.cpu_count()
+    malformed = 0
+    first_malformed = None
+
+    with Pool(processes) as pool:
+        # Only a couple of chunks per process are in flight so the parsed batches waiting to be consumed stay bounded
+        pending = deque()
+        while chunk is not None or pending:
+            while chunk is not None and len(pending) < 2 * processes:
+                pending.append(pool.apply_async(_parse_csv_chunk, ((file_path, chunk, parse_row, batch_func),)))
+                chunk = next(chunks, None)
+
+            parsed, chunk_malformed, chunk_first_malformed = pending.popleft().get()
+            malformed += chunk_malformed
+            first_malformed = first_malformed or chunk_first_malformed
+            yield parsed
+
+    if malformed:
+        print(f"{malformed} malformed rows skipped in {file_path}, first one: {first_malformed}")
+
+
+def load_csv_file_parallel_gen(file_path, parse_row, processes=None, chunk_bytes=64 * 1024 * 1024, skip_header=True):
+    """
+    Same as load_csv_file_batches_parallel but yielding the objects one by one, as a drop-in
+    replacement of load_csv_repo_file_gen/load_csv_user_file_gen.
+    Binary records files are already cheap to decode, they are read in the main process.
+    """
+
+    if is_records_file(file_path):
+        yield from load_records_gen(file_path)
+        return
+
+    for batch in load_csv_file_batches_parallel(file_path, parse_row, processes, chunk_bytes, skip_header):
+        yield from batch
@@ -0,0 +1,356 @@
+import csv
+import os
+import struct
+import sys
+
+from array import array
+from itertools import repeat
+
+from .classes import Repository, User
+from .compression import open_text
+
+
+# Binary record files, a compact alternative to the csvs passed between gh_scraper, gh_enhancer and gh_investigator.
+#
+# A file starts with MAGIC and a byte with its kind (REPOS_KIND or USERS_KIND), followed by length-prefixed blocks of
+# records. Each block has a BLOCK_STRUCT header (number of records, payload length) and a payload with the records
+# stored by column:
+#   - repos: int32 stars, int32 forks, int32 watchers, uint8 flags (deleted, private, archived, disabled), names
+#   - users: uint8 flags (deleted, site_admin, hireable, github_star), names, emails, companies, repos_collab
+# Every string column is a uint32 length followed by its utf-8 values joined by NUL, the repos collaborated by a user
+# are joined by newlines. Decoding a column is a single C call (array.frombytes, bytes.split), per record Python code
+# like varint parsing would be slower than the csv module itself.
+
+MAGIC = b"GHRB\x01"
+REPOS_KIND = b"R"
+USERS_KIND = b"U"
+HEADER_SIZE = len(MAGIC) + 1
+RECORDS_EXTENSION = ".ghr"
+
+BLOCK_STRUCT = struct.Struct("<II")
+LENGTH_STRUCT = struct.Struct("<I")
+SEPARATOR = "\0"
+REPOS_SEPARATOR = "\n"
+
+DELETED = 1
+PRIVATE = 2
+ARCHIVED = 4
+DISABLED = 8
+
+SITE_ADMIN = 2
+HIREABLE = 4
+GITHUB_STAR = 8
+
+# Bit value of every possible flags byte, so the flags columns are decoded with map
+FLAG_TABLES = {bit: tuple(bool(flags & bit) for flags in range(256)) for bit in (1, 2, 4, 8)}
+
+
+def is_records_file(file_path):
+    """
+    :return: If the file is a binary records file (by its magic, not its extension).
+    """
+
+    try:
+        with open(file_path, 'rb') as records_file:
+            return records_file.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def records_kind(file_path):
+    """
+    :return: REPOS_KIND or USERS_KIND.
+    """
+
+    with open(file_path, 'rb') as records_file:
+        header = records_file.read(HEADER_SIZE)
+    if header[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{file_path} is not a records file")
+    return header[len(MAGIC):]
+
+
+def _int32_column(values):
+    column = array('i', values)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column.tobytes()
+
+
+def _string_column(values):
+    column = SEPARATOR.join(values).encode('utf-8')
+    return LENGTH_STRUCT.pack(len(column)) + column
+
+
+def _flags_column(first, second, third, fourth):
+    return bytes([(1 if a else 0) | (2 if b else 0) | (4 if c else 0) | (8 if d else 0) for a, b, c, d in zip(first, second, third, fourth)])
+
+
+def _block(num_records, payload):
+    return BLOCK_STRUCT.pack(num_records, len(payload)) + payload
+
+
+def encode_repos_block(rows):
+    """
+    Encode rows with the columns of the repos csv (already typed, as the enhancer builds them) into a block.
+    """
+
+    if not rows:
+        return b''
+    full_names, stars, forks, watchers, deleted, private, archived, disabled = zip(*rows)
+    payload = b''.join([_int32_column(stars), _int32_column(forks), _int32_column(watchers),
+                        _flags_column(deleted, private, archived, disabled), _string_column(full_names)])
+    return _block(len(rows), payload)
+
+
+def encode_users_block(rows):
+    """
+    Encode rows with the columns of the users csv (repos_collab as a list or comma joined) into a block.
+    """
+
+    if not rows:
+        return b''
+    usernames, repos_collab, deleted, site_admin, hireable, emails, companies, github_star = zip(*rows)
+    repos_collab = [REPOS_SEPARATOR.join(filter(None, repos.split(',') if isinstance(repos, str) else repos)) for repos in repos_collab]
+    payload = b''.join([_flags_column(deleted, site_admin, hireable, github_star), _string_column(usernames),
+                        _string_column(email or '' for email in emails), _string_column(company or '' for company in companies),
+                        _string_column(repos_collab)])
+    return _block(len(rows), payload)
+
+
+def repo_row(repo):
+    return (repo.full_name, repo.stars, repo.forks, repo.watchers, repo.deleted, repo.private, repo.archived, repo.disabled)
+
+
+def user_row(user):
+    return (user.username, user.repos_collab, user.deleted, user.site_admin, user.hireable, user.email, user.company, user.github_star)
+
+
+def _read_int32_column(payload, offset, num_records):
+    column = array('i')
+    column.frombytes(payload[offset:offset + 4 * num_records])
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column, offset + 4 * num_records
+
+
+def _read_string_column(payload, offset, num_records):
+    length, = LENGTH_STRUCT.unpack_from(payload, offset)
+    offset += LENGTH_STRUCT.size
+    values = payload[offset:offset + length].decode('utf-8').split(SEPARATOR)
+    return values, offset + length
+
+
+def _read_flags(flags, bit):
+    return map(FLAG_TABLES[bit].__getitem__, flags)
+
+
+def decode_repos_columns(payload, num_records):
+    """
+    Decode a repos block payload without creating objects, for consumers working by column.
+
+    :return: A tuple (full_names, stars, forks, watchers, flags) with lists, int32 arrays and the flags bytes.
+    """
+
+    stars, offset = _read_int32_column(payload, 0, num_records)
+    forks, offset = _read_int32_column(payload, offset, num_records)
+    watchers, offset = _read_int32_column(payload, offset, num_records)
+    flags = payload[offset:offset + num_records]
+    full_names, _ = _read_string_column(payload, offset + num_records, num_records)
+    return full_names, stars, forks, watchers, flags
+
+
+def decode_repos_block(payload, num_records):
+    """
+    :return: The list of Repository objects of a block payload.
+    """
+
+    full_names, stars, forks, watchers, flags = decode_repos_columns(payload, num_records)
+    return list(map(Repository, full_names, stars, forks, watchers, _read_flags(flags, DELETED), _read_flags(flags, PRIVATE),
+                    _read_flags(flags, ARCHIVED), _read_flags(flags, DISABLED)))
+
+
+def decode_users_block(payload, num_records):
+    """
+    :return: The list of User objects of a block payload.
+    """
+
+    flags = payload[:num_records]
+    usernames, offset = _read_string_column(payload, num_records, num_records)
+    emails, offset = _read_string_column(payload, offset, num_records)
+    companies, offset = _read_string_column(payload, offset, num_records)
+    repos_collab, _ = _read_string_column(payload, offset, num_records)
+    # Like in the csvs a user without repos has [''] as repos_collab
+    repos_collab = map(str.split, repos_collab, repeat(REPOS_SEPARATOR))
+    return list(map(User, usernames, repos_collab, _read_flags(flags, DELETED), _read_flags(flags, SITE_ADMIN),
+                    _read_flags(flags, HIREABLE), emails, companies, _read_flags(flags, GITHUB_STAR)))
+
+
+def iter_blocks(file_path):
+    """
+    :return: A generator of (number of records, payload) of the blocks of a records file.
+    """
+
+    with open(file_path, 'rb') as records_file:
+        records_file.seek(HEADER_SIZE)
+        while True:
+            block_header = records_file.read(BLOCK_STRUCT.size)
+            if len(block_header) < BLOCK_STRUCT.size:
+                if block_header:
+                    print(f"Truncated block ignored at the end of {file_path}")
+                return
+            num_records, payload_len = BLOCK_STRUCT.unpack(block_header)
+            payload = records_file.read(payload_len)
+            if len(payload) < payload_len:
+                print(f"Truncated block ignored at the end of {file_path}")
+                return
+            yield num_records, payload
+
+
+def load_records_batches_gen(file_path, kind=None):
+    """
+    Load the records of a records file block by block.
+
+    :param file_path: The records file.
+    :param kind: The expected kind, ValueError is raised if the file has another one.
+    :return: A generator of lists of Repository or User objects.
+    """
+
+    file_kind = records_kind(file_path)
+    if kind and file_kind != kind:
+        raise ValueError(f"{file_path} has {'users' if file_kind == USERS_KIND else 'repos'} records")
+    decode = decode_repos_block if file_kind == REPOS_KIND else decode_users_block
+
+    for num_records, payload in iter_blocks(file_path):
+        yield decode(payload, num_records)
+
+
+def load_records_gen(file_path, kind=None):
+    """
+    Same as load_records_batches_gen but yielding the objects one by one.
+    """
+
+    for records in load_records_batches_gen(file_path, kind):
+        yield from records
+
+
+def count_records(file_path):
+    """
+    :return: The number of records of a records file, only the block headers are read.
+    """
+
+    count = 0
+    with open(file_path, 'rb') as records_file:
+        records_file.seek(HEADER_SIZE)
+        while True:
+            block_header = records_file.read(BLOCK_STRUCT.size)
+            if len(block_header) < BLOCK_STRUCT.size:
+                return count
+            num_records, payload_len = BLOCK_STRUCT.unpack(block_header)
+            count += num_records
+            records_file.seek(payload_len, os.SEEK_CUR)
+
+
+class RecordsFile:
+    """
+    Writer of a records file, every write_rows call appends one block. When appending to an existing file its header is kept.
+    """
+
+    def __init__(self, file_path, kind, mode='a'):
+        """
+        :param file_path: The records file.
+        :param kind: REPOS_KIND or USERS_KIND.
+        :param mode: 'a' to append or 'w' to truncate.
+        """
+
+        if mode == 'a' and os.path.isfile(file_path) and os.path.getsize(file_path):
+            existing_kind = records_kind(file_path)
+            if existing_kind != kind:
+                raise ValueError(f"Can't append {kind} records to {file_path} with {existing_kind} records")
+            self.file = open(file_path, 'ab')
+        else:
+            self.file = open(file_path, 'wb')
+            self.file.write(MAGIC + kind)
+        self.encode_block = encode_repos_block if kind == REPOS_KIND else encode_users_block
+
+    def write_rows(self, rows):
+        """
+        :param rows: Rows with the columns of the csv of the kind of the file.
+        """
+        self.file.write(self.encode_block(list(rows)))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_records_file(file_path, kind, rows, block_rows=100_000):
+    """
+    Write rows to a new records file in blocks of block_rows.
+
+    :return: The number of rows written.
+    """
+
+    records_file = RecordsFile(file_path, kind, mode='w')
+    count = 0
+    block = []
+    try:
+        for row in rows:
+            block.append(row)
+            if len(block) >= block_rows:
+                records_file.write_rows(block)
+                count += len(block)
+                block = []
+        records_file.write_rows(block)
+        count += len(block)
+    finally:
+        records_file.close()
+    return count
+
+
+def csv_to_records(csv_path, records_path, kind=None):
+    """
+    Convert a repos or users csv into a records file.
+
+    :param kind: REPOS_KIND or USERS_KIND, guessed from the header of the csv by default.
+    :return: The number of records written.
+    """
+
+    # Imported here because functions imports this module to load the records files transparently
+    from .functions import load_csv_repo_file_gen, load_csv_user_file_gen
+
+    if kind is None:
+        with open_text(csv_path) as csv_file:
+            kind = USERS_KIND if csv_file.readline().startswith('user,') else REPOS_KIND
+
+    if kind == REPOS_KIND:
+        return write_records_file(records_path, kind, map(repo_row, load_csv_repo_file_gen(csv_path)))
+    return write_records_file(records_path, kind, map(user_row, load_csv_user_file_gen(csv_path)))
+
+
+def records_to_csv(records_path, csv_path):
+    """
+    Convert a records file into a csv in the format written by write_csv_files.
+
+    :return: The number of rows written.
+    """
+
+    from .functions import REPOS_CSV_HEADER, USERS_CSV_HEADER, repo_csv_row, user_csv_row
+
+    kind = records_kind(records_path)
+    header, row_func = (REPOS_CSV_HEADER, repo_csv_row) if kind == REPOS_KIND else (USERS_CSV_HEADER, user_csv_row)
+    count = 0
+    with open_text(csv_path, 'w') as csv_file:
+        csv_writer = csv.writer(csv_file)
+        csv_writer.writerow(header)
+        for records in load_records_batches_gen(records_path):
+            csv_writer.writerows(map(row_func, records))
+            count += len(records)
+    return count
@@ -0,0 +1,183 @@
+import csv
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+from .compression import copy_file
+
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class ReportCache:
+    """
+    Cache of the reports generated from an input csv, keyed by the identity of the csv (size, mtime and content hash).
+    Each input gets a folder with the intermediate reports that don't depend on the parameters (e.g. all the repos
+    sorted by stars) and the final reports derived from them for the parameters used (e.g. the repos with more than
+    N stars), so a rerun with the same inputs copies the final reports and a rerun with other parameters only derives
+    them again from the intermediate ones.
+    """
+
+    def __init__(self, cache_folder):
+        """
+        :param cache_folder: The folder where the cache is kept.
+        """
+        self.cache_folder = cache_folder
+        self.hashes_path = os.path.join(cache_folder, "inputs.json")
+        os.makedirs(cache_folder, exist_ok=True)
+
+    def _load_hashes(self):
+        if not os.path.isfile(self.hashes_path):
+            return dict()
+        with open(self.hashes_path) as hashes_file:
+            return json.load(hashes_file)
+
+    def input_hash(self, file_path):
+        """
+        Content hash of an input file. The hash is only recomputed when the size or the mtime of the file change.
+
+        :param file_path: The input file.
+        :return: The hex digest of the file.
+        """
+
+        stat = os.stat(file_path)
+        abs_path = os.path.abspath(file_path)
+        hashes = self._load_hashes()
+        known = hashes.get(abs_path)
+        if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime:
+            return known["hash"]
+
+        print(f"[cache] Hashing {file_path}")
+        digest = hashlib.blake2b(digest_size=16)
+        with open(file_path, 'rb') as input_file:
+            for block in iter(lambda: input_file.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+
+        hashes[abs_path] = {"size": stat.st_size, "mtime": stat.st_mtime, "hash": digest.hexdigest()}
+        self._save_hashes(hashes)
+        return hashes[abs_path]["hash"]
+
+    def _save_hashes(self, hashes):
+        tmp_path = self.hashes_path + ".tmp"
+        with open(tmp_path, 'w') as hashes_file:
+            json.dump(hashes, hashes_file, indent=2)
+        os.replace(tmp_path, self.hashes_path)
+
+    def entry(self, file_path, kind):
+        """
+        :param file_path: The input file.
+        :param kind: Kind of the input (repos or users), inputs with the same content but other kind are different entries.
+        :return: The folder of the cache entry of the input.
+        """
+
+        entry_folder = os.path.join(self.cache_folder, f"{kind}_{self.input_hash(file_path)}")
+        os.makedirs(entry_folder, exist_ok=True)
+        # The mtime of the folder is the last use of the entry, see prune
+        os.utime(entry_folder)
+        return entry_folder
+
+    def prune(self, keep):
+        """
+        Remove all but the keep most recently used entries of each kind, and forget the hashes of the inputs
+        that no longer exist, changed since they were hashed or have no entry left.
+
+        :param keep: Entries kept of each kind.
+        :return: The number of entries removed.
+        """
+
+        entries = dict()
+        for name in os.listdir(self.cache_folder):
+            entry_folder = os.path.join(self.cache_folder, name)
+            if os.path.isdir(entry_folder) and "_" in name:
+                entries.setdefault(name.split("_", 1)[0], []).append(entry_folder)
+
+        removed = 0
+        kept_hashes = set()
+        for kind_entries in entries.values():
+            kind_entries.sort(key=os.path.getmtime, reverse=True)
+            kept_hashes.update(os.path.basename(entry_folder).split("_", 1)[1] for entry_folder in kind_entries[:keep])
+            for entry_folder in kind_entries[keep:]:
+                shutil.rmtree(entry_folder, ignore_errors=True)
+                removed += 1
+
+        hashes = self._load_hashes()
+        current = dict()
+        for path, known in hashes.items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if known["size"] == stat.st_size and known["mtime"] == stat.st_mtime and known["hash"] in kept_hashes:
+                current[path] = known
+        if len(current) != len(hashes):
+            self._save_hashes(current)
+        return removed
+
+    @staticmethod
+    def is_complete(entry_folder):
+        return os.path.isfile(os.path.join(entry_folder, "complete"))
+
+    @staticmethod
+    def mark_complete(entry_folder):
+        open(os.path.join(entry_folder, "complete"), 'w').close()
+
+    @staticmethod
+    def derived_path(entry_folder, file_name, params):
+        """
+        :param params: The parameters the report depends on, e.g. {"minimum": 10, "top": None}.
+        :return: The path where the report derived with those parameters is cached.
+        """
+
+        params_key = "_".join(f"{name}-{value}" for name, value in sorted(params.items()))
+        return os.path.join(entry_folder, "derived", f"{os.path.splitext(file_name)[0]}.{params_key}.csv")
+
+
+def copy_cached_report(cached_path, output_folder, file_name):
+    """
+    Copy a cached report to the output folder. The cache keeps the reports uncompressed, they are compressed
+    while copied if file_name ends with .gz or .zst.
+
+    :return: The number of rows of the report (records, the company and email fields can have quoted newlines).
+    """
+
+    os.makedirs(output_folder, exist_ok=True)
+    copy_file(cached_path, os.path.join(output_folder, file_name))
+    csv.field_size_limit(sys.maxsize)
+    with open(cached_path, 'r', newline='', encoding='utf-8') as report_file:
+        return max(sum(1 for _ in csv.reader(report_file)) - 1, 0)
+
+
+def derive_sorted_report(sorted_path, derived_path, column, minimum, top=None):
+    """
+    Derive a sorted report from the cached report with all the rows sorted (descending) by column:
+    the rows with column > minimum are a prefix of it, and with top only the first top of them are kept.
+
+    :param sorted_path: The cached report with all the rows sorted.
+    :param derived_path: Where the derived report is written.
+    :param column: The index of the sort column.
+    :param minimum: Exclusive minimum of the column.
+    :param top: Max number of rows.
+    :return: The number of rows of the derived report.
+    """
+
+    csv.field_size_limit(sys.maxsize)
+    os.makedirs(os.path.dirname(derived_path), exist_ok=True)
+    count = 0
+    # Written to a temporary file first so an interrupted run never leaves a partial report in the cache
+    tmp_path = derived_path + ".tmp"
+    with open(sorted_path, 'r', newline='', encoding='utf-8') as sorted_file, \
+            open(tmp_path, 'w', newline='', encoding='utf-8') as derived_file:
+        sorted_reader = csv.reader(sorted_file)
+        derived_writer = csv.writer(derived_file)
+        derived_writer.writerow(next(sorted_reader))
+
+        for row in sorted_reader:
+            if int(row[column]) <= minimum or (top and count >= top):
+                break
+            derived_writer.writerow(row)
+            count += 1
+
+    os.replace(tmp_path, derived_path)
+    return count
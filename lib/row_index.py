@@ -0,0 +1,260 @@
+import csv
+import io
+import os
+import struct
+import sys
+
+from array import array
+from itertools import islice
+
+from .compression import is_compressed, open_binary
+
+
+# Sidecar index of a csv (<csv>.idx): the total number of rows and the byte offset of every K-th row, so counting
+# the rows, seeking to a row and splitting the file in exact row ranges don't need to read the csv.
+#
+# The file is MAGIC, an INDEX_STRUCT header (K, rows, size and mtime of the csv when indexed, offset of the first row
+# after the header) and the uint64 offsets of the rows 0, K, 2K... Rows are counted after the header and a row can
+# span several lines (quoted newlines). An index whose csv changed size or mtime is stale and ignored.
+# Compressed csvs (.gz, .zst) can't be seeked, they are never indexed and their rows are counted reading them.
+
+MAGIC = b"GHIX\x01"
+INDEX_STRUCT = struct.Struct("<IQQqQ")
+INDEX_EXTENSION = ".idx"
+DEFAULT_INDEX_EVERY = 100_000
+
+
+def index_path(csv_path):
+    return csv_path + INDEX_EXTENSION
+
+
+class RowIndex:
+    def __init__(self, every=DEFAULT_INDEX_EVERY, rows=0, data_start=0, offsets=None):
+        """
+        :param every: Rows between indexed offsets (K).
+        :param rows: Rows of the csv, without the header.
+        :param data_start: Byte offset of the first row after the header.
+        :param offsets: array('Q') with the byte offsets of the rows 0, K, 2K...
+        """
+
+        self.every = every
+        self.rows = rows
+        self.data_start = data_start
+        self.offsets = offsets if offsets is not None else array('Q')
+
+    def add_row(self, offset):
+        """
+        Add the next row of the csv, starting at offset.
+        """
+
+        if self.rows % self.every == 0:
+            self.offsets.append(offset)
+        self.rows += 1
+
+    def seek_point(self, row):
+        """
+        :return: Tuple with the offset of the closest indexed row before row and the rows to skip from it.
+        """
+
+        if row >= self.rows:
+            return None, 0
+        return self.offsets[row // self.every], row % self.every
+
+    def save(self, csv_path):
+        stat = os.stat(csv_path)
+        offsets = array('Q', self.offsets)
+        if sys.byteorder == 'big':
+            offsets.byteswap()
+        tmp_path = index_path(csv_path) + ".tmp"
+        with open(tmp_path, 'wb') as index_file:
+            index_file.write(MAGIC + INDEX_STRUCT.pack(self.every, self.rows, stat.st_size, stat.st_mtime_ns, self.data_start))
+            index_file.write(offsets.tobytes())
+        os.replace(tmp_path, index_path(csv_path))
+
+    @classmethod
+    def load(cls, csv_path):
+        """
+        :return: The RowIndex of the csv, or None if it has no index or the index is stale.
+        """
+
+        try:
+            with open(index_path(csv_path), 'rb') as index_file:
+                content = index_file.read()
+            stat = os.stat(csv_path)
+        except OSError:
+            return None
+
+        if content[:len(MAGIC)] != MAGIC:
+            return None
+        every, rows, size, mtime_ns, data_start = INDEX_STRUCT.unpack_from(content, len(MAGIC))
+        if size != stat.st_size or mtime_ns != stat.st_mtime_ns:
+            return None
+
+        offsets = array('Q')
+        offsets.frombytes(content[len(MAGIC) + INDEX_STRUCT.size:])
+        if sys.byteorder == 'big':
+            offsets.byteswap()
+        return cls(every, rows, data_start, offsets)
+
+
+def _row_offsets_gen(csv_file, skip_header=True):
+    """
+    Scan a csv opened in binary mode. A line ends a row only if an even number of quotes precede it,
+    so quoted newlines never split a row.
+
+    :return: A generator of the offset of the first row after the header followed by the offset of every row.
+    """
+
+    offset = len(csv_file.readline()) if skip_header else 0
+    yield offset
+    row_start = offset
+    quotes = 0
+    for line in csv_file:
+        offset += len(line)
+        quotes += line.count(b'"')
+        if quotes % 2 == 0:
+            yield row_start
+            row_start = offset
+            quotes = 0
+
+
+def build_row_index(csv_path, every=DEFAULT_INDEX_EVERY, skip_header=True):
+    """
+    Index an existing csv reading it once.
+
+    :return: The RowIndex, also saved next to the csv.
+    """
+
+    if is_compressed(csv_path):
+        raise ValueError(f"{csv_path} is compressed, compressed csvs can't be indexed")
+
+    row_index = RowIndex(every)
+    with open(csv_path, 'rb') as csv_file:
+        offsets = _row_offsets_gen(csv_file, skip_header)
+        row_index.data_start = next(offsets)
+        for offset in offsets:
+            row_index.add_row(offset)
+
+    row_index.save(csv_path)
+    return row_index
+
+
+def scan_rows(csv_path, skip_header=True):
+    """
+    :return: The rows of the csv (without the header) reading it, compressed csvs are decompressed on the fly.
+    """
+
+    with open_binary(csv_path) as csv_file:
+        return sum(1 for _ in _row_offsets_gen(csv_file, skip_header)) - 1
+
+
+def count_rows(csv_path):
+    """
+    :return: The rows of the csv (without the header) from its index, or None if it has no valid index.
+    """
+
+    row_index = RowIndex.load(csv_path)
+    return row_index.rows if row_index else None
+
+
+class IndexedOutput:
+    """
+    Text file wrapper for csv.writer indexing the rows while they are written. csv.writer writes every row
+    with a single write call, so each call is a row.
+    """
+
+    def __init__(self, output_file, row_index, position):
+        """
+        :param output_file: The csv file opened for writing.
+        :param row_index: The RowIndex to update.
+        :param position: Byte offset of the end of the file.
+        """
+
+        self.output_file = output_file
+        self.row_index = row_index
+        self.position = position
+
+    def write(self, text):
+        self.row_index.add_row(self.position)
+        self.position += len(text.encode('utf-8'))
+        return self.output_file.write(text)
+
+
+def open_indexed_csv(csv_path, mode, header=None, every=DEFAULT_INDEX_EVERY):
+    """
+    Open a csv for writing keeping its row index updated, appending to the index of the existing rows
+    (which is built if missing) in append mode.
+
+    :return: Tuple with the opened file, a csv.writer indexing the rows and the RowIndex, save it when the file is closed.
+    """
+
+    existing_size = os.path.getsize(csv_path) if 'a' in mode and os.path.isfile(csv_path) else 0
+    row_index = None
+    if existing_size:
+        row_index = RowIndex.load(csv_path) or build_row_index(csv_path, every)
+
+    csv_file = open(csv_path, mode, newline='', encoding='utf-8')
+    if row_index is None:
+        row_index = RowIndex(every)
+        if header:
+            csv.writer(csv_file).writerow(header)
+            header = None
+        row_index.data_start = csv_file.tell()
+
+    csv_writer = csv.writer(IndexedOutput(csv_file, row_index, existing_size or row_index.data_start))
+    if header:
+        csv_writer.writerow(header)
+    return csv_file, csv_writer, row_index
+
+
+def csv_rows_gen(csv_path, skip_header=True, start_row=0, end_row=None):
+    """
+    Read the rows of a csv, or only the rows [start_row, end_row). With a valid index the reading starts at the
+    closest indexed row, otherwise the previous rows are read and skipped (always for compressed csvs).
+    Rows are counted after the header, like in the index and split_row_ranges.
+
+    :param skip_header: Skip the first line when the whole csv is read. The header is always skipped when reading a
+                        range, so consecutive ranges never lose or repeat a row.
+    :return: A generator of rows (lists).
+    """
+
+    csv.field_size_limit(sys.maxsize)
+    row_index = RowIndex.load(csv_path) if start_row and not is_compressed(csv_path) else None
+
+    with open_binary(csv_path) as raw_file:
+        skip_rows = start_row
+        if row_index:
+            offset, skip_rows = row_index.seek_point(start_row)
+            if offset is None:
+                return
+            raw_file.seek(offset)
+
+        csv_reader = csv.reader(io.TextIOWrapper(raw_file, encoding='utf-8', newline=''))
+        if not row_index and (skip_header or start_row or end_row is not None):
+            next(csv_reader, None)
+
+        rows = islice(csv_reader, skip_rows, None if end_row is None else skip_rows + end_row - start_row)
+        yield from rows
+
+
+def split_row_ranges(csv_path, parts, every=DEFAULT_INDEX_EVERY):
+    """
+    Split the rows of a csv in parts exact ranges for parallel workers, indexing it first if needed.
+    Compressed csvs are only counted, their workers will have to read the rows before their range.
+
+    :return: A list of (start_row, end_row) tuples.
+    """
+
+    if is_compressed(csv_path):
+        rows = scan_rows(csv_path)
+    else:
+        rows = (RowIndex.load(csv_path) or build_row_index(csv_path, every)).rows
+    part_rows, extra = divmod(rows, parts)
+    ranges = []
+    start = 0
+    for part in range(parts):
+        end = start + part_rows + (1 if part < extra else 0)
+        if end > start:
+            ranges.append((start, end))
+        start = end
+    return ranges
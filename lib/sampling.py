@@ -0,0 +1,117 @@
+import math
+
+from statistics import NormalDist, mean, variance
+
+
+# Estimators to scale the results of a stratified sample of hours (see gen_gh_urls.stratified_sample) to the
+# whole range of hours, with normal confidence intervals.
+
+
+def z_value(confidence):
+    """
+    :return: The z of a two sided normal confidence interval, e.g. 1.96 for 0.95.
+    """
+
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def estimate_dict(estimate, std_error, confidence, lower_bound=0):
+    z = z_value(confidence)
+    return {
+        "estimate": estimate,
+        "std_error": std_error,
+        "ci_low": max(lower_bound, estimate - z * std_error),
+        "ci_high": estimate + z * std_error,
+        "confidence": confidence,
+    }
+
+
+def stratified_total(values_by_stratum, population_by_stratum, confidence=0.95):
+    """
+    Stratified estimator of the total of a value over every hour of the population, e.g. the number of events:
+    sum of N_h * mean_h, with variance sum of N_h^2 * (1 - n_h / N_h) * s_h^2 / n_h.
+    The strata with a single sampled hour have no variance of their own, they use the mean variance of the others.
+
+    :param values_by_stratum: Dict with the list of values of the sampled hours of each stratum.
+    :param population_by_stratum: Dict with the number of hours of each stratum.
+    :return: Dict with the estimate, its standard error and its confidence interval.
+    """
+
+    variances = {label: variance(values) for label, values in values_by_stratum.items() if len(values) > 1}
+    pooled_variance = mean(variances.values()) if variances else 0
+
+    total = total_variance = 0
+    for label, values in values_by_stratum.items():
+        if not values:
+            continue
+        population = population_by_stratum[label]
+        total += population * mean(values)
+        total_variance += population ** 2 * (1 - len(values) / population) * variances.get(label, pooled_variance) / len(values)
+
+    return estimate_dict(total, math.sqrt(total_variance), confidence)
+
+
+def chao2(incidences, num_units, population_units=None, confidence=0.95):
+    """
+    Chao2 estimator of the number of distinct items (repos, users) of the population from the number of sampled
+    hours each one was found in. The items found in a single hour (Q1) compared with the ones found in two (Q2)
+    tell how many were never sampled. With population_units it uses the version for sampling without replacement
+    of Chao and Lin (2012), unseen = Q1^2 / (2 * Q2 * m / (m - 1) + Q1 * q / (1 - q)) with q = m / T, so the estimate
+    tends to the observed items as the sample covers the population. It's a lower bound when the sample is small.
+    The variance is approximated with the delta method and the interval is the log-normal one of Chao (1987),
+    it never goes below the distinct items observed.
+
+    :param incidences: Iterable with the number of sampled hours each observed item was found in.
+    :param num_units: Number of sampled hours (m).
+    :param population_units: Number of hours of the population (T), None for an infinite population.
+    :return: Dict with the estimate, its standard error, its confidence interval and the observed distinct items.
+    """
+
+    observed = q1 = q2 = 0
+    for incidence in incidences:
+        observed += 1
+        if incidence == 1:
+            q1 += 1
+        elif incidence == 2:
+            q2 += 1
+
+    sampled_ratio = min(num_units / population_units, 1) if population_units else 0
+    if num_units < 2 or sampled_ratio == 1:
+        unseen = var = 0
+    else:
+        c = 2 * num_units / (num_units - 1)
+        d = sampled_ratio / (1 - sampled_ratio)
+        # Without doubletons the bias corrected form, Q1 * (Q1 - 1) / (Q2 + 1)
+        numerator, doubletons = (q1 ** 2, q2) if q2 else (q1 * max(q1 - 1, 0), 1)
+        denominator = c * doubletons + d * q1
+        unseen = numerator / denominator if denominator else 0
+        d_q1 = q1 * (2 * c * doubletons + d * q1) / denominator ** 2 if denominator else 0
+        d_q2 = c * numerator / denominator ** 2 if denominator else 0
+        var = d_q1 ** 2 * q1 + d_q2 ** 2 * q2
+
+    result = estimate_dict(observed + unseen, math.sqrt(var), confidence)
+    if unseen > 0 and var > 0:
+        k = math.exp(z_value(confidence) * math.sqrt(math.log(1 + var / unseen ** 2)))
+        result["ci_low"] = observed + unseen / k
+        result["ci_high"] = observed + unseen * k
+    else:
+        result["ci_low"] = result["ci_high"] = observed + unseen
+    result.update({"observed": observed, "found_in_one_hour": q1, "found_in_two_hours": q2})
+    return result
+
+
+def ratio_estimate(numerator, denominator, confidence=0.95):
+    """
+    Ratio of two estimates (e.g. deleted repos / distinct repos), its relative variance is approximated as the
+    sum of the relative variances of both (delta method ignoring their covariance).
+
+    :param numerator: Dict returned by an estimator.
+    :param denominator: Dict returned by an estimator.
+    """
+
+    if not denominator["estimate"]:
+        return estimate_dict(0, 0, confidence)
+    ratio = numerator["estimate"] / denominator["estimate"]
+    relative_variance = (numerator["std_error"] / numerator["estimate"]) ** 2 if numerator["estimate"] else 0
+    relative_variance += (denominator["std_error"] / denominator["estimate"]) ** 2
+    return estimate_dict(ratio, ratio * math.sqrt(relative_variance), confidence)
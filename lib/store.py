@@ -0,0 +1,222 @@
+import sqlite3
+
+from itertools import islice
+
+from .functions import load_csv_repo_file_gen, load_csv_user_file_gen
+
+
+REPOS_COLUMNS = ['full_name', 'owner', 'stars', 'forks', 'watchers', 'deleted', 'private', 'archived', 'disabled']
+USERS_COLUMNS = ['user', 'repos_collab', 'deleted', 'site_admin', 'hireable', 'email', 'company', 'github_star']
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS repos (
+        full_name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        stars INTEGER NOT NULL,
+        forks INTEGER NOT NULL,
+        watchers INTEGER NOT NULL,
+        deleted INTEGER NOT NULL,
+        private INTEGER NOT NULL,
+        archived INTEGER NOT NULL,
+        disabled INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS users (
+        user TEXT PRIMARY KEY,
+        repos_collab TEXT NOT NULL,
+        deleted INTEGER NOT NULL,
+        site_admin INTEGER NOT NULL,
+        hireable INTEGER NOT NULL,
+        email TEXT NOT NULL,
+        company TEXT NOT NULL,
+        github_star INTEGER NOT NULL
+    );
+'''
+
+# Created after the bulk import, building them once is much faster than updating them on every insert
+INDEXES = '''
+    CREATE INDEX IF NOT EXISTS idx_repos_stars ON repos (stars);
+    CREATE INDEX IF NOT EXISTS idx_repos_forks ON repos (forks);
+    CREATE INDEX IF NOT EXISTS idx_repos_watchers ON repos (watchers);
+    CREATE INDEX IF NOT EXISTS idx_repos_owner ON repos (owner);
+    CREATE INDEX IF NOT EXISTS idx_repos_flags ON repos (deleted, private, archived, disabled, stars);
+    CREATE INDEX IF NOT EXISTS idx_users_company ON users (company COLLATE NOCASE);
+    CREATE INDEX IF NOT EXISTS idx_users_flags ON users (hireable, site_admin, github_star, deleted);
+'''
+
+
+def like_literal(value):
+    """
+    :return: The value escaped to be matched literally in a LIKE pattern with ESCAPE '\\' (_ and % are wildcards).
+    """
+
+    return str(value).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+# Filters accepted by query_repos/query_users: name -> (sql condition, kind)
+# The minimums are exclusive like the ones of gh_investigator.py (more than N stars), the maximums inclusive
+REPOS_FILTERS = {
+    "min_stars": ("stars > ?", int),
+    "max_stars": ("stars <= ?", int),
+    "min_forks": ("forks > ?", int),
+    "max_forks": ("forks <= ?", int),
+    "min_watchers": ("watchers > ?", int),
+    "max_watchers": ("watchers <= ?", int),
+    "owner": ("owner = ?", str),
+    "deleted": ("deleted = ?", int),
+    "private": ("private = ?", int),
+    "archived": ("archived = ?", int),
+    "disabled": ("disabled = ?", int),
+}
+
+USERS_FILTERS = {
+    "company": ("company = ? COLLATE NOCASE", str),
+    "company_like": ("company LIKE ?", str),
+    "email_domain": ("email LIKE '%@' || ? ESCAPE '\\'", like_literal),
+    "has_email": ("(email != '') = ?", int),
+    "collab_repo": ("instr(',' || repos_collab || ',', ',' || ? || ',') > 0", str),
+    "deleted": ("deleted = ?", int),
+    "site_admin": ("site_admin = ?", int),
+    "hireable": ("hireable = ?", int),
+    "github_star": ("github_star = ?", int),
+}
+
+
+def open_store(db_path):
+    """
+    Open (and create if needed) the sqlite store.
+
+    :param db_path: The path of the sqlite database.
+    :return: The sqlite connection.
+    """
+
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _bulk_insert(conn, table, columns, rows, chunk_size):
+    """
+    Insert the rows in chunks inside a single transaction, later rows replace earlier ones with the same key.
+
+    :return: The number of rows inserted.
+    """
+
+    # The store can be rebuilt from the csvs, so durability is traded for import speed
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+
+    sql = f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    total = 0
+    with conn:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            conn.executemany(sql, chunk)
+            total += len(chunk)
+    return total
+
+
+def import_repos(conn, file_path, chunk_size=100_000):
+    """
+    Import a repos csv into the store.
+
+    :param conn: The sqlite connection.
+    :param file_path: The repos csv.
+    :param chunk_size: Number of rows inserted at once.
+    :return: The number of repos imported.
+    """
+
+    rows = (
+        (repo.full_name, repo.full_name.split('/')[0], repo.stars, repo.forks, repo.watchers,
+         int(repo.deleted), int(repo.private), int(repo.archived), int(repo.disabled))
+        for repo in load_csv_repo_file_gen(file_path)
+    )
+    return _bulk_insert(conn, "repos", REPOS_COLUMNS, rows, chunk_size)
+
+
+def import_users(conn, file_path, chunk_size=100_000):
+    """
+    Import a users csv into the store.
+
+    :param conn: The sqlite connection.
+    :param file_path: The users csv.
+    :param chunk_size: Number of rows inserted at once.
+    :return: The number of users imported.
+    """
+
+    rows = (
+        (user.username, ','.join(repo for repo in user.repos_collab if repo), int(user.deleted), int(user.site_admin),
+         int(user.hireable), user.email or '', user.company or '', int(user.github_star))
+        for user in load_csv_user_file_gen(file_path)
+    )
+    return _bulk_insert(conn, "users", USERS_COLUMNS, rows, chunk_size)
+
+
+def create_indexes(conn):
+    """
+    Create the indexes of the store and update the statistics used by the query planner.
+
+    :param conn: The sqlite connection.
+    """
+
+    conn.executescript(INDEXES)
+    conn.execute("ANALYZE")
+
+
+def _query(conn, table, columns, filters_spec, filters, sort, ascending, limit):
+    conditions = []
+    params = []
+    for name, value in filters.items():
+        if value is None:
+            continue
+        if name not in filters_spec:
+            raise ValueError(f"Unknown filter {name} for {table}")
+        condition, kind = filters_spec[name]
+        conditions.append(condition)
+        params.append(kind(value))
+
+    sql = f"SELECT {', '.join(columns)} FROM {table}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+
+    if sort:
+        if sort not in columns:
+            raise ValueError(f"Unknown sort column {sort} for {table}")
+        sql += f" ORDER BY {sort} {'ASC' if ascending else 'DESC'}"
+
+    if limit:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+
+    return conn.execute(sql, params)
+
+
+def query_repos(conn, sort=None, ascending=False, limit=None, **filters):
+    """
+    Query the repos of the store.
+
+    :param conn: The sqlite connection.
+    :param sort: Column to sort by.
+    :param ascending: Sort in ascending order instead of descending.
+    :param limit: Max number of repos returned.
+    :param filters: Filters from REPOS_FILTERS (None values are ignored).
+    :return: A cursor of rows with the REPOS_COLUMNS.
+    """
+
+    return _query(conn, "repos", REPOS_COLUMNS, REPOS_FILTERS, filters, sort, ascending, limit)
+
+
+def query_users(conn, sort=None, ascending=False, limit=None, **filters):
+    """
+    Query the users of the store.
+
+    :param conn: The sqlite connection.
+    :param sort: Column to sort by.
+    :param ascending: Sort in ascending order instead of descending.
+    :param limit: Max number of users returned.
+    :param filters: Filters from USERS_FILTERS (None values are ignored).
+    :return: A cursor of rows with the USERS_COLUMNS.
+    """
+
+    return _query(conn, "users", USERS_COLUMNS, USERS_FILTERS, filters, sort, ascending, limit)
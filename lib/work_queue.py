@@ -0,0 +1,270 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+
+# Work queue of GH Archive hours shared by several nodes through a sqlite file (e.g. on a shared disk).
+# Nodes lease batches of hours for lease_secs, keep them alive with heartbeats while they work and mark them
+# done. The hours of a node that stops heartbeating go back to the queue when its lease expires, so the
+# share of a dead node is taken by the others instead of being lost.
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS hours (
+        stage TEXT NOT NULL,
+        url TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        node TEXT,
+        lease_id TEXT,
+        lease_expires REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        updated REAL,
+        PRIMARY KEY (stage, url)
+    );
+    CREATE INDEX IF NOT EXISTS idx_hours_status ON hours (stage, status, lease_expires);
+'''
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+STATUSES = [PENDING, LEASED, DONE, FAILED]
+
+
+def default_node_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    Lease based queue of URLs stored in a sqlite file. Every method is a short transaction, so many processes
+    (local or on other machines sharing the file) can use the same file at the same time.
+    """
+
+    def __init__(self, db_path, stage="scrape", node=None, lease_secs=600, max_attempts=3):
+        """
+        :param db_path: The sqlite file of the queue.
+        :param stage: Name of the queue in the file, so the downloader and the scraper can share a file.
+        :param node: Id of this node (hostname-pid by default).
+        :param lease_secs: Seconds a lease lasts without a heartbeat.
+        :param max_attempts: Failed attempts after which an hour is marked as failed instead of retried.
+        """
+
+        self.db_path = db_path
+        self.stage = stage
+        self.node = node or default_node_id()
+        self.lease_secs = lease_secs
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        # The rollback journal instead of WAL, WAL doesn't work on network filesystems
+        self.connection = sqlite3.connect(db_path, timeout=120, isolation_level=None, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+
+    def _transaction(self, func):
+        """
+        Run func(cursor) in an immediate transaction, it takes the write lock at the start so concurrent
+        leases never pick the same rows.
+        """
+
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(cursor)
+                cursor.execute("COMMIT")
+                return result
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+
+    def add(self, urls):
+        """
+        Add URLs to the queue, the ones already in it are ignored.
+
+        :return: The number of URLs added.
+        """
+
+        now = time.time()
+
+        def add_urls(cursor):
+            before = cursor.execute("SELECT COUNT(*) FROM hours WHERE stage = ?", (self.stage,)).fetchone()[0]
+            cursor.executemany("INSERT OR IGNORE INTO hours (stage, url, updated) VALUES (?, ?, ?)",
+                               ((self.stage, url, now) for url in urls))
+            return cursor.execute("SELECT COUNT(*) FROM hours WHERE stage = ?", (self.stage,)).fetchone()[0] - before
+
+        return self._transaction(add_urls)
+
+    def requeue_expired(self, cursor=None):
+        """
+        Put back in the queue the hours whose lease expired, or mark them as failed after max_attempts like fail()
+        (every lease is an attempt, so an hour killing the nodes leasing it isn't retried forever).
+
+        :return: The number of hours requeued or failed.
+        """
+
+        def requeue(cursor):
+            now = time.time()
+            cursor.execute("UPDATE hours SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, node = NULL, lease_id = NULL, "
+                           "lease_expires = NULL, error = CASE WHEN attempts >= ? THEN ? ELSE error END, updated = ? "
+                           "WHERE stage = ? AND status = ? AND lease_expires < ?",
+                           (self.max_attempts, FAILED, PENDING, self.max_attempts, "lease expired", now, self.stage, LEASED, now))
+            return cursor.rowcount
+
+        return requeue(cursor) if cursor else self._transaction(requeue)
+
+    def lease(self, batch_size=10):
+        """
+        Lease up to batch_size pending hours for this node.
+
+        :return: A tuple (lease_id, urls), urls is empty when there is nothing pending.
+        """
+
+        lease_id = uuid.uuid4().hex
+
+        def lease_urls(cursor):
+            requeued = self.requeue_expired(cursor)
+            if requeued:
+                print(f"[queue] {requeued} expired leases back to the queue (or failed after {self.max_attempts} attempts)")
+            urls = [row[0] for row in cursor.execute("SELECT url FROM hours WHERE stage = ? AND status = ? ORDER BY rowid LIMIT ?",
+                                                       (self.stage, PENDING, batch_size))]
+            now = time.time()
+            cursor.executemany("UPDATE hours SET status = ?, node = ?, lease_id = ?, lease_expires = ?, attempts = attempts + 1, updated = ? "
+                               "WHERE stage = ? AND url = ?", ((LEASED, self.node, lease_id, now + self.lease_secs, now, self.stage, url) for url in urls))
+            return urls
+
+        return lease_id, self._transaction(lease_urls)
+
+    def heartbeat(self):
+        """
+        Extend the leases of every hour this node holds.
+
+        :return: The number of hours still leased by this node (hours whose lease expired and were taken by another node are lost).
+        """
+
+        def extend(cursor):
+            now = time.time()
+            cursor.execute("UPDATE hours SET lease_expires = ?, updated = ? WHERE stage = ? AND status = ? AND node = ?",
+                           (now + self.lease_secs, now, self.stage, LEASED, self.node))
+            return cursor.rowcount
+
+        return self._transaction(extend)
+
+    def complete(self, urls):
+        """
+        Mark as done the hours this node holds. The hours whose lease expired and went back to the queue
+        (maybe leased by another node) are left as they are.
+
+        :return: The number of hours marked as done.
+        """
+
+        def mark_done(cursor):
+            now = time.time()
+            cursor.executemany("UPDATE hours SET status = ?, lease_id = NULL, lease_expires = NULL, error = NULL, updated = ? "
+                               "WHERE stage = ? AND url = ? AND node = ? AND status = ?",
+                               ((DONE, now, self.stage, url, self.node, LEASED) for url in urls))
+            return cursor.rowcount
+
+        return self._transaction(mark_done)
+
+    def fail(self, url, error=""):
+        """
+        Give an hour this node holds back to the queue after an error, or mark it as failed after max_attempts.
+
+        :return: If the hour was still held by this node.
+        """
+
+        def mark_failed(cursor):
+            cursor.execute("UPDATE hours SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, node = NULL, lease_id = NULL, "
+                           "lease_expires = NULL, error = ?, updated = ? WHERE stage = ? AND url = ? AND node = ? AND status = ?",
+                           (self.max_attempts, FAILED, PENDING, str(error)[:1000], time.time(), self.stage, url, self.node, LEASED))
+            return cursor.rowcount > 0
+
+        return self._transaction(mark_failed)
+
+    def release(self):
+        """
+        Give back every hour leased by this node and not done, e.g. when it's stopped.
+        """
+
+        def release_leases(cursor):
+            cursor.execute("UPDATE hours SET status = ?, node = NULL, lease_id = NULL, lease_expires = NULL, attempts = MAX(attempts - 1, 0), updated = ? "
+                           "WHERE stage = ? AND status = ? AND node = ?", (PENDING, time.time(), self.stage, LEASED, self.node))
+            return cursor.rowcount
+
+        return self._transaction(release_leases)
+
+    def retry_failed(self):
+        """
+        :return: The number of failed hours put back in the queue.
+        """
+
+        def retry(cursor):
+            cursor.execute("UPDATE hours SET status = ?, attempts = 0, updated = ? WHERE stage = ? AND status = ?",
+                           (PENDING, time.time(), self.stage, FAILED))
+            return cursor.rowcount
+
+        return self._transaction(retry)
+
+    def status(self):
+        """
+        :return: A dict with the number of hours in each status and the hours leased by each node.
+        """
+
+        with self.lock:
+            counts = dict(self.connection.execute("SELECT status, COUNT(*) FROM hours WHERE stage = ? GROUP BY status", (self.stage,)).fetchall())
+            nodes = dict(self.connection.execute("SELECT node, COUNT(*) FROM hours WHERE stage = ? AND status = ? GROUP BY node",
+                                                 (self.stage, LEASED)).fetchall())
+        return {"hours": {status: counts.get(status, 0) for status in STATUSES}, "leased_by_node": nodes}
+
+    def close(self):
+        self.connection.close()
+
+
+class Heartbeat(threading.Thread):
+    """
+    Heartbeat the leases of a node every interval seconds until closed.
+    """
+
+    def __init__(self, work_queue, interval=None):
+        super().__init__(daemon=True, name="heartbeat")
+        self.work_queue = work_queue
+        self.interval = interval or max(1, work_queue.lease_secs / 3)
+        self.stop_event = threading.Event()
+        self.start()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.work_queue.heartbeat()
+            except sqlite3.Error as e:
+                print(f"[queue] Heartbeat failed: {e}")
+
+    def close(self):
+        self.stop_event.set()
+        self.join()
+
+
+def leased_urls_gen(work_queue, batch_size=10, poll_interval=0):
+    """
+    Lease batches of hours until the queue is empty, yielding the URLs one by one. The caller marks
+    them as done (or failed) and a Heartbeat should keep the leases alive meanwhile.
+
+    :param batch_size: Hours leased at once.
+    :param poll_interval: When nothing is pending but other nodes hold leases, wait this number of seconds
+                          and try again (their hours come back if they die). 0 to stop as soon as nothing is pending.
+    :return: A generator of URLs.
+    """
+
+    while True:
+        _, urls = work_queue.lease(batch_size)
+        if urls:
+            yield from urls
+            continue
+
+        other_leases = {node: count for node, count in work_queue.status()["leased_by_node"].items() if node != work_queue.node}
+        if not poll_interval or not other_leases:
+            return
+        time.sleep(poll_interval)
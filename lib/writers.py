@@ -0,0 +1,138 @@
+import csv
+import os
+import time
+
+from queue import Queue, Empty
+from threading import Thread
+
+from . import metrics
+from .compression import is_compressed, open_text
+from .records import RecordsFile
+from .row_index import open_indexed_csv
+
+
+class CSVWriter(Thread):
+    """
+    Single writer stage for a CSV file. Worker threads push rows into a queue and this
+    thread is the only one touching the file, writing the rows in buffered bulk writes.
+    """
+
+    def __init__(self, csv_path, header=None, flush_rows=1000, flush_interval=5, mode='a', index_every=None):
+        """
+        :param csv_path: The csv path to write the rows to.
+        :param header: Optional header row written when the file is opened.
+        :param flush_rows: Number of buffered rows that triggers a write.
+        :param flush_interval: Max seconds a buffered row waits before being written.
+        :param mode: The mode used to open the csv file. A .gz/.zst csv is compressed, appending adds a gzip member or zstd frame.
+        :param index_every: Keep a sidecar row index of the csv with the offset of every index_every rows, saved when closed.
+        """
+        super().__init__(daemon=True, name="writer")
+        self.csv_path = csv_path
+        self.header = header
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.mode = mode
+        self.index_every = index_every
+        self.row_index = None
+        self.queue = Queue()
+        self.rows_written = 0
+        # Exception that stopped the thread, raised again to the threads writing rows and closing the writer
+        self.error = None
+        metrics.register_gauge("writer_queue_depth", self.queue.qsize, file=os.path.basename(csv_path))
+        self.start()
+
+    def write_rows(self, rows):
+        """
+        Queue rows to be written. Never blocks on the file.
+        Raises the exception that stopped the writer thread if it failed (e.g. disk full).
+
+        :param rows: A list of rows (lists) to write.
+        """
+        self.raise_error()
+        if rows:
+            self.queue.put(rows)
+
+    def close(self):
+        """
+        Flush every pending row, close the file and wait for the writer thread to end.
+        Raises the exception that stopped the writer thread if it failed, the rows queued after it weren't written.
+        """
+        self.queue.put(None)
+        self.join()
+        metrics.unregister_gauge("writer_queue_depth", file=os.path.basename(self.csv_path))
+        self.raise_error()
+
+    def raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def open_output(self):
+        """
+        :return: The opened output file and the function writing a list of rows to it.
+        """
+        if self.index_every and not is_compressed(self.csv_path):
+            csv_file, csv_writer, self.row_index = open_indexed_csv(self.csv_path, self.mode, self.header, self.index_every)
+            return csv_file, csv_writer.writerows
+
+        csv_file = open_text(self.csv_path, self.mode)
+        csv_writer = csv.writer(csv_file)
+        if self.header:
+            csv_writer.writerow(self.header)
+        return csv_file, csv_writer.writerows
+
+    def run(self):
+        try:
+            self.write_loop()
+        except BaseException as e:
+            print(f"[!] Error writing {self.csv_path}: {e}")
+            self.error = e
+
+    def write_loop(self):
+        csv_file, write_rows = self.open_output()
+        with csv_file:
+            buffer = []
+            last_flush = time.monotonic()
+            finished = False
+
+            while not finished:
+                timeout = max(0, self.flush_interval - (time.monotonic() - last_flush))
+                try:
+                    rows = self.queue.get(timeout=timeout)
+                    if rows is None:
+                        finished = True
+                    else:
+                        buffer.extend(rows)
+                except Empty:
+                    pass
+
+                elapsed = time.monotonic() - last_flush
+                if buffer and (finished or len(buffer) >= self.flush_rows or elapsed >= self.flush_interval):
+                    write_rows(buffer)
+                    csv_file.flush()
+                    self.rows_written += len(buffer)
+                    metrics.inc("writer_rows_total", len(buffer), file=os.path.basename(self.csv_path))
+                    buffer = []
+                    last_flush = time.monotonic()
+                elif elapsed >= self.flush_interval:
+                    last_flush = time.monotonic()
+
+        if self.row_index:
+            self.row_index.save(self.csv_path)
+
+
+class RecordsWriter(CSVWriter):
+    """
+    Same as CSVWriter but writing the rows to a binary records file, one block per flush.
+    """
+
+    def __init__(self, records_path, kind, flush_rows=1000, flush_interval=5, mode='a'):
+        """
+        :param records_path: The records file path to write the rows to.
+        :param kind: REPOS_KIND or USERS_KIND.
+        """
+        self.kind = kind
+        super().__init__(records_path, flush_rows=flush_rows, flush_interval=flush_interval, mode=mode)
+
+    def open_output(self):
+        records_file = RecordsFile(self.csv_path, self.kind, self.mode)
+        return records_file, records_file.write_rows
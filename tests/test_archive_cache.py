@@ -0,0 +1,71 @@
+import gzip
+import os
+import time
+
+import lib.archive_cache
+
+from lib.archive_cache import ArchiveCache, ORPHAN_GRACE_SECS
+
+
+def test_remove_orphans_keeps_recent_files(tmp_path):
+    archive_cache = ArchiveCache(str(tmp_path))
+    path = archive_cache._store("2023-01-01-0.json.gz", gzip.compress(b'{"type": "WatchEvent"}\n'))
+    folder = os.path.dirname(path)
+
+    old_mtime = time.time() - ORPHAN_GRACE_SECS - 60
+    files = {}
+    for name in ["old.gz", "old.gz.1.2.tmp", "new.gz", "new.gz.1.2.tmp"]:
+        files[name] = os.path.join(folder, name)
+        with open(files[name], 'wb') as orphan_file:
+            orphan_file.write(b"partial")
+        if name.startswith("old"):
+            os.utime(files[name], (old_mtime, old_mtime))
+
+    # The new files may belong to a process storing them right now
+    assert archive_cache.remove_orphans() == 2
+    assert not os.path.exists(files["old.gz"]) and not os.path.exists(files["old.gz.1.2.tmp"])
+    assert os.path.exists(files["new.gz"]) and os.path.exists(files["new.gz.1.2.tmp"])
+    assert os.path.exists(path)
+
+    assert archive_cache.remove_orphans(grace_secs=0) == 2
+    assert os.listdir(folder) == [os.path.basename(path)]
+    archive_cache.close()
+
+
+def test_hours_in_use_are_not_evicted(tmp_path, monkeypatch):
+    archives = {f"https://data.gharchive.org/2023-01-01-{hour}.json.gz": gzip.compress(f'{{"hour": {hour}}}\n'.encode() * 100)
+                for hour in range(3)}
+    monkeypatch.setattr(lib.archive_cache, "download_file", lambda url: archives[url])
+    urls = list(archives)
+    # Room for a single hour
+    archive_cache = ArchiveCache(str(tmp_path), max_bytes=len(archives[urls[0]]) + 1)
+    locks_folder = tmp_path / "locks"
+
+    with archive_cache.use_path(urls[0]) as path:
+        # Storing another hour evicts the least recently used one, but the one being read is skipped
+        assert archive_cache.get(urls[1]) == archives[urls[1]]
+        assert os.path.exists(path)
+        assert archive_cache.status()["hours"] == 2
+
+    # Evicted with its lock file once it isn't used
+    archive_cache.get(urls[2])
+    assert not os.path.exists(path)
+    assert sorted(os.listdir(locks_folder)) == ["2023-01-01-2.json.gz.lock"]
+
+    archive_cache.discard(urls[2])
+    assert os.listdir(locks_folder) == []
+    archive_cache.close()
+
+
+def test_remove_orphans_removes_the_lock_files_of_hours_not_cached(tmp_path):
+    archive_cache = ArchiveCache(str(tmp_path))
+    archive_cache._store("2023-01-01-0.json.gz", gzip.compress(b'{"type": "WatchEvent"}\n'))
+    locks_folder = tmp_path / "locks"
+    for hour in ["2023-01-01-0.json.gz", "2023-01-01-1.json.gz"]:
+        (locks_folder / f"{hour}.lock").touch()
+
+    with archive_cache._hour_lock("2023-01-01-2.json.gz"):
+        assert archive_cache.remove_orphans(grace_secs=0) == 1
+    # The lock of a cached hour and the ones held are kept
+    assert sorted(os.listdir(locks_folder)) == ["2023-01-01-0.json.gz.lock", "2023-01-01-2.json.gz.lock"]
+    archive_cache.close()
@@ -0,0 +1,71 @@
+import csv
+import os
+
+import pytest
+
+import lib.collab_index
+from lib.collab_index import CollabIndex
+from lib.columnar import StringTable
+from lib.functions import USERS_CSV_HEADER
+
+
+class NamesTable:
+    def __init__(self, names):
+        self.names = StringTable.from_strings(names)
+
+    def __len__(self):
+        return len(self.names)
+
+
+def test_build_with_on_disk_runs(tmp_path):
+    users_csv_path = str(tmp_path / "users.csv")
+    with open(users_csv_path, 'w', newline='', encoding='utf-8') as users_file:
+        csv_writer = csv.writer(users_file)
+        csv_writer.writerow(USERS_CSV_HEADER)
+        csv_writer.writerow(["user0", "z/new,a/table,z/new", 0, 0, 0, "", "", 0])
+        csv_writer.writerow(["user1", "b/new,a/table,c/dup", 0, 0, 1, "a@b.c", "", 0])
+        csv_writer.writerow(["user2", "", 0, 0, 0, "", "", 0])
+
+    # chunk_rows=2 makes the sort of the repo names spill several runs to disk
+    index = CollabIndex.build(users_csv_path, NamesTable(["c/dup", "a/table", "c/dup"]), chunk_rows=2)
+
+    assert [index.usernames[user] for user in range(index.num_users)] == ["user0", "user1", "user2"]
+    # The table rows are the first ids, the other repos follow in name order
+    assert [index.repo_names[repo] for repo in range(index.num_repos)] == ["c/dup", "a/table", "c/dup", "b/new", "z/new"]
+    assert [index.repo_id(name) for name in ["a/table", "b/new", "c/dup", "z/new", "missing"]] == [1, 3, 0, 4, None]
+    assert [list(index.repos_of(user)) for user in range(index.num_users)] == [[4, 1], [3, 1, 0], []]
+    assert [list(index.contributors_of(repo)) for repo in range(index.num_repos)] == [[1], [0, 1], [], [1], [0]]
+
+
+def test_interrupted_save_is_never_up_to_date(tmp_path, monkeypatch):
+    users_csv_path = str(tmp_path / "users.csv")
+    folder = str(tmp_path / "index")
+
+    def write_users(rows):
+        with open(users_csv_path, 'w', newline='', encoding='utf-8') as users_file:
+            csv_writer = csv.writer(users_file)
+            csv_writer.writerow(USERS_CSV_HEADER)
+            csv_writer.writerows(rows)
+
+    write_users([["user0", "a/repo", 0, 0, 0, "", "", 0]])
+    CollabIndex.build_cached(users_csv_path, folder)
+
+    write_users([["user0", "a/repo,b/repo", 0, 0, 0, "", "", 0], ["user1", "b/repo", 0, 0, 0, "", "", 0]])
+    os.utime(users_csv_path, (0, 0))
+    original_save = lib.collab_index.np.save
+
+    def interrupted_save(path, array):
+        if path.endswith("repo_offsets.npy"):
+            raise KeyboardInterrupt
+        original_save(path, array)
+
+    monkeypatch.setattr(lib.collab_index.np, "save", interrupted_save)
+    with pytest.raises(KeyboardInterrupt):
+        CollabIndex.build_cached(users_csv_path, folder)
+    monkeypatch.undo()
+
+    # Half of the arrays are of the new build, the index is rebuilt instead of loaded
+    assert not CollabIndex.is_up_to_date(folder, [users_csv_path])
+    index = CollabIndex.build_cached(users_csv_path, folder)
+    assert [list(index.contributors_of(index.repo_id(name))) for name in ["a/repo", "b/repo"]] == [[0], [0, 1]]
+    assert CollabIndex.is_up_to_date(folder, [users_csv_path])
@@ -0,0 +1,43 @@
+import csv
+import os
+
+import pytest
+
+import lib.columnar
+from lib.columnar import RepoTable
+from lib.functions import REPOS_CSV_HEADER
+
+
+def write_repos_csv(csv_path, stars):
+    with open(csv_path, 'w', newline='', encoding='utf-8') as repos_file:
+        csv_writer = csv.writer(repos_file)
+        csv_writer.writerow(REPOS_CSV_HEADER)
+        for i, repo_stars in enumerate(stars):
+            csv_writer.writerow([f"owner/repo{i}", repo_stars, 0, 0, 0, 0, 0, 0])
+
+
+def test_interrupted_save_is_never_up_to_date(tmp_path, monkeypatch):
+    csv_path = str(tmp_path / "repos.csv")
+    folder = str(tmp_path / "table")
+    write_repos_csv(csv_path, [1, 2])
+    RepoTable.from_csv_cached(csv_path, folder)
+
+    write_repos_csv(csv_path, [3, 4, 5])
+    os.utime(csv_path, (0, 0))
+    original_save = lib.columnar.np.save
+
+    def interrupted_save(path, array):
+        if path.endswith("forks.npy"):
+            raise KeyboardInterrupt
+        original_save(path, array)
+
+    monkeypatch.setattr(lib.columnar.np, "save", interrupted_save)
+    with pytest.raises(KeyboardInterrupt):
+        RepoTable.from_csv_cached(csv_path, folder)
+    monkeypatch.undo()
+
+    # The stars of the new build are next to the old flags, they are rebuilt instead of loaded
+    assert not RepoTable.is_up_to_date(folder, csv_path)
+    assert list(RepoTable.from_csv_cached(csv_path, folder).stars) == [3, 4, 5]
+    assert list(RepoTable.load(folder).stars) == [3, 4, 5]
+    assert RepoTable.is_up_to_date(folder, csv_path)
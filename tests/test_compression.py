@@ -0,0 +1,100 @@
+import os
+import shutil
+import zlib
+
+import pytest
+
+import gh_scraper
+from benchmarks.gen_gh_archive import generate_archive
+from lib.classes import Repository
+from lib.compression import PigzWriter, open_binary
+from lib.functions import REPOS_CSV_HEADER, load_csv_repo_file_gen, load_csv_user_file_gen, repo_csv_row
+from lib.writers import CSVWriter
+
+
+def append_runs(csv_path):
+    # Two enhancer runs appending to the same output, only the first one writes the header
+    for run, header in enumerate([REPOS_CSV_HEADER, None]):
+        writer = CSVWriter(csv_path, header=header, flush_rows=2)
+        writer.write_rows([repo_csv_row(Repository(f"owner/run{run}_{i}", i, 0, 0, False, False, False, False)) for i in range(3)])
+        writer.close()
+
+
+def expected_names():
+    return [f"owner/run{run}_{i}" for run in range(2) for i in range(3)]
+
+
+def count_gzip_members(gz_path):
+    with open(gz_path, 'rb') as gz_file:
+        data = gz_file.read()
+    members = 0
+    while data:
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        decompressor.decompress(data)
+        data = decompressor.unused_data
+        members += 1
+    return members
+
+
+def test_appends_to_gz_are_gzip_members(tmp_path):
+    csv_path = str(tmp_path / "repos.csv.gz")
+    append_runs(csv_path)
+
+    assert [repo.full_name for repo in load_csv_repo_file_gen(csv_path)] == expected_names()
+    assert [repo.stars for repo in load_csv_repo_file_gen(csv_path)] == [0, 1, 2, 0, 1, 2]
+
+    assert count_gzip_members(csv_path) == 2
+
+
+@pytest.mark.skipif(not shutil.which("pigz"), reason="pigz isn't installed")
+def test_pigz_appends_are_gzip_members(tmp_path):
+    gz_path = str(tmp_path / "lines.gz")
+    for run in range(2):
+        with open_binary(gz_path, 'ab', threads=2) as gz_file:
+            assert isinstance(gz_file, PigzWriter)
+            gz_file.write(f"run{run}\n".encode())
+
+    with open_binary(gz_path) as gz_file:
+        assert gz_file.read() == b"run0\nrun1\n"
+    assert count_gzip_members(gz_path) == 2
+
+
+def test_appends_to_zst_are_zstd_frames(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    csv_path = str(tmp_path / "repos.csv.zst")
+    append_runs(csv_path)
+
+    assert [repo.full_name for repo in load_csv_repo_file_gen(csv_path)] == expected_names()
+
+    with open(csv_path, 'rb') as csv_file:
+        data = csv_file.read()
+    frames = 0
+    while data:
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        decompressor.decompress(data)
+        data = decompressor.unused_data
+        frames += 1
+    assert frames == 2
+
+
+def test_scraper_reads_json_and_json_gz_logs(tmp_path):
+    logs_folder = str(tmp_path / "logs")
+    generate_archive(logs_folder, hours=1, events_per_hour=200, start="2023-01-01-0", compress=False, num_repos=50, num_users=30)
+    generate_archive(logs_folder, hours=1, events_per_hour=200, start="2023-01-01-1", compress=True, num_repos=50, num_users=30, seed=1)
+    gh_scraper.UNIQUE_REPOS.clear()
+    gh_scraper.UNIQUE_USERS.clear()
+    try:
+        for file_name in sorted(os.listdir(logs_folder)):
+            gh_scraper.parse_github_archive(os.path.join(logs_folder, file_name))
+        expected_repos = set(gh_scraper.UNIQUE_REPOS)
+        gh_scraper.UNIQUE_REPOS.clear()
+        gh_scraper.UNIQUE_USERS.clear()
+
+        gh_scraper.main(None, logs_folder, None, str(tmp_path / "out"))
+    finally:
+        gh_scraper.UNIQUE_REPOS.clear()
+        gh_scraper.UNIQUE_USERS.clear()
+
+    assert sorted(os.listdir(logs_folder)) == ["2023-01-01-0.json", "2023-01-01-1.json.gz"]
+    assert {repo.full_name for repo in load_csv_repo_file_gen(str(tmp_path / "out" / "repos.csv"))} == expected_repos
+    assert list(load_csv_user_file_gen(str(tmp_path / "out" / "users.csv")))
@@ -0,0 +1,90 @@
+import pytest
+
+import gh_enhancer
+import lib.functions
+
+from lib.classes import Repository, User
+from lib.functions import process_assets_by_cost, estimate_batch_cost
+from benchmarks.bench_enhancer import write_synthetic_csvs
+from benchmarks.mock_github_graphql import MockGithubState, start_mock_server
+
+
+@pytest.mark.parametrize("mixed", [False, True])
+def test_budget_is_spent_with_the_cost_of_the_requests(tmp_path, monkeypatch, mixed):
+    state = MockGithubState(points_per_token=10 ** 9, latency_ms=5, latency_jitter_ms=0)
+    server, url = start_mock_server(state)
+    monkeypatch.setattr(lib.functions, "GITHUB_GRAPHQL_API_URL", url)
+    points_before = lib.functions.API_STATS["points"]
+    try:
+        repos_csv_path, users_csv_path = write_synthetic_csvs(str(tmp_path), 2000, 2000)
+        gh_enhancer.main(users_csv_path, repos_csv_path, str(tmp_path / "out"), "token", None, 10, 4, budget=60, mixed=mixed)
+    finally:
+        server.shutdown()
+
+    spent = state.snapshot()["global"]["points"]
+    assert 0 < spent <= 60
+    assert lib.functions.API_STATS["points"] - points_before == spent
+
+
+def test_mixed_batches_have_at_most_batch_size_assets():
+    repos = [Repository(f"owner/repo{i}", 0, 0, 0, False, False, False, False) for i in range(450)]
+    users = [User(f"user{i}", [], False, False, False, "", "", False) for i in range(1000)]
+
+    batches = list(process_assets_by_cost(iter(repos + users), max_assets=300))
+    assert [len(batch) for batch in batches] == [300, 300, 300, 300, 250]
+
+
+def test_batches_are_estimated_with_the_connections_of_the_query():
+    repos = [Repository(f"owner/repo{i}", 0, 0, 0, False, False, False, False) for i in range(450)]
+    users = [User(f"user{i}", [], False, False, False, "", "", False) for i in range(300)]
+
+    assert estimate_batch_cost(repos[:300]) == 6
+    assert estimate_batch_cost(repos[:10]) == 1
+    assert estimate_batch_cost(users) == 1
+
+    batches = list(process_assets_by_cost(iter(repos + users), 2, max_assets=300))
+    assert [len(batch) for batch in batches] == [100, 100, 100, 100, 300, 50]
+
+
+@pytest.mark.parametrize("num_repos, num_users, points", [(3, 2, 1), (300, 0, 6), (250, 300, 5), (0, 300, 1)])
+def test_mock_charges_the_connections_of_the_query(monkeypatch, num_repos, num_users, points):
+    state = MockGithubState(points_per_token=10 ** 9, latency_ms=0, latency_jitter_ms=0)
+    server, url = start_mock_server(state)
+    monkeypatch.setattr(lib.functions, "GITHUB_GRAPHQL_API_URL", url)
+    points_before = lib.functions.API_STATS["points"]
+    repos = [Repository(f"owner/repo{i}", 0, 0, 0, False, False, False, False) for i in range(num_repos)]
+    users = [User(f"user{i}", [], False, False, False, "", "", False) for i in range(num_users)]
+    try:
+        repos_info, users_info = lib.functions.get_assets_info(repos, users, "token")
+    finally:
+        server.shutdown()
+
+    # Every repo asks for 2 connections (forks and watchers), GitHub charges connections / 100 rounded, at least 1
+    assert len(repos_info) == num_repos and len(users_info) == num_users
+    assert state.snapshot()["global"]["points"] == points
+    assert lib.functions.API_STATS["points"] - points_before == points
+
+
+def test_rejected_queries_without_data_fail_the_request(monkeypatch):
+    state = MockGithubState(points_per_token=10 ** 9, latency_ms=0, latency_jitter_ms=0, max_aliases=2)
+    server, url = start_mock_server(state)
+    monkeypatch.setattr(lib.functions, "GITHUB_GRAPHQL_API_URL", url)
+    repos = [Repository(f"owner/repo{i}", 0, 0, 0, False, False, False, False) for i in range(3)]
+    try:
+        assert lib.functions.get_assets_info(repos, [], "token") is None
+    finally:
+        server.shutdown()
+
+
+def test_writers_are_closed_when_the_enrichment_fails(tmp_path, monkeypatch):
+    def failing_run_batches(batches_generator, gh_token_or_file, max_num_threads, budget=None, repos_writer=None, users_writer=None):
+        repos_writer.write_rows([["owner/repo", 1, 2, 3, False, False, False, False]])
+        raise RuntimeError("enrichment failed")
+
+    monkeypatch.setattr(gh_enhancer, "run_batches", failing_run_batches)
+    repos_csv_path, _ = write_synthetic_csvs(str(tmp_path), 10, 0)
+    with pytest.raises(RuntimeError, match="enrichment failed"):
+        gh_enhancer.main(None, repos_csv_path, str(tmp_path / "out"), "token", None, 10, 1, flush_interval=60)
+
+    with open(tmp_path / "out" / "repos.csv") as repos_file:
+        assert repos_file.read().splitlines()[1] == "owner/repo,1,2,3,False,False,False,False"
@@ -0,0 +1,30 @@
+import csv
+import os
+
+import gh_enhancer
+import lib.functions
+
+from benchmarks.bench_enhancer import write_synthetic_csvs
+from benchmarks.mock_github_graphql import MockGithubState, start_mock_server
+
+
+def test_mixed_with_owners_writes_every_user_once(tmp_path, monkeypatch):
+    """
+    The user batches finishing before the repo batches of their owners used to write those owners twice.
+    """
+
+    server, url = start_mock_server(MockGithubState(points_per_token=10 ** 9, latency_ms=20, latency_jitter_ms=20))
+    monkeypatch.setattr(lib.functions, "GITHUB_GRAPHQL_API_URL", url)
+    try:
+        repos_csv_path, users_csv_path = write_synthetic_csvs(str(tmp_path), 3000, 8000)
+        tokens_path = tmp_path / "tokens.txt"
+        tokens_path.write_text("token0\ntoken1")
+        output_folder = str(tmp_path / "out")
+        gh_enhancer.main(users_csv_path, repos_csv_path, output_folder, None, str(tokens_path), 100, 8, mixed=True, with_owners=True)
+    finally:
+        server.shutdown()
+
+    with open(os.path.join(output_folder, "users.csv"), newline='') as users_file:
+        usernames = [row[0] for row in csv.reader(users_file)][1:]
+    assert len(usernames) >= 8000
+    assert len(usernames) == len(set(usernames))
@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+import gh_scraper
+from benchmarks.gen_gh_archive import generate_archive
+from lib.event_dispatch import ALL_EVENTS, EventDispatcher, sniff_event_type
+
+
+def event_line(*items):
+    # Lines written like GH Archive: compact separators and the keys in the given order
+    return json.dumps(dict(items), separators=(',', ':')).encode()
+
+
+@pytest.fixture
+def dispatcher():
+    dispatcher = EventDispatcher()
+    calls = []
+    dispatcher.add(lambda fields: calls.append(("repo", fields["repo.name"])), ["WatchEvent", "PushEvent"], ["repo.name"])
+    dispatcher.add(lambda fields: calls.append(("ref", fields["payload.ref"])), ["DeleteEvent"], ["payload.ref"])
+    dispatcher.calls = calls
+    return dispatcher
+
+
+def test_sniff_event_type():
+    assert sniff_event_type(event_line(("id", "1"), ("type", "WatchEvent"), ("actor", {"login": "a"}))) == "WatchEvent"
+    # A "type" after a nested object may be a key of that object
+    assert sniff_event_type(event_line(("id", "1"), ("actor", {"type": "User"}), ("type", "WatchEvent"))) is None
+    assert sniff_event_type(event_line(("id", "1"))) is None
+
+
+def test_only_the_part_before_the_payload_is_decoded(dispatcher):
+    line = event_line(("id", "1"), ("type", "WatchEvent"), ("repo", {"name": "o/r"}), ("payload", {"action": "started"}), ("public", True))
+    assert dispatcher.decode(line) == ("WatchEvent", {"id": "1", "type": "WatchEvent", "repo": {"name": "o/r"}})
+
+
+def test_the_whole_line_is_decoded_when_needed(dispatcher):
+    full_event = {"id": "1", "type": "WatchEvent", "repo": {"name": "o/r"}, "payload": {"action": "started"}}
+
+    # The type can't be sniffed
+    line = event_line(("id", "1"), ("actor", {"type": "User"}), ("type", "WatchEvent"), ("payload", {}))
+    assert dispatcher.decode(line) == ("WatchEvent", json.loads(line))
+    # No compact ,"payload": key to cut at
+    line = json.dumps(full_event).encode()
+    assert dispatcher.decode(line) == ("WatchEvent", full_event)
+    # The cut isn't valid json: the ,"payload": key is inside a nested object
+    line = event_line(("id", "1"), ("type", "WatchEvent"), ("actor", {"login": "a", "payload": 1}), ("repo", {"name": "o/r"}))
+    assert dispatcher.decode(line) == ("WatchEvent", json.loads(line))
+    # A key the extractors read is after the payload
+    line = event_line(("id", "1"), ("type", "WatchEvent"), ("payload", {"action": "started"}), ("repo", {"name": "o/r"}))
+    assert dispatcher.decode(line) == ("WatchEvent", json.loads(line))
+    # An extractor of the type reads the payload
+    line = event_line(("id", "1"), ("type", "DeleteEvent"), ("repo", {"name": "o/r"}), ("payload", {"ref": "main"}))
+    assert dispatcher.decode(line) == ("DeleteEvent", json.loads(line))
+
+
+def test_invalid_lines_raise(dispatcher):
+    with pytest.raises(json.JSONDecodeError):
+        dispatcher.decode(b'{"id":"1","type":"WatchEvent","repo":')
+    with pytest.raises(json.JSONDecodeError):
+        dispatcher.decode(b'not json')
+
+
+def test_extractors_only_run_for_their_event_types(dispatcher):
+    # No extractor handles the type: the line isn't even decoded
+    assert dispatcher.decode(b'{"id":"1","type":"ForkEvent","repo":not json}') == ("ForkEvent", None)
+    assert dispatcher.dispatch({"type": "ForkEvent", "repo": {"name": "o/r"}}) is False
+
+    assert dispatcher.dispatch({"type": "WatchEvent", "repo": {"name": "o/r1"}}) is True
+    assert dispatcher.dispatch({"type": "DeleteEvent", "repo": {"name": "o/r2"}, "payload": {"ref": "main"}}) is True
+    # Missing fields are None
+    assert dispatcher.dispatch({"type": "PushEvent", "repo": None}) is True
+    assert dispatcher.calls == [("repo", "o/r1"), ("ref", "main"), ("repo", None)]
+
+    all_events = []
+    dispatcher.add(lambda fields: all_events.append(fields["type"]), ALL_EVENTS, ["type"])
+    assert dispatcher.dispatch({"type": "ForkEvent"}) is True
+    assert all_events == ["ForkEvent"]
+
+
+def snapshot_scraper():
+    repos = {name: vars(repo).copy() for name, repo in gh_scraper.UNIQUE_REPOS.items()}
+    users = {name: dict(vars(user), repos_collab=list(user.repos_collab)) for name, user in gh_scraper.UNIQUE_USERS.items()}
+    gh_scraper.UNIQUE_REPOS.clear()
+    gh_scraper.UNIQUE_USERS.clear()
+    return repos, users
+
+
+def test_scraper_matches_a_full_decode(tmp_path):
+    hour_path, = generate_archive(str(tmp_path), hours=1, events_per_hour=3000, num_repos=500, num_users=300)
+    gh_scraper.UNIQUE_REPOS.clear()
+    gh_scraper.UNIQUE_USERS.clear()
+
+    gh_scraper.parse_github_archive(hour_path)
+    scraped = snapshot_scraper()
+
+    # Every line decoded entirely with json.loads
+    with gh_scraper.open_binary(hour_path) as hour_file:
+        for line in hour_file:
+            gh_scraper.EXTRACTORS.dispatch(json.loads(line))
+    decoded = snapshot_scraper()
+
+    assert scraped == decoded
+    assert scraped[0] and scraped[1]
+    assert any(repo["deleted"] for repo in scraped[0].values())
+    assert any(user["repos_collab"] for user in scraped[1].values())
@@ -0,0 +1,89 @@
+import csv
+import gzip
+
+import pytest
+
+import gh_merger
+from lib.functions import REPOS_CSV_HEADER, USERS_CSV_HEADER
+from lib.merge import merge_repos_csvs, merge_users_csvs
+
+
+def write_csv(csv_path, header, rows):
+    open_func = gzip.open if str(csv_path).endswith(".gz") else open
+    with open_func(csv_path, 'wt', newline='', encoding='utf-8') as csv_file:
+        csv_writer = csv.writer(csv_file)
+        csv_writer.writerow(header)
+        csv_writer.writerows(rows)
+    return str(csv_path)
+
+
+def read_csv(csv_path):
+    with open(csv_path, newline='', encoding='utf-8') as csv_file:
+        return list(csv.reader(csv_file))
+
+
+def repos_runs(tmp_path):
+    return [
+        write_csv(tmp_path / "run1_repos.csv", REPOS_CSV_HEADER, [["a/r", "", "", "", "", 1, "", ""], ["b/r", "", "", "", "", "", "", ""]]),
+        write_csv(tmp_path / "run2_repos.csv.gz", REPOS_CSV_HEADER, [["a/r", "", "", "", 1, "", "", ""], ["c/r", 5, "", "", "", 1, "", ""]]),
+        write_csv(tmp_path / "run3_repos.csv", REPOS_CSV_HEADER, [["b/r", 3, 1, "", "", "", 1, ""]]),
+    ]
+
+
+def test_merge_combines_the_runs(tmp_path):
+    alice_run1 = [f"o/r{i:03d}" for i in range(300)]
+    alice_run2 = [f"o/r{i:03d}" for i in range(250, 550)]
+    users_files = [
+        write_csv(tmp_path / "run1_users.csv", USERS_CSV_HEADER, [
+            ["alice", ",".join(alice_run1), "", "", "", "alice@one.com", "", ""],
+            ["bob", "b/r", 1, "", "", "", "", ""],
+        ]),
+        write_csv(tmp_path / "run2_users.csv.gz", USERS_CSV_HEADER, [
+            ["alice", ",".join(alice_run2), "", 1, "", "alice@two.com", "Company", ""],
+            ["bob", "a/r,b/r", "", "", "", "bob@two.com", "", ""],
+            ["carol", "", "", "", "", "", "", 1],
+        ]),
+        write_csv(tmp_path / "run3_users.csv", USERS_CSV_HEADER, [
+            ["alice", "z/new", "", "", "", "", "Other", ""],
+        ]),
+    ]
+
+    gh_merger.main(repos_runs(tmp_path), users_files, str(tmp_path / "merged"))
+
+    # Deleted in any run wins and a deleted repo isn't private, the counts keep the highest value
+    assert read_csv(tmp_path / "merged" / "repos.csv") == [
+        REPOS_CSV_HEADER,
+        ["a/r", "", "", "", "1", "", "", ""],
+        ["b/r", "3", "1", "", "", "", "1", ""],
+        ["c/r", "5", "", "", "", "1", "", ""],
+    ]
+
+    users = {row[0]: row for row in read_csv(tmp_path / "merged" / "users.csv")[1:]}
+    assert list(users) == ["alice", "bob", "carol"]
+    # The union of the repos in the order of the runs without duplicates, capped at max_repos (500)
+    assert users["alice"][1].split(",") == [f"o/r{i:03d}" for i in range(500)]
+    # The first email and company found are kept and the flags of any run
+    assert users["alice"][2:] == ["", "1", "", "alice@one.com", "Company", ""]
+    assert users["bob"] == ["bob", "b/r,a/r", "1", "", "", "bob@two.com", "", ""]
+    assert users["carol"] == ["carol", "", "", "", "", "", "", "1"]
+
+
+def test_unsorted_inputs(tmp_path):
+    files = repos_runs(tmp_path)
+    files.append(write_csv(tmp_path / "unsorted_repos.csv", REPOS_CSV_HEADER, [["d/r", "", "", "", "", "", "", ""], ["a/r", "", "", "", "", "", "", 1]]))
+
+    with pytest.raises(ValueError, match="is not sorted"):
+        merge_repos_csvs(files, str(tmp_path / "repos.csv"))
+
+    # Every input is sorted on disk first, run_size=1 spills a run for each row
+    assert merge_repos_csvs(files, str(tmp_path / "repos.csv"), unsorted=True, run_size=1) == 4
+    rows = read_csv(tmp_path / "repos.csv")
+    assert [row[0] for row in rows[1:]] == ["a/r", "b/r", "c/r", "d/r"]
+    assert rows[1] == ["a/r", "", "", "", "1", "", "", "1"]
+
+
+def test_merged_output_can_be_compressed(tmp_path):
+    users_file = write_csv(tmp_path / "users.csv", USERS_CSV_HEADER, [["alice", "a/r", "", "", "", "", "", ""]])
+    assert merge_users_csvs([users_file, users_file], str(tmp_path / "merged.csv.gz")) == 1
+    with gzip.open(tmp_path / "merged.csv.gz", 'rt', newline='', encoding='utf-8') as merged_file:
+        assert list(csv.reader(merged_file)) == [USERS_CSV_HEADER, ["alice", "a/r", "", "", "", "", "", ""]]
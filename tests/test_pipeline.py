@@ -0,0 +1,67 @@
+import json
+import threading
+
+import pytest
+
+import gh_pipeline
+import gh_scraper
+
+
+def write_logs(logs_folder, hours=3):
+    for hour in range(hours):
+        events = [{"type": "WatchEvent", "repo": {"name": f"owner{hour}/repo{i}"}, "actor": {"login": f"user{hour}_{i}"}} for i in range(50)]
+        lines = [json.dumps(event).encode() for event in events]
+        # Invalid utf-8, json that isn't an object and an event with a repo that isn't a dict
+        lines += [b'{"type": "WatchEvent", "actor": {"login": "\xff\xfe"}}', b'[1, 2]',
+                  json.dumps({"type": "WatchEvent", "repo": "not_a_dict", "actor": None}).encode()]
+        (logs_folder / f"2023-01-01-{hour}.json").write_bytes(b'\n'.join(lines) + b'\n')
+
+
+@pytest.fixture(autouse=True)
+def clean_scraper_state():
+    gh_scraper.UNIQUE_REPOS.clear()
+    gh_scraper.UNIQUE_USERS.clear()
+    for name in gh_pipeline.STATS:
+        gh_pipeline.STATS[name] = 0
+    yield
+    gh_scraper.UNIQUE_REPOS.clear()
+    gh_scraper.UNIQUE_USERS.clear()
+
+
+def test_bad_events_are_counted(tmp_path):
+    logs_folder = tmp_path / "logs"
+    logs_folder.mkdir()
+    write_logs(logs_folder)
+
+    gh_pipeline.main(None, str(logs_folder), str(tmp_path / "out"), None, fetch_workers=2, scrape_workers=2, progress_interval=60)
+
+    assert gh_pipeline.STATS["scraped"] == 3
+    assert gh_pipeline.STATS["bad_events"] == 9
+    assert len(gh_scraper.UNIQUE_REPOS) == 150
+
+
+def test_failed_worker_stops_the_pipeline(tmp_path, monkeypatch):
+    logs_folder = tmp_path / "logs"
+    logs_folder.mkdir()
+    write_logs(logs_folder, hours=20)
+
+    def failing_apply_events(events):
+        raise MemoryError("no memory to apply the events")
+
+    # Small logs queue so the fetch workers would block forever on it if the scrape worker died silently
+    monkeypatch.setattr(gh_pipeline, "apply_events", failing_apply_events)
+    monkeypatch.setattr(gh_pipeline, "QUEUE_POLL_SECS", 0.1)
+    errors = []
+
+    def run_pipeline():
+        try:
+            gh_pipeline.main(None, str(logs_folder), str(tmp_path / "out"), None, fetch_workers=4, scrape_workers=1,
+                             logs_queue_size=1, progress_interval=60)
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run_pipeline, daemon=True)
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive()
+    assert len(errors) == 1 and isinstance(errors[0].__cause__, MemoryError)
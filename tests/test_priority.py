@@ -0,0 +1,27 @@
+import csv
+
+from lib.functions import prioritized_repos_gen, repo_contributors_gen, USERS_CSV_HEADER
+from lib.classes import Repository
+
+
+def write_csv(csv_path, header, rows):
+    with open(csv_path, 'w', newline='', encoding='utf-8') as csv_file:
+        csv_writer = csv.writer(csv_file)
+        csv_writer.writerow(header)
+        csv_writer.writerows(rows)
+
+
+def test_repos_are_prioritized_by_their_contributors(tmp_path):
+    users_csv_path = str(tmp_path / "users.csv")
+    write_csv(users_csv_path, USERS_CSV_HEADER, [
+        ["user1", "a/popular,b/some,a/popular", 0, 0, 0, "", "", 0],
+        ["user2", "a/popular,b/some", 0, 0, 0, "", "", 0],
+        ["user3", "a/popular,c/not_in_repos", 0, 0, 0, "", "", 0],
+    ])
+    assert list(repo_contributors_gen(users_csv_path)) == [("a/popular", 3), ("b/some", 2), ("c/not_in_repos", 1)]
+
+    repos = [Repository("z/none", 0, 0, 0, False, False, False, False), Repository("b/some", 0, 0, 0, False, False, False, False),
+             Repository("a/popular", 0, 0, 0, False, False, False, False), Repository("d/starred", 10, 0, 0, False, False, False, False),
+             Repository("a/popular_deleted", 0, 0, 0, True, False, False, False)]
+    prioritized = [repo.full_name for repo in prioritized_repos_gen(iter(repos), users_csv_path)]
+    assert prioritized == ["a/popular", "b/some", "d/starred", "z/none", "a/popular_deleted"]
@@ -0,0 +1,15 @@
+import csv
+
+from lib.report_cache import copy_cached_report
+
+
+def test_copied_reports_count_records_not_lines(tmp_path):
+    cached_path = str(tmp_path / "cached.csv")
+    with open(cached_path, 'w', newline='', encoding='utf-8') as cached_file:
+        csv_writer = csv.writer(cached_file)
+        csv_writer.writerow(["username", "company"])
+        csv_writer.writerow(["user0", "Company\nwith\nnewlines"])
+        csv_writer.writerow(["user1", ""])
+
+    assert copy_cached_report(cached_path, str(tmp_path / "out"), "users.csv") == 2
+    assert (tmp_path / "out" / "users.csv").read_bytes() == (tmp_path / "cached.csv").read_bytes()
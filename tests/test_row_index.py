@@ -0,0 +1,46 @@
+import csv
+import os
+
+import pytest
+
+from lib.compression import open_text
+from lib.functions import load_csv_repo_file_gen, REPOS_CSV_HEADER
+from lib.row_index import build_row_index, csv_rows_gen, index_path, split_row_ranges
+
+
+def write_repos_csv(csv_path, num_rows):
+    rows = [[f"owner{i}/repo{i}", i, 0, 0, 0, 0, 0, 0] for i in range(num_rows)]
+    # A quoted newline, so a row spans two lines
+    rows[3][0] = "owner3/re\npo3"
+    with open_text(csv_path, 'w') as csv_file:
+        csv_writer = csv.writer(csv_file)
+        csv_writer.writerow(REPOS_CSV_HEADER)
+        csv_writer.writerows(rows)
+    return [[str(field) for field in row] for row in rows]
+
+
+@pytest.mark.parametrize("file_name,indexed", [("repos.csv", True), ("repos.csv", False), ("repos.csv.gz", False)])
+@pytest.mark.parametrize("skip_header", [True, False])
+def test_concatenated_ranges_are_the_whole_csv(tmp_path, file_name, indexed, skip_header):
+    csv_path = str(tmp_path / file_name)
+    rows = write_repos_csv(csv_path, 4721)
+    if indexed:
+        build_row_index(csv_path, every=100)
+
+    ranges = split_row_ranges(csv_path, 4, every=100)
+    if not indexed and os.path.exists(index_path(csv_path)):
+        os.remove(index_path(csv_path))
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(rows)
+
+    range_rows = [row for start_row, end_row in ranges for row in csv_rows_gen(csv_path, skip_header, start_row, end_row)]
+    assert range_rows == rows
+
+
+def test_enhancer_loading_of_ranges_covers_every_repo(tmp_path):
+    csv_path = str(tmp_path / "repos.csv")
+    rows = write_repos_csv(csv_path, 4721)
+
+    # gh_enhancer loads the csvs with skip_header=False
+    repos = [repo.full_name for start_row, end_row in [(0, 1181), (1181, 2362), (2362, 3543), (3543, 4721)]
+             for repo in load_csv_repo_file_gen(csv_path, skip_header=False, start_row=start_row, end_row=end_row)]
+    assert repos == [row[0] for row in rows]
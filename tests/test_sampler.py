@@ -0,0 +1,45 @@
+import gzip
+import json
+
+import pytest
+
+import gh_sampler
+import gh_scraper
+
+
+@pytest.fixture(autouse=True)
+def clean_sampler_state():
+    yield
+    gh_scraper.UNIQUE_REPOS.clear()
+    gh_scraper.UNIQUE_USERS.clear()
+    gh_sampler.REPOS_INCIDENCE.clear()
+    gh_sampler.USERS_INCIDENCE.clear()
+    gh_sampler.DELETED_INCIDENCE.clear()
+
+
+def test_scrape_hour_skips_the_bad_lines():
+    lines = [json.dumps({"type": "WatchEvent", "repo": {"name": "owner/repo"}, "actor": {"login": "user"}}).encode(),
+             b'{"type": "WatchEvent", "actor": {"login": "\xff\xfe"}}', b'[1, 2]',
+             json.dumps({"type": "WatchEvent", "repo": "not_a_dict", "actor": None}).encode()]
+
+    stats = gh_sampler.scrape_hour(lines)
+    assert stats["repos"] == 1 and stats["users"] == 1
+
+
+def test_hours_that_fail_to_download_are_missing(monkeypatch):
+    content = gzip.compress(json.dumps({"type": "WatchEvent", "repo": {"name": "owner/repo"}, "actor": {"login": "user"}}).encode())
+
+    def download_file(url):
+        if url.endswith("-1.json.gz"):
+            # A truncated .gz raises EOFError when decompressed
+            return content[:len(content) // 2]
+        if url.endswith("-2.json.gz"):
+            raise OSError("Connection reset")
+        return content
+
+    monkeypatch.setattr(gh_sampler, "download_file", download_file)
+    hours = [f"2023-01-01-{hour}" for hour in range(4)]
+    results = dict(gh_sampler.hours_from_urls(hours, 2))
+
+    assert sorted(results) == hours
+    assert [hour for hour, lines in sorted(results.items()) if lines is None] == ["2023-01-01-1", "2023-01-01-2"]
@@ -0,0 +1,110 @@
+import gzip
+import multiprocessing
+import os
+import time
+
+import gh_downloader
+from lib.work_queue import WorkQueue, DONE, FAILED, LEASED, PENDING
+
+
+def test_expired_leases_fail_after_max_attempts(tmp_path):
+    work_queue = WorkQueue(str(tmp_path / "queue.db"), node="node1", lease_secs=0.01, max_attempts=2)
+    work_queue.add(["url1"])
+
+    for _ in range(2):
+        _, urls = work_queue.lease()
+        assert urls == ["url1"]
+        time.sleep(0.05)
+
+    # The second lease expired too, the hour isn't leased a third time
+    _, urls = work_queue.lease()
+    assert urls == []
+    assert work_queue.status()["hours"][FAILED] == 1
+    work_queue.close()
+
+
+def test_complete_and_fail_only_touch_the_hours_of_the_node(tmp_path):
+    db_path = str(tmp_path / "queue.db")
+    node1 = WorkQueue(db_path, node="node1", lease_secs=0.01)
+    node2 = WorkQueue(db_path, node="node2", lease_secs=600)
+    node1.add(["url1", "url2"])
+
+    _, urls = node1.lease()
+    assert urls == ["url1", "url2"]
+    time.sleep(0.05)
+    # The leases of node1 expired and node2 takes the hours
+    _, urls = node2.lease()
+    assert urls == ["url1", "url2"]
+
+    assert node1.complete(["url1"]) == 0
+    assert node1.fail("url2", "late error") is False
+    assert node2.status()["hours"][LEASED] == 2
+    assert node2.status()["leased_by_node"] == {"node2": 2}
+
+    assert node2.complete(["url1"]) == 1
+    assert node2.fail("url2", "error") is True
+    hours = node2.status()["hours"]
+    assert hours[DONE] == 1 and hours[PENDING] == 1
+    node1.close()
+    node2.close()
+
+
+def lease_until_empty(db_path, node, start, results):
+    # A node of test_nodes_in_several_processes_never_lease_an_hour_twice
+    work_queue = WorkQueue(db_path, node=node)
+    leased = []
+    start.wait()
+    while True:
+        _, urls = work_queue.lease(3)
+        if not urls:
+            break
+        leased += urls
+        time.sleep(0.001)
+        work_queue.complete(urls)
+    work_queue.close()
+    results.put((node, leased))
+
+
+def test_nodes_in_several_processes_never_lease_an_hour_twice(tmp_path):
+    db_path = str(tmp_path / "queue.db")
+    work_queue = WorkQueue(db_path, node="setup")
+    urls = [f"url{i}" for i in range(300)]
+    work_queue.add(urls)
+
+    start = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=lease_until_empty, args=(db_path, f"node{i}", start, results)) for i in range(4)]
+    for process in processes:
+        process.start()
+    # The nodes start leasing at the same time
+    start.set()
+    leased_by_node = dict(results.get(timeout=120) for _ in processes)
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    leased = [url for node_urls in leased_by_node.values() for url in node_urls]
+    assert sorted(leased) == sorted(urls)
+    assert sum(1 for node_urls in leased_by_node.values() if node_urls) > 1
+    assert work_queue.status()["hours"] == {PENDING: 0, LEASED: 0, DONE: 300, FAILED: 0}
+    work_queue.close()
+
+
+def test_download_errors_fail_the_hour_without_blocking_the_workers(tmp_path, monkeypatch):
+    def download_file(url):
+        if url.endswith("bad.json.gz"):
+            raise OSError("Connection reset")
+        if url.endswith("truncated.json.gz"):
+            return gzip.compress(b'{"type": "WatchEvent"}\n')[:10]
+        return gzip.compress(b'{"type": "WatchEvent"}\n')
+
+    monkeypatch.setattr(gh_downloader, "download_file", download_file)
+    work_queue = WorkQueue(str(tmp_path / "queue.db"), stage="download", node="node1", max_attempts=2)
+    work_queue.add([f"https://data.gharchive.org/{name}.json.gz" for name in ["ok1", "bad", "truncated", "ok2"]])
+
+    gh_downloader.process_github_archive_queue(work_queue, str(tmp_path / "logs"), 2, lease_batch=1, poll_interval=0)
+
+    hours = work_queue.status()["hours"]
+    assert hours[DONE] == 2 and hours[FAILED] == 2
+    assert sorted(os.listdir(tmp_path / "logs")) == ["ok1.json_1.json", "ok2.json_1.json"]
+    work_queue.close()